@@ -0,0 +1,390 @@
+"""Agrégats pré-calculés (vues matérialisées) servis par `/api/analytics/*`.
+
+Par pays : nombre d'utilisateurs, de commandes et chiffre d'affaires (hashes
+Redis), et classement des plus gros clients (sorted set sur `total_spent`).
+Une lecture coûte O(nombre de pays) ou O(log n + N) pour le top N, quelle
+que soit la taille des collections :
+- chaque écriture d'utilisateur ou de commande met les agrégats à jour
+  (HINCRBY / HINCRBYFLOAT / ZINCRBY dans un pipeline) ; le pays d'une
+  commande est celui de son utilisateur, gardé dans le hash `analytics:users` ;
+- une reconstruction complète (pipeline `$group` sur `users` + parcours par
+  lots pour le classement) remplit des clés temporaires puis les renomme
+  d'un coup ; elle tourne au premier accès, sur demande et toutes les
+  `rebuild_interval` secondes (un seul replica à la fois) pour corriger la
+  dérive (écritures manquées pendant une coupure Redis ou une reconstruction).
+"""
+import asyncio
+import contextvars
+import json
+import threading
+import time
+
+import redis
+
+COUNTRY_USERS_KEY = 'analytics:country:users'
+COUNTRY_ORDERS_KEY = 'analytics:country:orders'
+COUNTRY_REVENUE_KEY = 'analytics:country:revenue'
+SPENDERS_KEY = 'analytics:spenders'
+USERS_KEY = 'analytics:users'
+BUILT_KEY = 'analytics:built'
+REBUILD_LOCK_KEY = 'analytics:rebuild'
+KEYS = (COUNTRY_USERS_KEY, COUNTRY_ORDERS_KEY, COUNTRY_REVENUE_KEY, SPENDERS_KEY, USERS_KEY)
+UNKNOWN_COUNTRY = 'unknown'
+MAX_TOP = 100
+
+
+def country_pipeline():
+    """Agrégats par pays en un seul `$group` (les totaux par utilisateur sont déjà dans `users`)"""
+    return [{"$group": {
+        "_id": {"$ifNull": ["$country", UNKNOWN_COUNTRY]},
+        "users": {"$sum": 1},
+        "orders": {"$sum": {"$ifNull": ["$order_count", 0]}},
+        "revenue": {"$sum": {"$ifNull": ["$total_spent", 0]}},
+    }}]
+
+
+def user_entry(user):
+    return json.dumps({"name": user.get("name"), "country": user.get("country") or UNKNOWN_COUNTRY})
+
+
+def per_user_totals(orders):
+    totals = {}
+    for order in orders:
+        count, spent = totals.get(order["user_id"], (0, 0.0))
+        totals[order["user_id"]] = (count + 1, spent + order["amount"])
+    return totals
+
+
+def queue_users(pipe, users):
+    for user in users:
+        country = user.get("country") or UNKNOWN_COUNTRY
+        pipe.hincrby(COUNTRY_USERS_KEY, country, 1)
+        pipe.hset(USERS_KEY, user["user_id"], user_entry(user))
+        pipe.zadd(SPENDERS_KEY, {user["user_id"]: user.get("total_spent") or 0})
+        if user.get("order_count"):
+            pipe.hincrby(COUNTRY_ORDERS_KEY, country, user["order_count"])
+        if user.get("total_spent"):
+            pipe.hincrbyfloat(COUNTRY_REVENUE_KEY, country, user["total_spent"])
+
+
+def queue_orders(pipe, totals, entries):
+    for (user_id, (count, spent)), entry in zip(totals.items(), entries):
+        country = json.loads(entry)["country"] if entry else UNKNOWN_COUNTRY
+        pipe.zincrby(SPENDERS_KEY, round(spent, 2), user_id)
+        pipe.hincrby(COUNTRY_ORDERS_KEY, country, count)
+        pipe.hincrbyfloat(COUNTRY_REVENUE_KEY, country, round(spent, 2))
+
+
+def country_rows(users, orders, revenue):
+    rows = [
+        {"country": country, "users": int(users.get(country, 0)), "orders": int(orders.get(country, 0)),
+         "revenue": round(float(revenue.get(country, 0)), 2)}
+        for country in set(users) | set(orders) | set(revenue)
+    ]
+    return sorted(rows, key=lambda row: row["revenue"], reverse=True)
+
+
+def spender_rows(ranking, entries):
+    rows = []
+    for rank, ((user_id, score), entry) in enumerate(zip(ranking, entries), start=1):
+        details = json.loads(entry) if entry else {}
+        rows.append({"rank": rank, "user_id": user_id, "name": details.get("name"),
+                     "country": details.get("country"), "total_spent": round(score, 2)})
+    return rows
+
+
+def tmp_key(key):
+    return f"{key}:tmp"
+
+
+class Analytics:
+    """Agrégats par pays et classement des clients, maintenus dans Redis."""
+
+    def __init__(self, redis_client, db, rebuild_interval=3600, batch_size=1000):
+        self.redis = redis_client
+        self.db = db
+        self.rebuild_interval = rebuild_interval
+        self.batch_size = batch_size
+        self.last_rebuild = None
+        self.last_rebuild_ms = None
+        self._thread = None
+
+    def record_users(self, users):
+        """Nouveaux utilisateurs (avec leurs éventuels totaux de commandes)"""
+        if self.redis is None or not users:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            queue_users(pipe, users)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def record_orders(self, orders):
+        """Commandes dont les stats utilisateur viennent d'être appliquées"""
+        if self.redis is None or not orders:
+            return
+        totals = per_user_totals(orders)
+        try:
+            entries = self.redis.hmget(USERS_KEY, *totals)
+            pipe = self.redis.pipeline(transaction=False)
+            queue_orders(pipe, totals, entries)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def reset(self):
+        """Agrégats vides (après un vidage complet des données)"""
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline()
+            pipe.delete(*KEYS)
+            pipe.set(BUILT_KEY, time.time())
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def built(self):
+        return bool(self.redis.exists(BUILT_KEY))
+
+    def countries(self):
+        """Agrégats par pays triés par chiffre d'affaires, None si pas encore construits"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.exists(BUILT_KEY)
+        for key in (COUNTRY_USERS_KEY, COUNTRY_ORDERS_KEY, COUNTRY_REVENUE_KEY):
+            pipe.hgetall(key)
+        built, users, orders, revenue = pipe.execute()
+        if not built:
+            self.start_rebuild()
+            return None
+        return country_rows(users, orders, revenue)
+
+    def top_spenders(self, limit=10):
+        if not self.built():
+            self.start_rebuild()
+            return None
+        ranking = self.redis.zrevrange(SPENDERS_KEY, 0, min(limit, MAX_TOP) - 1, withscores=True)
+        entries = self.redis.hmget(USERS_KEY, *(user_id for user_id, _ in ranking)) if ranking else []
+        return spender_rows(ranking, entries)
+
+    def _swap(self, pipe, filled):
+        """Remplace les clés par leurs versions temporaires (MULTI/EXEC)"""
+        for key in KEYS:
+            if key in filled:
+                pipe.rename(tmp_key(key), key)
+            else:
+                pipe.delete(key)
+        pipe.set(BUILT_KEY, time.time())
+
+    def rebuild(self):
+        """Reconstruction complète depuis MongoDB"""
+        started = time.perf_counter()
+        self.redis.delete(*(tmp_key(key) for key in KEYS))
+        filled = set()
+        # Tous les pays en un seul aller-retour
+        pipe = self.redis.pipeline(transaction=False)
+        for row in self.db.users.aggregate(country_pipeline()):
+            for key, field in ((COUNTRY_USERS_KEY, "users"), (COUNTRY_ORDERS_KEY, "orders"),
+                               (COUNTRY_REVENUE_KEY, "revenue")):
+                pipe.hset(tmp_key(key), row["_id"], row[field])
+                filled.add(key)
+        pipe.execute()
+        projection = {"_id": 0, "user_id": 1, "name": 1, "country": 1, "total_spent": 1}
+        batch = []
+        for user in self.db.users.find({}, projection, batch_size=self.batch_size):
+            if "user_id" in user:
+                batch.append(user)
+            if len(batch) >= self.batch_size:
+                self._write_users(batch, filled)
+                batch = []
+        self._write_users(batch, filled)
+        pipe = self.redis.pipeline()
+        self._swap(pipe, filled)
+        pipe.execute()
+        self.last_rebuild = time.time()
+        self.last_rebuild_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def _write_users(self, users, filled):
+        if not users:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(tmp_key(USERS_KEY), mapping={user["user_id"]: user_entry(user) for user in users})
+        pipe.zadd(tmp_key(SPENDERS_KEY), {user["user_id"]: user.get("total_spent") or 0 for user in users})
+        pipe.execute()
+        filled.update((USERS_KEY, SPENDERS_KEY))
+
+    def _locked_rebuild(self):
+        try:
+            self.rebuild()
+        except Exception:
+            pass
+        finally:
+            self.redis.delete(REBUILD_LOCK_KEY)
+
+    def start_rebuild(self):
+        """Reconstruction en arrière-plan (une seule à la fois, tous replicas confondus);
+        False si une reconstruction est déjà en cours"""
+        if self.redis is None or not self.redis.set(REBUILD_LOCK_KEY, '1', nx=True, ex=600):
+            return False
+        threading.Thread(target=self._locked_rebuild, name="analytics-rebuild", daemon=True).start()
+        return True
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.rebuild_interval)
+            try:
+                if self.redis.set(REBUILD_LOCK_KEY, '1', nx=True, ex=600):
+                    self._locked_rebuild()
+            except Exception:
+                pass
+
+    def start_refresher(self):
+        """Reconstruction périodique pour corriger la dérive (idempotent)"""
+        if self.redis is None or self.rebuild_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._refresh_loop, name="analytics-refresh", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {
+            "rebuild_interval": self.rebuild_interval,
+            "last_rebuild": self.last_rebuild,
+            "last_rebuild_ms": self.last_rebuild_ms,
+        }
+
+
+class AsyncAnalytics(Analytics):
+    """Variante d'`Analytics` pour le mode ASGI (redis.asyncio + AsyncMongoClient)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tasks = set()
+
+    async def record_users(self, users):
+        if self.redis is None or not users:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            queue_users(pipe, users)
+            await pipe.execute()
+        except redis.RedisError:
+            pass
+
+    async def record_orders(self, orders):
+        if self.redis is None or not orders:
+            return
+        totals = per_user_totals(orders)
+        try:
+            entries = await self.redis.hmget(USERS_KEY, *totals)
+            pipe = self.redis.pipeline(transaction=False)
+            queue_orders(pipe, totals, entries)
+            await pipe.execute()
+        except redis.RedisError:
+            pass
+
+    async def reset(self):
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline()
+            pipe.delete(*KEYS)
+            pipe.set(BUILT_KEY, time.time())
+            await pipe.execute()
+        except redis.RedisError:
+            pass
+
+    async def built(self):
+        return bool(await self.redis.exists(BUILT_KEY))
+
+    async def countries(self):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.exists(BUILT_KEY)
+        for key in (COUNTRY_USERS_KEY, COUNTRY_ORDERS_KEY, COUNTRY_REVENUE_KEY):
+            pipe.hgetall(key)
+        built, users, orders, revenue = await pipe.execute()
+        if not built:
+            await self.start_rebuild()
+            return None
+        return country_rows(users, orders, revenue)
+
+    async def top_spenders(self, limit=10):
+        if not await self.built():
+            await self.start_rebuild()
+            return None
+        ranking = await self.redis.zrevrange(SPENDERS_KEY, 0, min(limit, MAX_TOP) - 1, withscores=True)
+        entries = await self.redis.hmget(USERS_KEY, *(user_id for user_id, _ in ranking)) if ranking else []
+        return spender_rows(ranking, entries)
+
+    async def rebuild(self):
+        started = time.perf_counter()
+        await self.redis.delete(*(tmp_key(key) for key in KEYS))
+        filled = set()
+        pipe = self.redis.pipeline(transaction=False)
+        async for row in await self.db.users.aggregate(country_pipeline()):
+            for key, field in ((COUNTRY_USERS_KEY, "users"), (COUNTRY_ORDERS_KEY, "orders"),
+                               (COUNTRY_REVENUE_KEY, "revenue")):
+                pipe.hset(tmp_key(key), row["_id"], row[field])
+                filled.add(key)
+        await pipe.execute()
+        projection = {"_id": 0, "user_id": 1, "name": 1, "country": 1, "total_spent": 1}
+        batch = []
+        async for user in self.db.users.find({}, projection, batch_size=self.batch_size):
+            if "user_id" in user:
+                batch.append(user)
+            if len(batch) >= self.batch_size:
+                await self._write_users(batch, filled)
+                batch = []
+        await self._write_users(batch, filled)
+        pipe = self.redis.pipeline()
+        self._swap(pipe, filled)
+        await pipe.execute()
+        self.last_rebuild = time.time()
+        self.last_rebuild_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    async def _write_users(self, users, filled):
+        if not users:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(tmp_key(USERS_KEY), mapping={user["user_id"]: user_entry(user) for user in users})
+        pipe.zadd(tmp_key(SPENDERS_KEY), {user["user_id"]: user.get("total_spent") or 0 for user in users})
+        await pipe.execute()
+        filled.update((USERS_KEY, SPENDERS_KEY))
+
+    async def _locked_rebuild(self):
+        try:
+            await self.rebuild()
+        except Exception:
+            pass
+        finally:
+            await self.redis.delete(REBUILD_LOCK_KEY)
+
+    async def start_rebuild(self):
+        if self.redis is None or not await self.redis.set(REBUILD_LOCK_KEY, '1', nx=True, ex=600):
+            return False
+        # Sans le budget pymongo.timeout de la requête qui l'a déclenchée
+        task = asyncio.get_running_loop().create_task(self._locked_rebuild(), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                if await self.redis.set(REBUILD_LOCK_KEY, '1', nx=True, ex=600):
+                    await self._locked_rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+
+    def start_refresher(self):
+        if self.redis is None or self.rebuild_interval <= 0 or self._thread is not None:
+            return
+        self._thread = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    def stop_refresher(self):
+        if self._thread is not None:
+            self._thread.cancel()
+            self._thread = None
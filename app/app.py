@@ -1,406 +1,515 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, g, jsonify, request
+from flask.json.provider import JSONProvider
 from pymongo import MongoClient
+import pymongo
 import redis
-import json
+import functools
 import os
 import socket
+import time
+
+from analytics import MAX_TOP, Analytics
+from backends import BackendMonitor, health_report
+from breaker import CircuitBreaker, CircuitOpenError
+from cache import LocalCache, TwoTierCache
+from coalescing import Coalescer, query_key
+from counters import Counters
+from events import SSE_HEADERS, SSE_MIMETYPE, EventHub
+from indexes import IndexManager
+from ingest import NDJSON_MIMETYPES, OrderIngestor, iter_ndjson
+import metrics
+from migrations import MigrationRunner
+from order_stream import OrderStream
+from pages import build_pages
+from pagination import (STREAM_BATCH_SIZE, STREAM_CHUNKS, STREAM_MIMETYPES, BadRequest, next_cursor,
+                        parse_limit, parse_list_args, strip_id)
+from rate_limit import EXEMPT_PATHS, AdmissionController, RateLimiter, client_id, rejection, route_class
+import redis_pool
+from read_routing import READ_YOUR_WRITES_COOKIE, WRITE_METHODS, ReadRouter, load_route_classes
+import sample_data
+import serialization
+from serialization import Payload
+from sharding import ShardDiagnostics
+from user_sampler import UserSampler
+
+class FastJSONProvider(JSONProvider):
+    """`jsonify` et `app.json` via serialization (orjson si installé, types BSON)"""
+
+    def dumps(self, obj, **kwargs):
+        return serialization.dumps_text(obj)
+
+    def loads(self, s, **kwargs):
+        return serialization.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(serialization.dumps(obj), mimetype=serialization.JSON_MIMETYPE)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # Configuration via variables d'environnement
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://mongo-mongos.dev.svc.cluster.local:27017/?directConnection=true')
 REDIS_HOST = os.getenv('REDIS_HOST', 'redis-service.dev')
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'dev')
+HOSTS_CACHE_TTL = int(os.getenv('HOSTS_CACHE_TTL', '300'))
+L1_CACHE_TTL = int(os.getenv('L1_CACHE_TTL', '30'))
+L1_CACHE_MAXSIZE = int(os.getenv('L1_CACHE_MAXSIZE', '256'))
+HOSTS_STALE_TTL = int(os.getenv('HOSTS_STALE_TTL', '30'))
+CACHE_EARLY_EXPIRATION_BETA = float(os.getenv('CACHE_EARLY_EXPIRATION_BETA', '0'))
+# Taille des pools par process (gunicorn_conf.py les dimensionne par worker)
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '50'))
+# Pool Redis bloquant (redis_pool.py) : attente max d'une connexion libre (s),
+# vérification des connexions inactives (s), délais de socket (s)
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', '1'))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', '30'))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', '1'))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', '1'))
+# Cache côté client RESP3 pour hosts_data (nombre d'entrées, 0 = désactivé)
+REDIS_CLIENT_CACHE_SIZE = int(os.getenv('REDIS_CLIENT_CACHE_SIZE', '0'))
+STATS_RECONCILE_INTERVAL = int(os.getenv('STATS_RECONCILE_INTERVAL', '60'))
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '1000'))
+# Surveillance des backends : intervalle de vérification et backoff max (s)
+BACKEND_CHECK_INTERVAL = float(os.getenv('BACKEND_CHECK_INTERVAL', '5'))
+BACKEND_MAX_BACKOFF = float(os.getenv('BACKEND_MAX_BACKOFF', '30'))
+PAGE_CACHE_MAX_AGE = int(os.getenv('PAGE_CACHE_MAX_AGE', '60'))
+# Budget de latence MongoDB par requête (pymongo.timeout -> timeoutMS/maxTimeMS)
+MONGO_DEADLINE_MS = int(os.getenv('MONGO_DEADLINE_MS', '2000'))
+# Disjoncteurs : seuil de lenteur par backend, durée d'ouverture
+MONGO_SLOW_CALL_MS = int(os.getenv('MONGO_SLOW_CALL_MS', '1000'))
+REDIS_SLOW_CALL_MS = int(os.getenv('REDIS_SLOW_CALL_MS', '250'))
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '10'))
+# Copie longue durée de hosts_data servie quand MongoDB est indisponible (s)
+HOSTS_LAST_GOOD_TTL = int(os.getenv('HOSTS_LAST_GOOD_TTL', '86400'))
+# Encodage des payloads stockés compressés dans le cache (gzip, ou br si le
+# module brotli est installé) : un hit est renvoyé sans recompression
+CACHE_PAYLOAD_ENCODING = os.getenv('CACHE_PAYLOAD_ENCODING', 'gzip')
+# sync : /api/random-order écrit dans MongoDB ; stream : XADD dans un Redis
+# Stream, écrit plus tard par le worker order_stream.py (write-behind)
+ORDER_WRITE_MODE = os.getenv('ORDER_WRITE_MODE', 'sync')
+# Migrations de schéma en arrière-plan : taille des lots, débit max, bail (s)
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '500'))
+MIGRATION_MAX_DOCS_PER_SEC = int(os.getenv('MIGRATION_MAX_DOCS_PER_SEC', '2000'))
+MIGRATION_LEASE_SECONDS = int(os.getenv('MIGRATION_LEASE_SECONDS', '60'))
+# Lectures identiques en vol partagées (/api/stats exact/estimated, pages de
+# /api/users) ; fenêtre de micro-batching en ms (0 = pas d'attente)
+REQUEST_COALESCING = os.getenv('REQUEST_COALESCING', '1') == '1'
+COALESCE_WINDOW_MS = float(os.getenv('COALESCE_WINDOW_MS', '0'))
+# Flux SSE /api/events (changements publiés par change_stream.py) : clients
+# max par process (un thread chacun en mode sync) et intervalle des pings (s)
+SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', '100'))
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))
+# Création des index déclarés (indexes.py) à chaque connexion MongoDB
+ENSURE_INDEXES = os.getenv('ENSURE_INDEXES', '1') == '1'
+# Durée de validité du ciblage des requêtes mesuré par /sharding-info?explain=1 (s)
+SHARD_DIAGNOSTICS_MAX_AGE = float(os.getenv('SHARD_DIAGNOSTICS_MAX_AGE', '60'))
+# Contrôle d'admission (rate_limit.py) : requêtes en cours max par process
+# (0 = sans limite) et latence MongoDB au-delà de laquelle les écritures sont
+# refusées (ms, 0 = jamais) ; limites de débit par client : RATE_LIMIT_<CLASSE>_*
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '64'))
+ADMISSION_LATENCY_MS = float(os.getenv('ADMISSION_LATENCY_MS', '500'))
+# Proxies de confiance devant l'app (ingress = 1) : le client de la limite de
+# débit est l'entrée de X-Forwarded-For posée par le plus éloigné (0 = connexion)
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+# Reconstruction complète des agrégats /api/analytics (s, 0 = jamais)
+ANALYTICS_REBUILD_INTERVAL = int(os.getenv('ANALYTICS_REBUILD_INTERVAL', '3600'))
+# Préférence de lecture, pool et délais par classe de route (MONGO_<CLASSE>_*,
+# voir read_routing.py) : primary, dashboard, list, analytics
+MONGO_ROUTE_CLASSES = load_route_classes(MONGO_MAX_POOL_SIZE, MONGO_DEADLINE_MS)
 
 print(f"🔧 Configuration chargée:")
 print(f"   - ENV: {ENVIRONMENT}")
 print(f"   - MongoDB: {MONGODB_URI}")
 print(f"   - Redis: {REDIS_HOST}")
 
-# Connexion à MongoDB
-try:
-    client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-    db = client["demoDB"]
-    # Test connection CORRIGÉ (sans serverSelectionTimeoutMS dans la commande)
+# Clients MongoDB et Redis : créés sans contacter les serveurs, les
+# connexions sont établies et surveillées en arrière-plan (backends.py)
+def make_mongo_client(uri, route_class):
+    return MongoClient(
+        uri,
+        serverSelectionTimeoutMS=route_class.server_selection_timeout_ms,
+        maxPoolSize=route_class.pool_size,
+        maxIdleTimeMS=60000,
+        event_listeners=metrics.mongo_listeners()
+    )
+
+client = make_mongo_client(MONGODB_URI, MONGO_ROUTE_CLASSES['primary'])
+db = client["demoDB"]
+# Lectures des tableaux de bord et des listes vers les secondaires (pools dédiés)
+read_router = ReadRouter(MONGO_ROUTE_CLASSES, MONGODB_URI, make_mongo_client, clients={'primary': client})
+REDIS_OPTIONS = dict(socket_timeout=REDIS_SOCKET_TIMEOUT, connect_timeout=REDIS_CONNECT_TIMEOUT,
+                     health_check_interval=REDIS_HEALTH_CHECK_INTERVAL, pool_timeout=REDIS_POOL_TIMEOUT)
+redis_client = redis_pool.make_redis(metrics.InstrumentedRedis, REDIS_HOST, max_connections=REDIS_MAX_CONNECTIONS,
+                                     **REDIS_OPTIONS)
+# Lectures de hosts_data servies depuis la mémoire tant que Redis ne signale pas de modification
+hot_redis_client = (redis_pool.make_hot_client(metrics.InstrumentedRedis, REDIS_HOST, REDIS_CLIENT_CACHE_SIZE,
+                                               **REDIS_OPTIONS)
+                    if REDIS_CLIENT_CACHE_SIZE > 0 else None)
+
+# Disjoncteurs partagés par toutes les routes (un par backend)
+mongo_breaker = CircuitBreaker('mongodb', failure_rate=BREAKER_FAILURE_RATE,
+                               slow_call_seconds=MONGO_SLOW_CALL_MS / 1000, open_seconds=BREAKER_OPEN_SECONDS)
+redis_breaker = CircuitBreaker('redis', failure_rate=BREAKER_FAILURE_RATE,
+                               slow_call_seconds=REDIS_SLOW_CALL_MS / 1000, open_seconds=BREAKER_OPEN_SECONDS)
+redis_client.breaker = redis_breaker
+
+mongodb_status = "⏳ MongoDB en cours de connexion"
+mongodb_available = False
+redis_status = "⏳ Redis en cours de connexion"
+redis_available = False
+
+# Cache L1 (mémoire du pod) devant Redis (L2), invalidé via pub/sub.
+# Le L2 est branché par le moniteur Redis dès que Redis répond.
+hosts_cache = TwoTierCache(
+    None,
+    LocalCache(maxsize=L1_CACHE_MAXSIZE, ttl=L1_CACHE_TTL),
+    stale_ttl=HOSTS_STALE_TTL,
+    early_expiration_beta=CACHE_EARLY_EXPIRATION_BETA,
+    last_good_ttl=HOSTS_LAST_GOOD_TTL,
+    binary=True,
+    hot_keys=('hosts_data',),
+)
+
+# Compteurs users/orders dans Redis pour /api/stats, recalés périodiquement sur MongoDB
+stats_counters = Counters(None, db, STATS_RECONCILE_INTERVAL)
+
+# Tirage aléatoire d'un utilisateur sans charger la collection (set Redis d'user_id)
+user_sampler = UserSampler(None, db)
+
+# Agrégats par pays et classement des clients, tenus à jour à chaque écriture
+analytics = Analytics(None, read_router.db('analytics'), ANALYTICS_REBUILD_INTERVAL)
+
+# Commandes en écriture différée (ORDER_WRITE_MODE=stream)
+order_stream = OrderStream(redis_client)
+
+# Changements MongoDB relayés aux navigateurs (un abonnement Redis par process)
+event_hub = EventHub(None, max_clients=SSE_MAX_CLIENTS, heartbeat=SSE_HEARTBEAT)
+
+# Migrations par lots avec points de reprise, hors du chemin des requêtes
+migration_runner = MigrationRunner(
+    db, f"{socket.gethostname()}-{os.getpid()}",
+    batch_size=MIGRATION_BATCH_SIZE,
+    max_docs_per_sec=MIGRATION_MAX_DOCS_PER_SEC,
+    lease_seconds=MIGRATION_LEASE_SECONDS,
+    breaker=mongo_breaker,
+)
+
+# Une seule lecture MongoDB par requête identique en vol dans ce process
+read_coalescer = Coalescer(COALESCE_WINDOW_MS, REQUEST_COALESCING, observer=metrics.observe_coalescing)
+
+# Index secondaires déclarés par l'app, créés en arrière-plan s'ils manquent
+index_manager = IndexManager(db)
+
+# Limite de débit par client (commune aux pods via Redis) et délestage local
+rate_limiter = RateLimiter(None)
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_LATENCY_MS)
+
+# Diagnostic du sharding pour /sharding-info (ciblage mesuré par explain)
+shard_diagnostics = ShardDiagnostics(client, max_age=SHARD_DIAGNOSTICS_MAX_AGE)
+
+def probe_mongodb():
     client.admin.command('ping')
-    mongodb_status = "✅ MongoDB Connecté"
-    mongodb_available = True
-    
-    # Test supplémentaire pour déterminer le type de connexion
     try:
         # Méthode plus fiable pour détecter le sharding
-        is_mongos = client.is_mongos
-        if is_mongos:
-            mongodb_status += " (Sharding)"
-        else:
-            mongodb_status += " (Réplication)"
-    except:
+        return "Sharding" if client.is_mongos else "Réplication"
+    except Exception:
         # Fallback : vérifier si la DB config existe (sharding)
         try:
-            config_db = client["config"]
-            config_db.list_collection_names()
-            mongodb_status += " (Sharding)"
-        except:
-            mongodb_status += " (Réplication)"
-        
-except Exception as e:
-    mongodb_status = f"❌ MongoDB Erreur: {str(e)}"
-    mongodb_available = False
-
-# Connexion à Redis
-try:
-    redis_client = redis.Redis(
-        host=REDIS_HOST, 
-        port=6379, 
-        decode_responses=True,
-        socket_connect_timeout=2,
-        socket_timeout=2
-    )
+            client["config"].list_collection_names()
+            return "Sharding"
+        except Exception:
+            return "Réplication"
+
+def on_mongodb_change(available):
+    global mongodb_status, mongodb_available
+    mongodb_available = available
+    if available:
+        mongodb_status = f"✅ MongoDB Connecté ({mongodb_monitor.detail})"
+        # Migration interrompue par l'arrêt d'un pod : reprise au point de reprise
+        migration_runner.resume_interrupted()
+        if ENSURE_INDEXES:
+            index_manager.start()
+    else:
+        mongodb_status = f"❌ MongoDB Erreur: {mongodb_monitor.last_error}"
+
+def probe_redis():
     redis_client.ping()
-    redis_available = True
-    redis_status = "✅ Redis Connecté"
-except redis.ConnectionError:
-    redis_available = False
-    redis_status = "❌ Redis Non Connecté"
+
+def on_redis_change(available):
+    """Branche ou débranche Redis de tout ce qui l'utilise, sans redémarrer le pod"""
+    global redis_status, redis_available
+    target = redis_client if available else None
+    hosts_cache.redis = stats_counters.redis = user_sampler.redis = analytics.redis = event_hub.redis = target
+    rate_limiter.redis = target
+    hosts_cache.hot_redis = hot_redis_client if available else None
+    if available:
+        # Des invalidations ont pu être manquées pendant la coupure
+        hosts_cache.l1.clear()
+        hosts_cache.start_listener()
+        event_hub.start_listener()
+        stats_counters.start_reconciler()
+        analytics.start_refresher()
+    else:
+        hosts_cache.stop_listener()
+        event_hub.stop_listener()
+    redis_available = available
+    redis_status = "✅ Redis Connecté" if available else "❌ Redis Non Connecté"
+
+mongodb_monitor = BackendMonitor('mongodb', probe_mongodb, on_mongodb_change, BACKEND_CHECK_INTERVAL,
+                                 max_backoff=BACKEND_MAX_BACKOFF)
+redis_monitor = BackendMonitor('redis', probe_redis, on_redis_change, BACKEND_CHECK_INTERVAL,
+                               max_backoff=BACKEND_MAX_BACKOFF)
+mongodb_monitor.start()
+redis_monitor.start()
+
+order_ingestor = OrderIngestor(db, batch_size=BULK_BATCH_SIZE, on_applied=analytics.record_orders)
+
+def close_connections():
+    """Ferme les pools du process (appelé par gunicorn à la sortie d'un worker)"""
+    mongodb_monitor.stop()
+    redis_monitor.stop()
+    migration_runner.stop()
+    hosts_cache.stop_listener()
+    event_hub.stop_listener()
+    for mongo_client in read_router.clients():
+        mongo_client.close()
+    redis_client.close()
+    redis_client.connection_pool.disconnect()
+    if hot_redis_client is not None:
+        hot_redis_client.connection_pool.disconnect()
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def admit_request():
+    """Délestage (503) puis limite de débit par client (429), avant la route"""
+    if request.path in EXEMPT_PATHS:
+        return None
+    priority = route_class(request.path)
+    reason = admission.try_enter(priority)
+    if reason is not None:
+        metrics.observe_rejection(priority, reason)
+        return rejection(reason)
+    g.admitted = True
+    if rate_limiter.applies(priority):
+        client = client_id(request.headers.get('X-Forwarded-For'), request.remote_addr, TRUSTED_PROXY_HOPS)
+        decision = rate_limiter.check(priority, client)
+        if not decision.allowed:
+            metrics.observe_rejection(priority, 'rate_limited')
+            body, status, _ = rejection('rate_limited')
+            return body, status, decision.headers()
+    return None
+
+@app.teardown_request
+def release_admission(exc):
+    if g.pop('admitted', False):
+        admission.leave()
+
+@app.after_request
+def record_request(response):
+    """Latence par route (gabarit d'URL) et statut, pool Redis du process"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        metrics.observe_http(request.method, route, response.status_code, time.perf_counter() - started)
+    metrics.update_redis_pool(redis_client)
+    if request.method in WRITE_METHODS and response.status_code < 400:
+        # Les lectures suivantes de ce client iront au primaire (voir read_db)
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, '1', max_age=read_router.read_your_writes_seconds(),
+                            httponly=True, samesite='Lax')
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli négocié pour les réponses non streamées (les exports en flux
+    et les réponses déjà encodées, comme les pages et /hosts, passent tels quels)"""
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in serialization.COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    body, encoding = serialization.compress_response(response.get_data(), response.mimetype,
+                                                     request.headers.get('Accept-Encoding'))
+    if encoding is not None:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def read_route(route_class):
+    """Classe effective : le primaire juste après une écriture du client"""
+    return 'primary' if READ_YOUR_WRITES_COOKIE in request.cookies else route_class
+
+def read_db(route_class):
+    """Base routée pour la classe (voir read_route)"""
+    return read_router.db(read_route(route_class))
+
+def circuit_open_response(error):
+    response = jsonify({"error": str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response
+
+def mongo_route(deadline_ms=MONGO_DEADLINE_MS):
+    """Route dépendante de MongoDB : passe par le disjoncteur, avec un budget de
+    latence pour toute la requête (None pour les traitements longs)"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not mongo_breaker.allow():
+                return circuit_open_response(CircuitOpenError('mongodb', mongo_breaker.retry_after()))
+            started = time.perf_counter()
+            try:
+                with pymongo.timeout(deadline_ms / 1000 if deadline_ms else None):
+                    response = app.make_response(view(*args, **kwargs))
+            except Exception:
+                mongo_breaker.record(False, time.perf_counter() - started)
+                raise
+            # Sans budget (imports, migrations), un appel long n'est pas un appel lent
+            elapsed = time.perf_counter() - started if deadline_ms else 0.0
+            mongo_breaker.record(response.status_code < 500, elapsed)
+            if deadline_ms:
+                # Latence des routes interactives seulement (pas des imports ou migrations)
+                admission.observe(elapsed)
+            return response
+        return wrapper
+    return decorator
+
+# Pages rendues une seule fois (le contenu ne dépend que de ENVIRONMENT)
+pages = build_pages(ENVIRONMENT, PAGE_CACHE_MAX_AGE)
+
+def serve_page(page):
+    """Sert une page pré-rendue : 304 si l'ETag correspond, sinon la variante compressée"""
+    status, body, headers = page.respond(request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'))
+    return Response(body, status=status, headers=headers, mimetype='text/html')
 
 @app.route("/")
 def home():
-    hostname = socket.gethostname()
+    return serve_page(pages['home'])
+
+@app.route("/api/page-info")
+def page_info():
+    """Parties dynamiques des pages (pod et état des connexions)"""
+    response = jsonify({
+        "hostname": socket.gethostname(),
+        "environment": ENVIRONMENT,
+        "mongodb_status": mongodb_status,
+        "redis_status": redis_status
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def load_hosts_payload():
+    """Lit les hosts dans MongoDB et renvoie le JSON compressé prêt à être servi"""
+    hosts = list(read_router.db('dashboard').hosts.find({}, {"_id": 0}))
     
-    return f'''
-    <!DOCTYPE html>
-    <html lang="fr">
-    <head>
-      <meta charset="UTF-8">
-      <title>Distributed Systems Demo - {ENVIRONMENT.upper()}</title>
-      <style>
-        /* [GARDE TOUT TON CSS EXISTANT] */
-        * {{margin: 0; padding: 0; box-sizing: border-box;}}
-        body {{
-          font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-          background: linear-gradient(160deg, #e0f7fa, #ffffff);
-          color: #333;
-          line-height: 1.6;
-        }}
-        header {{
-          background: linear-gradient(90deg, #2196f3, #21cbf3);
-          color: white;
-          text-align: center;
-          padding: 30px 20px;
-          box-shadow: 0 5px 15px rgba(0,0,0,0.2);
-          position: sticky;
-          top: 0;
-          z-index: 100;
-        }}
-        .container {{
-          width: 90%;
-          max-width: 1100px;
-          margin: 40px auto;
-          display: flex;
-          flex-direction: column;
-          gap: 30px;
-        }}
-        .frame {{
-          background: #ffffff;
-          border-radius: 15px;
-          padding: 25px;
-          box-shadow: 0 8px 20px rgba(0,0,0,0.1);
-          transition: transform 0.3s;
-        }}
-        .info-box {{
-          background: #e3f2fd;
-          padding: 18px;
-          border-radius: 10px;
-          border-left: 5px solid #2196f3;
-          margin-top: 10px;
-          font-size: 0.95rem;
-        }}
-        .badge {{
-          display: inline-block;
-          background: #4caf50;
-          color: white;
-          padding: 3px 8px;
-          border-radius: 5px;
-          font-size: 0.85rem;
-          margin-left: 8px;
-        }}
-        .cache-indicator {{
-          display: inline-block;
-          padding: 2px 8px;
-          border-radius: 12px;
-          font-size: 0.8rem;
-          margin-left: 8px;
-          background: #4caf50;
-          color: white;
-        }}
-        .cache-miss {{ background: #ff9800; }}
-        .cache-error {{ background: #f44336; }}
-        
-        /* Nouveaux styles pour sharding */
-        .architecture {{
-          display: grid;
-          grid-template-columns: 1fr 1fr 1fr;
-          gap: 20px;
-          margin-top: 20px;
-        }}
-        .component {{
-          background: #f8f9fa;
-          padding: 15px;
-          border-radius: 10px;
-          border: 2px solid #e9ecef;
-        }}
-        .component h3 {{
-          color: #495057;
-          margin-bottom: 10px;
-        }}
-        .shard-active {{
-          background: #d4edda;
-          border-color: #c3e6cb;
-        }}
-        .shard-inactive {{
-          background: #f8d7da;
-          border-color: #f5c6cb;
-        }}
-      </style>
-    </head>
-    <body>
-
-    <header>
-      <h1>Distributed Systems EXAMEEEEEEN <span class="badge">Flask + MongoDB + Redis</span></h1>
-    </header>
-
-    <div class="container">
-
-      <!-- Pod Hostname -->
-      <div class="frame">
-        <h2>Pod Hostname</h2>
-        <div class="hostname-container">
-          <span class="hostname" id="hostname">{hostname}</span>
-        </div>
-        <div class="info-box">
-          <strong>ENVIRONMENT: {ENVIRONMENT.upper()}</strong><br>
-          MongoDB: {mongodb_status}<br>
-          Redis: {redis_status}
-        </div>
-      </div>
-
-      <!-- MongoDB Architecture -->
-      <div class="frame">
-        <h2>MongoDB Architecture</h2>
-        <div class="architecture">
-          <div class="component {'' if ENVIRONMENT == 'dev' else 'shard-inactive'}">
-            <h3>🔧 Config Servers</h3>
-            <p>Métadonnées du sharding</p>
-            <ul>
-              <li>mongo-config-0</li>
-              <li>mongo-config-1</li>
-              <li>mongo-config-2</li>
-            </ul>
-            <small>{'✅ Actif' if ENVIRONMENT == 'dev' else '❌ Inactif'}</small>
-          </div>
-          
-          <div class="component {'' if ENVIRONMENT == 'dev' else 'shard-inactive'}">
-            <h3>🗄️ Shard Servers</h3>
-            <p>Données partitionnées</p>
-            <ul>
-              <li>mongo-shard-0</li>
-              <li>mongo-shard-1</li>
-              <li>mongo-shard-2</li>
-            </ul>
-            <small>{'✅ Actif' if ENVIRONMENT == 'dev' else '❌ Inactif'}</small>
-          </div>
-          
-          <div class="component {'' if ENVIRONMENT == 'dev' else 'shard-inactive'}">
-            <h3>🎯 Mongos Routers</h3>
-            <p>Routage intelligent</p>
-            <ul>
-              <li>mongo-mongos-xxxxx</li>
-              <li>mongo-mongos-xxxxx</li>
-            </ul>
-            <small>{'✅ Actif' if ENVIRONMENT == 'dev' else '❌ Inactif'}</small>
-          </div>
-        </div>
-        <div class="info-box">
-          <strong>Mode: { '🚀 SHARDING AVANCÉ' if ENVIRONMENT == 'dev' else '🗄️ RÉPLICATION SIMPLE' }</strong><br>
-          { 'Données partitionnées sur 3 shards + 2 routeurs + 3 config servers' if ENVIRONMENT == 'dev' else 'Réplication standard avec 3 pods MongoDB' }
-        </div>
-      </div>
-
-      <!-- MongoDB Hosts avec Cache -->
-      <div class="frame">
-        <h2>Hosts from MongoDB <span id="cache-indicator" class="cache-indicator">Chargement...</span></h2>
-        <ul id="host-list"></ul>
-        <div class="info-box">
-          <strong>Performance:</strong><br>
-          • Redis Cache: {redis_status}<br>
-          • MongoDB: {mongodb_status}<br>
-          • Architecture: {ENVIRONMENT.upper()}
-        </div>
-      </div>
-
-      <!-- Cache Performance -->
-      <div class="frame">
-        <h2>Cache Performance</h2>
-        <div class="info-box">
-          <div id="performance-stats">
-            <p><strong>Temps de réponse:</strong> <span id="response-time">-</span></p>
-            <p><strong>Source données:</strong> <span id="data-source">-</span></p>
-            <p><strong>Statut Redis:</strong> <span id="redis-status">{redis_status}</span></p>
-          </div>
-          <br>
-          <button onclick="clearCache()" style="padding: 8px 16px; background: #ff5722; color: white; border: none; border-radius: 5px; cursor: pointer;">
-            🗑️ Vider le Cache
-          </button>
-          <button onclick="loadData()" style="padding: 8px 16px; background: #2196f3; color: white; border: none; border-radius: 5px; cursor: pointer; margin-left: 10px;">
-            🔄 Recharger
-          </button>
-          <button onclick="showShardingInfo()" style="padding: 8px 16px; background: #4caf50; color: white; border: none; border-radius: 5px; cursor: pointer; margin-left: 10px;">
-            🗄️ Info Sharding
-          </button>
-        </div>
-      </div>
-
-    </div>
-
-    <footer>
-      &copy; 2025 Distributed Systems Demo Project - Environment: {ENVIRONMENT.upper()}
-    </footer>
-
-    <script>
-      // Format hostname
-      const span = document.getElementById('hostname');
-      const text = span.textContent;
-      if (text.length > 5) {{
-        const firstPart = text.slice(0, -5);
-        const last5 = text.slice(-5);
-        span.innerHTML = `${{firstPart}}<span class="last5">${{last5}}</span>`;
-      }}
-
-      // Load data
-      async function loadData() {{
-        try {{
-          const startTime = performance.now();
-          const response = await fetch('/hosts');
-          const endTime = performance.now();
-          
-          const data = await response.json();
-          const list = document.getElementById('host-list');
-          list.innerHTML = '';
-          
-          const responseTime = (endTime - startTime).toFixed(2);
-          const cacheStatus = response.headers.get('X-Cache');
-          const dataSource = cacheStatus === 'HIT' ? '🚀 Redis Cache' : '💾 MongoDB';
-          
-          document.getElementById('response-time').textContent = `${{responseTime}}ms`;
-          document.getElementById('data-source').textContent = dataSource;
-          
-          const cacheIndicator = document.getElementById('cache-indicator');
-          cacheIndicator.textContent = cacheStatus === 'HIT' ? 'CACHE' : 'DATABASE';
-          cacheIndicator.className = cacheStatus === 'HIT' ? 'cache-indicator' : 'cache-indicator cache-miss';
-          
-          data.forEach(item => {{
-            const li = document.createElement('li');
-            li.textContent = `${{item.pod}} (${{item.info}})`;
-            list.appendChild(li);
-          }});
-          
-        }} catch (e) {{
-          document.getElementById('host-list').textContent = 'Error loading data.';
-          document.getElementById('cache-indicator').textContent = 'ERROR';
-          document.getElementById('cache-indicator').className = 'cache-indicator cache-error';
-        }}
-      }}
-
-      // Vider le cache
-      async function clearCache() {{
-        try {{
-          await fetch('/cache/clear');
-          alert('Cache vidé ! Prochain chargement viendra de MongoDB.');
-          loadData();
-        }} catch (e) {{
-          alert('Erreur lors du vidage du cache');
-        }}
-      }}
-
-      // Info sharding
-      async function showShardingInfo() {{
-        try {{
-          const response = await fetch('/sharding-info');
-          const data = await response.json();
-          alert(`Info Sharding:\\n- Actif: ${{data.sharding_enabled}}\\n- Shards: ${{data.shards || 'N/A'}}\\n- Mode: ${{data.mode}}`);
-        }} catch (e) {{
-          alert('Erreur lors de la récupération des infos sharding');
-        }}
-      }}
-
-      loadData();
-    </script>
-
-    </body>
-    </html>
-    '''
+    # Transformer les données pour l'affichage
+    formatted_hosts = []
+    for host in hosts:
+        # Les données sont maintenant stockées différemment avec le sharding
+        pod_name = host.get('_id', 'Unknown')  # Maintenant _id est utilisé pour le sharding
+        info = host.get('info', 'No info')
+        formatted_hosts.append({
+            "pod": pod_name,
+            "info": info
+        })
+    
+    return Payload.encode(formatted_hosts, CACHE_PAYLOAD_ENCODING).to_bytes()
+
+ERROR_HOSTS_PAYLOAD = Payload(serialization.dumps([{"pod": "Error", "info": "Cannot load data"}]), 'identity').to_bytes()
+
+def load_hosts_guarded():
+    """`load_hosts_payload` sous le disjoncteur MongoDB et le budget de latence"""
+    with pymongo.timeout(read_router.timeout('dashboard')):
+        return mongo_breaker.call(load_hosts_payload)
 
 @app.route("/hosts")
 def get_hosts():
     from flask import Response
     import time
     
-    cache_hit = False
     start_time = time.time()
     
     try:
-        # Essayer Redis d'abord
-        if redis_available:
-            cached_data = redis_client.get('hosts_data')
-            if cached_data:
-                cache_hit = True
-                response = Response(cached_data, mimetype='application/json')
-                response.headers['X-Cache'] = 'HIT'
-                response.headers['X-Response-Time'] = f"{(time.time() - start_time)*1000:.2f}ms"
-                return response
-        
-        # Fallback sur MongoDB - STRUCTURE CORRIGÉE
-        hosts = list(db.hosts.find({}, {"_id": 0}))
-        
-        # Transformer les données pour l'affichage
-        formatted_hosts = []
-        for host in hosts:
-            # Les données sont maintenant stockées différemment avec le sharding
-            pod_name = host.get('_id', 'Unknown')  # Maintenant _id est utilisé pour le sharding
-            info = host.get('info', 'No info')
-            formatted_hosts.append({
-                "pod": pod_name,
-                "info": info
-            })
-        
-        response_data = json.dumps(formatted_hosts)
-        
-        # Mettre en cache pour 5 minutes
-        if redis_available:
-            redis_client.setex('hosts_data', 300, response_data)
+        # Cache L1 (mémoire) puis Redis (L2), MongoDB seulement sur miss.
+        # Un seul worker recalcule à l'expiration (verrou Redis), les autres
+        # attendent ou reçoivent l'ancienne valeur (stale-while-revalidate).
+        response_data, cache_tier = hosts_cache.get_or_compute(
+            'hosts_data', load_hosts_guarded, HOSTS_CACHE_TTL
+        )
+        metrics.observe_cache('hosts_data', cache_tier)
         
-        response = Response(response_data, mimetype='application/json')
-        response.headers['X-Cache'] = 'MISS'
+        # Envoyé tel qu'il est stocké dans Redis (compressé) si le client l'accepte
+        body, headers = Payload.from_bytes(response_data).respond(request.headers.get('Accept-Encoding'))
+        response = Response(body, mimetype='application/json', headers=headers)
+        response.headers['X-Cache'] = f"{cache_tier}-HIT" if cache_tier else 'MISS'
         response.headers['X-Response-Time'] = f"{(time.time() - start_time)*1000:.2f}ms"
         return response
         
     except Exception as e:
-        # Fallback complet en cas d'erreur
-        try:
-            hosts = list(db.hosts.find({}, {"_id": 0}))
-            formatted_hosts = [{"pod": h.get('_id', 'Unknown'), "info": h.get('info', 'No info')} for h in hosts]
-            response = Response(json.dumps(formatted_hosts), mimetype='application/json')
-        except:
-            response = Response(json.dumps([{"pod": "Error", "info": "Cannot load data"}]), mimetype='application/json')
-        response.headers['X-Cache'] = 'ERROR'
+        metrics.observe_cache('hosts_data', None, error=True)
+        # Pas de seconde requête sur un MongoDB en difficulté : dernière valeur
+        # connue (même ancienne). MongoDB n'est relu que si c'est Redis qui a échoué.
+        response_data, x_cache = hosts_cache.last_good('hosts_data'), 'LKG-HIT'
+        if response_data is None and isinstance(e, redis.RedisError):
+            try:
+                response_data, x_cache = load_hosts_guarded(), 'MISS'
+            except Exception:
+                pass
+        if response_data is None:
+            response_data, x_cache = ERROR_HOSTS_PAYLOAD, 'ERROR'
+        body, headers = Payload.from_bytes(response_data).respond(request.headers.get('Accept-Encoding'))
+        response = Response(body, mimetype='application/json', headers=headers)
+        response.headers['X-Cache'] = x_cache
         return response
 
+@app.route("/api/events")
+def change_events():
+    """Flux SSE des changements de hosts/users/orders (résumés par lot du watcher)"""
+    client = event_hub.subscribe() if redis_available else None
+    if client is None:
+        response = jsonify({"error": "Event stream unavailable"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    response = Response(event_hub.stream(client), mimetype=SSE_MIMETYPE, headers=SSE_HEADERS)
+    # Flux jamais démarré (client parti) : la file est libérée quand même
+    response.call_on_close(lambda: event_hub.unsubscribe(client))
+    return response
+
+@app.route("/healthz")
+def healthz():
+    """Liveness : le process répond et ses moniteurs de connexion tournent"""
+    alive = mongodb_monitor.alive() and redis_monitor.alive()
+    return jsonify({"alive": alive}), 200 if alive else 503
+
+@app.route("/readyz")
+def readyz():
+    """Readiness : MongoDB joignable (Redis est optionnel, l'app se dégrade sans)"""
+    ready, report = health_report([mongodb_monitor, redis_monitor])
+    return jsonify(report), 200 if ready else 503
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Métriques Prometheus (tous les workers gunicorn agrégés)"""
+    if redis_available:
+        try:
+            metrics.update_order_stream(order_stream.lag())
+        except redis.RedisError:
+            pass
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 @app.route("/cache/clear")
 def clear_cache():
     """Endpoint pour vider le cache (pour les tests)"""
     try:
+        # Vide Redis et le L1 de tous les replicas (pub/sub)
+        hosts_cache.invalidate('hosts_data')
         if redis_available:
-            redis_client.delete('hosts_data')
             return "✅ Cache cleared"
         return "❌ Redis not available"
     except:
@@ -410,18 +519,38 @@ def clear_cache():
 def cache_status():
     """Endpoint pour voir le statut du cache"""
     try:
+        cache_entries, cache_ttl = 0, -1
+        if redis_available:
+            # Un seul aller-retour (TTL vaut -2 pour une clé absente)
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.dbsize()
+            pipe.ttl('hosts_data')
+            cache_entries, cache_ttl = pipe.execute()
         status = {
             "redis_available": redis_available,
-            "cache_entries": redis_client.dbsize() if redis_available else 0,
-            "cache_ttl": redis_client.ttl('hosts_data') if redis_available and redis_client.exists('hosts_data') else -1
+            "cache_entries": cache_entries,
+            "cache_ttl": max(cache_ttl, -1),
+            "redis_pool": {"shared": redis_pool.describe(redis_client), "hot": redis_pool.describe(hot_redis_client)},
+            "hosts_cache": hosts_cache.stats(),
+            "stats_counters": stats_counters.stats(),
+            "analytics": analytics.stats(),
+            "read_routing": read_router.describe(),
+            "request_coalescing": read_coalescer.stats(),
+            "events": event_hub.stats(),
+            "admission": admission.stats(),
+            "rate_limits": rate_limiter.stats(),
+            "circuit_breakers": {"mongodb": mongo_breaker.stats(), "redis": redis_breaker.stats()}
         }
         return jsonify(status)
     except:
-        return jsonify({"redis_available": False})
+        return jsonify({
+            "redis_available": False,
+            "circuit_breakers": {"mongodb": mongo_breaker.stats(), "redis": redis_breaker.stats()}
+        })
 
 @app.route("/sharding-info")
 def sharding_info():
-    """Endpoint pour voir les infos de sharding"""
+    """Endpoint pour voir les infos de sharding; ?explain=1 ajoute le ciblage des requêtes (?refresh=1 le remesure)"""
     try:
         if ENVIRONMENT == 'dev':
             # En dev, on teste si on est connecté à un mongos (sharding)
@@ -430,13 +559,17 @@ def sharding_info():
                 config_db = client["config"]
                 shards_count = config_db.shards.count_documents({})
                 
-                return jsonify({
+                info = {
                     "sharding_enabled": True,
                     "shards": shards_count,
                     "mode": "sharding",
                     "environment": ENVIRONMENT,
                     "connected_to": "mongos"
-                })
+                }
+                # Répartition, balancer et (?explain=1) ciblage des requêtes
+                info.update(shard_diagnostics.report(explain=request.args.get('explain') == '1',
+                                                     refresh=request.args.get('refresh') == '1'))
+                return jsonify(info)
             except Exception as e:
                 # Si on arrive ici, on est probablement connecté à un mongod normal
                 return jsonify({
@@ -464,142 +597,99 @@ def sharding_info():
 @app.route("/user-dashboard")
 def user_dashboard():
     """Page simplifiée de gestion users"""
-    hostname = socket.gethostname()
-    
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>User Management - {ENVIRONMENT.upper()}</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; padding: 20px; background: #f5f5f5; }}
-            .container {{ display: grid; gap: 20px; grid-template-columns: 1fr 1fr; max-width: 1000px; margin: 0 auto; }}
-            .card {{ background: white; padding: 20px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-            button {{ background: #2196f3; color: white; border: none; padding: 10px 15px; border-radius: 5px; cursor: pointer; margin: 5px; }}
-            button:hover {{ background: #1976d2; }}
-            .user-item {{ background: #f8f9fa; margin: 8px 0; padding: 12px; border-radius: 5px; border-left: 4px solid #2196f3; }}
-        </style>
-    </head>
-    <body>
-        <h1>👥 User Management Dashboard - {ENVIRONMENT.upper()}</h1>
-        <p><strong>Pod:</strong> {hostname} | <strong>MongoDB:</strong> {mongodb_status} | <strong>Redis:</strong> {redis_status}</p>
-        
-        <div class="container">
-            <!-- Stats -->
-            <div class="card">
-                <h3>📊 Statistics</h3>
-                <p>Total Users: <strong id="user-count">-</strong></p>
-                <p>Total Orders: <strong id="order-count">-</strong></p>
-                <div style="margin-top: 15px;">
-                    <button onclick="loadSampleData()">📥 Load Sample Data</button>
-                    <button onclick="refreshStats()">🔄 Refresh</button>
-                </div>
-            </div>
-            
-            <!-- Actions -->
-            <div class="card">
-                <h3>⚡ Actions</h3>
-                <button onclick="addRandomUser()">👤 Add Random User</button>
-                <button onclick="addRandomOrder()">🛒 Add Random Order</button>
-                <button onclick="runMigration()">🔧 Run Migration</button>
-                <button onclick="clearAllData()">🗑️ Clear All Data</button>
-            </div>
-        </div>
-        
-        <!-- Users List -->
-        <div class="card" style="margin-top: 20px;">
-            <h3>👤 Recent Users</h3>
-            <div id="user-list">Loading...</div>
-        </div>
-
-        <script>
-            async function refreshStats() {{
-                try {{
-                    const [stats, users] = await Promise.all([
-                        fetch('/api/stats').then(r => r.json()),
-                        fetch('/api/users').then(r => r.json())
-                    ]);
-                    
-                    document.getElementById('user-count').textContent = stats.total_users;
-                    document.getElementById('order-count').textContent = stats.total_orders;
-                    
-                    document.getElementById('user-list').innerHTML = users.map(user => `
-                        <div class="user-item">
-                            <strong>${{user.name}}</strong> (${{user.email}})<br>
-                            <small>Orders: ${{user.order_count}} | Country: ${{user.country}}</small>
-                        </div>
-                    `).join('');
-                    
-                }} catch (error) {{
-                    document.getElementById('user-list').innerHTML = 'Error loading data';
-                }}
-            }}
-            
-            async function loadSampleData() {{
-                const response = await fetch('/api/load-sample-data', {{ method: 'POST' }});
-                const result = await response.json();
-                alert(`✅ ${{result.message}}`);
-                refreshStats();
-            }}
-            
-            async function addRandomUser() {{
-                await fetch('/api/random-user', {{ method: 'POST' }});
-                refreshStats();
-            }}
-            
-            async function addRandomOrder() {{
-                const response = await fetch('/api/random-order', {{ method: 'POST' }});
-                const result = await response.json();
-                alert(`✅ Order added for ${{result.user_name}} - €${{result.amount}}`);
-                refreshStats();
-            }}
-            
-            async function runMigration() {{
-                const response = await fetch('/api/run-migration', {{ method: 'POST' }});
-                const result = await response.json();
-                alert(`✅ Migration applied to ${{result.migrated_users}} users`);
-                refreshStats();
-            }}
-            
-            async function clearAllData() {{
-                if (confirm('Are you sure you want to delete ALL data?')) {{
-                    await fetch('/api/clear-data', {{ method: 'DELETE' }});
-                    alert('All data cleared!');
-                    refreshStats();
-                }}
-            }}
-            
-            // Load data on page load
-            refreshStats();
-        </script>
-    </body>
-    </html>
-    '''
+    return serve_page(pages['dashboard'])
 
 # API endpoints simplifiés
 @app.route("/api/stats")
 def api_stats():
-    """Retourne les statistiques globales"""
+    """Retourne les statistiques globales
+
+    Par défaut depuis les compteurs Redis (O(1)). `?mode=estimated` lit les
+    métadonnées des collections, `?exact=1` (ou `?mode=exact`) fait le vrai
+    count_documents sur tous les shards.
+    """
     try:
-        total_users = db.users.count_documents({})
-        total_orders = db.orders.count_documents({})
+        mode = 'exact' if request.args.get('exact') == '1' else request.args.get('mode', 'counter')
+        counts = None
+        stats_db = read_db('dashboard')
+        route = read_route('dashboard')
+        with pymongo.timeout(read_router.timeout('dashboard')):
+            if mode == 'exact':
+                counts = read_coalescer.run(query_key(route, 'stats', extra='exact'),
+                                            lambda: mongo_breaker.call(stats_counters.exact, stats_db), 'stats_exact')
+            elif mode == 'counter':
+                try:
+                    counts = stats_counters.read()
+                except redis.RedisError:
+                    # Redis en panne ou circuit ouvert : comptes estimés ci-dessous
+                    pass
+                else:
+                    if counts is None and redis_available:
+                        # Compteurs absents (Redis vidé, premier démarrage) : on les initialise
+                        counts = mongo_breaker.call(stats_counters.reconcile)
+                        mode = 'exact'
+            if counts is None:
+                counts = read_coalescer.run(query_key(route, 'stats', extra='estimated'),
+                                            lambda: mongo_breaker.call(stats_counters.estimated, stats_db),
+                                            'stats_estimated')
+                mode = 'estimated'
         return jsonify({
-            "total_users": total_users,
-            "total_orders": total_orders
+            "total_users": counts["users"],
+            "total_orders": counts["orders"],
+            "source": mode
         })
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+USERS_SORT = [("_id", -1)]
+
+def users_cursor(users_db, query, projection, limit):
+    cursor = users_db.users.find(query, projection, batch_size=STREAM_BATCH_SIZE).sort(USERS_SORT)
+    return cursor.limit(limit) if limit else cursor
+
+def users_page(users_db, query, projection, limit):
+    """Page de /api/users (sans `_id`) et curseur suivant; partagée par les requêtes identiques"""
+    users = list(users_cursor(users_db, query, projection, limit))
+    cursor_value = next_cursor(users, limit)
+    return [strip_id(user) for user in users], cursor_value
+
 @app.route("/api/users")
+@mongo_route(read_router.deadline_ms('list'))
 def api_users():
-    """Retourne la liste des utilisateurs"""
+    """Retourne la liste des utilisateurs, du plus récent au plus ancien
+
+    - `?limit=N&after=<cursor>` : pagination par clé, réponse
+      `{"users": [...], "next_cursor": ...}` (sans paramètre : tableau des
+      100 derniers, curseur suivant dans l'en-tête `X-Next-Cursor`) ;
+    - `?format=ndjson|json-stream` : flux direct depuis le curseur MongoDB
+      (lots de STREAM_BATCH_SIZE), pour les exports complets ;
+    - `?fields=name,email` : projection.
+    """
+    try:
+        query, projection, limit, fmt = parse_list_args(request.args)
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
     try:
-        users = list(db.users.find({}, {"_id": 0}).sort("_id", -1).limit(100))
-        return jsonify(users)
+        if fmt != 'page':
+            cursor = users_cursor(read_db('list'), query, projection, limit)
+            return Response(STREAM_CHUNKS[fmt](cursor, app.json.dumps), mimetype=STREAM_MIMETYPES[fmt])
+        users_db = read_db('list')
+        users, cursor_value = read_coalescer.run(
+            query_key(read_route('list'), 'users', query, projection, USERS_SORT, limit),
+            lambda: users_page(users_db, query, projection, limit), 'users_page')
+        if 'limit' in request.args or 'after' in request.args:
+            return jsonify({"users": users, "next_cursor": cursor_value})
+        response = jsonify(users)
+        if cursor_value:
+            response.headers['X-Next-Cursor'] = cursor_value
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/load-sample-data", methods=["POST"])
+@mongo_route()
 def load_sample_data():
     """Charge des données d'exemple simples"""
     try:
@@ -607,40 +697,15 @@ def load_sample_data():
         db.users.delete_many({})
         db.orders.delete_many({})
         
-        # Créer 5 utilisateurs de test
-        sample_users = [
-            {
-                "user_id": "user_1", "name": "Alice Dupont", "email": "alice@ecam.be", 
-                "country": "France", "order_count": 3, "total_spent": 150.50
-            },
-            {
-                "user_id": "user_2", "name": "Bob Martin", "email": "bob@ecam.be", 
-                "country": "Belgium", "order_count": 1, "total_spent": 45.00
-            },
-            {
-                "user_id": "user_3", "name": "Charlie Wilson", "email": "charlie@ecam.be", 
-                "country": "Germany", "order_count": 7, "total_spent": 320.75
-            },
-            {
-                "user_id": "user_4", "name": "Diana Lopez", "email": "diana@ecam.be", 
-                "country": "Spain", "order_count": 2, "total_spent": 89.99
-            },
-            {
-                "user_id": "user_5", "name": "Eve Chen", "email": "eve@ecam.be", 
-                "country": "Italy", "order_count": 0, "total_spent": 0
-            }
-        ]
-        
-        # Créer quelques commandes
-        sample_orders = [
-            {"order_id": "order_1", "user_id": "user_1", "user_name": "Alice Dupont", "amount": 75.25},
-            {"order_id": "order_2", "user_id": "user_1", "user_name": "Alice Dupont", "amount": 45.00},
-            {"order_id": "order_3", "user_id": "user_2", "user_name": "Bob Martin", "amount": 30.25},
-            {"order_id": "order_4", "user_id": "user_3", "user_name": "Charlie Wilson", "amount": 120.50}
-        ]
+        sample_users = sample_data.sample_users()
+        sample_orders = sample_data.sample_orders()
         
         db.users.insert_many(sample_users)
         db.orders.insert_many(sample_orders)
+        stats_counters.set(users=len(sample_users), orders=len(sample_orders))
+        user_sampler.reset([user["user_id"] for user in sample_users])
+        analytics.reset()
+        analytics.record_users(sample_users)
         
         return jsonify({
             "message": f"Sample data loaded: {len(sample_users)} users, {len(sample_orders)} orders"
@@ -649,61 +714,73 @@ def load_sample_data():
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/random-user", methods=["POST"])
+@mongo_route()
 def add_random_user():
     """Ajoute un utilisateur aléatoire"""
     try:
-        import random
-        first_names = ["Timothé", "Samir", "Ayoub", "Abelbadi", "Haitam", "Nabil", "Edin", "Arthur"]
-        last_names = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit"]
-        countries = ["France", "Belgium", "Germany", "Spain", "Italy", "Netherlands"]
-        
-        name = f"{random.choice(first_names)} {random.choice(last_names)}"
-        user_id = f"user_{random.randint(1000, 9999)}"
-        
-        new_user = {
-            "user_id": user_id,
-            "name": name,
-            "email": f"{name.lower().replace(' ', '.')}@ecam.be",
-            "country": random.choice(countries),
-            "order_count": 0,
-            "total_spent": 0
-        }
+        new_user = sample_data.random_user()
+        name = new_user["name"]
         
         db.users.insert_one(new_user)
+        stats_counters.incr('users')
+        user_sampler.add(new_user["user_id"])
+        analytics.record_users([new_user])
         return jsonify({"message": "Random user added", "user_name": name})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/random-order", methods=["POST"])
 def add_random_order():
-    """Ajoute une commande aléatoire"""
+    """Ajoute une commande aléatoire (différée via le Redis Stream en mode stream)"""
+    if ORDER_WRITE_MODE == 'stream':
+        response = queue_random_order()
+        if response is not None:
+            return response
+    return write_random_order()
+
+def queue_random_order():
+    """Écriture différée : un XADD puis réponse 202, sans attendre MongoDB.
+    Renvoie None si Redis ne peut pas prendre la commande (repli synchrone)."""
+    if not redis_available:
+        return None
+    user_id = user_sampler.pick_id()
+    if user_id is None:
+        return None
+    new_order = sample_data.random_order({"user_id": user_id})
     try:
-        import random
-        
-        # Trouver un utilisateur aléatoire
-        users = list(db.users.find({}))
-        if not users:
+        message_id = order_stream.publish(new_order)
+    except redis.RedisError:
+        return None
+    return jsonify({
+        "message": "Random order queued",
+        "order_id": new_order["order_id"],
+        "user_id": user_id,
+        "amount": new_order["amount"],
+        "stream_id": message_id
+    }), 202
+
+@mongo_route()
+def write_random_order():
+    """Écriture synchrone : commande puis `$inc` des stats de l'utilisateur"""
+    try:
+        # Trouver un utilisateur aléatoire (O(1), sans lire toute la collection)
+        user = user_sampler.pick()
+        if user is None:
             return jsonify({"error": "No users found"}), 400
             
-        user = random.choice(users)
-        order_id = f"order_{random.randint(10000, 99999)}"
-        amount = round(random.uniform(10, 200), 2)
-        
-        new_order = {
-            "order_id": order_id,
-            "user_id": user["user_id"],
-            "user_name": user["name"],
-            "amount": amount
-        }
+        new_order = sample_data.random_order(user)
+        amount = new_order["amount"]
         
         # Ajouter la commande
         db.orders.insert_one(new_order)
+        stats_counters.incr('orders')
         
         # Mettre à jour les stats de l'utilisateur
         db.users.update_one(
             {"user_id": user["user_id"]},
-            {"$inc": {"order_count": 1, "total_spent": amount}}
+            {"$inc": {"order_count": 1, "total_spent": amount}, "$currentDate": {"updated_at": True}}
         )
+        analytics.record_orders([new_order])
         
         return jsonify({
             "message": "Random order added",
@@ -713,36 +790,155 @@ def add_random_order():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/orders/stream")
+def order_stream_status():
+    """Retard du worker write-behind (longueur, lag, pending, âge du plus ancien)"""
+    try:
+        if not redis_available:
+            return jsonify({"mode": ORDER_WRITE_MODE, "error": "Redis not available"}), 503
+        return jsonify({"mode": ORDER_WRITE_MODE, **order_stream.lag()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def analytics_response(rows):
+    """Agrégats pas encore construits : 503, la reconstruction est lancée"""
+    if rows is None:
+        response = jsonify({"status": "building", "message": "Analytics are being rebuilt"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    return jsonify(rows)
+
+@app.route("/api/analytics/countries")
+def analytics_countries():
+    """Utilisateurs, commandes et chiffre d'affaires par pays (lecture Redis, O(pays))"""
+    try:
+        if not redis_available:
+            return jsonify({"error": "Redis not available"}), 503
+        return analytics_response(analytics.countries())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/analytics/top-spenders")
+def analytics_top_spenders():
+    """Classement des clients par total dépensé (`?limit=N`, 100 max)"""
+    try:
+        if not redis_available:
+            return jsonify({"error": "Redis not available"}), 503
+        limit = parse_limit(request.args.get('limit'), default=10, maximum=MAX_TOP)
+        return analytics_response(analytics.top_spenders(limit))
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/analytics/rebuild", methods=["POST"])
+def analytics_rebuild():
+    """Reconstruction complète des agrégats depuis MongoDB, en arrière-plan"""
+    try:
+        if not redis_available:
+            return jsonify({"error": "Redis not available"}), 503
+        started = analytics.start_rebuild()
+        return jsonify({"message": "Rebuild started" if started else "Rebuild already running"}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/orders/bulk", methods=["POST"])
+@mongo_route(deadline_ms=None)
+def bulk_orders():
+    """Ingestion de commandes en masse : tableau JSON ou flux NDJSON
+
+    Chaque commande : {"user_id": ..., "amount": ..., "order_id"?, "user_name"?}.
+    `?batch_size=N` change la taille des lots (défaut BULK_BATCH_SIZE).
+    """
+    try:
+        batch_size = parse_limit(request.args.get('batch_size'), None, maximum=None, name='batch_size')
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if request.mimetype in NDJSON_MIMETYPES:
+            raw_orders = iter_ndjson(request.stream)
+        else:
+            raw_orders = request.get_json(force=True, silent=True)
+            if not isinstance(raw_orders, list):
+                return jsonify({"error": "Expected a JSON array or an NDJSON body"}), 400
+        ingestor = order_ingestor
+        if batch_size:
+            ingestor = OrderIngestor(db, batch_size=batch_size, on_applied=analytics.record_orders)
+        report = ingestor.ingest(raw_orders)
+        stats_counters.incr('orders', report.inserted)
+        # Lot en échec : rapport partiel (lots déjà insérés) avec l'erreur
+        return jsonify(report.to_dict()), 500 if report.error else 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/run-migration", methods=["POST"])
+@mongo_route()
 def run_migration():
-    """Exécute une migration de schéma simple"""
+    """Lance (ou reprend) les migrations de schéma en arrière-plan; suivi via /api/migrations"""
     try:
-        from datetime import datetime
-        
-        # Migration: Ajouter un champ de timestamp à tous les utilisateurs
-        result = db.users.update_many(
-            {"created_at": {"$exists": False}},
-            {"$set": {"created_at": datetime.utcnow(), "schema_version": 1}}
-        )
-        
+        started = migration_runner.start()
         return jsonify({
-            "message": "Migration completed",
-            "migrated_users": result.modified_count
-        })
+            "message": "Migration started" if started else "Migration already running",
+            **migration_runner.progress()
+        }), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/migrations")
+@mongo_route()
+def migrations_progress():
+    """Avancement des migrations (lots traités, débit, point de reprise)"""
+    try:
+        return jsonify(migration_runner.progress())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/migrations/pause", methods=["POST"])
+@mongo_route()
+def pause_migrations():
+    """Arrête les migrations après leur lot en cours (reprise via /api/run-migration)"""
+    try:
+        return jsonify({"message": "Pause requested", "migrations": migration_runner.request_pause()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/indexes")
+@mongo_route(deadline_ms=None)
+def indexes_status():
+    """Index déclarés, dernier passage d'ensure; ?explain=1 ajoute les plans des requêtes"""
+    try:
+        report = index_manager.report()
+        if request.args.get('explain') == '1':
+            report["explain"] = index_manager.explain()
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/indexes/ensure", methods=["POST"])
+@mongo_route(deadline_ms=None)
+def ensure_indexes():
+    """Crée les index manquants (idempotent, ne supprime jamais rien)"""
+    try:
+        return jsonify(index_manager.ensure())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/clear-data", methods=["DELETE"])
+@mongo_route(deadline_ms=None)
 def clear_data():
     """Vide toutes les données"""
     try:
         db.users.delete_many({})
         db.orders.delete_many({})
-        if redis_available:
-            redis_client.delete('hosts_data')
+        stats_counters.set(users=0, orders=0)
+        user_sampler.reset()
+        order_stream.clear()
+        analytics.reset()
+        hosts_cache.invalidate('hosts_data')
         return jsonify({"message": "All data cleared"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
\ No newline at end of file
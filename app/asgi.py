@@ -0,0 +1,783 @@
+"""Point d'entrée ASGI (mode async) : mêmes routes que app.py, drivers non bloquants.
+
+MongoDB passe par `AsyncMongoClient` (API async native de pymongo) et Redis
+par `redis.asyncio` : un pod peut garder des milliers de requêtes en vol
+pendant qu'il attend les backends, au lieu d'une à la fois avec Werkzeug.
+
+Lancement : `SERVER_MODE=async ./start.sh` (ou `uvicorn asgi:app --port 5000`).
+"""
+from contextlib import asynccontextmanager
+import functools
+import os
+import socket
+import time
+
+from pymongo import AsyncMongoClient
+import pymongo
+import redis
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from analytics import MAX_TOP, AsyncAnalytics
+from backends import AsyncBackendMonitor, health_report
+from breaker import CircuitBreaker, CircuitOpenError
+from cache import AsyncTwoTierCache, LocalCache
+from coalescing import AsyncCoalescer, query_key
+from counters import AsyncCounters
+from events import SSE_HEADERS, SSE_MIMETYPE, AsyncEventHub
+from indexes import AsyncIndexManager
+from ingest import NDJSON_MIMETYPES, AsyncOrderIngestor, aiter_list, aiter_ndjson
+import metrics
+from migrations import AsyncMigrationRunner
+from order_stream import AsyncOrderStream
+from pages import build_pages
+from pagination import (ASYNC_STREAM_CHUNKS, STREAM_BATCH_SIZE, STREAM_MIMETYPES, BadRequest, next_cursor,
+                        parse_limit, parse_list_args, strip_id)
+from rate_limit import AdmissionController, AdmissionMiddleware, AsyncRateLimiter
+import redis_pool
+from read_routing import READ_YOUR_WRITES_COOKIE, ReadRouter, ReadYourWritesMiddleware, load_route_classes
+import sample_data
+import serialization
+from serialization import CompressionMiddleware, Payload
+from sharding import AsyncShardDiagnostics
+from user_sampler import AsyncUserSampler
+
+# Configuration via variables d'environnement (mêmes que app.py)
+MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://mongo-mongos.dev.svc.cluster.local:27017/?directConnection=true')
+REDIS_HOST = os.getenv('REDIS_HOST', 'redis-service.dev')
+ENVIRONMENT = os.getenv('ENVIRONMENT', 'dev')
+HOSTS_CACHE_TTL = int(os.getenv('HOSTS_CACHE_TTL', '300'))
+L1_CACHE_TTL = int(os.getenv('L1_CACHE_TTL', '30'))
+L1_CACHE_MAXSIZE = int(os.getenv('L1_CACHE_MAXSIZE', '256'))
+HOSTS_STALE_TTL = int(os.getenv('HOSTS_STALE_TTL', '30'))
+CACHE_EARLY_EXPIRATION_BETA = float(os.getenv('CACHE_EARLY_EXPIRATION_BETA', '0'))
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '100'))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', '1'))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', '30'))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', '1'))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', '1'))
+STATS_RECONCILE_INTERVAL = int(os.getenv('STATS_RECONCILE_INTERVAL', '60'))
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '1000'))
+BACKEND_CHECK_INTERVAL = float(os.getenv('BACKEND_CHECK_INTERVAL', '5'))
+BACKEND_MAX_BACKOFF = float(os.getenv('BACKEND_MAX_BACKOFF', '30'))
+PAGE_CACHE_MAX_AGE = int(os.getenv('PAGE_CACHE_MAX_AGE', '60'))
+MONGO_DEADLINE_MS = int(os.getenv('MONGO_DEADLINE_MS', '2000'))
+MONGO_SLOW_CALL_MS = int(os.getenv('MONGO_SLOW_CALL_MS', '1000'))
+REDIS_SLOW_CALL_MS = int(os.getenv('REDIS_SLOW_CALL_MS', '250'))
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '10'))
+HOSTS_LAST_GOOD_TTL = int(os.getenv('HOSTS_LAST_GOOD_TTL', '86400'))
+CACHE_PAYLOAD_ENCODING = os.getenv('CACHE_PAYLOAD_ENCODING', 'gzip')
+ORDER_WRITE_MODE = os.getenv('ORDER_WRITE_MODE', 'sync')
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '500'))
+MIGRATION_MAX_DOCS_PER_SEC = int(os.getenv('MIGRATION_MAX_DOCS_PER_SEC', '2000'))
+MIGRATION_LEASE_SECONDS = int(os.getenv('MIGRATION_LEASE_SECONDS', '60'))
+REQUEST_COALESCING = os.getenv('REQUEST_COALESCING', '1') == '1'
+COALESCE_WINDOW_MS = float(os.getenv('COALESCE_WINDOW_MS', '0'))
+SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', '1000'))
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))
+ENSURE_INDEXES = os.getenv('ENSURE_INDEXES', '1') == '1'
+SHARD_DIAGNOSTICS_MAX_AGE = float(os.getenv('SHARD_DIAGNOSTICS_MAX_AGE', '60'))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '256'))
+ADMISSION_LATENCY_MS = float(os.getenv('ADMISSION_LATENCY_MS', '500'))
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+ANALYTICS_REBUILD_INTERVAL = int(os.getenv('ANALYTICS_REBUILD_INTERVAL', '3600'))
+MONGO_ROUTE_CLASSES = load_route_classes(MONGO_MAX_POOL_SIZE, MONGO_DEADLINE_MS)
+
+def make_mongo_client(uri, route_class):
+    return AsyncMongoClient(
+        uri,
+        serverSelectionTimeoutMS=route_class.server_selection_timeout_ms,
+        maxPoolSize=route_class.pool_size,
+        maxIdleTimeMS=60000,
+        event_listeners=metrics.mongo_listeners()
+    )
+
+
+client = make_mongo_client(MONGODB_URI, MONGO_ROUTE_CLASSES['primary'])
+db = client["demoDB"]
+read_router = ReadRouter(MONGO_ROUTE_CLASSES, MONGODB_URI, make_mongo_client, clients={'primary': client})
+# Pas de cache côté client RESP3 ici : redis.asyncio ne le gère pas
+redis_client = redis_pool.make_async_redis(
+    metrics.InstrumentedAsyncRedis, REDIS_HOST, max_connections=REDIS_MAX_CONNECTIONS,
+    socket_timeout=REDIS_SOCKET_TIMEOUT, connect_timeout=REDIS_CONNECT_TIMEOUT,
+    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL, pool_timeout=REDIS_POOL_TIMEOUT,
+)
+
+mongo_breaker = CircuitBreaker('mongodb', failure_rate=BREAKER_FAILURE_RATE,
+                               slow_call_seconds=MONGO_SLOW_CALL_MS / 1000, open_seconds=BREAKER_OPEN_SECONDS)
+redis_breaker = CircuitBreaker('redis', failure_rate=BREAKER_FAILURE_RATE,
+                               slow_call_seconds=REDIS_SLOW_CALL_MS / 1000, open_seconds=BREAKER_OPEN_SECONDS)
+redis_client.breaker = redis_breaker
+
+mongodb_status = "⏳ MongoDB en cours de connexion"
+redis_status = "⏳ Redis en cours de connexion"
+redis_available = False
+# Redis est branché par le moniteur dès qu'il répond (voir on_redis_change)
+hosts_cache = AsyncTwoTierCache(
+    None,
+    LocalCache(maxsize=L1_CACHE_MAXSIZE, ttl=L1_CACHE_TTL),
+    stale_ttl=HOSTS_STALE_TTL,
+    early_expiration_beta=CACHE_EARLY_EXPIRATION_BETA,
+    last_good_ttl=HOSTS_LAST_GOOD_TTL,
+    binary=True,
+)
+stats_counters = AsyncCounters(None, db, STATS_RECONCILE_INTERVAL)
+user_sampler = AsyncUserSampler(None, db)
+analytics = AsyncAnalytics(None, read_router.db('analytics'), ANALYTICS_REBUILD_INTERVAL)
+order_stream = AsyncOrderStream(redis_client)
+event_hub = AsyncEventHub(None, max_clients=SSE_MAX_CLIENTS, heartbeat=SSE_HEARTBEAT)
+migration_runner = AsyncMigrationRunner(
+    db, f"{socket.gethostname()}-{os.getpid()}",
+    batch_size=MIGRATION_BATCH_SIZE,
+    max_docs_per_sec=MIGRATION_MAX_DOCS_PER_SEC,
+    lease_seconds=MIGRATION_LEASE_SECONDS,
+    breaker=mongo_breaker,
+)
+read_coalescer = AsyncCoalescer(COALESCE_WINDOW_MS, REQUEST_COALESCING, observer=metrics.observe_coalescing)
+index_manager = AsyncIndexManager(db)
+shard_diagnostics = AsyncShardDiagnostics(client, max_age=SHARD_DIAGNOSTICS_MAX_AGE)
+rate_limiter = AsyncRateLimiter(None)
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_LATENCY_MS)
+
+
+class FlaskJSONResponse(JSONResponse):
+    """JSON sérialisé comme `jsonify` dans app.py (serialization.dumps)"""
+
+    def render(self, content):
+        return serialization.dumps(content)
+
+
+async def probe_mongodb():
+    await client.admin.command('ping')
+    return "Sharding" if await client.is_mongos else "Réplication"
+
+
+async def on_mongodb_change(available):
+    global mongodb_status
+    if available:
+        mongodb_status = f"✅ MongoDB Connecté ({mongodb_monitor.detail})"
+        await migration_runner.resume_interrupted()
+        if ENSURE_INDEXES:
+            index_manager.start()
+    else:
+        mongodb_status = f"❌ MongoDB Erreur: {mongodb_monitor.last_error}"
+
+
+async def probe_redis():
+    await redis_client.ping()
+
+
+async def on_redis_change(available):
+    """Branche ou débranche Redis de tout ce qui l'utilise, sans redémarrer le pod"""
+    global redis_status, redis_available
+    target = redis_client if available else None
+    hosts_cache.redis = stats_counters.redis = user_sampler.redis = analytics.redis = event_hub.redis = target
+    rate_limiter.redis = target
+    if available:
+        hosts_cache.l1.clear()
+        await hosts_cache.start_listener()
+        await event_hub.start_listener()
+        stats_counters.start_reconciler()
+        analytics.start_refresher()
+    else:
+        await hosts_cache.stop_listener()
+        await event_hub.stop_listener()
+    redis_available = available
+    redis_status = "✅ Redis Connecté" if available else "❌ Redis Non Connecté"
+
+
+mongodb_monitor = AsyncBackendMonitor('mongodb', probe_mongodb, on_mongodb_change, BACKEND_CHECK_INTERVAL,
+                                      max_backoff=BACKEND_MAX_BACKOFF)
+redis_monitor = AsyncBackendMonitor('redis', probe_redis, on_redis_change, BACKEND_CHECK_INTERVAL,
+                                    max_backoff=BACKEND_MAX_BACKOFF)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Connexions établies en arrière-plan : le serveur accepte les requêtes tout de suite
+    mongodb_monitor.start()
+    redis_monitor.start()
+    yield
+    mongodb_monitor.stop()
+    redis_monitor.stop()
+    migration_runner.stop()
+    stats_counters.stop_reconciler()
+    analytics.stop_refresher()
+    await hosts_cache.stop_listener()
+    await event_hub.stop_listener()
+    await redis_client.aclose(close_connection_pool=True)
+    for mongo_client in read_router.clients():
+        await mongo_client.close()
+
+
+pages = build_pages(ENVIRONMENT, PAGE_CACHE_MAX_AGE)
+
+
+def serve_page(request, page):
+    status, body, headers = page.respond(request.headers.get('if-none-match'), request.headers.get('accept-encoding'))
+    return HTMLResponse(body, status_code=status, headers=headers)
+
+
+async def home(request):
+    return serve_page(request, pages['home'])
+
+
+async def page_info(request):
+    """Parties dynamiques des pages (pod et état des connexions)"""
+    return FlaskJSONResponse({
+        "hostname": socket.gethostname(),
+        "environment": ENVIRONMENT,
+        "mongodb_status": mongodb_status,
+        "redis_status": redis_status
+    }, headers={'Cache-Control': 'no-store'})
+
+
+async def load_hosts_payload():
+    """Lit les hosts dans MongoDB et renvoie le JSON compressé prêt à être servi"""
+    hosts = await read_router.db('dashboard').hosts.find({}, {"_id": 0}).to_list(None)
+    formatted_hosts = [{"pod": h.get('_id', 'Unknown'), "info": h.get('info', 'No info')} for h in hosts]
+    return Payload.encode(formatted_hosts, CACHE_PAYLOAD_ENCODING).to_bytes()
+
+
+ERROR_HOSTS_PAYLOAD = Payload(serialization.dumps([{"pod": "Error", "info": "Cannot load data"}]), 'identity').to_bytes()
+
+
+async def load_hosts_guarded():
+    with pymongo.timeout(read_router.timeout('dashboard')):
+        return await mongo_breaker.acall(load_hosts_payload)
+
+
+def read_route(request, route_class):
+    """Classe effective : le primaire juste après une écriture du client"""
+    return 'primary' if READ_YOUR_WRITES_COOKIE in request.cookies else route_class
+
+
+def read_db(request, route_class):
+    """Base routée pour la classe (voir read_route)"""
+    return read_router.db(read_route(request, route_class))
+
+
+def circuit_open_response(error):
+    return FlaskJSONResponse({"error": str(error)}, status_code=503,
+                             headers={'Retry-After': str(max(1, round(error.retry_after)))})
+
+
+def mongo_route(deadline_ms=MONGO_DEADLINE_MS):
+    """Route dépendante de MongoDB : disjoncteur + budget de latence (comme app.py)"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request):
+            if not mongo_breaker.allow():
+                return circuit_open_response(CircuitOpenError('mongodb', mongo_breaker.retry_after()))
+            started = time.perf_counter()
+            try:
+                with pymongo.timeout(deadline_ms / 1000 if deadline_ms else None):
+                    response = await view(request)
+            except Exception:
+                mongo_breaker.record(False, time.perf_counter() - started)
+                raise
+            # Sans budget (imports, migrations), un appel long n'est pas un appel lent
+            elapsed = time.perf_counter() - started if deadline_ms else 0.0
+            mongo_breaker.record(response.status_code < 500, elapsed)
+            if deadline_ms:
+                admission.observe(elapsed)
+            return response
+        return wrapper
+    return decorator
+
+
+async def get_hosts(request):
+    start_time = time.time()
+    try:
+        response_data, cache_tier = await hosts_cache.get_or_compute(
+            'hosts_data', load_hosts_guarded, HOSTS_CACHE_TTL
+        )
+        metrics.observe_cache('hosts_data', cache_tier)
+        x_cache = f"{cache_tier}-HIT" if cache_tier else 'MISS'
+    except Exception as e:
+        metrics.observe_cache('hosts_data', None, error=True)
+        # Dernière valeur connue plutôt qu'une seconde requête MongoDB
+        response_data, x_cache = await hosts_cache.last_good('hosts_data'), 'LKG-HIT'
+        if response_data is None and isinstance(e, redis.RedisError):
+            try:
+                response_data, x_cache = await load_hosts_guarded(), 'MISS'
+            except Exception:
+                pass
+        if response_data is None:
+            response_data, x_cache = ERROR_HOSTS_PAYLOAD, 'ERROR'
+    # Envoyé tel qu'il est stocké dans Redis (compressé) si le client l'accepte
+    body, headers = Payload.from_bytes(response_data).respond(request.headers.get('accept-encoding'))
+    return Response(body, media_type='application/json', headers={
+        **headers,
+        'X-Cache': x_cache,
+        'X-Response-Time': f"{(time.time() - start_time)*1000:.2f}ms",
+    })
+
+
+async def change_events(request):
+    """Flux SSE des changements de hosts/users/orders (résumés par lot du watcher)"""
+    client = event_hub.subscribe() if redis_available else None
+    if client is None:
+        return FlaskJSONResponse({"error": "Event stream unavailable"}, status_code=503,
+                                 headers={'Retry-After': '30'})
+    return StreamingResponse(event_hub.stream(client), media_type=SSE_MIMETYPE, headers=SSE_HEADERS,
+                             background=BackgroundTask(event_hub.unsubscribe, client))
+
+
+async def healthz(request):
+    """Liveness : le process répond et ses moniteurs de connexion tournent"""
+    alive = mongodb_monitor.alive() and redis_monitor.alive()
+    return FlaskJSONResponse({"alive": alive}, status_code=200 if alive else 503)
+
+
+async def readyz(request):
+    """Readiness : MongoDB joignable (Redis est optionnel, l'app se dégrade sans)"""
+    ready, report = health_report([mongodb_monitor, redis_monitor])
+    return FlaskJSONResponse(report, status_code=200 if ready else 503)
+
+
+async def prometheus_metrics(request):
+    """Métriques Prometheus (tous les workers gunicorn agrégés)"""
+    if redis_available:
+        try:
+            metrics.update_order_stream(await order_stream.lag())
+        except redis.RedisError:
+            pass
+    body, content_type = metrics.render()
+    return Response(body, headers={'Content-Type': content_type})
+
+
+async def clear_cache(request):
+    """Endpoint pour vider le cache (pour les tests)"""
+    try:
+        await hosts_cache.invalidate('hosts_data')
+        if redis_available:
+            return PlainTextResponse("✅ Cache cleared")
+        return PlainTextResponse("❌ Redis not available")
+    except Exception:
+        return PlainTextResponse("❌ Error clearing cache")
+
+
+async def cache_status(request):
+    """Endpoint pour voir le statut du cache"""
+    try:
+        cache_entries, ttl = 0, -1
+        if redis_available:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.dbsize()
+            pipe.ttl('hosts_data')
+            cache_entries, ttl = await pipe.execute()
+        return FlaskJSONResponse({
+            "redis_available": redis_available,
+            "cache_entries": cache_entries,
+            "cache_ttl": max(ttl, -1),
+            "redis_pool": {"shared": redis_pool.describe(redis_client)},
+            "hosts_cache": hosts_cache.stats(),
+            "stats_counters": stats_counters.stats(),
+            "analytics": analytics.stats(),
+            "read_routing": read_router.describe(),
+            "request_coalescing": read_coalescer.stats(),
+            "events": event_hub.stats(),
+            "admission": admission.stats(),
+            "rate_limits": rate_limiter.stats(),
+            "circuit_breakers": {"mongodb": mongo_breaker.stats(), "redis": redis_breaker.stats()}
+        })
+    except Exception:
+        return FlaskJSONResponse({
+            "redis_available": False,
+            "circuit_breakers": {"mongodb": mongo_breaker.stats(), "redis": redis_breaker.stats()}
+        })
+
+
+async def sharding_info(request):
+    """Endpoint pour voir les infos de sharding; ?explain=1 ajoute le ciblage des requêtes (?refresh=1 le remesure)"""
+    if ENVIRONMENT != 'dev':
+        return FlaskJSONResponse({
+            "sharding_enabled": False,
+            "mode": "replication",
+            "environment": ENVIRONMENT,
+            "connected_to": "mongod"
+        })
+    try:
+        shards_count = await client["config"].shards.count_documents({})
+        info = {
+            "sharding_enabled": True,
+            "shards": shards_count,
+            "mode": "sharding",
+            "environment": ENVIRONMENT,
+            "connected_to": "mongos"
+        }
+        # Répartition, balancer et (?explain=1) ciblage des requêtes
+        info.update(await shard_diagnostics.report(explain=request.query_params.get('explain') == '1',
+                                                   refresh=request.query_params.get('refresh') == '1'))
+        return FlaskJSONResponse(info)
+    except Exception:
+        return FlaskJSONResponse({
+            "sharding_enabled": False,
+            "mode": "replication",
+            "environment": ENVIRONMENT,
+            "connected_to": "mongod",
+            "info": "Connecté à un serveur MongoDB standard"
+        })
+
+
+async def user_dashboard(request):
+    return serve_page(request, pages['dashboard'])
+
+
+async def api_stats(request):
+    """Retourne les statistiques globales (compteurs Redis, `?mode=estimated` ou `?exact=1`)"""
+    try:
+        mode = 'exact' if request.query_params.get('exact') == '1' else request.query_params.get('mode', 'counter')
+        counts = None
+        stats_db = read_db(request, 'dashboard')
+        route = read_route(request, 'dashboard')
+        with pymongo.timeout(read_router.timeout('dashboard')):
+            if mode == 'exact':
+                counts = await read_coalescer.run(query_key(route, 'stats', extra='exact'),
+                                                  lambda: mongo_breaker.acall(stats_counters.exact, stats_db),
+                                                  'stats_exact')
+            elif mode == 'counter':
+                try:
+                    counts = await stats_counters.read()
+                except redis.RedisError:
+                    # Redis en panne ou circuit ouvert : comptes estimés ci-dessous
+                    pass
+                else:
+                    if counts is None and redis_available:
+                        counts = await mongo_breaker.acall(stats_counters.reconcile)
+                        mode = 'exact'
+            if counts is None:
+                counts = await read_coalescer.run(query_key(route, 'stats', extra='estimated'),
+                                                  lambda: mongo_breaker.acall(stats_counters.estimated, stats_db),
+                                                  'stats_estimated')
+                mode = 'estimated'
+        return FlaskJSONResponse({
+            "total_users": counts["users"],
+            "total_orders": counts["orders"],
+            "source": mode
+        })
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+USERS_SORT = [("_id", -1)]
+
+
+def users_cursor(users_db, query, projection, limit):
+    cursor = users_db.users.find(query, projection, batch_size=STREAM_BATCH_SIZE).sort(USERS_SORT)
+    return cursor.limit(limit) if limit else cursor
+
+
+async def users_page(users_db, query, projection, limit):
+    """Page de /api/users (sans `_id`) et curseur suivant; partagée par les requêtes identiques"""
+    users = await users_cursor(users_db, query, projection, limit).to_list(None)
+    cursor_value = next_cursor(users, limit)
+    return [strip_id(user) for user in users], cursor_value
+
+
+@mongo_route(read_router.deadline_ms('list'))
+async def api_users(request):
+    """Retourne la liste des utilisateurs (mêmes paramètres que app.py)"""
+    try:
+        query, projection, limit, fmt = parse_list_args(request.query_params)
+    except BadRequest as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=400)
+    try:
+        if fmt != 'page':
+            cursor = users_cursor(read_db(request, 'list'), query, projection, limit)
+            return StreamingResponse(ASYNC_STREAM_CHUNKS[fmt](cursor, serialization.dumps_text),
+                                     media_type=STREAM_MIMETYPES[fmt])
+        users_db = read_db(request, 'list')
+        users, cursor_value = await read_coalescer.run(
+            query_key(read_route(request, 'list'), 'users', query, projection, USERS_SORT, limit),
+            lambda: users_page(users_db, query, projection, limit), 'users_page')
+        if 'limit' in request.query_params or 'after' in request.query_params:
+            return FlaskJSONResponse({"users": users, "next_cursor": cursor_value})
+        headers = {'X-Next-Cursor': cursor_value} if cursor_value else None
+        return FlaskJSONResponse(users, headers=headers)
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+@mongo_route()
+async def load_sample_data(request):
+    """Charge des données d'exemple simples"""
+    try:
+        await db.users.delete_many({})
+        await db.orders.delete_many({})
+        sample_users = sample_data.sample_users()
+        sample_orders = sample_data.sample_orders()
+        await db.users.insert_many(sample_users)
+        await db.orders.insert_many(sample_orders)
+        await stats_counters.set(users=len(sample_users), orders=len(sample_orders))
+        await user_sampler.reset([user["user_id"] for user in sample_users])
+        await analytics.reset()
+        await analytics.record_users(sample_users)
+        return FlaskJSONResponse({
+            "message": f"Sample data loaded: {len(sample_users)} users, {len(sample_orders)} orders"
+        })
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+@mongo_route()
+async def add_random_user(request):
+    """Ajoute un utilisateur aléatoire"""
+    try:
+        new_user = sample_data.random_user()
+        await db.users.insert_one(new_user)
+        await stats_counters.incr('users')
+        await user_sampler.add(new_user["user_id"])
+        await analytics.record_users([new_user])
+        return FlaskJSONResponse({"message": "Random user added", "user_name": new_user["name"]})
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+async def add_random_order(request):
+    """Ajoute une commande aléatoire (différée via le Redis Stream en mode stream)"""
+    if ORDER_WRITE_MODE == 'stream':
+        response = await queue_random_order()
+        if response is not None:
+            return response
+    return await write_random_order(request)
+
+
+async def queue_random_order():
+    """Écriture différée : un XADD puis réponse 202 (None = repli synchrone)"""
+    if not redis_available:
+        return None
+    user_id = await user_sampler.pick_id()
+    if user_id is None:
+        return None
+    new_order = sample_data.random_order({"user_id": user_id})
+    try:
+        message_id = await order_stream.publish(new_order)
+    except redis.RedisError:
+        return None
+    return FlaskJSONResponse({
+        "message": "Random order queued",
+        "order_id": new_order["order_id"],
+        "user_id": user_id,
+        "amount": new_order["amount"],
+        "stream_id": message_id
+    }, status_code=202)
+
+
+@mongo_route()
+async def write_random_order(request):
+    """Écriture synchrone : commande puis `$inc` des stats de l'utilisateur"""
+    try:
+        user = await user_sampler.pick()
+        if user is None:
+            return FlaskJSONResponse({"error": "No users found"}, status_code=400)
+
+        new_order = sample_data.random_order(user)
+        await db.orders.insert_one(new_order)
+        await stats_counters.incr('orders')
+        await db.users.update_one(
+            {"user_id": user["user_id"]},
+            {"$inc": {"order_count": 1, "total_spent": new_order["amount"]}, "$currentDate": {"updated_at": True}}
+        )
+        await analytics.record_orders([new_order])
+        return FlaskJSONResponse({
+            "message": "Random order added",
+            "user_name": user["name"],
+            "amount": new_order["amount"]
+        })
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+async def order_stream_status(request):
+    """Retard du worker write-behind (longueur, lag, pending, âge du plus ancien)"""
+    try:
+        if not redis_available:
+            return FlaskJSONResponse({"mode": ORDER_WRITE_MODE, "error": "Redis not available"}, status_code=503)
+        return FlaskJSONResponse({"mode": ORDER_WRITE_MODE, **await order_stream.lag()})
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+def analytics_response(rows):
+    """Agrégats pas encore construits : 503, la reconstruction est lancée"""
+    if rows is None:
+        return FlaskJSONResponse({"status": "building", "message": "Analytics are being rebuilt"},
+                                 status_code=503, headers={'Retry-After': '5'})
+    return FlaskJSONResponse(rows)
+
+
+async def analytics_countries(request):
+    """Utilisateurs, commandes et chiffre d'affaires par pays (lecture Redis, O(pays))"""
+    try:
+        if not redis_available:
+            return FlaskJSONResponse({"error": "Redis not available"}, status_code=503)
+        return analytics_response(await analytics.countries())
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+async def analytics_top_spenders(request):
+    """Classement des clients par total dépensé (`?limit=N`, 100 max)"""
+    try:
+        if not redis_available:
+            return FlaskJSONResponse({"error": "Redis not available"}, status_code=503)
+        limit = parse_limit(request.query_params.get('limit'), default=10, maximum=MAX_TOP)
+        return analytics_response(await analytics.top_spenders(limit))
+    except BadRequest as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+async def analytics_rebuild(request):
+    """Reconstruction complète des agrégats depuis MongoDB, en arrière-plan"""
+    try:
+        if not redis_available:
+            return FlaskJSONResponse({"error": "Redis not available"}, status_code=503)
+        started = await analytics.start_rebuild()
+        return FlaskJSONResponse({"message": "Rebuild started" if started else "Rebuild already running"},
+                                 status_code=202)
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+@mongo_route(deadline_ms=None)
+async def bulk_orders(request):
+    """Ingestion de commandes en masse : tableau JSON ou flux NDJSON"""
+    try:
+        batch_size = parse_limit(request.query_params.get('batch_size'), BULK_BATCH_SIZE, maximum=None,
+                                 name='batch_size')
+    except BadRequest as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=400)
+    try:
+        mimetype = request.headers.get('content-type', '').split(';')[0].strip()
+        if mimetype in NDJSON_MIMETYPES:
+            raw_orders = aiter_ndjson(request.stream())
+        else:
+            try:
+                body = await request.json()
+            except ValueError:
+                body = None
+            if not isinstance(body, list):
+                return FlaskJSONResponse({"error": "Expected a JSON array or an NDJSON body"}, status_code=400)
+            raw_orders = aiter_list(body)
+        report = await AsyncOrderIngestor(db, batch_size=batch_size,
+                                          on_applied=analytics.record_orders).ingest(raw_orders)
+        await stats_counters.incr('orders', report.inserted)
+        return FlaskJSONResponse(report.to_dict(), status_code=500 if report.error else 200)
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+@mongo_route()
+async def run_migration(request):
+    """Lance (ou reprend) les migrations de schéma en arrière-plan; suivi via /api/migrations"""
+    try:
+        started = migration_runner.start()
+        return FlaskJSONResponse({
+            "message": "Migration started" if started else "Migration already running",
+            **await migration_runner.progress()
+        }, status_code=202)
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+@mongo_route()
+async def migrations_progress(request):
+    """Avancement des migrations (lots traités, débit, point de reprise)"""
+    try:
+        return FlaskJSONResponse(await migration_runner.progress())
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+@mongo_route()
+async def pause_migrations(request):
+    """Arrête les migrations après leur lot en cours (reprise via /api/run-migration)"""
+    try:
+        return FlaskJSONResponse({"message": "Pause requested", "migrations": await migration_runner.request_pause()})
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+@mongo_route(deadline_ms=None)
+async def indexes_status(request):
+    """Index déclarés, dernier passage d'ensure; ?explain=1 ajoute les plans des requêtes"""
+    try:
+        report = index_manager.report()
+        if request.query_params.get('explain') == '1':
+            report["explain"] = await index_manager.explain()
+        return FlaskJSONResponse(report)
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+@mongo_route(deadline_ms=None)
+async def ensure_indexes(request):
+    """Crée les index manquants (idempotent, ne supprime jamais rien)"""
+    try:
+        return FlaskJSONResponse(await index_manager.ensure())
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+@mongo_route(deadline_ms=None)
+async def clear_data(request):
+    """Vide toutes les données"""
+    try:
+        await db.users.delete_many({})
+        await db.orders.delete_many({})
+        await stats_counters.set(users=0, orders=0)
+        await user_sampler.reset()
+        await order_stream.clear()
+        await analytics.reset()
+        await hosts_cache.invalidate('hosts_data')
+        return FlaskJSONResponse({"message": "All data cleared"})
+    except Exception as e:
+        return FlaskJSONResponse({"error": str(e)}, status_code=500)
+
+
+routes = [
+    Route("/", home),
+    Route("/hosts", get_hosts),
+    Route("/cache/clear", clear_cache),
+    Route("/cache/status", cache_status),
+    Route("/api/events", change_events),
+    Route("/healthz", healthz),
+    Route("/readyz", readyz),
+    Route("/metrics", prometheus_metrics),
+    Route("/sharding-info", sharding_info),
+    Route("/user-dashboard", user_dashboard),
+    Route("/api/stats", api_stats),
+    Route("/api/page-info", page_info),
+    Route("/api/users", api_users),
+    Route("/api/load-sample-data", load_sample_data, methods=["POST"]),
+    Route("/api/random-user", add_random_user, methods=["POST"]),
+    Route("/api/random-order", add_random_order, methods=["POST"]),
+    Route("/api/orders/stream", order_stream_status),
+    Route("/api/orders/bulk", bulk_orders, methods=["POST"]),
+    Route("/api/analytics/countries", analytics_countries),
+    Route("/api/analytics/top-spenders", analytics_top_spenders),
+    Route("/api/analytics/rebuild", analytics_rebuild, methods=["POST"]),
+    Route("/api/run-migration", run_migration, methods=["POST"]),
+    Route("/api/migrations", migrations_progress),
+    Route("/api/migrations/pause", pause_migrations, methods=["POST"]),
+    Route("/api/indexes", indexes_status),
+    Route("/api/indexes/ensure", ensure_indexes, methods=["POST"]),
+    Route("/api/clear-data", clear_data, methods=["DELETE"]),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ReadYourWritesMiddleware, seconds=read_router.read_your_writes_seconds())
+app.add_middleware(AdmissionMiddleware, admission=admission, limiter=rate_limiter,
+                   observer=metrics.observe_rejection, trusted_hops=TRUSTED_PROXY_HOPS)
+app.add_middleware(metrics.ASGIMetricsMiddleware, redis_client=redis_client)
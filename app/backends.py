@@ -0,0 +1,165 @@
+"""Connexions MongoDB/Redis établies et surveillées en arrière-plan.
+
+Les clients pymongo/redis-py se créent sans contacter le serveur : l'import de
+l'app ne bloque donc plus sur un `ping`. Un `BackendMonitor` par backend
+sonde la connexion dans son propre thread (ou tâche asyncio) :
+- tant que le backend ne répond pas, nouvelle tentative avec backoff
+  exponentiel (plafonné à `max_backoff`, avec jitter) ;
+- une fois connecté, vérification toutes les `check_interval` secondes ;
+- chaque changement d'état appelle `on_change(available)`, qui (ré)active ou
+  coupe ce qui dépend du backend (cache Redis, compteurs...).
+
+`/healthz` (liveness) vérifie que les moniteurs tournent, `/readyz`
+(readiness) reflète l'état réel des backends.
+"""
+import asyncio
+import random
+import threading
+import time
+
+# Référence du démarrage du process pour mesurer le cold start
+PROCESS_STARTED = time.monotonic()
+
+
+def backoff_delay(failures, initial=0.5, maximum=30.0):
+    """Délai avant la prochaine tentative après `failures` échecs consécutifs"""
+    delay = min(maximum, initial * 2 ** max(0, failures - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class BackendMonitor:
+    """Sonde un backend en arrière-plan et suit son état.
+
+    `probe()` renvoie un détail (ex. "Sharding") ou lève une exception.
+    `available` vaut None tant que la première sonde n'a pas abouti.
+    """
+
+    def __init__(self, name, probe, on_change=None, check_interval=5.0,
+                 initial_backoff=0.5, max_backoff=30.0):
+        self.name = name
+        self.probe = probe
+        self.on_change = on_change
+        self.check_interval = check_interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.available = None
+        self.detail = None
+        self.last_error = None
+        self.failures = 0
+        self.reconnects = 0
+        self.last_check = None
+        self.ready_after = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _update(self, available, detail=None, error=None):
+        """Met à jour l'état; renvoie `(changé, délai avant la prochaine sonde)`"""
+        changed = available != self.available
+        if available:
+            if self.available is False and self.ready_after is not None:
+                self.reconnects += 1
+            if self.ready_after is None:
+                self.ready_after = time.monotonic() - PROCESS_STARTED
+            self.failures = 0
+            self.detail = detail
+            self.last_error = None
+        else:
+            self.failures += 1
+            self.last_error = str(error)
+        self.available = available
+        self.last_check = time.time()
+        if available:
+            return changed, self.check_interval
+        return changed, backoff_delay(self.failures, self.initial_backoff, self.max_backoff)
+
+    def _record(self, available, detail=None, error=None):
+        changed, delay = self._update(available, detail, error)
+        if changed and self.on_change is not None:
+            try:
+                self.on_change(available)
+            except Exception:
+                pass
+        return delay
+
+    def check(self):
+        """Une sonde; renvoie le délai avant la suivante"""
+        try:
+            detail = self.probe()
+        except Exception as e:
+            return self._record(False, error=e)
+        return self._record(True, detail)
+
+    def _run(self):
+        delay = 0
+        while not self._stop.wait(delay):
+            delay = self.check()
+
+    def start(self):
+        """Lance la surveillance (idempotent); ne bloque pas"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "detail": self.detail,
+            "last_error": self.last_error,
+            "failures": self.failures,
+            "reconnects": self.reconnects,
+            "last_check": self.last_check,
+            "ready_after_ms": round(self.ready_after * 1000, 1) if self.ready_after is not None else None,
+        }
+
+
+class AsyncBackendMonitor(BackendMonitor):
+    """Variante de `BackendMonitor` pour le mode ASGI (`probe` et `on_change` async)"""
+
+    async def _record_async(self, available, detail=None, error=None):
+        changed, delay = self._update(available, detail, error)
+        if changed and self.on_change is not None:
+            try:
+                await self.on_change(available)
+            except Exception:
+                pass
+        return delay
+
+    async def check(self):
+        try:
+            detail = await self.probe()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return await self._record_async(False, error=e)
+        return await self._record_async(True, detail)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(await self.check())
+
+    def start(self):
+        if self._thread is None:
+            self._thread = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.cancel()
+
+    def alive(self):
+        return self._thread is not None and not self._thread.done()
+
+
+def health_report(monitors, required=('mongodb',)):
+    """Corps de `/readyz` : prêt si tous les backends requis sont disponibles"""
+    ready = all(monitor.available for monitor in monitors if monitor.name in required)
+    return ready, {
+        "ready": ready,
+        "uptime_s": round(time.monotonic() - PROCESS_STARTED, 1),
+        **{monitor.name: monitor.stats() for monitor in monitors},
+    }
@@ -0,0 +1,144 @@
+"""Disjoncteurs (circuit breakers) par backend, partagés par toutes les routes.
+
+Chaque appel MongoDB/Redis passé par un `CircuitBreaker` est enregistré dans
+une fenêtre glissante des `window` derniers appels (succès/échec, durée) :
+- fermé : les appels passent ; le circuit s'ouvre si, sur au moins
+  `min_calls` appels, le taux d'échec ou le taux d'appels lents (plus de
+  `slow_call_seconds`) dépasse son seuil ;
+- ouvert : échec immédiat (`CircuitOpenError`) pendant `open_seconds`, sans
+  solliciter un backend déjà en difficulté ;
+- semi-ouvert : `half_open_calls` appels d'essai ; s'ils réussissent le
+  circuit se referme, sinon il se rouvre.
+"""
+import collections
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Appel refusé sans contacter le backend (circuit ouvert)"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Disjoncteur à fenêtre glissante sur le taux d'échec et de lenteur"""
+
+    def __init__(self, name, window=50, min_calls=10, failure_rate=0.5,
+                 slow_call_seconds=1.0, slow_call_rate=0.8, open_seconds=10.0, half_open_calls=3):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._calls = collections.deque(maxlen=window)
+        self._trial_calls = 0
+        self._trial_successes = 0
+        self._lock = threading.Lock()
+
+    def _rates(self):
+        total = len(self._calls)
+        if not total:
+            return 0.0, 0.0
+        failures = sum(1 for ok, _ in self._calls if not ok)
+        slow = sum(1 for _, duration in self._calls if duration >= self.slow_call_seconds)
+        return failures / total, slow / total
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def retry_after(self):
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def allow(self):
+        """True si un appel peut partir; à faire suivre d'un `record`"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._trial_calls = 0
+                self._trial_successes = 0
+            if self.state == HALF_OPEN:
+                if self._trial_calls >= self.half_open_calls:
+                    self.rejected += 1
+                    return False
+                self._trial_calls += 1
+            return True
+
+    def record(self, ok, duration):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if not ok:
+                    self._open()
+                    return
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_calls:
+                    self.state = CLOSED
+                    self._calls.clear()
+                return
+            self._calls.append((ok, duration))
+            if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                failure_rate, slow_rate = self._rates()
+                if failure_rate >= self.failure_rate or slow_rate >= self.slow_call_rate:
+                    self._open()
+
+    def check(self):
+        """Lève `CircuitOpenError` si le circuit refuse l'appel"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def call(self, fn, *args, **kwargs):
+        """Exécute `fn` sous le disjoncteur (échec immédiat si ouvert)"""
+        self.check()
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(False, time.perf_counter() - started)
+            raise
+        self.record(True, time.perf_counter() - started)
+        return result
+
+    async def acall(self, fn, *args, **kwargs):
+        """Comme `call` pour une coroutine"""
+        self.check()
+        started = time.perf_counter()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception:
+            self.record(False, time.perf_counter() - started)
+            raise
+        self.record(True, time.perf_counter() - started)
+        return result
+
+    def stats(self):
+        with self._lock:
+            failure_rate, slow_rate = self._rates()
+            return {
+                "state": self.state,
+                "calls_in_window": len(self._calls),
+                "failure_rate": round(failure_rate, 3),
+                "slow_call_rate": round(slow_rate, 3),
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "retry_after_s": round(self.retry_after(), 1),
+            }
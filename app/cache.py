@@ -0,0 +1,596 @@
+"""Cache à deux niveaux pour les payloads de l'application.
+
+- L1 : cache en mémoire du process (LRU borné + TTL), aucun aller-retour réseau.
+- L2 : Redis, partagé entre tous les replicas.
+
+L'invalidation est diffusée à tous les replicas via un canal Redis pub/sub,
+pour que `/cache/clear` sur un pod vide aussi le L1 des autres pods.
+
+À l'expiration, `get_or_compute` évite le "cache stampede" (tous les workers
+de tous les replicas qui relancent la même requête MongoDB en même temps).
+
+Avec `binary=True`, les valeurs sont des bytes (payloads déjà compressés,
+voir serialization.Payload) relus sans décodage, même sur un client Redis
+créé avec `decode_responses=True`. Les lectures L2 des `hot_keys` passent
+alors par `hot_redis`, s'il est branché : client RESP3 avec cache côté
+client (redis_pool.make_hot_client), sans aller-retour tant que Redis n'a pas
+signalé de modification.
+"""
+import asyncio
+from collections import OrderedDict, namedtuple
+import math
+import random
+import threading
+import time
+import uuid
+
+import redis
+from redis.client import NEVER_DECODE
+
+INVALIDATION_CHANNEL = 'cache:invalidate'
+ALL_KEYS = '*'
+
+
+class LocalCache:
+    """Cache LRU en mémoire, borné en taille, avec expiration par entrée."""
+
+    def __init__(self, maxsize=256, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "entries": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CacheEntry(namedtuple('CacheEntry', 'value fresh_until delta')):
+    """Valeur en cache + fin de fraîcheur (epoch) + coût du dernier calcul (s)."""
+
+
+def meta_key(key):
+    return f"{key}:meta"
+
+
+def lock_key(key):
+    return f"{key}:lock"
+
+
+def last_good_key(key):
+    return f"{key}:last_good"
+
+
+def parse_l2_entry(value, meta):
+    if value is None:
+        return None
+    if isinstance(meta, bytes):
+        meta = meta.decode()
+    if meta:
+        fresh_until, delta = (float(part) for part in meta.split(':'))
+    else:
+        # Entrée écrite sans métadonnées : Redis gère seul l'expiration
+        fresh_until, delta = math.inf, 0.0
+    return CacheEntry(value, fresh_until, delta)
+
+
+class TwoTierCache:
+    """L1 en mémoire devant Redis (L2), avec invalidation inter-replicas.
+
+    `get` renvoie `(valeur, niveau)` où niveau vaut "L1", "L2" ou None (miss).
+    Si Redis n'est pas disponible (`redis_client` à None), seul le L1 est utilisé.
+
+    `get_or_compute` ajoute la protection contre les stampedes :
+    - single-flight : un verrou Redis par clé, un seul worker (tous replicas
+      confondus) recalcule la valeur, les autres attendent qu'elle apparaisse ;
+    - stale-while-revalidate : pendant `stale_ttl` secondes après expiration,
+      l'ancienne valeur est servie pendant qu'un thread la rafraîchit ;
+    - expiration anticipée probabiliste (XFetch) si `early_expiration_beta` > 0.
+
+    Chaque valeur calculée est aussi gardée comme "dernière valeur connue"
+    (`last_good`) : en mémoire, et dans Redis pendant `last_good_ttl` secondes.
+    Elle sert de repli quand le backend source est indisponible.
+    """
+
+    def __init__(self, redis_client, local_cache=None, channel=INVALIDATION_CHANNEL,
+                 stale_ttl=0, early_expiration_beta=0.0, lock_timeout=5.0, last_good_ttl=0, binary=False,
+                 hot_keys=()):
+        self.redis = redis_client
+        self.hot_redis = None
+        self.hot_keys = frozenset(hot_keys)
+        self.l1 = local_cache or LocalCache()
+        self.channel = channel
+        self.stale_ttl = stale_ttl
+        self.early_expiration_beta = early_expiration_beta
+        self.lock_timeout = lock_timeout
+        self.last_good_ttl = last_good_ttl
+        # Options des lectures de valeurs : bytes bruts si binary
+        self._read_options = {NEVER_DECODE: True} if binary else {}
+        self.l2_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.recomputes = 0
+        self.coalesced = 0
+        self.refresh_errors = 0
+        self._listener = None
+        self._local_locks = set()
+        self._local_locks_guard = threading.Lock()
+        self._last_good = {}
+
+    def _read_l2(self, key):
+        if self.hot_redis is not None and key in self.hot_keys:
+            try:
+                return parse_l2_entry(*self.hot_redis.execute_command('MGET', key, meta_key(key)))
+            except redis.RedisError:
+                pass
+        return parse_l2_entry(*self.redis.execute_command('MGET', key, meta_key(key), **self._read_options))
+
+    def _l1_ttl(self, entry, now):
+        return min(self.l1.ttl, entry.fresh_until + self.stale_ttl - now)
+
+    def _lookup(self, key):
+        entry = self.l1.get(key)
+        if entry is not None:
+            return entry, "L1"
+        if self.redis is not None:
+            entry = self._read_l2(key)
+            if entry is not None:
+                self.l1.set(key, entry, ttl=self._l1_ttl(entry, time.time()))
+                return entry, "L2"
+        return None, None
+
+    def get(self, key):
+        entry, tier = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return None, None
+        if tier == "L2":
+            self.l2_hits += 1
+        return entry.value, tier
+
+    def set(self, key, value, ttl, delta=0.0):
+        now = time.time()
+        entry = CacheEntry(value, now + ttl, delta)
+        if self.redis is not None:
+            expire_ms = math.ceil((ttl + self.stale_ttl) * 1000)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(key, value, px=expire_ms)
+            pipe.set(meta_key(key), f"{entry.fresh_until}:{delta}", px=expire_ms)
+            if self.last_good_ttl > 0:
+                pipe.set(last_good_key(key), value, ex=self.last_good_ttl)
+            pipe.execute()
+        self._last_good[key] = value
+        # Le L1 ne doit jamais survivre au L2
+        self.l1.set(key, entry, ttl=self._l1_ttl(entry, now))
+
+    def last_good(self, key):
+        """Dernière valeur calculée (ce process, sinon Redis), ou None"""
+        value = self._last_good.get(key)
+        if value is None and self.redis is not None and self.last_good_ttl > 0:
+            try:
+                value = self.redis.execute_command('GET', last_good_key(key), **self._read_options)
+            except redis.RedisError:
+                return None
+        return value
+
+    def _should_refresh_early(self, entry, now):
+        if self.early_expiration_beta <= 0 or entry.delta <= 0:
+            return False
+        # XFetch : plus on approche de l'expiration (et plus le calcul est
+        # coûteux), plus la probabilité de rafraîchir en avance est forte.
+        gap = -entry.delta * self.early_expiration_beta * math.log(1.0 - random.random())
+        return now + gap >= entry.fresh_until
+
+    def get_or_compute(self, key, loader, ttl):
+        """Renvoie `(valeur, niveau)` en appelant `loader()` au plus une fois
+        par expiration, tous replicas confondus.
+
+        niveau vaut "L1", "L2", "STALE" (ancienne valeur servie pendant le
+        rafraîchissement) ou None si la valeur vient d'être calculée.
+        """
+        entry, tier = self._lookup(key)
+        now = time.time()
+        if entry is not None and self.stale_ttl <= 0 and now >= entry.fresh_until:
+            entry = None
+        if entry is not None:
+            stale = now >= entry.fresh_until
+            if stale or self._should_refresh_early(entry, now):
+                token = self._acquire(key)
+                if token is not None:
+                    self._spawn_refresh(key, loader, ttl, token, entry)
+            if stale:
+                self.stale_hits += 1
+                return entry.value, "STALE"
+            if tier == "L2":
+                self.l2_hits += 1
+            return entry.value, tier
+
+        token = self._acquire(key)
+        if token is None:
+            # Un autre worker recalcule déjà : on attend son résultat
+            entry = self._wait_for(key)
+            if entry is not None:
+                self.coalesced += 1
+                return entry.value, "L2"
+        self.misses += 1
+        try:
+            return self._compute(key, loader, ttl), None
+        finally:
+            if token is not None:
+                self._release(key, token)
+
+    def _compute(self, key, loader, ttl):
+        started = time.time()
+        value = loader()
+        self.recomputes += 1
+        self.set(key, value, ttl, delta=time.time() - started)
+        return value
+
+    def _refreshed_elsewhere(self, key, seen):
+        """Le L2 a-t-il déjà été rafraîchi depuis l'entrée `seen` (autre replica) ?
+
+        Le verrou est libéré dès qu'un replica a fini : sans cette relecture,
+        chaque replica dont le L1 garde l'entrée périmée recalculerait à son tour.
+        """
+        if self.redis is None:
+            return False
+        try:
+            entry = self._read_l2(key)
+        except redis.RedisError:
+            return False
+        if entry is None or entry.fresh_until <= seen.fresh_until:
+            return False
+        self.l1.set(key, entry, ttl=self._l1_ttl(entry, time.time()))
+        return True
+
+    def _spawn_refresh(self, key, loader, ttl, token, seen):
+        def refresh():
+            try:
+                if not self._refreshed_elsewhere(key, seen):
+                    self._compute(key, loader, ttl)
+            except Exception:
+                self.refresh_errors += 1
+            finally:
+                self._release(key, token)
+
+        threading.Thread(target=refresh, name=f"cache-refresh-{key}", daemon=True).start()
+
+    def _wait_for(self, key):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry, _ = self._lookup(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def _acquire(self, key):
+        """Prend le verrou de recalcul de `key`; renvoie un jeton ou None."""
+        if self.redis is None:
+            with self._local_locks_guard:
+                if key in self._local_locks:
+                    return None
+                self._local_locks.add(key)
+                return key
+        token = uuid.uuid4().hex
+        if self.redis.set(lock_key(key), token, nx=True, px=int(self.lock_timeout * 1000)):
+            return token
+        return None
+
+    def _release(self, key, token):
+        if self.redis is None:
+            with self._local_locks_guard:
+                self._local_locks.discard(key)
+            return
+        # Ne supprimer le verrou que s'il nous appartient encore (il a pu
+        # expirer et être repris par un autre worker entre-temps).
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(lock_key(key))
+                current = pipe.get(lock_key(key))
+                if isinstance(current, bytes):
+                    current = current.decode()
+                if current == token:
+                    pipe.multi()
+                    pipe.delete(lock_key(key))
+                    pipe.execute()
+            except redis.WatchError:
+                pass
+
+    def invalidate(self, *keys):
+        """Supprime les clés du L2 et du L1 de tous les replicas."""
+        for key in keys:
+            self.l1.delete(key)
+        if self.redis is not None and keys:
+            # Suppression et diffusion en un seul aller-retour
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.delete(*keys, *(meta_key(key) for key in keys))
+            for key in keys:
+                pipe.publish(self.channel, key)
+            pipe.execute()
+
+    def _on_message(self, message):
+        key = message.get("data")
+        if key == ALL_KEYS:
+            self.l1.clear()
+        else:
+            self.l1.delete(key)
+
+    def _on_listener_error(self, exc, pubsub, thread):
+        # Des messages ont pu être perdus pendant la coupure : on vide le L1
+        # par prudence, puis redis-py se réabonne au prochain get_message.
+        self.l1.clear()
+        time.sleep(1)
+
+    def start_listener(self):
+        """Démarre le thread d'écoute des invalidations (idempotent)."""
+        if self.redis is None or self._listener is not None:
+            return self._listener
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: self._on_message})
+        self._listener = pubsub.run_in_thread(
+            sleep_time=1.0,
+            daemon=True,
+            exception_handler=self._on_listener_error,
+        )
+        return self._listener
+
+    def stop_listener(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def stats(self):
+        return {
+            "l1": self.l1.stats(),
+            "l2_hits": self.l2_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "recomputes": self.recomputes,
+            "coalesced": self.coalesced,
+            "refresh_errors": self.refresh_errors,
+            "listener_running": self._listener_running(),
+        }
+
+    def _listener_running(self):
+        return self._listener is not None and self._listener.is_alive()
+
+
+class AsyncTwoTierCache(TwoTierCache):
+    """Variante de `TwoTierCache` pour le mode ASGI, sur un client redis.asyncio.
+
+    Même algorithme (L1/L2, single-flight, stale-while-revalidate, XFetch),
+    mais les accès Redis sont des coroutines et le rafraîchissement en
+    arrière-plan est une tâche asyncio plutôt qu'un thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pubsub = None
+        self._tasks = set()
+
+    async def _read_l2(self, key):
+        return parse_l2_entry(*await self.redis.execute_command('MGET', key, meta_key(key), **self._read_options))
+
+    async def _lookup(self, key):
+        entry = self.l1.get(key)
+        if entry is not None:
+            return entry, "L1"
+        if self.redis is not None:
+            entry = await self._read_l2(key)
+            if entry is not None:
+                self.l1.set(key, entry, ttl=self._l1_ttl(entry, time.time()))
+                return entry, "L2"
+        return None, None
+
+    async def get(self, key):
+        entry, tier = await self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return None, None
+        if tier == "L2":
+            self.l2_hits += 1
+        return entry.value, tier
+
+    async def set(self, key, value, ttl, delta=0.0):
+        now = time.time()
+        entry = CacheEntry(value, now + ttl, delta)
+        if self.redis is not None:
+            expire_ms = math.ceil((ttl + self.stale_ttl) * 1000)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(key, value, px=expire_ms)
+            pipe.set(meta_key(key), f"{entry.fresh_until}:{delta}", px=expire_ms)
+            if self.last_good_ttl > 0:
+                pipe.set(last_good_key(key), value, ex=self.last_good_ttl)
+            await pipe.execute()
+        self._last_good[key] = value
+        self.l1.set(key, entry, ttl=self._l1_ttl(entry, now))
+
+    async def last_good(self, key):
+        value = self._last_good.get(key)
+        if value is None and self.redis is not None and self.last_good_ttl > 0:
+            try:
+                value = await self.redis.execute_command('GET', last_good_key(key), **self._read_options)
+            except redis.RedisError:
+                return None
+        return value
+
+    async def get_or_compute(self, key, loader, ttl):
+        """Comme `TwoTierCache.get_or_compute`, `loader` étant une coroutine."""
+        entry, tier = await self._lookup(key)
+        now = time.time()
+        if entry is not None and self.stale_ttl <= 0 and now >= entry.fresh_until:
+            entry = None
+        if entry is not None:
+            stale = now >= entry.fresh_until
+            if stale or self._should_refresh_early(entry, now):
+                token = await self._acquire(key)
+                if token is not None:
+                    self._spawn_refresh(key, loader, ttl, token, entry)
+            if stale:
+                self.stale_hits += 1
+                return entry.value, "STALE"
+            if tier == "L2":
+                self.l2_hits += 1
+            return entry.value, tier
+
+        token = await self._acquire(key)
+        if token is None:
+            entry = await self._wait_for(key)
+            if entry is not None:
+                self.coalesced += 1
+                return entry.value, "L2"
+        self.misses += 1
+        try:
+            return await self._compute(key, loader, ttl), None
+        finally:
+            if token is not None:
+                await self._release(key, token)
+
+    async def _compute(self, key, loader, ttl):
+        started = time.time()
+        value = await loader()
+        self.recomputes += 1
+        await self.set(key, value, ttl, delta=time.time() - started)
+        return value
+
+    async def _refreshed_elsewhere(self, key, seen):
+        if self.redis is None:
+            return False
+        try:
+            entry = await self._read_l2(key)
+        except redis.RedisError:
+            return False
+        if entry is None or entry.fresh_until <= seen.fresh_until:
+            return False
+        self.l1.set(key, entry, ttl=self._l1_ttl(entry, time.time()))
+        return True
+
+    def _spawn_refresh(self, key, loader, ttl, token, seen):
+        async def refresh():
+            try:
+                if not await self._refreshed_elsewhere(key, seen):
+                    await self._compute(key, loader, ttl)
+            except Exception:
+                self.refresh_errors += 1
+            finally:
+                await self._release(key, token)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _wait_for(self, key):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry, _ = await self._lookup(key)
+            if entry is not None:
+                return entry
+        return None
+
+    async def _acquire(self, key):
+        if self.redis is None:
+            return super()._acquire(key)
+        token = uuid.uuid4().hex
+        if await self.redis.set(lock_key(key), token, nx=True, px=int(self.lock_timeout * 1000)):
+            return token
+        return None
+
+    async def _release(self, key, token):
+        if self.redis is None:
+            return super()._release(key, token)
+        async with self.redis.pipeline() as pipe:
+            try:
+                await pipe.watch(lock_key(key))
+                current = await pipe.get(lock_key(key))
+                if isinstance(current, bytes):
+                    current = current.decode()
+                if current == token:
+                    pipe.multi()
+                    pipe.delete(lock_key(key))
+                    await pipe.execute()
+            except redis.WatchError:
+                pass
+
+    async def invalidate(self, *keys):
+        for key in keys:
+            self.l1.delete(key)
+        if self.redis is not None and keys:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.delete(*keys, *(meta_key(key) for key in keys))
+            for key in keys:
+                pipe.publish(self.channel, key)
+            await pipe.execute()
+
+    async def _listen(self):
+        while True:
+            try:
+                # Les messages sont dispatchés vers `_on_message` par redis-py
+                await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.l1.clear()
+                await asyncio.sleep(1)
+
+    async def start_listener(self):
+        if self.redis is None or self._listener is not None:
+            return self._listener
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(**{self.channel: self._on_message})
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return self._listener
+
+    async def stop_listener(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    def _listener_running(self):
+        return self._listener is not None and not self._listener.done()
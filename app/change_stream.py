@@ -0,0 +1,266 @@
+"""Watcher des change streams MongoDB : invalidation du cache et diffusion des changements.
+
+Un process à part (`python change_stream.py`, déploiement `change-watcher`,
+un seul replica) suit le change stream de `demoDB` via mongos, limité à
+`hosts`, `users` et `orders`. Les événements sont traités par lots (au plus
+`max_batch`, ou ce qui est arrivé en `flush_interval` secondes) :
+- `hosts` modifié : `hosts_data` est invalidé (L2 Redis et L1 de tous les
+  pods via le canal d'invalidation du cache), une fois par lot. Le TTL de
+  `hosts_data` peut donc être long : il ne sert plus qu'en filet de sécurité ;
+- `users` inséré ou supprimé : le set d'`user_id` du tirage aléatoire est
+  tenu à jour (SADD/SREM idempotents), même pour les écritures faites hors
+  de l'app ;
+- un résumé du lot (compteurs par collection et type d'opération, derniers
+  documents modifiés limités aux champs affichés) est publié sur le canal
+  Redis `changes:events`, relayé aux navigateurs en Server-Sent Events par
+  chaque pod (`/api/events`, voir events.py).
+
+Les compteurs de `/api/stats` et les agrégats analytics restent tenus par
+les routes d'écriture : les recompter ici les doublerait.
+
+Le resume token est enregistré dans `change_stream_checkpoints` après chaque
+lot (et périodiquement sans événement) : au redémarrage, le watcher reprend
+au lot suivant le dernier traité. Un lot interrompu est rejoué, ce qui est
+sans effet (invalidations et SADD/SREM idempotents). Sans point de reprise
+utilisable (premier démarrage, oplog dépassé), des changements ont pu être
+manqués : `hosts_data` est invalidé et un événement `resync` demande aux
+navigateurs de tout recharger.
+"""
+import os
+import signal
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+import redis
+
+from cache import TwoTierCache
+import serialization
+from user_sampler import UserSampler
+
+WATCHED_COLLECTIONS = ('hosts', 'users', 'orders')
+WATCHED_OPERATIONS = ('insert', 'update', 'replace', 'delete')
+EVENTS_CHANNEL = 'changes:events'
+CHECKPOINTS_COLLECTION = 'change_stream_checkpoints'
+HOSTS_CACHE_KEY = 'hosts_data'
+# Champs diffusés aux navigateurs (ceux qu'affichent les pages)
+PUBLIC_FIELDS = {
+    'hosts': ('info',),
+    'users': ('user_id', 'name', 'email', 'country', 'order_count', 'total_spent'),
+    'orders': ('order_id', 'user_id', 'user_name', 'amount'),
+}
+# Derniers documents modifiés par collection dans un résumé de lot
+RECENT_PER_COLLECTION = 20
+# Oplog dépassé : le resume token ne correspond plus à rien
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+def watch_pipeline(collections=WATCHED_COLLECTIONS):
+    return [
+        {"$match": {"ns.coll": {"$in": list(collections)}, "operationType": {"$in": list(WATCHED_OPERATIONS)}}},
+        {"$project": {"operationType": 1, "ns": 1, "documentKey": 1, "fullDocument": 1,
+                      "updateDescription.updatedFields": 1, "clusterTime": 1}},
+    ]
+
+
+def document_id(change):
+    """Identifiant lisible : clé de sharding si elle est dans `documentKey`, sinon `_id`"""
+    key = change.get("documentKey", {})
+    fields = {field: value for field, value in key.items() if field != '_id'}
+    if len(fields) == 1:
+        return next(iter(fields.values()))
+    return str(key.get('_id'))
+
+
+def describe_change(change):
+    """Delta diffusable d'un événement : opération, identifiant et champs affichés"""
+    collection = change["ns"]["coll"]
+    op = change["operationType"]
+    delta = {"op": op, "id": document_id(change)}
+    if op in ('insert', 'replace'):
+        source = change.get("fullDocument") or {}
+    elif op == 'update':
+        source = change.get("updateDescription", {}).get("updatedFields", {})
+    else:
+        source = {}
+    fields = {field: source[field] for field in PUBLIC_FIELDS.get(collection, ()) if field in source}
+    if fields:
+        delta["fields"] = fields
+    return delta
+
+
+def summarize(changes, recent=RECENT_PER_COLLECTION):
+    """Résumé d'un lot : compteurs par collection et opération, derniers deltas"""
+    collections = {}
+    for change in changes:
+        summary = collections.setdefault(change["ns"]["coll"], {"recent": []})
+        summary[change["operationType"]] = summary.get(change["operationType"], 0) + 1
+        summary["recent"].append(describe_change(change))
+    for summary in collections.values():
+        summary["recent"] = summary["recent"][-recent:]
+    return {"type": "changes", "at": time.time(), "collections": collections}
+
+
+class ChangeWatcher:
+    """Suit le change stream de la base et applique ses effets par lots."""
+
+    def __init__(self, db, redis_client, name='cache-watcher', flush_interval=0.25, max_batch=1000,
+                 checkpoint_interval=10.0, channel=EVENTS_CHANNEL):
+        self.db = db
+        self.redis = redis_client
+        self.name = name
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.checkpoint_interval = checkpoint_interval
+        self.channel = channel
+        self.checkpoints = db[CHECKPOINTS_COLLECTION]
+        self.hosts_cache = TwoTierCache(redis_client)
+        self.user_sampler = UserSampler(redis_client, db)
+        self.events = 0
+        self.batches = 0
+        self.invalidations = 0
+        self.resyncs = 0
+        self.last_event_at = None
+        self.lag_seconds = None
+        self._last_checkpoint = 0.0
+        self._running = True
+
+    def load_token(self):
+        checkpoint = self.checkpoints.find_one({"_id": self.name})
+        return checkpoint.get("resume_token") if checkpoint else None
+
+    def save_token(self, token):
+        if token is None:
+            return
+        self.checkpoints.update_one(
+            {"_id": self.name},
+            {"$set": {"resume_token": token, "updated_at": time.time(), "events": self.events}},
+            upsert=True,
+        )
+        self._last_checkpoint = time.monotonic()
+
+    def clear_token(self):
+        self.checkpoints.delete_one({"_id": self.name})
+
+    def publish(self, message):
+        self.redis.publish(self.channel, serialization.dumps_text(message))
+
+    def resync(self):
+        """Changements peut-être manqués : tout ce qui dépend des collections est à relire"""
+        self.hosts_cache.invalidate(HOSTS_CACHE_KEY)
+        self.invalidations += 1
+        self.resyncs += 1
+        self.publish({"type": "resync", "at": time.time()})
+
+    def handle(self, changes):
+        """Applique un lot d'événements puis enregistre son resume token"""
+        if not changes:
+            return 0
+        if any(change["ns"]["coll"] == 'hosts' for change in changes):
+            self.hosts_cache.invalidate(HOSTS_CACHE_KEY)
+            self.invalidations += 1
+        inserted, deleted = [], []
+        for change in changes:
+            if change["ns"]["coll"] != 'users':
+                continue
+            user_id = (change.get("fullDocument") or change.get("documentKey", {})).get("user_id")
+            if user_id is None:
+                continue
+            if change["operationType"] == 'insert':
+                inserted.append(user_id)
+            elif change["operationType"] == 'delete':
+                deleted.append(user_id)
+        self.user_sampler.add(*inserted)
+        self.user_sampler.remove(*deleted)
+        self.publish(summarize(changes))
+        self.events += len(changes)
+        self.batches += 1
+        self.last_event_at = time.time()
+        cluster_time = changes[-1].get("clusterTime")
+        if cluster_time is not None:
+            self.lag_seconds = max(0.0, self.last_event_at - cluster_time.time)
+        self.save_token(changes[-1]["_id"])
+        return len(changes)
+
+    def read_batch(self, stream):
+        """Événements arrivés pendant `flush_interval` (au plus `max_batch`)"""
+        changes = []
+        deadline = time.monotonic() + self.flush_interval
+        while self._running and stream.alive and len(changes) < self.max_batch:
+            change = stream.try_next()
+            if change is not None:
+                changes.append(change)
+            elif time.monotonic() >= deadline:
+                break
+        return changes
+
+    def open_stream(self):
+        token = self.load_token()
+        stream = self.db.watch(watch_pipeline(), start_after=token,
+                               max_await_time_ms=max(1, int(self.flush_interval * 1000)))
+        if token is None:
+            self.resync()
+            self.save_token(stream.resume_token)
+        return stream
+
+    def run_once(self, stream):
+        handled = self.handle(self.read_batch(stream))
+        if not handled and time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+            # Sans événement, le token avance quand même : reprise sans relire l'oplog
+            self.save_token(stream.resume_token)
+        return handled
+
+    def stop(self, *args):
+        self._running = False
+
+    def run(self, retry_delay=1.0):
+        """Boucle du watcher; un arrêt (SIGTERM) termine le lot en cours"""
+        while self._running:
+            try:
+                with self.open_stream() as stream:
+                    while self._running and stream.alive:
+                        self.run_once(stream)
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    print(f"⚠️ Watcher {self.name}: point de reprise perdu, resynchronisation")
+                    self.clear_token()
+                else:
+                    print(f"❌ Watcher {self.name}: {e}")
+                    time.sleep(retry_delay)
+            except (PyMongoError, redis.RedisError) as e:
+                print(f"❌ Watcher {self.name}: {e}")
+                time.sleep(retry_delay)
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "events": self.events,
+            "batches": self.batches,
+            "invalidations": self.invalidations,
+            "resyncs": self.resyncs,
+            "last_event_at": self.last_event_at,
+            "lag_seconds": self.lag_seconds,
+        }
+
+
+def main():
+    from pymongo import MongoClient
+
+    mongodb_uri = os.getenv('MONGODB_URI', 'mongodb://mongo-mongos.dev.svc.cluster.local:27017/?directConnection=true')
+    redis_client = redis.Redis(host=os.getenv('REDIS_HOST', 'redis-service.dev'), port=6379,
+                               decode_responses=True, socket_connect_timeout=2)
+    db = MongoClient(mongodb_uri)["demoDB"]
+    watcher = ChangeWatcher(
+        db, redis_client,
+        name=os.getenv('CHANGE_WATCHER_NAME', 'cache-watcher'),
+        flush_interval=float(os.getenv('CHANGE_WATCHER_FLUSH_INTERVAL', '0.25')),
+        max_batch=int(os.getenv('CHANGE_WATCHER_MAX_BATCH', '1000')),
+    )
+    signal.signal(signal.SIGTERM, watcher.stop)
+    signal.signal(signal.SIGINT, watcher.stop)
+    print(f"👀 Watcher {watcher.name} démarré sur {', '.join(WATCHED_COLLECTIONS)}")
+    watcher.run()
+    print(f"🛑 Watcher arrêté: {watcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Regroupement des lectures identiques en vol (request coalescing).
+
+Sous une rafale de tableaux de bord, des dizaines de requêtes du même pod
+lancent la même requête MongoDB en même temps (`/api/stats?exact=1`, la
+première page de `/api/users`). `Coalescer.run(key, fn)` n'exécute `fn`
+qu'une fois par clé en vol : le premier appelant (leader) fait l'appel, les
+suivants attendent son résultat (ou son exception) et le partagent.
+
+- La clé (`query_key`) couvre la classe de route (préférence de lecture),
+  la collection, le filtre, la projection, le tri et la limite.
+- `window_ms` (micro-batching) : le leader attend quelques millisecondes
+  avant d'interroger MongoDB pour que les requêtes quasi simultanées le
+  rejoignent. 0 = seules les requêtes arrivées pendant l'appel en profitent.
+- Le résultat est partagé tel quel entre les requêtes : il ne doit pas être
+  modifié après coup (les routes ne font que le sérialiser).
+
+Rien n'est gardé après l'appel : ce n'est pas un cache, une requête arrivée
+après la réponse relance la lecture.
+"""
+import asyncio
+from concurrent.futures import Future
+import threading
+import time
+
+import serialization
+
+
+def query_key(route, collection, filter=None, projection=None, sort=None, limit=0, extra=None):
+    """Clé d'une lecture (bytes) : deux clés égales renvoient le même résultat"""
+    return serialization.dumps([route, collection, filter or {}, projection, sort, limit, extra])
+
+
+class Coalescer:
+    """Regroupement des lectures pour le mode threadé (gunicorn gthread)."""
+
+    def __init__(self, window_ms=0, enabled=True, observer=None):
+        self.window_ms = window_ms
+        self.enabled = enabled
+        # observer(name, coalesced) à chaque requête (métriques Prometheus)
+        self.observer = observer
+        self.requests = 0
+        self.backend_calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key, name, start):
+        """(appel en vol pour `key`, leader) ; `start()` crée l'appel s'il n'y en a pas"""
+        with self._lock:
+            self.requests += 1
+            pending = self._in_flight.get(key)
+            leader = pending is None
+            if leader:
+                self.backend_calls += 1
+                pending = self._in_flight[key] = start()
+            else:
+                self.coalesced += 1
+        if self.observer is not None:
+            self.observer(name, not leader)
+        return pending, leader
+
+    def _bypass(self, name):
+        with self._lock:
+            self.requests += 1
+            self.backend_calls += 1
+        if self.observer is not None:
+            self.observer(name, False)
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if error is not None:
+                self.errors += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run(self, key, fn, name='query'):
+        """Résultat de `fn()`, partagé avec les appels identiques en vol"""
+        if not self.enabled:
+            self._bypass(name)
+            return fn()
+        future, leader = self._join(key, name, Future)
+        if not leader:
+            return future.result()
+        try:
+            if self.window_ms > 0:
+                time.sleep(self.window_ms / 1000)
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "window_ms": self.window_ms,
+            "requests": self.requests,
+            "backend_calls": self.backend_calls,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.coalesced / self.requests, 3) if self.requests else 0.0,
+            "errors": self.errors,
+            "in_flight": len(self._in_flight),
+        }
+
+
+class AsyncCoalescer(Coalescer):
+    """Variante asyncio (mode ASGI) : `fn` est une fonction coroutine.
+
+    L'appel tourne dans sa propre tâche : l'annulation d'une requête (client
+    parti, délai dépassé) n'interrompt pas les autres qui l'attendent.
+    """
+
+    async def run(self, key, fn, name='query'):
+        if not self.enabled:
+            self._bypass(name)
+            return await fn()
+        # La tâche hérite du contexte du leader (budget pymongo.timeout)
+        task, _ = self._join(key, name, lambda: asyncio.ensure_future(self._lead(key, fn)))
+        return await asyncio.shield(task)
+
+    async def _lead(self, key, fn):
+        try:
+            if self.window_ms > 0:
+                await asyncio.sleep(self.window_ms / 1000)
+            result = await fn()
+        except BaseException:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        return result
@@ -0,0 +1,169 @@
+"""Compteurs agrégés (total users / total orders) maintenus dans Redis.
+
+Sur le cluster shardé, `count_documents({})` est un scatter-gather sur tous
+les shards. `/api/stats` lit plutôt un hash Redis (O(1)) :
+- les routes d'écriture mettent les compteurs à jour atomiquement (HINCRBY) ;
+- une réconciliation périodique (une seule par intervalle, tous replicas
+  confondus) recale les compteurs sur MongoDB pour corriger la dérive
+  (écriture Mongo réussie pendant une coupure Redis, suppression manuelle...).
+"""
+import asyncio
+import threading
+import time
+
+import redis
+
+COUNTERS_KEY = 'stats:counters'
+RECONCILE_LOCK_KEY = 'stats:counters:reconcile'
+COLLECTIONS = ('users', 'orders')
+
+
+class Counters:
+    """Compteurs par collection, lus en O(1) depuis Redis."""
+
+    def __init__(self, redis_client, db, reconcile_interval=60):
+        self.redis = redis_client
+        self.db = db
+        self.reconcile_interval = reconcile_interval
+        self.last_reconcile = None
+        self.last_drift = {}
+        self._thread = None
+
+    def incr(self, collection, amount=1):
+        """Incrément atomique; une erreur Redis sera rattrapée par la réconciliation"""
+        if self.redis is None:
+            return
+        try:
+            self.redis.hincrby(COUNTERS_KEY, collection, amount)
+        except redis.RedisError:
+            pass
+
+    def set(self, **values):
+        """Fixe des valeurs absolues (après un chargement ou un vidage complet)"""
+        if self.redis is None:
+            return
+        try:
+            self.redis.hset(COUNTERS_KEY, mapping=values)
+        except redis.RedisError:
+            pass
+
+    def read(self):
+        """Valeurs en cache, ou None si Redis est absent ou les compteurs pas encore initialisés"""
+        if self.redis is None:
+            return None
+        values = self.redis.hmget(COUNTERS_KEY, *COLLECTIONS)
+        if any(value is None for value in values):
+            return None
+        return {collection: int(value) for collection, value in zip(COLLECTIONS, values)}
+
+    def exact(self, db=None):
+        # `db` : vue routée vers les secondaires pour /api/stats ; la
+        # réconciliation lit le primaire pour ne pas recaler sur un retard
+        db = self.db if db is None else db
+        return {collection: db[collection].count_documents({}) for collection in COLLECTIONS}
+
+    def estimated(self, db=None):
+        # Métadonnées des collections : pas de scan, mais approximatif sur un
+        # cluster shardé (documents orphelins pendant les migrations de chunks)
+        db = self.db if db is None else db
+        return {collection: db[collection].estimated_document_count() for collection in COLLECTIONS}
+
+    def reconcile(self):
+        """Recale les compteurs Redis sur les comptes exacts de MongoDB"""
+        counts = self.exact()
+        if self.redis is not None:
+            cached = self.read() or {}
+            self.last_drift = {c: counts[c] - cached[c] for c in COLLECTIONS if c in cached}
+            self.redis.hset(COUNTERS_KEY, mapping=counts)
+        self.last_reconcile = time.time()
+        return counts
+
+    def _reconcile_loop(self):
+        while True:
+            time.sleep(self.reconcile_interval)
+            try:
+                # Un seul replica réconcilie par intervalle
+                if self.redis.set(RECONCILE_LOCK_KEY, '1', nx=True, ex=max(1, self.reconcile_interval - 1)):
+                    self.reconcile()
+            except Exception:
+                pass
+
+    def start_reconciler(self):
+        """Démarre le job de réconciliation en arrière-plan (idempotent)"""
+        if self.redis is None or self.reconcile_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._reconcile_loop, name="counters-reconcile", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {
+            "reconcile_interval": self.reconcile_interval,
+            "last_reconcile": self.last_reconcile,
+            "last_drift": self.last_drift,
+        }
+
+
+class AsyncCounters(Counters):
+    """Variante de `Counters` pour le mode ASGI (redis.asyncio + AsyncMongoClient)."""
+
+    async def incr(self, collection, amount=1):
+        if self.redis is None:
+            return
+        try:
+            await self.redis.hincrby(COUNTERS_KEY, collection, amount)
+        except redis.RedisError:
+            pass
+
+    async def set(self, **values):
+        if self.redis is None:
+            return
+        try:
+            await self.redis.hset(COUNTERS_KEY, mapping=values)
+        except redis.RedisError:
+            pass
+
+    async def read(self):
+        if self.redis is None:
+            return None
+        values = await self.redis.hmget(COUNTERS_KEY, *COLLECTIONS)
+        if any(value is None for value in values):
+            return None
+        return {collection: int(value) for collection, value in zip(COLLECTIONS, values)}
+
+    async def exact(self, db=None):
+        db = self.db if db is None else db
+        return {collection: await db[collection].count_documents({}) for collection in COLLECTIONS}
+
+    async def estimated(self, db=None):
+        db = self.db if db is None else db
+        return {collection: await db[collection].estimated_document_count() for collection in COLLECTIONS}
+
+    async def reconcile(self):
+        counts = await self.exact()
+        if self.redis is not None:
+            cached = await self.read() or {}
+            self.last_drift = {c: counts[c] - cached[c] for c in COLLECTIONS if c in cached}
+            await self.redis.hset(COUNTERS_KEY, mapping=counts)
+        self.last_reconcile = time.time()
+        return counts
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                if await self.redis.set(RECONCILE_LOCK_KEY, '1', nx=True, ex=max(1, self.reconcile_interval - 1)):
+                    await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+
+    def start_reconciler(self):
+        if self.redis is None or self.reconcile_interval <= 0 or self._thread is not None:
+            return
+        self._thread = asyncio.get_running_loop().create_task(self._reconcile_loop())
+
+    def stop_reconciler(self):
+        if self._thread is not None:
+            self._thread.cancel()
+            self._thread = None
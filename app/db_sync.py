@@ -0,0 +1,335 @@
+"""Copie DEV -> TEST de `demoDB` en flux, par curseurs parallèles.
+
+Remplace le transfert de `refresh-test-db.sh` (JSON mongosh, 10 users) :
+les documents sont lus sur le mongos DEV et écrits dans le replica set TEST
+par lots, sans jamais charger une collection en mémoire.
+
+- Découpage : sur DEV, un curseur par chunk de la clé de sharding hashée
+  (`config.chunks`, bornes `min`/`max` + `hint` sur l'index hashé) : chaque
+  curseur ne lit qu'un shard. Sans sharding (ou `--split id`), la plage des
+  `_id` ObjectId est coupée en tranches de temps égales.
+- `--parallel` curseurs à la fois, lots de `--batch-size` documents : la
+  mémoire est bornée par parallel x batch-size.
+- Copie complète : collection cible vidée (drop), `insert_many` non
+  ordonnés, puis index de l'app (indexes.py). `--incremental` : seulement
+  les documents créés (`_id`) ou modifiés (`updated_at`) depuis le début de
+  la synchronisation précédente, écrits en `ReplaceOne` upsert non ordonnés.
+  Les suppressions ne sont pas propagées : copie complète de temps en temps.
+- `--sample 0.1` : 10 % des utilisateurs, choisis par hash de `user_id`,
+  avec leurs commandes (même hash) pour garder les données cohérentes.
+- `--anonymize` : noms remplacés par `User_<user_id>` (users et orders),
+  `--mask-emails` en plus pour les emails.
+
+Les lectures DEV utilisent la classe de route `analytics` de l'app
+(secondaryPreferred, retard toléré, sans budget ; MONGO_ANALYTICS_*), les
+écritures TEST la classe `primary`. Le rapport JSON donne docs/s par
+collection.
+
+    python app/db_sync.py --anonymize
+    python app/db_sync.py --incremental --parallel 8
+    python app/db_sync.py --sample 0.05 --collections users,orders
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+
+from bson import ObjectId
+from pymongo import MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from indexes import IndexManager
+from read_routing import load_route_classes
+
+SOURCE_URI = os.getenv('SOURCE_MONGODB_URI', 'mongodb://mongo-mongos.dev.svc.cluster.local:27017/?directConnection=true')
+TARGET_URI = os.getenv('TARGET_MONGODB_URI', 'mongodb://mongo-0.mongo.test.svc.cluster.local:27017,'
+                       'mongo-1.mongo.test.svc.cluster.local:27017,mongo-2.mongo.test.svc.cluster.local:27017/'
+                       '?replicaSet=rs0')
+DB_NAME = 'demoDB'
+COLLECTIONS = ('users', 'orders', 'hosts')
+# Champ dont le hash décide de l'échantillonnage (users et orders ensemble)
+SAMPLE_KEYS = {'users': 'user_id', 'orders': 'user_id', 'hosts': '_id'}
+SYNC_STATE_COLLECTION = 'sync_state'
+# Marge sur le point de départ incrémental (écritures en vol, horloges)
+INCREMENTAL_MARGIN = timedelta(seconds=60)
+DUPLICATE_KEY = 11000
+
+
+class Partition:
+    """Tranche d'une collection lue par un seul curseur"""
+
+    def __init__(self, name, filter=None, min=None, max=None, hint=None):
+        self.name = name
+        self.filter = filter or {}
+        self.min = min
+        self.max = max
+        self.hint = hint
+
+    def cursor(self, collection, extra_filter, batch_size):
+        query = {"$and": [self.filter, extra_filter]} if self.filter and extra_filter else (self.filter or extra_filter)
+        cursor = collection.find(query, batch_size=batch_size)
+        if self.hint is not None:
+            cursor = cursor.hint(self.hint)
+        if self.min is not None:
+            cursor = cursor.min(self.min)
+        if self.max is not None:
+            cursor = cursor.max(self.max)
+        return cursor
+
+
+def chunk_partitions(client, db_name, collection):
+    """Un curseur par chunk si la collection est shardée sur une clé hashée"""
+    meta = client.config.collections.find_one({"_id": f"{db_name}.{collection}", "dropped": {"$ne": True}})
+    if not meta or 'hashed' not in meta.get("key", {}).values():
+        return []
+    hint = list(meta["key"].items())
+    # `uuid` depuis MongoDB 5.0, `ns` avant
+    chunks = client.config.chunks.find({"$or": [{"uuid": meta.get("uuid")}, {"ns": meta["_id"]}]}).sort("min", 1)
+    return [Partition(f"chunk {index} ({chunk.get('shard')})", min=list(chunk["min"].items()),
+                      max=list(chunk["max"].items()), hint=hint)
+            for index, chunk in enumerate(chunks)]
+
+
+def id_partitions(collection, count):
+    """Tranches de temps égales sur les `_id` ObjectId (une seule sinon)"""
+    object_ids = {"_id": {"$type": "objectId"}}
+    first = collection.find_one(object_ids, {"_id": 1}, sort=[("_id", 1)])
+    last = collection.find_one(object_ids, {"_id": 1}, sort=[("_id", -1)])
+    if not first or count < 2:
+        return [Partition("all")]
+    start, end = first["_id"].generation_time, last["_id"].generation_time
+    step = (end - start) / count
+    bounds = [ObjectId.from_datetime(start + step * i) for i in range(1, count)]
+    # Bornes ouvertes aux extrémités pour les _id créés pendant la copie ; les
+    # _id d'un autre type BSON (jamais comparés à un ObjectId) ont leur tranche
+    partitions = [Partition("_id < " + str(bounds[0]), {"_id": {"$lt": bounds[0]}})]
+    partitions += [Partition(f"{low}..{high}", {"_id": {"$gte": low, "$lt": high}})
+                   for low, high in zip(bounds, bounds[1:])]
+    partitions.append(Partition("_id >= " + str(bounds[-1]), {"_id": {"$gte": bounds[-1]}}))
+    partitions.append(Partition("_id hors ObjectId", {"_id": {"$not": {"$type": "objectId"}}}))
+    return partitions
+
+
+def sampled(document, collection, fraction):
+    """Choix déterministe : même résultat pour un user et ses commandes"""
+    if fraction >= 1:
+        return True
+    key = str(document.get(SAMPLE_KEYS.get(collection, '_id')))
+    return zlib.crc32(key.encode()) % 10000 < fraction * 10000
+
+
+def anonymize(document, collection, mask_emails=False):
+    if collection == 'users':
+        document["name"] = f"User_{document.get('user_id')}"
+        if mask_emails and document.get("email"):
+            digest = hashlib.sha256(document["email"].encode()).hexdigest()[:12]
+            document["email"] = f"{digest}@test.invalid"
+    elif collection == 'orders' and "user_name" in document:
+        document["user_name"] = f"User_{document.get('user_id')}"
+    return document
+
+
+def incremental_filter(since):
+    """Documents créés (horodatage de l'_id) ou modifiés depuis `since`"""
+    return {"$or": [{"_id": {"$gte": ObjectId.from_datetime(since)}}, {"updated_at": {"$gte": since}}]}
+
+
+class CollectionReport:
+    def __init__(self, collection, partitions):
+        self.collection = collection
+        self.partitions = partitions
+        self.read = 0
+        self.written = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, read, written, skipped, duplicates):
+        with self._lock:
+            self.read += read
+            self.written += written
+            self.skipped += skipped
+            self.duplicates += duplicates
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def to_dict(self):
+        return {
+            "collection": self.collection,
+            "partitions": self.partitions,
+            "read": self.read,
+            "written": self.written,
+            "skipped": self.skipped,
+            "duplicates": self.duplicates,
+            "seconds": round(self.seconds, 2),
+            "docs_per_sec": round(self.written / self.seconds, 1) if self.seconds else 0.0,
+        }
+
+
+class DatabaseSync:
+    """Copie de collections d'une base source vers une base cible."""
+
+    def __init__(self, source_client, target_client, db_name=DB_NAME, parallel=4, batch_size=1000,
+                 sample=1.0, anonymize=False, mask_emails=False, split='auto', log=None):
+        route_classes = load_route_classes()
+        self.source_client = source_client
+        self.source = source_client.get_database(db_name,
+                                                 read_preference=route_classes['analytics'].make_read_preference())
+        self.target = target_client[db_name]
+        self.db_name = db_name
+        self.parallel = parallel
+        self.batch_size = batch_size
+        self.sample = sample
+        self.anonymize = anonymize
+        self.mask_emails = mask_emails
+        self.split = split
+        self.log = log or (lambda message: print(message, file=sys.stderr))
+        self.imported_date = datetime.utcnow()
+
+    def partitions(self, collection):
+        if self.split in ('auto', 'chunks'):
+            try:
+                partitions = chunk_partitions(self.source_client, self.db_name, collection)
+            except Exception:
+                partitions = []
+            if partitions or self.split == 'chunks':
+                return partitions
+        if self.split == 'none':
+            return [Partition("all")]
+        return id_partitions(self.source[collection], self.parallel * 4)
+
+    def transform(self, document, collection):
+        if self.anonymize:
+            anonymize(document, collection, self.mask_emails)
+        # Provenance, comme l'ancien script de rafraîchissement
+        document.update(environment='test', source='dev_sync', imported_date=self.imported_date)
+        return document
+
+    def write(self, collection, documents, incremental):
+        """Écrit un lot sans ordre; renvoie (écrits, doublons)"""
+        target = self.target[collection]
+        if incremental:
+            result = target.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in documents],
+                                       ordered=False)
+            return result.upserted_count + result.matched_count, 0
+        try:
+            target.insert_many(documents, ordered=False)
+            return len(documents), 0
+        except BulkWriteError as error:
+            write_errors = error.details.get("writeErrors", [])
+            if any(write_error.get("code") != DUPLICATE_KEY for write_error in write_errors):
+                raise
+            return len(documents) - len(write_errors), len(write_errors)
+
+    def copy_partition(self, collection, partition, extra_filter, incremental, report):
+        batch, read, skipped = [], 0, 0
+
+        def flush():
+            written, duplicates = self.write(collection, batch, incremental)
+            report.add(read, written, skipped, duplicates)
+
+        for document in partition.cursor(self.source[collection], extra_filter, self.batch_size):
+            read += 1
+            if not sampled(document, collection, self.sample):
+                skipped += 1
+                continue
+            batch.append(self.transform(document, collection))
+            if len(batch) >= self.batch_size:
+                flush()
+                batch, read, skipped = [], 0, 0
+        if batch or read:
+            if batch:
+                flush()
+            else:
+                report.add(read, 0, skipped, 0)
+
+    def last_sync(self, collection):
+        state = self.target[SYNC_STATE_COLLECTION].find_one({"_id": collection})
+        return state.get("started_at") if state else None
+
+    def sync_collection(self, collection, incremental=False):
+        started_at = datetime.utcnow()
+        self.imported_date = started_at
+        since = self.last_sync(collection) if incremental else None
+        incremental = since is not None
+        extra_filter = incremental_filter(since - INCREMENTAL_MARGIN) if incremental else {}
+        if not incremental:
+            self.target[collection].drop()
+        partitions = self.partitions(collection)
+        report = CollectionReport(collection, len(partitions))
+        self.log(f"📦 {collection}: {len(partitions)} tranche(s), "
+                 f"{'incrémental depuis ' + since.isoformat() if incremental else 'copie complète'}")
+        with ThreadPoolExecutor(self.parallel) as pool:
+            futures = [pool.submit(self.copy_partition, collection, partition, extra_filter, incremental, report)
+                       for partition in partitions]
+            for future in futures:
+                future.result()
+        report.finish()
+        self.target[SYNC_STATE_COLLECTION].update_one(
+            {"_id": collection},
+            {"$set": {"started_at": started_at, "finished_at": datetime.utcnow(), "mode":
+                      "incremental" if incremental else "full", "sample": self.sample, "written": report.written}},
+            upsert=True,
+        )
+        self.log(f"✅ {collection}: {report.written} documents en {report.seconds:.1f}s "
+                 f"({report.to_dict()['docs_per_sec']} docs/s)")
+        return report
+
+    def run(self, collections=COLLECTIONS, incremental=False):
+        started = time.perf_counter()
+        reports = [self.sync_collection(collection, incremental) for collection in collections]
+        if not incremental:
+            # Index de l'app construits une fois, après la copie
+            IndexManager(self.target).ensure()
+        seconds = time.perf_counter() - started
+        written = sum(report.written for report in reports)
+        return {
+            "mode": "incremental" if incremental else "full",
+            "sample": self.sample,
+            "anonymized": self.anonymize,
+            "collections": [report.to_dict() for report in reports],
+            "written": written,
+            "seconds": round(seconds, 2),
+            "docs_per_sec": round(written / seconds, 1) if seconds else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=SOURCE_URI, help="URI MongoDB DEV (SOURCE_MONGODB_URI)")
+    parser.add_argument("--target", default=TARGET_URI, help="URI MongoDB TEST (TARGET_MONGODB_URI)")
+    parser.add_argument("--collections", default=",".join(COLLECTIONS))
+    parser.add_argument("--parallel", type=int, default=4, help="curseurs simultanés")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--sample", type=float, default=1.0, help="fraction des utilisateurs copiés (0-1)")
+    parser.add_argument("--anonymize", action="store_true", help="noms remplacés par User_<user_id>")
+    parser.add_argument("--mask-emails", action="store_true", help="emails remplacés par un hash")
+    parser.add_argument("--incremental", action="store_true",
+                        help="seulement les documents créés/modifiés depuis la synchronisation précédente")
+    parser.add_argument("--split", choices=("auto", "chunks", "id", "none"), default="auto")
+    args = parser.parse_args()
+    if not 0 < args.sample <= 1:
+        parser.error("--sample doit être dans ]0, 1]")
+
+    route_classes = load_route_classes()
+    source = MongoClient(args.source, serverSelectionTimeoutMS=route_classes['analytics'].server_selection_timeout_ms,
+                         maxPoolSize=max(args.parallel + 2, route_classes['analytics'].pool_size))
+    target = MongoClient(args.target, serverSelectionTimeoutMS=route_classes['primary'].server_selection_timeout_ms,
+                         maxPoolSize=args.parallel + 2)
+    sync = DatabaseSync(source, target, parallel=args.parallel, batch_size=args.batch_size, sample=args.sample,
+                        anonymize=args.anonymize, mask_emails=args.mask_emails, split=args.split)
+    report = sync.run(args.collections.split(","), incremental=args.incremental)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
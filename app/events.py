@@ -0,0 +1,190 @@
+"""Diffusion des changements aux navigateurs en Server-Sent Events (`/api/events`).
+
+Le watcher des change streams (change_stream.py) publie un résumé par lot
+sur le canal Redis `changes:events`. Chaque process de l'app y est abonné
+une seule fois (`EventHub`) et recopie les messages dans la file de chacun
+de ses clients SSE : les pages se mettent à jour sur événement au lieu de
+relire `/hosts`, `/api/stats` et `/api/users` à intervalle fixe.
+
+- Un client trop lent (file pleine) perd ses messages en attente et reçoit
+  un `resync` : il recharge tout au lieu d'appliquer des deltas incomplets.
+- En mode sync, chaque flux SSE occupe un thread gthread pendant toute la
+  connexion : `max_clients` (SSE_MAX_CLIENTS) le borne, au-delà la route
+  répond 503 et la page garde son rafraîchissement manuel.
+- Un commentaire `: ping` part toutes les `heartbeat` secondes pour que les
+  proxys ne coupent pas une connexion inactive.
+"""
+import asyncio
+import queue
+import threading
+import time
+
+from change_stream import EVENTS_CHANNEL
+
+SSE_MIMETYPE = 'text/event-stream'
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    # nginx (ingress) : pas de mise en tampon du flux
+    'X-Accel-Buffering': 'no',
+}
+RESYNC_MESSAGE = '{"type":"resync"}'
+# Délai de reconnexion suggéré au navigateur (ms)
+RETRY_MS = 5000
+
+
+def sse_message(data):
+    return f"data: {data}\n\n"
+
+
+class EventHub:
+    """Abonnement Redis partagé par le process, une file par client SSE."""
+
+    def __init__(self, redis_client, channel=EVENTS_CHANNEL, max_clients=100, queue_size=100, heartbeat=15.0):
+        self.redis = redis_client
+        self.channel = channel
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.delivered = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.last_event_at = None
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def _new_queue(self):
+        return queue.Queue(self.queue_size)
+
+    def subscribe(self):
+        """File d'un nouveau client, ou None si le process en a déjà `max_clients`"""
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                self.rejected += 1
+                return None
+            client = self._new_queue()
+            self._clients.add(client)
+            return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def broadcast(self, data):
+        """Recopie un message dans la file de chaque client du process"""
+        self.last_event_at = time.time()
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.put_nowait(data)
+                self.delivered += 1
+            except (queue.Full, asyncio.QueueFull):
+                # Client en retard : on remplace ses deltas par un rechargement complet
+                try:
+                    while True:
+                        client.get_nowait()
+                        self.dropped += 1
+                except (queue.Empty, asyncio.QueueEmpty):
+                    pass
+                client.put_nowait(RESYNC_MESSAGE)
+
+    def _on_message(self, message):
+        self.broadcast(message.get("data"))
+
+    def _on_listener_error(self, exc, pubsub, thread):
+        # Messages peut-être perdus pendant la coupure
+        self.broadcast(RESYNC_MESSAGE)
+        time.sleep(1)
+
+    def start_listener(self):
+        """Démarre le thread d'abonnement au canal (idempotent)"""
+        if self.redis is None or self._listener is not None:
+            return self._listener
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: self._on_message})
+        self._listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True,
+                                              exception_handler=self._on_listener_error)
+        return self._listener
+
+    def stop_listener(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def stream(self, client):
+        """Corps de la réponse SSE d'un client (générateur, libère la file à la fin)"""
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                try:
+                    yield sse_message(client.get(timeout=self.heartbeat))
+                except queue.Empty:
+                    yield ": ping\n\n"
+        finally:
+            self.unsubscribe(client)
+
+    def _listener_running(self):
+        return self._listener is not None and self._listener.is_alive()
+
+    def stats(self):
+        return {
+            "clients": len(self._clients),
+            "max_clients": self.max_clients,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "last_event_at": self.last_event_at,
+            "listener_running": self._listener_running(),
+        }
+
+
+class AsyncEventHub(EventHub):
+    """Variante pour le mode ASGI : redis.asyncio et files asyncio."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pubsub = None
+
+    def _new_queue(self):
+        return asyncio.Queue(self.queue_size)
+
+    async def _listen(self):
+        while True:
+            try:
+                await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.broadcast(RESYNC_MESSAGE)
+                await asyncio.sleep(1)
+
+    async def start_listener(self):
+        if self.redis is None or self._listener is not None:
+            return self._listener
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(**{self.channel: self._on_message})
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return self._listener
+
+    async def stop_listener(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def stream(self, client):
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                try:
+                    yield sse_message(await asyncio.wait_for(client.get(), self.heartbeat))
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            self.unsubscribe(client)
+
+    def _listener_running(self):
+        return self._listener is not None and not self._listener.done()
@@ -0,0 +1,103 @@
+"""Configuration gunicorn du mode production (lancé par start.sh).
+
+- préfork : un process par CPU disponible pour le conteneur (quota cgroup) ;
+- `SERVER_MODE=async` : workers uvicorn qui servent `asgi:app`, sinon
+  workers gthread qui servent l'app Flask `app:app` ;
+- l'app n'est pas préchargée : chaque worker importe app.py après le fork et
+  crée donc ses propres pools MongoClient/Redis (jamais partagés entre process) ;
+- recyclage des workers après `GUNICORN_MAX_REQUESTS` requêtes (avec jitter
+  pour ne pas tous les redémarrer en même temps) ;
+- arrêt propre : SIGTERM laisse `GUNICORN_GRACEFUL_TIMEOUT` secondes aux
+  requêtes en cours avant de couper ;
+- métriques Prometheus multi-process : chaque worker écrit dans
+  `PROMETHEUS_MULTIPROC_DIR`, vidé au démarrage du master.
+
+MONGODB_URI, REDIS_HOST et ENVIRONMENT sont lus par l'app comme avant.
+"""
+import os
+import shutil
+
+
+def available_cpus():
+    """CPUs utilisables par le conteneur (quota cgroup v2, sinon affinité)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'sync')
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', available_cpus()))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+if SERVER_MODE == 'async':
+    wsgi_app = 'asgi:app'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'app:app'
+    worker_class = 'gthread'
+
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', str(max_requests // 10)))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+keepalive = 5
+preload_app = False
+accesslog = '-' if os.getenv('GUNICORN_ACCESS_LOG') else None
+
+# Pools dimensionnés par worker : un thread de requête tient au plus une
+# connexion, plus de la marge pour les threads de fond (cache, pub/sub).
+# Lus par app.py/asgi.py à l'import, donc dans chaque worker.
+os.environ.setdefault('MONGO_MAX_POOL_SIZE', str(threads * 2 if SERVER_MODE != 'async' else 100))
+os.environ.setdefault('REDIS_MAX_CONNECTIONS', str(threads * 2 + 2 if SERVER_MODE != 'async' else 100))
+# Pools des lectures routées vers les secondaires (read_routing.py)
+if SERVER_MODE != 'async':
+    for route_class in ('DASHBOARD', 'LIST'):
+        os.environ.setdefault(f'MONGO_{route_class}_POOL_SIZE', str(threads * 2))
+
+# Flux SSE (/api/events) : en gthread, chacun garde un thread pendant toute
+# la connexion ; la moitié des threads reste aux requêtes ordinaires
+os.environ.setdefault('SSE_MAX_CLIENTS', str(max(1, threads // 2)) if SERVER_MODE != 'async' else '1000')
+
+# Contrôle d'admission (rate_limit.py) : en gthread, pas plus de requêtes en
+# cours que de threads ; les parts write/admin en sont des fractions
+os.environ.setdefault('ADMISSION_MAX_IN_FLIGHT', str(threads) if SERVER_MODE != 'async' else '256')
+
+# Doit être défini avant l'import de prometheus_client dans les workers
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus-multiproc')
+
+
+def on_starting(server):
+    # Les fichiers d'un conteneur précédent fausseraient les compteurs
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_fork(server, worker):
+    server.log.info("Worker %s démarré (pools MongoDB/Redis créés à l'import de l'app)", worker.pid)
+
+
+def child_exit(server, worker):
+    # Les jauges "livesum" du worker mort ne doivent plus compter
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    # Fermer proprement les pools du worker (recyclage ou arrêt)
+    import sys
+    app_module = sys.modules.get('app')
+    close_connections = getattr(app_module, 'close_connections', None)
+    if close_connections is not None:
+        close_connections()
@@ -0,0 +1,307 @@
+"""Index déclarés par l'application et contrôle des plans d'exécution.
+
+`INDEXES` liste tous les index dont les requêtes de l'app ont besoin, clés
+de sharding hashées comprises (mêmes noms que `setup-sharding.sh`) :
+- users : `user_id` hashé (clé de sharding, égalité ciblée sur un shard),
+  `user_id` croissant (plages et tris), `email`, `country + total_spent`
+  (meilleurs clients d'un pays sans tri en mémoire), `updated_at`
+  (synchronisation incrémentale, db_sync.py) ;
+- orders : `order_id` hashé (clé de sharding) et unique (idempotence du
+  write-behind), `user_id + _id` (commandes d'un utilisateur, récentes
+  d'abord) ;
+- hosts : `_id` hashé.
+`/api/users` trie sur `_id` : l'index `_id_` existe sur chaque shard, mais
+la collection étant shardée sur `user_id`, ce tri reste un scatter-gather
+(fusion triée par mongos), accepté dans le catalogue ci-dessous.
+
+`IndexManager.ensure()` crée les index manquants (idempotent : un index
+identique déjà présent n'est pas reconstruit) et signale sans rien supprimer
+ceux dont le nom existe avec d'autres clés ou options. Il est lancé en
+arrière-plan à la connexion MongoDB (`ENSURE_INDEXES=1`), ou à la main :
+
+    python app/indexes.py ensure
+    python app/indexes.py explain
+
+`explain_catalog` passe les requêtes de `QUERIES` (celles des routes) dans
+`explain` et signale les plans `COLLSCAN`, les tris en mémoire et les
+scatter-gather (plusieurs shards) non attendus.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, HASHED, IndexModel
+from pymongo.errors import OperationFailure
+
+COLLSCAN = 'COLLSCAN'
+IN_MEMORY_SORT = 'IN_MEMORY_SORT'
+SCATTER_GATHER = 'SCATTER_GATHER'
+# Codes MongoDB : même nom avec d'autres options / d'autres clés
+INDEX_CONFLICT_CODES = (85, 86)
+
+
+class IndexSpec:
+    """Index attendu sur `collection` (nom MongoDB par défaut, ex. `email_1`)"""
+
+    def __init__(self, collection, keys, reason, **options):
+        self.collection = collection
+        self.keys = keys
+        self.reason = reason
+        self.options = options
+        self.name = options.get('name') or '_'.join(f"{field}_{direction}" for field, direction in keys)
+
+    def model(self):
+        return IndexModel(self.keys, **{**self.options, 'name': self.name})
+
+    def matches(self, info):
+        """`info` : entrée de `index_information()` pour ce nom"""
+        return [(field, direction) for field, direction in info['key']] == list(self.keys) \
+            and bool(info.get('unique')) == bool(self.options.get('unique'))
+
+    def describe(self):
+        return {"collection": self.collection, "name": self.name,
+                "keys": dict(self.keys), "reason": self.reason, **self.options}
+
+
+INDEXES = (
+    IndexSpec('users', [('user_id', HASHED)], "clé de sharding"),
+    IndexSpec('users', [('user_id', ASCENDING)], "plages et tris sur user_id"),
+    IndexSpec('users', [('email', ASCENDING)], "recherche par email"),
+    IndexSpec('users', [('country', ASCENDING), ('total_spent', DESCENDING)], "meilleurs clients par pays"),
+    IndexSpec('users', [('updated_at', ASCENDING)], "synchronisation incrémentale vers TEST"),
+    IndexSpec('orders', [('order_id', HASHED)], "clé de sharding"),
+    IndexSpec('orders', [('order_id', ASCENDING)], "idempotence du write-behind", unique=True),
+    IndexSpec('orders', [('user_id', ASCENDING), ('_id', DESCENDING)], "commandes d'un utilisateur"),
+    IndexSpec('hosts', [('_id', HASHED)], "clé de sharding"),
+)
+
+
+class PlannedQuery:
+    """Requête émise par une route, contrôlée par `explain`.
+
+    `route` : route ou composant qui l'émet. `accepted` : signalements
+    attendus (ex. scatter-gather d'une liste globale triée sur `_id`).
+    """
+
+    def __init__(self, name, collection, filter, sort=None, limit=0, accepted=(), route=None):
+        self.name = name
+        self.route = route
+        self.collection = collection
+        self.filter = filter
+        self.sort = sort
+        self.limit = limit
+        self.accepted = frozenset(accepted)
+
+    def cursor(self, db):
+        cursor = db[self.collection].find(self.filter)
+        if self.sort:
+            cursor = cursor.sort(self.sort)
+        if self.limit:
+            cursor = cursor.limit(self.limit)
+        return cursor
+
+
+QUERIES = (
+    PlannedQuery('users_recent', 'users', {}, [('_id', DESCENDING)], 100, accepted={SCATTER_GATHER},
+                 route='/api/users'),
+    PlannedQuery('users_after_cursor', 'users', {'_id': {'$lt': ObjectId('f' * 24)}}, [('_id', DESCENDING)], 100,
+                 accepted={SCATTER_GATHER}, route='/api/users?cursor='),
+    PlannedQuery('user_by_id', 'users', {'user_id': 'user_1'}, route='/api/random-order'),
+    PlannedQuery('users_by_ids', 'users', {'user_id': {'$in': ['user_1', 'user_2', 'user_3']}},
+                 accepted={SCATTER_GATHER}, route='/api/orders/bulk'),
+    PlannedQuery('users_by_email', 'users', {'email': 'alice@ecam.be'}, accepted={SCATTER_GATHER}),
+    PlannedQuery('top_spenders_in_country', 'users', {'country': 'France'}, [('total_spent', DESCENDING)], 10,
+                 accepted={SCATTER_GATHER}),
+    PlannedQuery('order_by_id', 'orders', {'order_id': 'order_1'}, route='order_stream.py'),
+    PlannedQuery('orders_of_user', 'orders', {'user_id': 'user_1'}, [('_id', DESCENDING)], 50,
+                 accepted={SCATTER_GATHER}),
+    PlannedQuery('hosts_all', 'hosts', {}, accepted={SCATTER_GATHER, COLLSCAN}, route='/hosts'),
+)
+
+
+def winning_plan(plan):
+    # MongoDB 7 (moteur SBE) enveloppe le plan dans `queryPlan`
+    return plan.get('queryPlan', plan)
+
+
+def plan_stages(plan):
+    """Toutes les étapes d'un plan (shards compris), en profondeur"""
+    plan = winning_plan(plan)
+    stages = [plan]
+    for child in plan.get('inputStages', []) + ([plan['inputStage']] if 'inputStage' in plan else []):
+        stages.extend(plan_stages(child))
+    for shard in plan.get('shards', []):
+        stages.extend(plan_stages(shard.get('winningPlan', {})))
+    return stages
+
+
+def analyze_plan(explain):
+    """Signalements et index utilisés d'une sortie d'`explain` (mongod ou mongos)"""
+    plan = winning_plan(explain.get('queryPlanner', {}).get('winningPlan', {}))
+    stages = plan_stages(plan)
+    names = {stage.get('stage') for stage in stages}
+    flags = set()
+    if COLLSCAN in names:
+        flags.add(COLLSCAN)
+    if 'SORT' in names:
+        flags.add(IN_MEMORY_SORT)
+    if plan.get('stage') in ('SHARD_MERGE', 'SHARD_MERGE_SORT') and len(plan.get('shards', [])) > 1:
+        flags.add(SCATTER_GATHER)
+    return {
+        "flags": sorted(flags),
+        "indexes": sorted({stage['indexName'] for stage in stages if stage.get('indexName')}),
+        "shards": len(plan.get('shards', [])) or 1,
+    }
+
+
+def explain_report(query, explain):
+    report = {"query": query.name, "route": query.route, "collection": query.collection, **analyze_plan(explain)}
+    report["unexpected"] = sorted(set(report["flags"]) - query.accepted)
+    return report
+
+
+def explain_catalog(db, queries=QUERIES):
+    """Plan de chaque requête du catalogue ; `unexpected` liste les problèmes"""
+    reports = []
+    for query in queries:
+        try:
+            reports.append(explain_report(query, query.cursor(db).explain()))
+        except Exception as e:
+            reports.append({"query": query.name, "collection": query.collection, "error": str(e)})
+    return reports
+
+
+def index_status(spec, existing):
+    info = existing.get(spec.name)
+    if info is None:
+        return 'missing'
+    return 'exists' if spec.matches(info) else 'conflict'
+
+
+def normalize_index_information(information):
+    # mongomock renvoie les clés en dict_items
+    return {name: {**info, 'key': list(info['key'])} for name, info in information.items()}
+
+
+class IndexManager:
+    """Crée les index déclarés, en arrière-plan, sans jamais en supprimer."""
+
+    def __init__(self, db, specs=INDEXES):
+        self.db = db
+        self.specs = specs
+        self.last_run = None
+        self._thread = None
+
+    def ensure(self):
+        """Crée les index manquants ; renvoie le statut de chacun"""
+        started = time.perf_counter()
+        results = []
+        for collection in dict.fromkeys(spec.collection for spec in self.specs):
+            specs = [spec for spec in self.specs if spec.collection == collection]
+            existing = normalize_index_information(self.db[collection].index_information())
+            for spec in specs:
+                status = index_status(spec, existing)
+                if status == 'missing':
+                    try:
+                        self.db[collection].create_indexes([spec.model()])
+                        status = 'created'
+                    except OperationFailure as e:
+                        status = 'conflict' if e.code in INDEX_CONFLICT_CODES else f"error: {e}"
+                results.append({"collection": collection, "name": spec.name, "status": status})
+        self.last_run = {"at": time.time(), "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                         "indexes": results}
+        return self.last_run
+
+    def _ensure_quietly(self):
+        try:
+            self.ensure()
+        except Exception as e:
+            self.last_run = {"at": time.time(), "error": str(e)}
+
+    def start(self):
+        """Lance `ensure` dans un thread; False s'il tourne déjà"""
+        if self.running():
+            return False
+        self._thread = threading.Thread(target=self._ensure_quietly, name="indexes", daemon=True)
+        self._thread.start()
+        return True
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def explain(self):
+        return explain_catalog(self.db)
+
+    def report(self):
+        return {"declared": [spec.describe() for spec in self.specs], "running": self.running(),
+                "last_run": self.last_run}
+
+
+class AsyncIndexManager(IndexManager):
+    """Variante d'`IndexManager` pour le mode ASGI (AsyncMongoClient)."""
+
+    async def ensure(self):
+        started = time.perf_counter()
+        results = []
+        for collection in dict.fromkeys(spec.collection for spec in self.specs):
+            specs = [spec for spec in self.specs if spec.collection == collection]
+            existing = normalize_index_information(await self.db[collection].index_information())
+            for spec in specs:
+                status = index_status(spec, existing)
+                if status == 'missing':
+                    try:
+                        await self.db[collection].create_indexes([spec.model()])
+                        status = 'created'
+                    except OperationFailure as e:
+                        status = 'conflict' if e.code in INDEX_CONFLICT_CODES else f"error: {e}"
+                results.append({"collection": collection, "name": spec.name, "status": status})
+        self.last_run = {"at": time.time(), "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                         "indexes": results}
+        return self.last_run
+
+    async def _ensure_quietly(self):
+        try:
+            await self.ensure()
+        except Exception as e:
+            self.last_run = {"at": time.time(), "error": str(e)}
+
+    def start(self):
+        if self.running():
+            return False
+        self._thread = asyncio.get_running_loop().create_task(self._ensure_quietly())
+        return True
+
+    def running(self):
+        return self._thread is not None and not self._thread.done()
+
+    async def explain(self):
+        reports = []
+        for query in QUERIES:
+            try:
+                reports.append(explain_report(query, await query.cursor(self.db).explain()))
+            except Exception as e:
+                reports.append({"query": query.name, "collection": query.collection, "error": str(e)})
+        return reports
+
+
+def main():
+    """`python app/indexes.py ensure|explain` (MONGODB_URI comme l'app)"""
+    from pymongo import MongoClient
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'ensure'
+    if command not in ('ensure', 'explain'):
+        raise SystemExit("usage: indexes.py ensure|explain")
+    uri = os.getenv('MONGODB_URI', 'mongodb://mongo-mongos.dev.svc.cluster.local:27017/?directConnection=true')
+    manager = IndexManager(MongoClient(uri)["demoDB"])
+    result = manager.ensure() if command == 'ensure' else manager.explain()
+    print(json.dumps(result, indent=2, default=str))
+    if command == 'explain' and any(report.get("unexpected") for report in result):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""Ingestion de commandes en masse (`POST /api/orders/bulk`).
+
+Les commandes arrivent en tableau JSON ou en flux NDJSON (une commande par
+ligne, lu au fil de l'eau sans charger tout le corps). Par lot de
+`batch_size` commandes :
+- un `insert_many(ordered=False)` dans `orders` ;
+- les `$inc` de `order_count`/`total_spent` regroupés par `user_id` en un
+  seul `bulk_write` d'`UpdateOne` (une opération par utilisateur, pas par
+  commande), uniquement pour les commandes réellement insérées, avec
+  `updated_at` (synchronisation incrémentale de TEST, voir db_sync.py) ;
+- `on_applied(commandes)` optionnel (agrégats analytics).
+Chaque lot renvoie ses statistiques de débit. Les erreurs sont rapportées
+avec la position de la commande dans le flux (`index`, à partir de 0). Si un
+lot échoue (MongoDB indisponible...), l'ingestion s'arrête et le rapport
+partiel (lots déjà insérés, `error`) est renvoyé.
+"""
+from collections import defaultdict
+import time
+import uuid
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from serialization import loads
+
+MAX_REPORTED_ERRORS = 20
+
+
+def iter_ndjson(lines):
+    """Décode un flux NDJSON ligne par ligne (les lignes vides sont ignorées)"""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield loads(line)
+        except ValueError as e:
+            yield ValueError(f"JSON invalide: {e}")
+
+
+async def aiter_ndjson(chunks):
+    """Comme `iter_ndjson` sur un flux async de morceaux d'octets (corps ASGI)"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for item in iter_ndjson(lines):
+            yield item
+    for item in iter_ndjson([buffer]):
+        yield item
+
+
+async def aiter_list(items):
+    for item in items:
+        yield item
+
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+def validate_order(raw):
+    """Normalise une commande entrante; lève ValueError si elle est invalide"""
+    if isinstance(raw, Exception):
+        raise raw
+    if not isinstance(raw, dict):
+        raise ValueError("une commande doit être un objet JSON")
+    user_id = raw.get("user_id")
+    amount = raw.get("amount")
+    if not isinstance(user_id, str) or not user_id:
+        raise ValueError("user_id manquant")
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount < 0:
+        raise ValueError("amount doit être un nombre positif")
+    order = {
+        "order_id": raw.get("order_id") or f"order_{uuid.uuid4().hex}",
+        "user_id": user_id,
+        "amount": round(float(amount), 2),
+    }
+    if raw.get("user_name"):
+        order["user_name"] = raw["user_name"]
+    return order
+
+
+def user_increments(orders):
+    """Un UpdateOne `$inc` par utilisateur pour un lot de commandes insérées"""
+    totals = defaultdict(lambda: [0, 0.0])
+    for order in orders:
+        total = totals[order["user_id"]]
+        total[0] += 1
+        total[1] += order["amount"]
+    return [
+        UpdateOne({"user_id": user_id},
+                  {"$inc": {"order_count": count, "total_spent": round(spent, 2)}, "$currentDate": {"updated_at": True}})
+        for user_id, (count, spent) in totals.items()
+    ]
+
+
+def inserted_orders(orders, error):
+    """Commandes insérées malgré une BulkWriteError (insert non ordonné)"""
+    failed = {write_error["index"] for write_error in error.details.get("writeErrors", [])}
+    return [order for index, order in enumerate(orders) if index not in failed]
+
+
+def reject_write_errors(report, orders, positions, error):
+    """Rejets d'une BulkWriteError, à la position de chaque commande dans le flux"""
+    for write_error in error.details.get("writeErrors", []):
+        report.reject(positions[write_error["index"]], write_error.get("errmsg"),
+                      orders[write_error["index"]]["order_id"])
+
+
+class IngestReport:
+    """Statistiques cumulées de l'ingestion (par lot et au total)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.batches = []
+        self.received = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.users_updated = 0
+        self.errors = []
+        self.error = None
+
+    def reject(self, index, reason, order_id=None):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            entry = {"index": index, "error": str(reason)}
+            if order_id is not None:
+                entry["order_id"] = order_id
+            self.errors.append(entry)
+
+    def add_batch(self, orders, inserted, users_updated, duration, error=None):
+        self.inserted += inserted
+        self.users_updated += users_updated
+        batch = {
+            "batch": len(self.batches),
+            "orders": orders,
+            "inserted": inserted,
+            "users_updated": users_updated,
+            "duration_ms": round(duration * 1000, 2),
+            "orders_per_sec": round(inserted / duration, 1) if duration > 0 else None,
+        }
+        if error is not None:
+            batch["error"] = self.error = str(error)
+        self.batches.append(batch)
+
+    def to_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "rejected": self.rejected,
+            "users_updated": self.users_updated,
+            "duration_ms": round(elapsed * 1000, 2),
+            "orders_per_sec": round(self.inserted / elapsed, 1) if elapsed > 0 else None,
+            "batches": self.batches,
+            "errors": self.errors,
+            **({"error": self.error} if self.error is not None else {}),
+        }
+
+
+class OrderIngestor:
+    """Insère un flux de commandes par lots non ordonnés"""
+
+    def __init__(self, db, batch_size=1000, on_applied=None):
+        self.db = db
+        self.batch_size = batch_size
+        # Appelé avec les commandes dont les stats utilisateur viennent d'être appliquées
+        self.on_applied = on_applied
+
+    def _fill_user_names(self, orders):
+        missing = {order["user_id"] for order in orders if "user_name" not in order}
+        if not missing:
+            return
+        names = {
+            user["user_id"]: user.get("name")
+            for user in self.db.users.find({"user_id": {"$in": list(missing)}}, {"_id": 0, "user_id": 1, "name": 1})
+        }
+        for order in orders:
+            if "user_name" not in order and names.get(order["user_id"]):
+                order["user_name"] = names[order["user_id"]]
+
+    def _write_batch(self, orders, positions, report):
+        """Écrit un lot; False (erreur dans le rapport) si le lot a échoué"""
+        started = time.perf_counter()
+        inserted, updates = [], []
+        try:
+            self._fill_user_names(orders)
+            try:
+                self.db.orders.insert_many(orders, ordered=False)
+                inserted = orders
+            except BulkWriteError as error:
+                inserted = inserted_orders(orders, error)
+                reject_write_errors(report, orders, positions, error)
+            updates = user_increments(inserted)
+            if updates:
+                self.db.users.bulk_write(updates, ordered=False)
+            if self.on_applied is not None:
+                self.on_applied(inserted)
+        except Exception as e:
+            report.add_batch(len(orders), len(inserted), len(updates), time.perf_counter() - started, error=e)
+            return False
+        report.add_batch(len(orders), len(inserted), len(updates), time.perf_counter() - started)
+        return True
+
+    def ingest(self, raw_orders):
+        report = IngestReport()
+        batch, positions = [], []
+        for index, raw in enumerate(raw_orders):
+            report.received += 1
+            try:
+                batch.append(validate_order(raw))
+            except ValueError as e:
+                report.reject(index, e)
+                continue
+            positions.append(index)
+            if len(batch) >= self.batch_size:
+                if not self._write_batch(batch, positions, report):
+                    return report
+                batch, positions = [], []
+        if batch:
+            self._write_batch(batch, positions, report)
+        return report
+
+
+class AsyncOrderIngestor(OrderIngestor):
+    """Variante de `OrderIngestor` pour le mode ASGI (AsyncMongoClient)"""
+
+    async def _fill_user_names(self, orders):
+        missing = {order["user_id"] for order in orders if "user_name" not in order}
+        if not missing:
+            return
+        cursor = self.db.users.find({"user_id": {"$in": list(missing)}}, {"_id": 0, "user_id": 1, "name": 1})
+        names = {user["user_id"]: user.get("name") async for user in cursor}
+        for order in orders:
+            if "user_name" not in order and names.get(order["user_id"]):
+                order["user_name"] = names[order["user_id"]]
+
+    async def _write_batch(self, orders, positions, report):
+        started = time.perf_counter()
+        inserted, updates = [], []
+        try:
+            await self._fill_user_names(orders)
+            try:
+                await self.db.orders.insert_many(orders, ordered=False)
+                inserted = orders
+            except BulkWriteError as error:
+                inserted = inserted_orders(orders, error)
+                reject_write_errors(report, orders, positions, error)
+            updates = user_increments(inserted)
+            if updates:
+                await self.db.users.bulk_write(updates, ordered=False)
+            if self.on_applied is not None:
+                await self.on_applied(inserted)
+        except Exception as e:
+            report.add_batch(len(orders), len(inserted), len(updates), time.perf_counter() - started, error=e)
+            return False
+        report.add_batch(len(orders), len(inserted), len(updates), time.perf_counter() - started)
+        return True
+
+    async def ingest(self, raw_orders):
+        """`raw_orders` est un itérable async de commandes décodées"""
+        report = IngestReport()
+        batch, positions = [], []
+        index = 0
+        async for raw in raw_orders:
+            report.received += 1
+            try:
+                batch.append(validate_order(raw))
+            except ValueError as e:
+                report.reject(index, e)
+            else:
+                positions.append(index)
+                if len(batch) >= self.batch_size:
+                    if not await self._write_batch(batch, positions, report):
+                        return report
+                    batch, positions = [], []
+            index += 1
+        if batch:
+            await self._write_batch(batch, positions, report)
+        return report
@@ -0,0 +1,296 @@
+"""Métriques Prometheus (`/metrics`) : latences HTTP, MongoDB, Redis et cache.
+
+- HTTP : histogramme par route (gabarit d'URL, pas l'URL brute), méthode et
+  code de statut ;
+- MongoDB : `CommandListener` de pymongo, une mesure par commande envoyée au
+  serveur (`find`, `aggregate`, `insert`, ... : `count_documents` apparaît
+  en `aggregate`), durée fournie par le driver ;
+- Redis : `execute_command` des clients `InstrumentedRedis`, une
+  mesure par commande (`get`, `set`, `hincrby`, ...) et par pipeline ;
+- cache : compteurs hit/miss/error par clé de cache ;
+- pools : connexions MongoDB (événements du pool) et Redis (à chaque requête).
+
+Sous gunicorn, `PROMETHEUS_MULTIPROC_DIR` (positionné par gunicorn_conf.py)
+fait écrire chaque worker dans des fichiers mmap de ce répertoire ; `/metrics`
+agrège alors tous les workers, quel que soit celui qui répond.
+"""
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from pymongo import monitoring
+import redis
+import redis.asyncio as aioredis
+
+import redis_pool
+
+# Requêtes HTTP : de 1 ms à 10 s
+HTTP_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+# Appels backend : plus fins vers le bas (un GET Redis fait ~100 µs)
+BACKEND_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 5)
+
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Durée des requêtes HTTP',
+    ['method', 'route', 'status'], buckets=HTTP_BUCKETS
+)
+MONGO_LATENCY = Histogram(
+    'mongodb_command_duration_seconds', 'Durée des commandes MongoDB',
+    ['command', 'outcome'], buckets=BACKEND_BUCKETS
+)
+REDIS_LATENCY = Histogram(
+    'redis_command_duration_seconds', 'Durée des commandes Redis',
+    ['command', 'outcome'], buckets=BACKEND_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Lectures de cache par résultat (l1, l2, stale, miss, error)',
+    ['cache', 'result']
+)
+COALESCED_READS = Counter(
+    'coalesced_reads_total', 'Lectures MongoDB par requête (backend : appel fait, coalesced : résultat partagé)',
+    ['query', 'result']
+)
+REQUESTS_REJECTED = Counter(
+    'requests_rejected_total', 'Requêtes refusées avant la route (rate_limited : 429, overloaded/slow_backend : 503)',
+    ['route_class', 'reason']
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    'mongodb_pool_connections', 'Connexions MongoDB ouvertes', ['state'], multiprocess_mode='livesum'
+)
+REDIS_POOL_CONNECTIONS = Gauge(
+    'redis_pool_connections', 'Connexions Redis du pool', ['state'], multiprocess_mode='livesum'
+)
+# Retard du worker write-behind (relevé sur Redis à chaque scrape : valeur
+# commune à tous les workers, on garde la plus récente)
+ORDERS_STREAM_LAG = Gauge(
+    'orders_stream_lag', 'Commandes du stream pas encore lues par le groupe', multiprocess_mode='mostrecent'
+)
+ORDERS_STREAM_PENDING = Gauge(
+    'orders_stream_pending', 'Commandes lues mais pas encore acquittées', multiprocess_mode='mostrecent'
+)
+ORDERS_STREAM_OLDEST_AGE = Gauge(
+    'orders_stream_oldest_age_seconds', 'Âge de la plus ancienne commande pas encore écrite',
+    multiprocess_mode='mostrecent'
+)
+
+
+def observe_http(method, route, status, duration):
+    HTTP_LATENCY.labels(method, route, str(status)).observe(duration)
+
+
+def observe_cache(cache, tier, error=False):
+    """`tier` est le niveau renvoyé par `get_or_compute` (None = miss)"""
+    result = 'error' if error else (tier.lower() if tier else 'miss')
+    CACHE_REQUESTS.labels(cache, result).inc()
+
+
+def observe_coalescing(query, coalesced):
+    COALESCED_READS.labels(query, 'coalesced' if coalesced else 'backend').inc()
+
+
+def observe_rejection(route_class, reason):
+    REQUESTS_REJECTED.labels(route_class, reason).inc()
+
+
+def update_redis_pool(client):
+    """Relève l'occupation du pool Redis du process (appelé après chaque requête)"""
+    usage = redis_pool.pool_usage(client)
+    if usage is None:
+        return
+    in_use, idle = usage
+    REDIS_POOL_CONNECTIONS.labels('in_use').set(in_use)
+    REDIS_POOL_CONNECTIONS.labels('idle').set(idle)
+
+
+def update_order_stream(report):
+    """`report` est le résultat de `OrderStream.lag()`"""
+    ORDERS_STREAM_LAG.set(report["lag"] if report["lag"] is not None else report["length"])
+    ORDERS_STREAM_PENDING.set(report["pending"])
+    ORDERS_STREAM_OLDEST_AGE.set(report["oldest_age_s"])
+
+
+def render():
+    """Corps et content-type de `/metrics` (agrégé sur les workers si multiprocess)"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Latence de chaque commande MongoDB (mesurée par le driver)"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_LATENCY.labels(event.command_name, 'ok').observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_LATENCY.labels(event.command_name, 'error').observe(event.duration_micros / 1e6)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Connexions ouvertes / empruntées du pool MongoDB"""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.labels('open').inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.labels('open').dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CONNECTIONS.labels('checked_out').inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CONNECTIONS.labels('checked_out').dec()
+
+
+def mongo_listeners():
+    return [MongoCommandMetrics(), MongoPoolMetrics()]
+
+
+def _command_name(args):
+    name = args[0] if args else 'unknown'
+    return (name.decode() if isinstance(name, bytes) else str(name)).lower()
+
+
+# Erreurs qui traduisent un Redis malade (pas une commande invalide)
+REDIS_BACKEND_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+
+def _before_redis_call(breaker):
+    if breaker is not None and not breaker.allow():
+        raise redis.ConnectionError(f"{breaker.name} circuit open")
+    return time.perf_counter()
+
+
+def _after_redis_call(breaker, command, started, error=None):
+    duration = time.perf_counter() - started
+    REDIS_LATENCY.labels(command, 'error' if error is not None else 'ok').observe(duration)
+    if breaker is not None:
+        breaker.record(not isinstance(error, REDIS_BACKEND_ERRORS), duration)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    breaker = None
+
+    def execute(self, raise_on_error=True):
+        started = _before_redis_call(self.breaker)
+        try:
+            result = super().execute(raise_on_error)
+        except Exception as e:
+            _after_redis_call(self.breaker, 'pipeline', started, e)
+            raise
+        _after_redis_call(self.breaker, 'pipeline', started)
+        return result
+
+
+class InstrumentedRedis(redis.Redis):
+    """Client Redis qui mesure chaque commande.
+
+    Si `breaker` (un `CircuitBreaker`) est renseigné, les commandes passent
+    par le disjoncteur : circuit ouvert = `redis.ConnectionError` immédiate,
+    que les composants traitent déjà comme un Redis indisponible.
+    """
+    breaker = None
+
+    def execute_command(self, *args, **options):
+        started = _before_redis_call(self.breaker)
+        try:
+            result = super().execute_command(*args, **options)
+        except Exception as e:
+            _after_redis_call(self.breaker, _command_name(args), started, e)
+            raise
+        _after_redis_call(self.breaker, _command_name(args), started)
+        return result
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.breaker = self.breaker
+        return pipe
+
+
+class InstrumentedAsyncPipeline(aioredis.client.Pipeline):
+    breaker = None
+
+    async def execute(self, raise_on_error=True):
+        started = _before_redis_call(self.breaker)
+        try:
+            result = await super().execute(raise_on_error)
+        except Exception as e:
+            _after_redis_call(self.breaker, 'pipeline', started, e)
+            raise
+        _after_redis_call(self.breaker, 'pipeline', started)
+        return result
+
+
+class InstrumentedAsyncRedis(aioredis.Redis):
+    """Variante de `InstrumentedRedis` pour redis.asyncio"""
+    breaker = None
+
+    async def execute_command(self, *args, **options):
+        started = _before_redis_call(self.breaker)
+        try:
+            result = await super().execute_command(*args, **options)
+        except Exception as e:
+            _after_redis_call(self.breaker, _command_name(args), started, e)
+            raise
+        _after_redis_call(self.breaker, _command_name(args), started)
+        return result
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = InstrumentedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.breaker = self.breaker
+        return pipe
+
+
+class ASGIMetricsMiddleware:
+    """Middleware ASGI : même histogramme HTTP que le `after_request` de app.py"""
+
+    def __init__(self, app, redis_client=None):
+        self.app = app
+        self.redis_client = redis_client
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Le routeur Starlette dépose la route trouvée dans le scope
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            observe_http(scope["method"], route, status, time.perf_counter() - started)
+            update_redis_pool(self.redis_client)
@@ -0,0 +1,397 @@
+"""Migrations de schéma versionnées, par lots, reprenables.
+
+Chaque `Migration` porte une version : elle s'applique aux documents dont
+`schema_version` est inférieur, et fixe `schema_version` à sa version. Le
+`MigrationRunner` les exécute dans l'ordre, en arrière-plan (thread ou tâche
+asyncio), jamais dans la requête HTTP :
+- lots de `batch_size` documents parcourus par `_id` croissant (index `_id`
+  de chaque shard, pas de tri en mémoire), un `update_many` ciblé sur les
+  `_id` du lot ;
+- débit plafonné à `max_docs_per_sec`, pause tant que le disjoncteur
+  MongoDB n'est pas fermé : le trafic de l'app garde sa latence ;
+- point de reprise (`last_id`, compteurs) enregistré après chaque lot dans la
+  collection `migrations`, avec un bail (`lease_expires`) : un seul replica
+  exécute une migration, et un autre la reprend si le bail expire.
+
+Le point de reprise ne sert qu'à finir un run interrompu : relancer une
+migration terminée reparcourt le filtre des documents en attente (les
+ObjectId d'autres process ne sont pas strictement croissants) et ne modifie
+que ceux encore sans la version.
+Rejouer un lot est sans effet (filtre sur `schema_version`).
+"""
+import asyncio
+import contextvars
+from datetime import datetime, timedelta
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+from breaker import CLOSED
+
+PENDING = 'pending'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Migration:
+    """Migration d'une collection vers `version`.
+
+    `fields(now)` renvoie les champs d'un `$set` d'agrégation (pipeline
+    d'update) : ils peuvent donc dépendre des valeurs existantes.
+    """
+
+    def __init__(self, version, name, collection, fields):
+        self.version = version
+        self.name = name
+        self.collection = collection
+        self.fields = fields
+
+    def pending_filter(self):
+        return {"schema_version": {"$not": {"$gte": self.version}}}
+
+    def update(self, now):
+        # updated_at (heure du serveur) : repris par la synchronisation incrémentale vers TEST
+        return [{"$set": {**self.fields(now), "schema_version": self.version, "updated_at": "$$NOW"}}]
+
+
+MIGRATIONS = (
+    Migration(1, "users_created_at", "users", lambda now: {
+        "created_at": {"$ifNull": ["$created_at", now]},
+    }),
+    Migration(2, "users_stats_defaults", "users", lambda now: {
+        "order_count": {"$ifNull": ["$order_count", 0]},
+        "total_spent": {"$ifNull": ["$total_spent", 0]},
+    }),
+)
+
+
+def resume_id(state):
+    """`last_id` de reprise : seulement pour un run interrompu (RUNNING/PAUSED).
+
+    Relancer une migration terminée (ou en échec) reparcourt tout le filtre
+    des documents en attente : des `_id` créés entre-temps par d'autres
+    process (ou pods dont l'horloge diffère) peuvent être inférieurs au
+    dernier point de reprise.
+    """
+    if state.get("status") in (RUNNING, PAUSED):
+        return state.get("last_id")
+    return None
+
+
+def batch_query(migration, last_id):
+    query = migration.pending_filter()
+    if last_id is not None:
+        query["_id"] = {"$gt": last_id}
+    return query
+
+
+def throttle_delay(processed, elapsed, max_docs_per_sec):
+    """Attente pour ne pas dépasser `max_docs_per_sec` depuis le début du run"""
+    if not max_docs_per_sec:
+        return 0.0
+    return max(0.0, processed / max_docs_per_sec - elapsed)
+
+
+def progress_report(migration, state):
+    """Avancement lisible d'une migration (`state` = son document de reprise)"""
+    state = state or {}
+    processed = state.get("processed", 0)
+    report = {
+        "version": migration.version,
+        "name": migration.name,
+        "collection": migration.collection,
+        "status": state.get("status", PENDING),
+        "processed": processed,
+        "modified": state.get("modified", 0),
+        "batches": state.get("batches", 0),
+        "total_estimate": state.get("total_estimate"),
+        "owner": state.get("owner"),
+        "error": state.get("error"),
+        "started_at": state.get("started_at"),
+        "updated_at": state.get("updated_at"),
+        "finished_at": state.get("finished_at"),
+        "docs_per_sec": None,
+        "percent": None,
+    }
+    if state.get("started_at") and state.get("updated_at"):
+        elapsed = (state["updated_at"] - state["started_at"]).total_seconds()
+        if elapsed > 0:
+            report["docs_per_sec"] = round(state.get("run_processed", processed) / elapsed, 1)
+    if report["total_estimate"]:
+        report["percent"] = min(100.0, round(100 * processed / report["total_estimate"], 1))
+    if report["status"] == DONE:
+        report["percent"] = 100.0
+    return report
+
+
+class MigrationRunner:
+    """Exécute les `MIGRATIONS` en arrière-plan avec points de reprise."""
+
+    def __init__(self, db, owner, migrations=MIGRATIONS, batch_size=500, max_docs_per_sec=2000,
+                 lease_seconds=60, breaker=None):
+        self.db = db
+        self.owner = owner
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.batch_size = batch_size
+        self.max_docs_per_sec = max_docs_per_sec
+        self.lease_seconds = lease_seconds
+        self.breaker = breaker
+        self.checkpoints = db.migrations
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _initial_state(self, migration):
+        return {"name": migration.name, "collection": migration.collection, "status": PENDING,
+                "processed": 0, "modified": 0, "batches": 0, "last_id": None}
+
+    def _acquire_filter(self, migration, now):
+        """Migration libre : pas de bail en cours chez un autre replica"""
+        return {"_id": migration.version,
+                "$or": [{"lease_expires": None}, {"lease_expires": {"$lt": now}}, {"owner": self.owner}]}
+
+    def _acquire_update(self, migration, now, total_estimate):
+        return {"$set": {"status": RUNNING, "owner": self.owner,
+                         "lease_expires": now + timedelta(seconds=self.lease_seconds), "started_at": now, "updated_at": now, "run_processed": 0, "pause_requested": False,
+                         "error": None, "finished_at": None, "total_estimate": total_estimate}}
+
+    def acquire(self, migration):
+        """Prend le bail de `migration`; renvoie son état d'avant la prise du
+        bail (statut du run précédent), ou None si un autre replica l'exécute"""
+        now = datetime.utcnow()
+        self.checkpoints.update_one({"_id": migration.version}, {"$setOnInsert": self._initial_state(migration)},
+                                    upsert=True)
+        total_estimate = self.db[migration.collection].estimated_document_count()
+        return self.checkpoints.find_one_and_update(
+            self._acquire_filter(migration, now), self._acquire_update(migration, now, total_estimate),
+            return_document=ReturnDocument.BEFORE
+        )
+
+    def _checkpoint_update(self, last_id, batch, modified):
+        now = datetime.utcnow()
+        return {"$set": {"last_id": last_id, "updated_at": now,
+                         "lease_expires": now + timedelta(seconds=self.lease_seconds)},
+                "$inc": {"processed": batch, "run_processed": batch, "modified": modified, "batches": 1}}
+
+    def checkpoint(self, migration, last_id, batch, modified):
+        """Point de reprise après un lot; None si le bail a été perdu"""
+        return self.checkpoints.find_one_and_update(
+            {"_id": migration.version, "owner": self.owner},
+            self._checkpoint_update(last_id, batch, modified),
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _release(self, migration, status, error=None):
+        fields = {"status": status, "lease_expires": None, "updated_at": datetime.utcnow()}
+        if status == DONE:
+            fields["finished_at"] = fields["updated_at"]
+        if error is not None:
+            fields["error"] = str(error)
+        self.checkpoints.update_one({"_id": migration.version, "owner": self.owner}, {"$set": fields})
+
+    def _backend_busy(self):
+        return self.breaker is not None and self.breaker.state != CLOSED
+
+    def run(self, migration):
+        """Exécute une migration jusqu'au bout; renvoie son statut final"""
+        state = self.acquire(migration)
+        if state is None:
+            return None
+        collection = self.db[migration.collection]
+        last_id = resume_id(state)
+        started = time.monotonic()
+        processed = 0
+        try:
+            while True:
+                if self._stop.is_set():
+                    self._release(migration, PAUSED)
+                    return PAUSED
+                if self._backend_busy():
+                    self._stop.wait(max(1.0, self.breaker.retry_after()))
+                    continue
+                cursor = collection.find(batch_query(migration, last_id), {"_id": 1}).sort("_id", 1)
+                ids = [document["_id"] for document in cursor.limit(self.batch_size)]
+                if not ids:
+                    self._release(migration, DONE)
+                    return DONE
+                result = collection.update_many({"_id": {"$in": ids}, **migration.pending_filter()},
+                                                migration.update(datetime.utcnow()))
+                last_id = ids[-1]
+                state = self.checkpoint(migration, last_id, len(ids), result.modified_count)
+                if state is None:
+                    return None  # bail repris par un autre replica
+                if state.get("pause_requested"):
+                    self._release(migration, PAUSED)
+                    return PAUSED
+                processed += len(ids)
+                self._stop.wait(throttle_delay(processed, time.monotonic() - started, self.max_docs_per_sec))
+        except Exception as e:
+            self._release(migration, FAILED, e)
+            raise
+
+    def run_all(self):
+        """Migrations dans l'ordre des versions; s'arrête à la première non terminée"""
+        for migration in self.migrations:
+            if self.run(migration) != DONE:
+                return False
+        return True
+
+    def _run_all_quietly(self):
+        try:
+            self.run_all()
+        except Exception as e:
+            print(f"❌ Migration interrompue: {e}")
+
+    def start(self):
+        """Lance les migrations dans un thread; False si elles tournent déjà dans ce process"""
+        if self.running():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_all_quietly, name="migrations", daemon=True)
+        self._thread.start()
+        return True
+
+    def resume_interrupted(self):
+        """Relance en arrière-plan une migration restée `running` (process arrêté en cours)"""
+        if self.checkpoints.find_one({"status": RUNNING, "lease_expires": {"$lt": datetime.utcnow()}}) is not None:
+            self.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def request_pause(self):
+        """Demande l'arrêt après le lot en cours, quel que soit le replica qui l'exécute"""
+        result = self.checkpoints.update_many({"status": RUNNING}, {"$set": {"pause_requested": True}})
+        return result.modified_count
+
+    def progress(self):
+        states = {state["_id"]: state for state in self.checkpoints.find({})}
+        return {
+            "running_here": self.running(),
+            "migrations": [progress_report(migration, states.get(migration.version)) for migration in self.migrations],
+        }
+
+
+class AsyncMigrationRunner(MigrationRunner):
+    """Variante de `MigrationRunner` pour le mode ASGI (AsyncMongoClient, tâche asyncio)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stop = asyncio.Event()
+
+    async def acquire(self, migration):
+        now = datetime.utcnow()
+        await self.checkpoints.update_one({"_id": migration.version},
+                                          {"$setOnInsert": self._initial_state(migration)}, upsert=True)
+        total_estimate = await self.db[migration.collection].estimated_document_count()
+        return await self.checkpoints.find_one_and_update(
+            self._acquire_filter(migration, now), self._acquire_update(migration, now, total_estimate),
+            return_document=ReturnDocument.BEFORE
+        )
+
+    async def checkpoint(self, migration, last_id, batch, modified):
+        return await self.checkpoints.find_one_and_update(
+            {"_id": migration.version, "owner": self.owner},
+            self._checkpoint_update(last_id, batch, modified),
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _release(self, migration, status, error=None):
+        fields = {"status": status, "lease_expires": None, "updated_at": datetime.utcnow()}
+        if status == DONE:
+            fields["finished_at"] = fields["updated_at"]
+        if error is not None:
+            fields["error"] = str(error)
+        await self.checkpoints.update_one({"_id": migration.version, "owner": self.owner}, {"$set": fields})
+
+    async def _wait(self, delay):
+        try:
+            await asyncio.wait_for(self._stop.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, migration):
+        state = await self.acquire(migration)
+        if state is None:
+            return None
+        collection = self.db[migration.collection]
+        last_id = resume_id(state)
+        started = time.monotonic()
+        processed = 0
+        try:
+            while True:
+                if self._stop.is_set():
+                    await self._release(migration, PAUSED)
+                    return PAUSED
+                if self._backend_busy():
+                    await self._wait(max(1.0, self.breaker.retry_after()))
+                    continue
+                cursor = collection.find(batch_query(migration, last_id), {"_id": 1}).sort("_id", 1)
+                ids = [document["_id"] async for document in cursor.limit(self.batch_size)]
+                if not ids:
+                    await self._release(migration, DONE)
+                    return DONE
+                result = await collection.update_many({"_id": {"$in": ids}, **migration.pending_filter()},
+                                                      migration.update(datetime.utcnow()))
+                last_id = ids[-1]
+                state = await self.checkpoint(migration, last_id, len(ids), result.modified_count)
+                if state is None:
+                    return None
+                if state.get("pause_requested"):
+                    await self._release(migration, PAUSED)
+                    return PAUSED
+                processed += len(ids)
+                await self._wait(throttle_delay(processed, time.monotonic() - started, self.max_docs_per_sec))
+        except asyncio.CancelledError:
+            await self._release(migration, PAUSED)
+            raise
+        except Exception as e:
+            await self._release(migration, FAILED, e)
+            raise
+
+    async def run_all(self):
+        for migration in self.migrations:
+            if await self.run(migration) != DONE:
+                return False
+        return True
+
+    async def _run_all_quietly(self):
+        try:
+            await self.run_all()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Migration interrompue: {e}")
+
+    def start(self):
+        if self.running():
+            return False
+        self._stop.clear()
+        # Contexte vierge : la tâche survit à la requête et ne doit pas hériter
+        # de son budget pymongo.timeout (contextvars copiées par create_task)
+        self._thread = asyncio.get_running_loop().create_task(self._run_all_quietly(),
+                                                              context=contextvars.Context())
+        return True
+
+    async def resume_interrupted(self):
+        if await self.checkpoints.find_one({"status": RUNNING, "lease_expires": {"$lt": datetime.utcnow()}}) is not None:
+            self.start()
+
+    def running(self):
+        return self._thread is not None and not self._thread.done()
+
+    async def request_pause(self):
+        result = await self.checkpoints.update_many({"status": RUNNING}, {"$set": {"pause_requested": True}})
+        return result.modified_count
+
+    async def progress(self):
+        states = {state["_id"]: state async for state in self.checkpoints.find({})}
+        return {
+            "running_here": self.running(),
+            "migrations": [progress_report(migration, states.get(migration.version)) for migration in self.migrations],
+        }
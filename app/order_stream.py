@@ -0,0 +1,312 @@
+"""Écriture différée (write-behind) des commandes via un Redis Stream.
+
+Avec `ORDER_WRITE_MODE=stream`, `POST /api/random-order` ne fait qu'un XADD
+dans `orders:stream` puis répond (202) : aucune écriture MongoDB sur le
+chemin de la requête, la latence ne dépend plus des shards. Un worker à part
+(`python order_stream.py`, groupe de consommateurs `orders-writers`) vide le
+stream par lots :
+- XAUTOCLAIM reprend d'abord les messages restés en attente chez un
+  consommateur mort depuis plus de `claim_idle_ms`, puis XREADGROUP lit les
+  nouveaux ;
+- `insert_many(ordered=False)` des commandes, marquées `stats_pending` ;
+  celles déjà insérées (index unique sur `order_id`) sont ignorées ;
+- les `$inc` des commandes encore `stats_pending` sont regroupés par
+  utilisateur (un `UpdateOne` par user_id), puis le marqueur est retiré ;
+- XACK du lot.
+
+Livraison au moins une fois : un message non acquitté est relivré, et
+l'index unique + le marqueur `stats_pending` rendent la relecture
+idempotente. Seul un arrêt brutal entre le `$inc` et le retrait du marqueur
+compte la commande deux fois dans les stats de l'utilisateur.
+Les messages illisibles partent dans `orders:stream:dead` (et sont acquittés).
+"""
+import json
+import os
+import signal
+import socket
+import time
+
+from pymongo.errors import BulkWriteError, OperationFailure
+import redis
+
+from ingest import OrderIngestor, user_increments, validate_order
+
+ORDERS_STREAM = 'orders:stream'
+DEAD_LETTER_STREAM = 'orders:stream:dead'
+CONSUMER_GROUP = 'orders-writers'
+# Taille max approximative du stream (XADD MAXLEN ~) : borne la mémoire Redis
+STREAM_MAXLEN = 1000000
+DUPLICATE_KEY = 11000
+
+
+def encode_order(order):
+    return {"order": json.dumps(order)}
+
+
+def decode_order(fields):
+    """Commande d'un message du stream; lève ValueError si elle est illisible"""
+    if not fields or "order" not in fields:
+        raise ValueError("message sans commande")
+    return validate_order(json.loads(fields["order"]))
+
+
+def message_age(message_id, now=None):
+    """Âge (s) d'un message d'après son id (`<ms>-<seq>`)"""
+    now = time.time() if now is None else now
+    return max(0.0, now - int(message_id.split('-')[0]) / 1000)
+
+
+class OrderStream:
+    """Côté producteur : publication des commandes et état du groupe"""
+
+    def __init__(self, redis_client, stream=ORDERS_STREAM, group=CONSUMER_GROUP, maxlen=STREAM_MAXLEN):
+        self.redis = redis_client
+        self.stream = stream
+        self.group = group
+        self.maxlen = maxlen
+
+    def publish(self, order):
+        """XADD de la commande; renvoie l'id du message"""
+        return self.redis.xadd(self.stream, encode_order(order), maxlen=self.maxlen, approximate=True)
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def clear(self):
+        """Supprime les commandes pas encore écrites (vidage complet des données);
+        le worker recrée le groupe"""
+        try:
+            self.redis.delete(self.stream)
+        except redis.RedisError:
+            pass
+
+    @staticmethod
+    def _lag_report(length, groups, group_name):
+        # Sans groupe (worker jamais lancé), tout le stream est en retard
+        report = {"length": length, "lag": length, "pending": 0, "consumers": 0, "last_delivered_id": None}
+        for group in groups:
+            if group["name"] == group_name:
+                report.update(lag=group.get("lag"), pending=group["pending"], consumers=group["consumers"],
+                              last_delivered_id=group["last-delivered-id"])
+        return report
+
+    @staticmethod
+    def _oldest(report, pending, undelivered):
+        """Âge du plus vieux message pas encore écrit (en attente ou jamais lu)"""
+        ids = [entry["message_id"] for entry in pending] + [message_id for message_id, _ in undelivered]
+        report["oldest_age_s"] = round(max(message_age(i) for i in ids), 3) if ids else 0.0
+        return report
+
+    def lag(self):
+        """Retard du groupe : messages jamais lus (`lag`), lus mais pas acquittés
+        (`pending`) et âge du plus ancien des deux"""
+        try:
+            groups = self.redis.xinfo_groups(self.stream)
+        except redis.ResponseError:
+            groups = []  # stream pas encore créé
+        report = self._lag_report(self.redis.xlen(self.stream), groups, self.group)
+        pending = self.redis.xpending_range(self.stream, self.group, '-', '+', 1) if report["pending"] else []
+        last = report["last_delivered_id"]
+        undelivered = self.redis.xrange(self.stream, min=f"({last}" if last else '-', count=1)
+        return self._oldest(report, pending, undelivered)
+
+
+class AsyncOrderStream(OrderStream):
+    """Variante de `OrderStream` pour le mode ASGI (redis.asyncio)"""
+
+    async def publish(self, order):
+        return await self.redis.xadd(self.stream, encode_order(order), maxlen=self.maxlen, approximate=True)
+
+    async def ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def clear(self):
+        try:
+            await self.redis.delete(self.stream)
+        except redis.RedisError:
+            pass
+
+    async def lag(self):
+        try:
+            groups = await self.redis.xinfo_groups(self.stream)
+        except redis.ResponseError:
+            groups = []
+        report = self._lag_report(await self.redis.xlen(self.stream), groups, self.group)
+        pending = []
+        if report["pending"]:
+            pending = await self.redis.xpending_range(self.stream, self.group, '-', '+', 1)
+        last = report["last_delivered_id"]
+        undelivered = await self.redis.xrange(self.stream, min=f"({last}" if last else '-', count=1)
+        return self._oldest(report, pending, undelivered)
+
+
+class OrderStreamConsumer(OrderIngestor):
+    """Consommateur du groupe : écrit les commandes du stream dans MongoDB par lots.
+
+    Hérite d'`OrderIngestor` pour compléter les `user_name` manquants (une
+    requête `$in` par lot).
+    """
+
+    def __init__(self, redis_client, db, consumer, counters=None, batch_size=500, block_ms=1000,
+                 claim_idle_ms=60000, stream=ORDERS_STREAM, group=CONSUMER_GROUP, on_applied=None):
+        super().__init__(db, batch_size, on_applied)
+        self.source = OrderStream(redis_client, stream, group)
+        self.redis = redis_client
+        self.consumer = consumer
+        self.counters = counters
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.batches = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.users_updated = 0
+        self.dead_lettered = 0
+        self.claimed = 0
+        self._claim_cursor = '0-0'
+        self._running = True
+
+    def ensure_indexes(self):
+        """Index unique sur `order_id` : c'est lui qui rend la relecture idempotente"""
+        try:
+            self.db.orders.create_index("order_id", unique=True)
+        except OperationFailure as e:
+            print(f"⚠️ Index unique orders.order_id non créé: {e}")
+
+    def read_batch(self):
+        """Messages abandonnés par un autre consommateur en priorité, puis nouveaux"""
+        stream, group = self.source.stream, self.source.group
+        claim = self.redis.xautoclaim(stream, group, self.consumer, self.claim_idle_ms,
+                                      start_id=self._claim_cursor, count=self.batch_size)
+        self._claim_cursor, claimed = claim[0], claim[1]
+        if claimed:
+            self.claimed += len(claimed)
+            return claimed
+        response = self.redis.xreadgroup(group, self.consumer, {stream: '>'},
+                                         count=self.batch_size, block=self.block_ms)
+        return response[0][1] if response else []
+
+    def write(self, orders):
+        """Écriture idempotente d'un lot (relivré ou non)"""
+        self._fill_user_names(orders)
+        for order in orders:
+            order["stats_pending"] = True
+        try:
+            self.db.orders.insert_many(orders, ordered=False)
+            duplicates = 0
+        except BulkWriteError as error:
+            write_errors = error.details.get("writeErrors", [])
+            if any(write_error.get("code") != DUPLICATE_KEY for write_error in write_errors):
+                raise
+            duplicates = len(write_errors)
+        # Commandes dont les stats utilisateur ne sont pas encore appliquées,
+        # y compris celles insérées lors d'une livraison précédente interrompue
+        pending = list(self.db.orders.find(
+            {"order_id": {"$in": [order["order_id"] for order in orders]}, "stats_pending": True},
+            {"_id": 0, "order_id": 1, "user_id": 1, "amount": 1}
+        ))
+        updates = user_increments(pending)
+        if updates:
+            self.db.users.bulk_write(updates, ordered=False)
+            self.db.orders.update_many(
+                {"order_id": {"$in": [order["order_id"] for order in pending]}},
+                {"$unset": {"stats_pending": ""}}
+            )
+        if self.on_applied is not None and pending:
+            self.on_applied(pending)
+        inserted = len(orders) - duplicates
+        self.inserted += inserted
+        self.duplicates += duplicates
+        self.users_updated += len(updates)
+        if self.counters is not None and inserted:
+            self.counters.incr('orders', inserted)
+
+    def dead_letter(self, message_id, fields, error):
+        self.redis.xadd(DEAD_LETTER_STREAM, {"message_id": message_id, "error": str(error),
+                                             "order": (fields or {}).get("order", "")},
+                        maxlen=self.source.maxlen, approximate=True)
+        self.dead_lettered += 1
+
+    def handle(self, messages):
+        """Écrit un lot de messages puis l'acquitte; renvoie le nombre de messages"""
+        if not messages:
+            return 0
+        orders = []
+        for message_id, fields in messages:
+            try:
+                orders.append(decode_order(fields))
+            except ValueError as e:
+                self.dead_letter(message_id, fields, e)
+        if orders:
+            self.write(orders)
+        # Un échec MongoDB lève avant l'ACK : le lot sera relivré
+        self.redis.xack(self.source.stream, self.source.group, *(message_id for message_id, _ in messages))
+        self.batches += 1
+        return len(messages)
+
+    def run_once(self):
+        return self.handle(self.read_batch())
+
+    def stop(self, *args):
+        self._running = False
+
+    def run(self, retry_delay=1.0):
+        """Boucle du worker; un arrêt (SIGTERM) termine le lot en cours"""
+        self.ensure_indexes()
+        while self._running:
+            try:
+                self.source.ensure_group()
+                while self._running:
+                    self.run_once()
+            except Exception as e:
+                print(f"❌ Worker {self.consumer}: {e}")
+                time.sleep(retry_delay)
+
+    def stats(self):
+        return {
+            "consumer": self.consumer,
+            "batches": self.batches,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "users_updated": self.users_updated,
+            "claimed": self.claimed,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+def main():
+    from pymongo import MongoClient
+
+    from analytics import Analytics
+    from counters import Counters
+
+    mongodb_uri = os.getenv('MONGODB_URI', 'mongodb://mongo-mongos.dev.svc.cluster.local:27017/?directConnection=true')
+    redis_client = redis.Redis(host=os.getenv('REDIS_HOST', 'redis-service.dev'), port=6379,
+                               decode_responses=True, socket_connect_timeout=2)
+    db = MongoClient(mongodb_uri)["demoDB"]
+    consumer = OrderStreamConsumer(
+        redis_client, db,
+        consumer=os.getenv('ORDER_CONSUMER_NAME', f"{socket.gethostname()}-{os.getpid()}"),
+        counters=Counters(redis_client, db),
+        batch_size=int(os.getenv('ORDER_STREAM_BATCH_SIZE', '500')),
+        block_ms=int(os.getenv('ORDER_STREAM_BLOCK_MS', '1000')),
+        claim_idle_ms=int(os.getenv('ORDER_STREAM_CLAIM_IDLE_MS', '60000')),
+        # Reconstruction périodique laissée aux pods de l'app
+        on_applied=Analytics(redis_client, db, rebuild_interval=0).record_orders,
+    )
+    signal.signal(signal.SIGTERM, consumer.stop)
+    signal.signal(signal.SIGINT, consumer.stop)
+    print(f"🚚 Worker write-behind {consumer.consumer} démarré sur {ORDERS_STREAM}")
+    consumer.run()
+    print(f"🛑 Worker arrêté: {consumer.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+"""Pages HTML de l'application (partagées par les modes sync et async).
+
+Les pages ne dépendent que de l'environnement : elles sont rendues une fois
+au démarrage (`StaticPage`), avec un ETag fort et des variantes gzip/brotli
+pré-compressées. Le nom du pod et l'état des connexions sont chargés par le
+JS via `/api/page-info`, ce qui garde le même ETag sur tous les pods d'un
+environnement (un 304 reste valide quel que soit le pod qui répond).
+"""
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : sans elle, seul gzip est proposé
+    brotli = None
+
+from serialization import accepted_encodings
+
+ENCODING_SUFFIXES = {'identity': '', 'gzip': '-gz', 'br': '-br'}
+
+
+class StaticPage:
+    """Page HTML rendue une fois, servie avec ETag/304 et pré-compressée"""
+
+    def __init__(self, html, max_age=60):
+        self.body = html.encode('utf-8')
+        self.tag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.cache_control = f'public, max-age={max_age}'
+        self.variants = {'identity': self.body, 'gzip': gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(self.body, quality=11)
+
+    def etag(self, encoding='identity'):
+        # ETag fort : un par représentation (encodage)
+        return f'"{self.tag}{ENCODING_SUFFIXES[encoding]}"'
+
+    def matches(self, if_none_match):
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return any(self.etag(encoding) in tags for encoding in self.variants)
+
+    def respond(self, if_none_match=None, accept_encoding=None):
+        """Renvoie `(status, body, headers)` pour une requête GET"""
+        accepted = accepted_encodings(accept_encoding)
+        encoding = next((e for e in ('br', 'gzip') if e in self.variants and e in accepted), 'identity')
+        headers = {
+            'ETag': self.etag(encoding),
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        if self.matches(if_none_match):
+            return 304, b'', headers
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, self.variants[encoding], headers
+
+
+def build_pages(environment, max_age=60):
+    """Rend les pages une fois pour toute la durée de vie du process"""
+    return {
+        'home': StaticPage(render_home(environment), max_age),
+        'dashboard': StaticPage(render_user_dashboard(environment), max_age),
+    }
+
+
+def render_home(environment):
+    """Page d'accueil : pod, architecture MongoDB et cache des hosts"""
+    return f'''
+    <!DOCTYPE html>
+    <html lang="fr">
+    <head>
+      <meta charset="UTF-8">
+      <title>Distributed Systems Demo - {environment.upper()}</title>
+      <style>
+        /* [GARDE TOUT TON CSS EXISTANT] */
+        * {{margin: 0; padding: 0; box-sizing: border-box;}}
+        body {{
+          font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+          background: linear-gradient(160deg, #e0f7fa, #ffffff);
+          color: #333;
+          line-height: 1.6;
+        }}
+        header {{
+          background: linear-gradient(90deg, #2196f3, #21cbf3);
+          color: white;
+          text-align: center;
+          padding: 30px 20px;
+          box-shadow: 0 5px 15px rgba(0,0,0,0.2);
+          position: sticky;
+          top: 0;
+          z-index: 100;
+        }}
+        .container {{
+          width: 90%;
+          max-width: 1100px;
+          margin: 40px auto;
+          display: flex;
+          flex-direction: column;
+          gap: 30px;
+        }}
+        .frame {{
+          background: #ffffff;
+          border-radius: 15px;
+          padding: 25px;
+          box-shadow: 0 8px 20px rgba(0,0,0,0.1);
+          transition: transform 0.3s;
+        }}
+        .info-box {{
+          background: #e3f2fd;
+          padding: 18px;
+          border-radius: 10px;
+          border-left: 5px solid #2196f3;
+          margin-top: 10px;
+          font-size: 0.95rem;
+        }}
+        .badge {{
+          display: inline-block;
+          background: #4caf50;
+          color: white;
+          padding: 3px 8px;
+          border-radius: 5px;
+          font-size: 0.85rem;
+          margin-left: 8px;
+        }}
+        .cache-indicator {{
+          display: inline-block;
+          padding: 2px 8px;
+          border-radius: 12px;
+          font-size: 0.8rem;
+          margin-left: 8px;
+          background: #4caf50;
+          color: white;
+        }}
+        .cache-miss {{ background: #ff9800; }}
+        .cache-error {{ background: #f44336; }}
+        
+        /* Nouveaux styles pour sharding */
+        .architecture {{
+          display: grid;
+          grid-template-columns: 1fr 1fr 1fr;
+          gap: 20px;
+          margin-top: 20px;
+        }}
+        .component {{
+          background: #f8f9fa;
+          padding: 15px;
+          border-radius: 10px;
+          border: 2px solid #e9ecef;
+        }}
+        .component h3 {{
+          color: #495057;
+          margin-bottom: 10px;
+        }}
+        .shard-active {{
+          background: #d4edda;
+          border-color: #c3e6cb;
+        }}
+        .shard-inactive {{
+          background: #f8d7da;
+          border-color: #f5c6cb;
+        }}
+      </style>
+    </head>
+    <body>
+
+    <header>
+      <h1>Distributed Systems EXAMEEEEEEN <span class="badge">Flask + MongoDB + Redis</span></h1>
+    </header>
+
+    <div class="container">
+
+      <!-- Pod Hostname -->
+      <div class="frame">
+        <h2>Pod Hostname</h2>
+        <div class="hostname-container">
+          <span class="hostname" id="hostname" data-info="hostname">-</span>
+        </div>
+        <div class="info-box">
+          <strong>ENVIRONMENT: {environment.upper()}</strong><br>
+          MongoDB: <span data-info="mongodb_status">-</span><br>
+          Redis: <span data-info="redis_status">-</span>
+        </div>
+      </div>
+
+      <!-- MongoDB Architecture -->
+      <div class="frame">
+        <h2>MongoDB Architecture</h2>
+        <div class="architecture">
+          <div class="component {'' if environment == 'dev' else 'shard-inactive'}">
+            <h3>🔧 Config Servers</h3>
+            <p>Métadonnées du sharding</p>
+            <ul>
+              <li>mongo-config-0</li>
+              <li>mongo-config-1</li>
+              <li>mongo-config-2</li>
+            </ul>
+            <small>{'✅ Actif' if environment == 'dev' else '❌ Inactif'}</small>
+          </div>
+          
+          <div class="component {'' if environment == 'dev' else 'shard-inactive'}">
+            <h3>🗄️ Shard Servers</h3>
+            <p>Données partitionnées</p>
+            <ul>
+              <li>mongo-shard-0</li>
+              <li>mongo-shard-1</li>
+              <li>mongo-shard-2</li>
+            </ul>
+            <small>{'✅ Actif' if environment == 'dev' else '❌ Inactif'}</small>
+          </div>
+          
+          <div class="component {'' if environment == 'dev' else 'shard-inactive'}">
+            <h3>🎯 Mongos Routers</h3>
+            <p>Routage intelligent</p>
+            <ul>
+              <li>mongo-mongos-xxxxx</li>
+              <li>mongo-mongos-xxxxx</li>
+            </ul>
+            <small>{'✅ Actif' if environment == 'dev' else '❌ Inactif'}</small>
+          </div>
+        </div>
+        <div class="info-box">
+          <strong>Mode: { '🚀 SHARDING AVANCÉ' if environment == 'dev' else '🗄️ RÉPLICATION SIMPLE' }</strong><br>
+          { 'Données partitionnées sur 3 shards + 2 routeurs + 3 config servers' if environment == 'dev' else 'Réplication standard avec 3 pods MongoDB' }
+        </div>
+      </div>
+
+      <!-- MongoDB Hosts avec Cache -->
+      <div class="frame">
+        <h2>Hosts from MongoDB <span id="cache-indicator" class="cache-indicator">Chargement...</span></h2>
+        <ul id="host-list"></ul>
+        <div class="info-box">
+          <strong>Performance:</strong><br>
+          • Redis Cache: <span data-info="redis_status">-</span><br>
+          • MongoDB: <span data-info="mongodb_status">-</span><br>
+          • Architecture: {environment.upper()}
+        </div>
+      </div>
+
+      <!-- Cache Performance -->
+      <div class="frame">
+        <h2>Cache Performance</h2>
+        <div class="info-box">
+          <div id="performance-stats">
+            <p><strong>Temps de réponse:</strong> <span id="response-time">-</span></p>
+            <p><strong>Source données:</strong> <span id="data-source">-</span></p>
+            <p><strong>Statut Redis:</strong> <span id="redis-status" data-info="redis_status">-</span></p>
+          </div>
+          <br>
+          <button onclick="clearCache()" style="padding: 8px 16px; background: #ff5722; color: white; border: none; border-radius: 5px; cursor: pointer;">
+            🗑️ Vider le Cache
+          </button>
+          <button onclick="loadData()" style="padding: 8px 16px; background: #2196f3; color: white; border: none; border-radius: 5px; cursor: pointer; margin-left: 10px;">
+            🔄 Recharger
+          </button>
+          <button onclick="showShardingInfo()" style="padding: 8px 16px; background: #4caf50; color: white; border: none; border-radius: 5px; cursor: pointer; margin-left: 10px;">
+            🗄️ Info Sharding
+          </button>
+        </div>
+      </div>
+
+    </div>
+
+    <footer>
+      &copy; 2025 Distributed Systems Demo Project - Environment: {environment.upper()}
+    </footer>
+
+    <script>
+      // Infos du pod (la page elle-même est statique et mise en cache)
+      async function loadPageInfo() {{
+        try {{
+          const info = await fetch('/api/page-info').then(r => r.json());
+          document.querySelectorAll('[data-info]').forEach(el => {{
+            el.textContent = info[el.dataset.info];
+          }});
+        }} catch (e) {{
+          return;
+        }}
+
+        // Format hostname
+        const span = document.getElementById('hostname');
+        const text = span.textContent;
+        if (text.length > 5) {{
+          const firstPart = text.slice(0, -5);
+          const last5 = text.slice(-5);
+          span.innerHTML = `${{firstPart}}<span class="last5">${{last5}}</span>`;
+        }}
+      }}
+
+      // Load data
+      async function loadData() {{
+        try {{
+          const startTime = performance.now();
+          const response = await fetch('/hosts');
+          const endTime = performance.now();
+          
+          const data = await response.json();
+          const list = document.getElementById('host-list');
+          list.innerHTML = '';
+          
+          const responseTime = (endTime - startTime).toFixed(2);
+          const cacheStatus = response.headers.get('X-Cache') || '';
+          const cacheHit = cacheStatus.endsWith('HIT');
+          const dataSource = cacheStatus === 'L1-HIT' ? '⚡ Cache mémoire (L1)'
+            : cacheStatus === 'L2-HIT' ? '🚀 Redis Cache (L2)'
+            : cacheStatus === 'STALE-HIT' ? '♻️ Cache périmé (rafraîchissement en cours)'
+            : cacheStatus === 'LKG-HIT' ? '🛟 Dernière valeur connue (MongoDB indisponible)' : '💾 MongoDB';
+          
+          document.getElementById('response-time').textContent = `${{responseTime}}ms`;
+          document.getElementById('data-source').textContent = dataSource;
+          
+          const cacheIndicator = document.getElementById('cache-indicator');
+          cacheIndicator.textContent = cacheHit ? `CACHE ${{cacheStatus.split('-')[0]}}` : 'DATABASE';
+          cacheIndicator.className = cacheHit ? 'cache-indicator' : 'cache-indicator cache-miss';
+          
+          data.forEach(item => {{
+            const li = document.createElement('li');
+            li.textContent = `${{item.pod}} (${{item.info}})`;
+            list.appendChild(li);
+          }});
+          
+        }} catch (e) {{
+          document.getElementById('host-list').textContent = 'Error loading data.';
+          document.getElementById('cache-indicator').textContent = 'ERROR';
+          document.getElementById('cache-indicator').className = 'cache-indicator cache-error';
+        }}
+      }}
+
+      // Vider le cache
+      async function clearCache() {{
+        try {{
+          await fetch('/cache/clear');
+          alert('Cache vidé ! Prochain chargement viendra de MongoDB.');
+          loadData();
+        }} catch (e) {{
+          alert('Erreur lors du vidage du cache');
+        }}
+      }}
+
+      // Info sharding
+      async function showShardingInfo() {{
+        try {{
+          const response = await fetch('/sharding-info');
+          const data = await response.json();
+          alert(`Info Sharding:\\n- Actif: ${{data.sharding_enabled}}\\n- Shards: ${{data.shards || 'N/A'}}\\n- Mode: ${{data.mode}}`);
+        }} catch (e) {{
+          alert('Erreur lors de la récupération des infos sharding');
+        }}
+      }}
+
+      // Rechargement sur changement (watcher des change streams, /api/events)
+      function watchChanges(collections, reload) {{
+        if (!window.EventSource) return;
+        let pending = null;
+        new EventSource('/api/events').onmessage = (event) => {{
+          const change = JSON.parse(event.data);
+          const relevant = change.type === 'resync'
+            || collections.some(name => change.collections && change.collections[name]);
+          if (relevant && pending === null) {{
+            // Une rafale de lots ne déclenche qu'un rechargement
+            pending = setTimeout(() => {{ pending = null; reload(); }}, 500);
+          }}
+        }};
+      }}
+
+      loadPageInfo();
+      loadData();
+      watchChanges(['hosts'], loadData);
+    </script>
+
+    </body>
+    </html>
+    '''
+
+
+def render_user_dashboard(environment):
+    """Page simplifiée de gestion users"""
+    return f'''
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>User Management - {environment.upper()}</title>
+        <style>
+            body {{ font-family: Arial, sans-serif; padding: 20px; background: #f5f5f5; }}
+            .container {{ display: grid; gap: 20px; grid-template-columns: 1fr 1fr; max-width: 1000px; margin: 0 auto; }}
+            .card {{ background: white; padding: 20px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
+            button {{ background: #2196f3; color: white; border: none; padding: 10px 15px; border-radius: 5px; cursor: pointer; margin: 5px; }}
+            button:hover {{ background: #1976d2; }}
+            .user-item {{ background: #f8f9fa; margin: 8px 0; padding: 12px; border-radius: 5px; border-left: 4px solid #2196f3; }}
+        </style>
+    </head>
+    <body>
+        <h1>👥 User Management Dashboard - {environment.upper()}</h1>
+        <p><strong>Pod:</strong> <span data-info="hostname">-</span> | <strong>MongoDB:</strong> <span data-info="mongodb_status">-</span> | <strong>Redis:</strong> <span data-info="redis_status">-</span></p>
+        
+        <div class="container">
+            <!-- Stats -->
+            <div class="card">
+                <h3>📊 Statistics</h3>
+                <p>Total Users: <strong id="user-count">-</strong></p>
+                <p>Total Orders: <strong id="order-count">-</strong></p>
+                <div style="margin-top: 15px;">
+                    <button onclick="loadSampleData()">📥 Load Sample Data</button>
+                    <button onclick="refreshStats()">🔄 Refresh</button>
+                </div>
+            </div>
+            
+            <!-- Actions -->
+            <div class="card">
+                <h3>⚡ Actions</h3>
+                <button onclick="addRandomUser()">👤 Add Random User</button>
+                <button onclick="addRandomOrder()">🛒 Add Random Order</button>
+                <button onclick="runMigration()">🔧 Run Migration</button>
+                <button onclick="clearAllData()">🗑️ Clear All Data</button>
+            </div>
+        </div>
+        
+        <!-- Users List -->
+        <div class="card" style="margin-top: 20px;">
+            <h3>👤 Recent Users</h3>
+            <div id="user-list">Loading...</div>
+        </div>
+
+        <script>
+            async function loadPageInfo() {{
+                try {{
+                    const info = await fetch('/api/page-info').then(r => r.json());
+                    document.querySelectorAll('[data-info]').forEach(el => {{
+                        el.textContent = info[el.dataset.info];
+                    }});
+                }} catch (error) {{
+                    return;
+                }}
+            }}
+
+            async function refreshStats() {{
+                try {{
+                    const [stats, users] = await Promise.all([
+                        fetch('/api/stats').then(r => r.json()),
+                        fetch('/api/users').then(r => r.json())
+                    ]);
+                    
+                    document.getElementById('user-count').textContent = stats.total_users;
+                    document.getElementById('order-count').textContent = stats.total_orders;
+                    
+                    document.getElementById('user-list').innerHTML = users.map(user => `
+                        <div class="user-item">
+                            <strong>${{user.name}}</strong> (${{user.email}})<br>
+                            <small>Orders: ${{user.order_count}} | Country: ${{user.country}}</small>
+                        </div>
+                    `).join('');
+                    
+                }} catch (error) {{
+                    document.getElementById('user-list').innerHTML = 'Error loading data';
+                }}
+            }}
+            
+            async function loadSampleData() {{
+                const response = await fetch('/api/load-sample-data', {{ method: 'POST' }});
+                const result = await response.json();
+                alert(`✅ ${{result.message}}`);
+                refreshStats();
+            }}
+            
+            async function addRandomUser() {{
+                await fetch('/api/random-user', {{ method: 'POST' }});
+                refreshStats();
+            }}
+            
+            async function addRandomOrder() {{
+                const response = await fetch('/api/random-order', {{ method: 'POST' }});
+                const result = await response.json();
+                // 202 en écriture différée : le nom est complété plus tard par le worker
+                alert(`✅ Order ${{response.status === 202 ? 'queued' : 'added'}} for ${{result.user_name || result.user_id}} - €${{result.amount}}`);
+                refreshStats();
+            }}
+            
+            async function runMigration() {{
+                const response = await fetch('/api/run-migration', {{ method: 'POST' }});
+                const result = await response.json();
+                // Migration exécutée en arrière-plan : avancement sur /api/migrations
+                alert(`✅ ${{result.message}}`);
+                refreshStats();
+            }}
+            
+            async function clearAllData() {{
+                if (confirm('Are you sure you want to delete ALL data?')) {{
+                    await fetch('/api/clear-data', {{ method: 'DELETE' }});
+                    alert('All data cleared!');
+                    refreshStats();
+                }}
+            }}
+            
+            // Rechargement sur changement (watcher des change streams, /api/events)
+            function watchChanges(collections, reload) {{
+                if (!window.EventSource) return;
+                let pending = null;
+                new EventSource('/api/events').onmessage = (event) => {{
+                    const change = JSON.parse(event.data);
+                    const relevant = change.type === 'resync'
+                        || collections.some(name => change.collections && change.collections[name]);
+                    if (relevant && pending === null) {{
+                        // Une rafale de lots ne déclenche qu'un rechargement
+                        pending = setTimeout(() => {{ pending = null; reload(); }}, 500);
+                    }}
+                }};
+            }}
+
+            // Load data on page load
+            loadPageInfo();
+            refreshStats();
+            watchChanges(['users', 'orders'], refreshStats);
+        </script>
+    </body>
+    </html>
+    '''
@@ -0,0 +1,139 @@
+"""Pagination par clé (keyset) et projection pour les listes de documents.
+
+Le curseur est l'`_id` du dernier document de la page, encodé en base64url :
+la page suivante est `{"_id": {"$lt": <_id>}}` trié par `_id` décroissant,
+qui reste un parcours d'index (pas de `skip`, coût constant quelle que soit
+la profondeur de la page).
+"""
+import base64
+import binascii
+import re
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_.]*$')
+
+
+class BadRequest(ValueError):
+    """Paramètre de requête invalide (renvoyé en 400)"""
+
+
+def encode_cursor(document_id):
+    return base64.urlsafe_b64encode(ObjectId(document_id).binary).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return ObjectId(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, InvalidId, TypeError, ValueError):
+        raise BadRequest("Invalid cursor")
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE, name='limit'):
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+    if limit < 1:
+        raise BadRequest(f"{name} must be positive")
+    return min(limit, maximum) if maximum else limit
+
+
+def parse_projection(fields):
+    """`?fields=name,email` -> projection MongoDB; `_id` toujours lu (pour le curseur)"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    for name in names:
+        if not FIELD_NAME.match(name):
+            raise BadRequest(f"Invalid field name: {name}")
+    projection = {name: 1 for name in names}
+    projection["_id"] = 1
+    return projection
+
+
+def keyset_filter(after):
+    return {"_id": {"$lt": decode_cursor(after)}} if after else {}
+
+
+def parse_list_args(args):
+    """Lit `after`, `limit`, `fields` et `format` d'une requête de liste.
+
+    Renvoie `(filter, projection, limit, fmt)`; `fmt` vaut `page` (défaut),
+    `ndjson` ou `json-stream`. En streaming `limit` est optionnel et non
+    plafonné (export complet), la mémoire restant bornée par `batch_size`.
+    """
+    fmt = args.get('format') or 'page'
+    if fmt not in ('page', 'ndjson', 'json-stream'):
+        raise BadRequest("format must be page, ndjson or json-stream")
+    if fmt == 'page':
+        limit = parse_limit(args.get('limit'))
+    else:
+        limit = parse_limit(args.get('limit'), default=None, maximum=None)
+    return keyset_filter(args.get('after')), parse_projection(args.get('fields')), limit, fmt
+
+
+def strip_id(document):
+    document.pop("_id", None)
+    return document
+
+
+def next_cursor(documents, limit):
+    """Curseur de la page suivante, ou None si c'est la dernière page"""
+    if not documents or len(documents) < limit:
+        return None
+    return encode_cursor(documents[-1]["_id"])
+
+
+def ndjson_chunks(documents, dumps, batch_size=STREAM_BATCH_SIZE):
+    """Un morceau de réponse par lot de `batch_size` documents (une ligne chacun)"""
+    lines = []
+    for document in documents:
+        lines.append(dumps(strip_id(document)) + "\n")
+        if len(lines) >= batch_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def json_array_chunks(documents, dumps, batch_size=STREAM_BATCH_SIZE):
+    """Tableau JSON envoyé en morceaux (transfert chunked)"""
+    yield "["
+    separator = ""
+    for chunk in ndjson_chunks(documents, dumps, batch_size):
+        yield separator + ",".join(chunk.rstrip("\n").split("\n"))
+        separator = ","
+    yield "]"
+
+
+async def andjson_chunks(documents, dumps, batch_size=STREAM_BATCH_SIZE):
+    lines = []
+    async for document in documents:
+        lines.append(dumps(strip_id(document)) + "\n")
+        if len(lines) >= batch_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+async def ajson_array_chunks(documents, dumps, batch_size=STREAM_BATCH_SIZE):
+    yield "["
+    separator = ""
+    async for chunk in andjson_chunks(documents, dumps, batch_size):
+        yield separator + ",".join(chunk.rstrip("\n").split("\n"))
+        separator = ","
+    yield "]"
+
+
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'json-stream': 'application/json'}
+STREAM_CHUNKS = {'ndjson': ndjson_chunks, 'json-stream': json_array_chunks}
+ASYNC_STREAM_CHUNKS = {'ndjson': andjson_chunks, 'json-stream': ajson_array_chunks}
@@ -0,0 +1,339 @@
+"""Limitation de débit par client et contrôle d'admission des requêtes.
+
+Deux protections, appliquées avant la route (hook Flask ou middleware ASGI) :
+
+- `RateLimiter` : limite commune à tous les pods, par client et par classe
+  de route (`ROUTE_CLASSES` : `write` pour les ajouts aléatoires, `admin`
+  pour les chargements, migrations, vidages et imports en masse). Fenêtre
+  glissante approchée par deux compteurs Redis (fenêtre courante + précédente
+  pondérée) : un INCR et un GET en un aller-retour, mémoire O(1) par client.
+  Au-delà : 429 avec `Retry-After`. Redis absent ou en erreur : même calcul
+  dans le process (limite par pod, jamais de refus faute de Redis).
+  Limites : RATE_LIMIT_<CLASSE>_REQUESTS requêtes par
+  RATE_LIMIT_<CLASSE>_WINDOW secondes (0 requête = pas de limite).
+- `AdmissionController` : délestage local, sans I/O. Chaque priorité n'a
+  droit qu'à une part des `max_in_flight` requêtes en cours du process
+  (lectures 100 %, `write` 75 %, `admin` 25 %) et les écritures sont refusées
+  quand la latence MongoDB récente (moyenne glissante des routes MongoDB)
+  dépasse le seuil (`admin` dès la moitié). Au-delà : 503 avec
+  `Retry-After`. Les lectures (`/hosts`, pages, stats) passent donc
+  toujours avant les écritures lourdes.
+
+Le client est identifié par l'adresse de la connexion ou, derrière
+`trusted_hops` proxies de confiance (TRUSTED_PROXY_HOPS, 1 pour l'ingress),
+par l'entrée de `X-Forwarded-For` posée par le plus éloigné d'entre eux :
+les entrées plus à gauche viennent du client et ne sont pas fiables. Les
+sondes, `/metrics` et le flux SSE ne sont jamais limités.
+"""
+import math
+import os
+import threading
+import time
+
+import redis
+
+import serialization
+
+READ = 'read'
+WRITE = 'write'
+ADMIN = 'admin'
+ROUTE_CLASSES = {
+    '/api/random-user': WRITE,
+    '/api/random-order': WRITE,
+    '/api/load-sample-data': ADMIN,
+    '/api/run-migration': ADMIN,
+    '/api/clear-data': ADMIN,
+    '/api/orders/bulk': ADMIN,
+    '/api/analytics/rebuild': ADMIN,
+    '/api/indexes/ensure': ADMIN,
+}
+EXEMPT_PATHS = frozenset(('/healthz', '/readyz', '/metrics', '/api/events'))
+# Part des requêtes en cours et facteur du seuil de latence par priorité
+# (None : jamais refusée pour la latence)
+PRIORITIES = {
+    READ: (1.0, None),
+    WRITE: (0.75, 1.0),
+    ADMIN: (0.25, 0.5),
+}
+KEY_PREFIX = 'ratelimit'
+# Au-delà, une latence mesurée n'est plus représentative (s)
+LATENCY_STALE_SECONDS = 10.0
+
+
+def route_class(path):
+    return ROUTE_CLASSES.get(path, READ)
+
+
+def client_id(forwarded_for, remote_addr, trusted_hops=0):
+    """Adresse du client : `trusted_hops`-ième entrée de X-Forwarded-For en
+    partant de la droite, sinon l'adresse de la connexion"""
+    if trusted_hops > 0 and forwarded_for:
+        entries = [entry.strip() for entry in forwarded_for.split(',') if entry.strip()]
+        if len(entries) >= trusted_hops:
+            return entries[-trusted_hops]
+    return remote_addr or 'unknown'
+
+
+class LimitClass:
+    """`requests` requêtes par `window` secondes et par client"""
+
+    def __init__(self, name, requests, window):
+        self.name = name
+        self.requests = requests
+        self.window = window
+
+    @classmethod
+    def from_env(cls, name, requests, window, env=None):
+        env = os.environ if env is None else env
+        prefix = f"RATE_LIMIT_{name.upper()}_"
+        return cls(name, int(env.get(prefix + 'REQUESTS', requests)), float(env.get(prefix + 'WINDOW', window)))
+
+    def describe(self):
+        return {"requests": self.requests, "window": self.window}
+
+
+def load_limit_classes(env=None):
+    return {
+        WRITE: LimitClass.from_env(WRITE, 60, 10, env),
+        ADMIN: LimitClass.from_env(ADMIN, 5, 60, env),
+    }
+
+
+class Decision:
+    def __init__(self, allowed, limit, remaining, retry_after=0.0):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+    def headers(self):
+        headers = {'X-RateLimit-Limit': str(self.limit), 'X-RateLimit-Remaining': str(self.remaining)}
+        if not self.allowed:
+            headers['Retry-After'] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def sliding_window(limit_class, now, current, previous):
+    """Décision pour une requête déjà comptée dans `current` (fenêtre courante)"""
+    elapsed = (now % limit_class.window) / limit_class.window
+    estimated = previous * (1 - elapsed) + current
+    if estimated <= limit_class.requests:
+        return Decision(True, limit_class.requests, int(limit_class.requests - estimated))
+    # Attente jusqu'à ce que le poids de la fenêtre précédente suffise à repasser sous la limite
+    excess = estimated - limit_class.requests
+    wait = limit_class.window * (1 - elapsed)
+    if previous:
+        wait = min(wait, excess / previous * limit_class.window)
+    return Decision(False, limit_class.requests, 0, wait)
+
+
+class RateLimiter:
+    """Limite par client et par classe de route, commune aux pods via Redis."""
+
+    def __init__(self, redis_client, classes=None, prefix=KEY_PREFIX, clock=time.time):
+        self.redis = redis_client
+        self.classes = load_limit_classes() if classes is None else classes
+        self.prefix = prefix
+        self.clock = clock
+        self.allowed = 0
+        self.limited = 0
+        self.local_fallbacks = 0
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def keys(self, limit_class, client, now):
+        window = int(now // limit_class.window)
+        base = f"{self.prefix}:{limit_class.name}:{client}"
+        return f"{base}:{window}", f"{base}:{window - 1}"
+
+    def applies(self, class_name):
+        limit_class = self.classes.get(class_name)
+        return limit_class is not None and limit_class.requests > 0
+
+    def _local_check(self, limit_class, client, now):
+        current_key, previous_key = self.keys(limit_class, client, now)
+        with self._lock:
+            if len(self._local) > 10000:
+                # Fenêtres expirées : seules les deux dernières comptent
+                self._local = {key: count for key, count in self._local.items()
+                               if key in (current_key, previous_key)}
+            current = self._local.get(current_key, 0) + 1
+            decision = sliding_window(limit_class, now, current, self._local.get(previous_key, 0))
+            if decision.allowed:
+                self._local[current_key] = current
+        return decision
+
+    def _record(self, decision):
+        if decision.allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+        return decision
+
+    def check(self, class_name, client):
+        limit_class = self.classes[class_name]
+        now = self.clock()
+        if self.redis is not None:
+            current_key, previous_key = self.keys(limit_class, client, now)
+            try:
+                pipe = self.redis.pipeline()
+                pipe.incr(current_key)
+                pipe.expire(current_key, math.ceil(limit_class.window * 2))
+                pipe.get(previous_key)
+                current, _, previous = pipe.execute()
+                decision = sliding_window(limit_class, now, current, int(previous or 0))
+                if not decision.allowed:
+                    # Une requête refusée ne consomme pas la limite
+                    self.redis.decr(current_key)
+                return self._record(decision)
+            except redis.RedisError:
+                self.local_fallbacks += 1
+        return self._record(self._local_check(limit_class, client, now))
+
+    def stats(self):
+        return {
+            "classes": {name: limit_class.describe() for name, limit_class in self.classes.items()},
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "local_fallbacks": self.local_fallbacks,
+            "shared": self.redis is not None,
+        }
+
+
+class AsyncRateLimiter(RateLimiter):
+    """Variante pour le mode ASGI (redis.asyncio)."""
+
+    async def check(self, class_name, client):
+        limit_class = self.classes[class_name]
+        now = self.clock()
+        if self.redis is not None:
+            current_key, previous_key = self.keys(limit_class, client, now)
+            try:
+                pipe = self.redis.pipeline()
+                pipe.incr(current_key)
+                pipe.expire(current_key, math.ceil(limit_class.window * 2))
+                pipe.get(previous_key)
+                current, _, previous = await pipe.execute()
+                decision = sliding_window(limit_class, now, current, int(previous or 0))
+                if not decision.allowed:
+                    await self.redis.decr(current_key)
+                return self._record(decision)
+            except redis.RedisError:
+                self.local_fallbacks += 1
+        return self._record(self._local_check(limit_class, client, now))
+
+
+class AdmissionController:
+    """Délestage local : requêtes en cours par priorité et latence MongoDB récente."""
+
+    def __init__(self, max_in_flight=64, latency_threshold_ms=500, alpha=0.2, priorities=PRIORITIES,
+                 clock=time.monotonic):
+        self.max_in_flight = max_in_flight
+        self.latency_threshold_ms = latency_threshold_ms
+        self.alpha = alpha
+        self.priorities = priorities
+        self.clock = clock
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = {}
+        self.latency_ms = None
+        self._latency_at = None
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Durée d'une route MongoDB (moyenne glissante exponentielle)"""
+        ms = seconds * 1000
+        with self._lock:
+            self.latency_ms = ms if self.latency_ms is None else self.latency_ms + self.alpha * (ms - self.latency_ms)
+            self._latency_at = self.clock()
+
+    def recent_latency_ms(self):
+        if self._latency_at is None or self.clock() - self._latency_at > LATENCY_STALE_SECONDS:
+            return None
+        return self.latency_ms
+
+    def try_enter(self, priority):
+        """None si la requête est admise (appeler `leave` à la fin), sinon la raison du refus"""
+        share, latency_factor = self.priorities.get(priority, self.priorities[READ])
+        latency = self.recent_latency_ms()
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= max(1, int(self.max_in_flight * share)):
+                reason = 'overloaded'
+            elif latency_factor is not None and self.latency_threshold_ms and latency is not None \
+                    and latency > self.latency_threshold_ms * latency_factor:
+                reason = 'slow_backend'
+            else:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+            self.shed[f"{priority}:{reason}"] = self.shed.get(f"{priority}:{reason}", 0) + 1
+            return reason
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        latency = self.recent_latency_ms()
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "latency_ms": round(latency, 1) if latency is not None else None,
+            "latency_threshold_ms": self.latency_threshold_ms,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+        }
+
+
+def rejection(reason, retry_after=1):
+    """Corps, statut et en-têtes d'un refus (429 limite de débit, 503 délestage)"""
+    if reason == 'rate_limited':
+        return {"error": "Too many requests", "reason": reason}, 429, {'Retry-After': str(retry_after)}
+    return {"error": "Server busy, retry later", "reason": reason}, 503, {'Retry-After': str(retry_after)}
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI : contrôle d'admission puis limite de débit (équivalent
+    des hooks `before_request`/`teardown_request` de app.py)"""
+
+    def __init__(self, app, admission, limiter, observer=None, trusted_hops=0):
+        self.app = app
+        self.admission = admission
+        self.limiter = limiter
+        self.observer = observer
+        self.trusted_hops = trusted_hops
+
+    async def respond(self, send, body, status, headers):
+        payload = serialization.dumps(body)
+        raw_headers = [(b"content-type", serialization.JSON_MIMETYPE.encode()),
+                       (b"content-length", str(len(payload)).encode())]
+        raw_headers += [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": payload})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        priority = route_class(scope["path"])
+        reason = self.admission.try_enter(priority)
+        if reason is not None:
+            if self.observer:
+                self.observer(priority, reason)
+            await self.respond(send, *rejection(reason))
+            return
+        try:
+            if self.limiter.applies(priority):
+                headers = dict((name.decode().lower(), value.decode()) for name, value in scope.get("headers", []))
+                client = client_id(headers.get("x-forwarded-for"), (scope.get("client") or ("unknown",))[0],
+                                   self.trusted_hops)
+                decision = await self.limiter.check(priority, client)
+                if not decision.allowed:
+                    if self.observer:
+                        self.observer(priority, 'rate_limited')
+                    body, status, _ = rejection('rate_limited')
+                    await self.respond(send, body, status, decision.headers())
+                    return
+            await self.app(scope, receive, send)
+        finally:
+            self.admission.leave()
@@ -0,0 +1,204 @@
+"""Routage des lectures MongoDB par classe de route.
+
+Sans préférence de lecture, toutes les requêtes vont au primaire de chaque
+shard : les secondaires du replica set `rs-shard` ne servent rien. Chaque
+classe de route a sa préférence de lecture, son pool et ses délais :
+- `primary`   : écritures et lectures qui doivent voir la dernière écriture
+  (tirage d'utilisateur, migrations, réconciliation des compteurs) ;
+- `dashboard` : `/hosts`, `/api/stats` (comptes exacts ou estimés) ;
+- `list`      : `/api/users` (pages et exports) ;
+- `analytics` : reconstruction des agrégats (parcours complets).
+
+Les classes de lecture utilisent `secondaryPreferred` borné par
+`maxStalenessSeconds` (90 s minimum côté MongoDB) et, en option, les
+lectures « hedged » de mongos (dépréciées à partir de MongoDB 8.0). Elles
+ont leur propre `MongoClient` (donc leur propre pool) : un export qui
+monopolise ses connexions ne bloque pas le tableau de bord ni les écritures.
+Les classes qui partagent URI, taille de pool et délais partagent un client.
+
+Lire ses propres écritures : une écriture réussie (POST/PUT/DELETE) pose le
+cookie `READ_YOUR_WRITES_COOKIE` pour la durée du retard toléré ; tant qu'il
+est présent, les lectures de ce client passent par le primaire.
+
+Configuration : `MONGO_<CLASSE>_READ_PREFERENCE`, `_MAX_STALENESS`, `_HEDGED`,
+`_POOL_SIZE`, `_DEADLINE_MS` (budget par requête, 0 = aucun),
+`_SERVER_SELECTION_TIMEOUT_MS` et `_URI` (ex. `MONGO_DASHBOARD_POOL_SIZE=50`).
+"""
+import os
+import threading
+
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+MIN_MAX_STALENESS = 90
+READ_YOUR_WRITES_COOKIE = 'mongo_primary'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+READ_PREFERENCES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+
+class RouteClass:
+    """Préférence de lecture, pool et délais d'une classe de routes"""
+
+    def __init__(self, name, read_preference='primary', max_staleness=-1, hedged=False, pool_size=100,
+                 deadline_ms=2000, server_selection_timeout_ms=5000, uri=None):
+        if read_preference not in READ_PREFERENCES:
+            raise ValueError(f"{name}: préférence de lecture inconnue {read_preference!r}")
+        if max_staleness != -1 and max_staleness < MIN_MAX_STALENESS:
+            raise ValueError(f"{name}: maxStalenessSeconds doit valoir -1 ou au moins {MIN_MAX_STALENESS}")
+        if read_preference == 'primary' and (max_staleness != -1 or hedged):
+            raise ValueError(f"{name}: maxStalenessSeconds et hedged ne s'appliquent pas au primaire")
+        self.name = name
+        self.read_preference = read_preference
+        self.max_staleness = max_staleness
+        self.hedged = hedged
+        self.pool_size = pool_size
+        self.deadline_ms = deadline_ms or None
+        self.server_selection_timeout_ms = server_selection_timeout_ms
+        self.uri = uri
+
+    @classmethod
+    def from_env(cls, name, env=None, **defaults):
+        """Valeurs par défaut de la classe, surchargées par `MONGO_<NAME>_*`"""
+        env = os.environ if env is None else env
+        prefix = f"MONGO_{name.upper()}_"
+
+        def get(key, cast):
+            value = env.get(prefix + key)
+            return defaults.get(key.lower()) if value in (None, '') else cast(value)
+
+        return cls(
+            name,
+            read_preference=get('READ_PREFERENCE', str) or 'primary',
+            max_staleness=get('MAX_STALENESS', int) or -1,
+            hedged=get('HEDGED', lambda value: value.lower() in ('1', 'true', 'yes')) or False,
+            pool_size=get('POOL_SIZE', int) or 100,
+            deadline_ms=get('DEADLINE_MS', int),
+            server_selection_timeout_ms=get('SERVER_SELECTION_TIMEOUT_MS', int) or 5000,
+            uri=get('URI', str),
+        )
+
+    def make_read_preference(self):
+        if self.read_preference == 'primary':
+            return Primary()
+        return READ_PREFERENCES[self.read_preference](max_staleness=self.max_staleness,
+                                                      hedge={"enabled": True} if self.hedged else None)
+
+    def pool_key(self, default_uri):
+        return (self.uri or default_uri, self.pool_size, self.server_selection_timeout_ms)
+
+    def describe(self):
+        return {
+            "read_preference": self.read_preference,
+            "max_staleness_s": self.max_staleness,
+            "hedged": self.hedged,
+            "pool_size": self.pool_size,
+            "deadline_ms": self.deadline_ms,
+            "server_selection_timeout_ms": self.server_selection_timeout_ms,
+            "dedicated_uri": self.uri is not None,
+        }
+
+
+def load_route_classes(primary_pool_size=100, deadline_ms=2000, env=None):
+    """Les quatre classes avec leurs valeurs par défaut"""
+    reads = dict(read_preference='secondaryPreferred', max_staleness=MIN_MAX_STALENESS)
+    return {
+        'primary': RouteClass.from_env('primary', env, pool_size=primary_pool_size, deadline_ms=deadline_ms),
+        'dashboard': RouteClass.from_env('dashboard', env, pool_size=50, deadline_ms=deadline_ms, **reads),
+        # Pool séparé : les exports en flux ne prennent pas les connexions du tableau de bord
+        'list': RouteClass.from_env('list', env, pool_size=20, deadline_ms=deadline_ms, **reads),
+        # Parcours complets en arrière-plan : pas de budget, retard toléré plus grand
+        'analytics': RouteClass.from_env('analytics', env, pool_size=10, deadline_ms=0,
+                                         read_preference='secondaryPreferred', max_staleness=120),
+    }
+
+
+class ReadRouter:
+    """Base `demoDB` vue avec la préférence de lecture de chaque classe.
+
+    `client_factory(uri, route_class)` crée un client (pymongo ou async) ;
+    `clients` fournit des clients existants par classe (le client principal
+    de l'app pour `primary`).
+    """
+
+    def __init__(self, classes, default_uri, client_factory, db_name='demoDB', clients=None):
+        self.classes = classes
+        self.default_uri = default_uri
+        self.client_factory = client_factory
+        self.db_name = db_name
+        self._clients = {}
+        self._databases = {}
+        # Premières requêtes simultanées (worker gthread) : un seul client par pool
+        self._lock = threading.Lock()
+        for name, client in (clients or {}).items():
+            self._clients[classes[name].pool_key(default_uri)] = client
+
+    def client(self, name):
+        route_class = self.classes[name]
+        key = route_class.pool_key(self.default_uri)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = self.client_factory(key[0], route_class)
+        return client
+
+    def db(self, name, read_your_writes=False):
+        """Vue de la base pour la classe `name` (primaire si `read_your_writes`)"""
+        if read_your_writes:
+            name = 'primary'
+        if name not in self._databases:
+            self._databases[name] = self.client(name).get_database(
+                self.db_name, read_preference=self.classes[name].make_read_preference()
+            )
+        return self._databases[name]
+
+    def deadline_ms(self, name):
+        return self.classes[name].deadline_ms
+
+    def timeout(self, name):
+        """Budget de la classe en secondes pour `pymongo.timeout` (None = aucun)"""
+        deadline_ms = self.deadline_ms(name)
+        return deadline_ms / 1000 if deadline_ms else None
+
+    def read_your_writes_seconds(self):
+        """Durée du cookie : le plus grand retard toléré par une classe de lecture"""
+        staleness = [c.max_staleness for c in self.classes.values() if c.read_preference != 'primary']
+        if not staleness:
+            return 0
+        # -1 : pas de borne côté MongoDB, on retient le minimum autorisé
+        return max(MIN_MAX_STALENESS if value == -1 else value for value in staleness)
+
+    def clients(self):
+        return list(self._clients.values())
+
+    def describe(self):
+        return {name: route_class.describe() for name, route_class in self.classes.items()}
+
+
+class ReadYourWritesMiddleware:
+    """Middleware ASGI : pose le cookie de lecture sur le primaire après une
+    écriture réussie (équivalent du `after_request` de app.py)"""
+
+    def __init__(self, app, seconds):
+        self.app = app
+        self.cookie = f"{READ_YOUR_WRITES_COOKIE}=1; Max-Age={seconds}; Path=/; HttpOnly; SameSite=Lax".encode()
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS or self.seconds <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"set-cookie", self.cookie)]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,93 @@
+"""Clients Redis de l'app : pool bloquant partagé, contrôles de santé, cache côté client.
+
+Un seul pool par process, partagé par toutes les routes et composants :
+- `BlockingConnectionPool` : au-delà de `max_connections` (dimensionné par
+  worker dans gunicorn_conf.py), une commande attend jusqu'à `pool_timeout`
+  secondes qu'une connexion se libère au lieu d'échouer aussitôt
+  (« Too many connections ») ;
+- `health_check_interval` : une connexion restée inutilisée plus longtemps
+  est vérifiée (PING) avant d'être réutilisée, ce qui évite l'erreur sur la
+  première commande après un redémarrage de Redis ou une coupure d'inactivité ;
+- keepalive TCP et délais de socket configurables (REDIS_SOCKET_TIMEOUT,
+  REDIS_CONNECT_TIMEOUT).
+
+Cache côté client (`REDIS_CLIENT_CACHE_SIZE` > 0, mode sync seulement :
+redis.asyncio ne le gère pas, et Redis >= 7.4) : un second client, sur son propre petit pool, parle RESP3
+avec suivi des clés (CLIENT TRACKING). Il ne sert qu'aux lectures des clés
+chaudes (`hosts_data` et ses métadonnées, voir `TwoTierCache.hot_keys`) :
+tant que Redis n'a pas signalé de modification, le MGET est servi depuis la
+mémoire du process, sans aller-retour, même après l'expiration du L1.
+"""
+import redis
+from redis.cache import CacheConfig
+import redis.asyncio as aioredis
+
+
+def pool_options(host, port=6379, decode_responses=True, socket_timeout=1.0, connect_timeout=1.0,
+                 health_check_interval=30, **extra):
+    return {
+        "host": host,
+        "port": port,
+        "decode_responses": decode_responses,
+        "socket_timeout": socket_timeout,
+        "socket_connect_timeout": connect_timeout,
+        "socket_keepalive": True,
+        "health_check_interval": health_check_interval,
+        **extra,
+    }
+
+
+def make_redis(client_class, host, max_connections=50, pool_timeout=1.0, **options):
+    """Client `client_class` (ex. metrics.InstrumentedRedis) sur un pool bloquant"""
+    pool = redis.BlockingConnectionPool(max_connections=max_connections, timeout=pool_timeout,
+                                        **pool_options(host, **options))
+    return client_class(connection_pool=pool)
+
+
+def make_async_redis(client_class, host, max_connections=100, pool_timeout=1.0, **options):
+    pool = aioredis.BlockingConnectionPool(max_connections=max_connections, timeout=pool_timeout,
+                                           **pool_options(host, **options))
+    return client_class(connection_pool=pool)
+
+
+def make_hot_client(client_class, host, cache_size=1000, max_connections=4, pool_timeout=1.0, **options):
+    """Client RESP3 avec cache côté client pour les clés chaudes (valeurs en bytes)"""
+    options = {**options, "decode_responses": False}
+    pool = redis.BlockingConnectionPool(max_connections=max_connections, timeout=pool_timeout, protocol=3,
+                                        cache_config=CacheConfig(max_size=cache_size),
+                                        **pool_options(host, **options))
+    return client_class(connection_pool=pool)
+
+
+def pool_usage(client):
+    """(connexions utilisées, connexions libres) du pool d'un client, ou None"""
+    pool = getattr(client, 'connection_pool', None)
+    if pool is None:
+        return None
+    if hasattr(pool, '_connections') and hasattr(pool, 'pool'):
+        # BlockingConnectionPool sync : file de connexions (None = place libre)
+        idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+        return len(pool._connections) - idle, idle
+    return len(getattr(pool, '_in_use_connections', ())), len(getattr(pool, '_available_connections', ()))
+
+
+def describe(client):
+    """Configuration et occupation du pool pour /cache/status"""
+    if client is None:
+        return None
+    pool = client.connection_pool
+    kwargs = pool.connection_kwargs
+    in_use, idle = pool_usage(client)
+    report = {
+        "max_connections": pool.max_connections,
+        "in_use": in_use,
+        "idle": idle,
+        "pool_timeout": getattr(pool, 'timeout', None),
+        "socket_timeout": kwargs.get("socket_timeout"),
+        "health_check_interval": kwargs.get("health_check_interval"),
+        "protocol": kwargs.get("protocol", 2),
+    }
+    cache = getattr(pool, 'cache', None)
+    if cache is not None:
+        report["client_cache"] = {"entries": cache.size, "max_size": cache.config.get_max_size()}
+    return report
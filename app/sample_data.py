@@ -0,0 +1,69 @@
+"""Génération des données de démonstration (partagée par les modes sync et async)."""
+import random
+import uuid
+
+FIRST_NAMES = ["Timothé", "Samir", "Ayoub", "Abelbadi", "Haitam", "Nabil", "Edin", "Arthur"]
+LAST_NAMES = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit"]
+COUNTRIES = ["France", "Belgium", "Germany", "Spain", "Italy", "Netherlands"]
+
+
+def sample_users():
+    """5 utilisateurs de test (nouvelle liste à chaque appel : insert_many ajoute les _id)"""
+    return [
+        {
+            "user_id": "user_1", "name": "Alice Dupont", "email": "alice@ecam.be", 
+            "country": "France", "order_count": 3, "total_spent": 150.50
+        },
+        {
+            "user_id": "user_2", "name": "Bob Martin", "email": "bob@ecam.be", 
+            "country": "Belgium", "order_count": 1, "total_spent": 45.00
+        },
+        {
+            "user_id": "user_3", "name": "Charlie Wilson", "email": "charlie@ecam.be", 
+            "country": "Germany", "order_count": 7, "total_spent": 320.75
+        },
+        {
+            "user_id": "user_4", "name": "Diana Lopez", "email": "diana@ecam.be", 
+            "country": "Spain", "order_count": 2, "total_spent": 89.99
+        },
+        {
+            "user_id": "user_5", "name": "Eve Chen", "email": "eve@ecam.be", 
+            "country": "Italy", "order_count": 0, "total_spent": 0
+        }
+    ]
+
+
+def sample_orders():
+    """Quelques commandes liées aux utilisateurs de test"""
+    return [
+        {"order_id": "order_1", "user_id": "user_1", "user_name": "Alice Dupont", "amount": 75.25},
+        {"order_id": "order_2", "user_id": "user_1", "user_name": "Alice Dupont", "amount": 45.00},
+        {"order_id": "order_3", "user_id": "user_2", "user_name": "Bob Martin", "amount": 30.25},
+        {"order_id": "order_4", "user_id": "user_3", "user_name": "Charlie Wilson", "amount": 120.50}
+    ]
+
+
+def random_user():
+    """Un utilisateur aléatoire sans commande"""
+    name = f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}"
+    return {
+        "user_id": f"user_{random.randint(1000, 9999)}",
+        "name": name,
+        "email": f"{name.lower().replace(' ', '.')}@ecam.be",
+        "country": random.choice(COUNTRIES),
+        "order_count": 0,
+        "total_spent": 0
+    }
+
+
+def random_order(user):
+    """Une commande aléatoire pour `user` (sans `user_name` si le nom n'est pas connu :
+    le worker write-behind le complète). `order_id` unique : clé d'idempotence."""
+    order = {
+        "order_id": f"order_{uuid.uuid4().hex}",
+        "user_id": user["user_id"],
+        "amount": round(random.uniform(10, 200), 2)
+    }
+    if user.get("name"):
+        order["user_name"] = user["name"]
+    return order
@@ -0,0 +1,214 @@
+"""Sérialisation JSON et compression des réponses (modes sync et async).
+
+- `dumps` : orjson s'il est installé (plusieurs fois plus rapide que `json`),
+  sinon la bibliothèque standard, avec le même résultat : types BSON gérés
+  directement (`ObjectId` et `Decimal128` en chaîne, `datetime` en ISO 8601
+  UTC avec `Z`, les dates MongoDB étant naïves en UTC) ;
+- négociation `Accept-Encoding` : brotli si le module `brotli` est
+  installé et accepté par le client, sinon gzip ;
+- `Payload` : corps déjà compressé, tel qu'il est stocké dans le cache Redis.
+  Un hit est renvoyé tel quel avec `Content-Encoding`, et n'est décompressé
+  que pour un client qui n'accepte pas l'encodage stocké.
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+import gzip
+import json
+import uuid
+
+from bson import Decimal128, ObjectId
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle : repli sur json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : sans elle, seul gzip est proposé
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+COMPRESSIBLE_MIMETYPES = frozenset({JSON_MIMETYPE, 'text/plain', 'text/html', 'application/x-ndjson'})
+# En dessous, l'en-tête gzip et le coût CPU dépassent le gain
+MIN_COMPRESS_SIZE = 1024
+# Réponses dynamiques : niveaux rapides ; payloads en cache : compressés une
+# fois par recalcul, servis à chaque hit, donc au niveau maximal
+DYNAMIC_LEVELS = {'gzip': 6, 'br': 5}
+CACHED_LEVELS = {'gzip': 9, 'br': 11}
+
+
+def supported_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def json_default(o):
+    """Types non natifs de JSON (BSON et dates), pour orjson comme pour json"""
+    if isinstance(o, (ObjectId, Decimal128, uuid.UUID)):
+        return str(o)
+    if isinstance(o, datetime):
+        # Même rendu qu'orjson (OPT_NAIVE_UTC | OPT_UTC_Z)
+        if o.tzinfo is None or o.utcoffset() == timedelta(0):
+            return o.replace(tzinfo=None).isoformat() + 'Z'
+        return o.isoformat()
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """JSON en bytes UTF-8"""
+        return orjson.dumps(obj, default=json_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        """JSON en bytes UTF-8"""
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=json_default).encode('utf-8')
+
+    loads = json.loads
+
+
+def dumps_text(obj):
+    """Comme `dumps`, en str (lignes des exports NDJSON)"""
+    return dumps(obj).decode('utf-8')
+
+
+def accepted_encodings(header):
+    """Encodages acceptés (q > 0) d'un en-tête Accept-Encoding"""
+    accepted = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def negotiate(accept_encoding, available=None):
+    """Meilleur encodage disponible accepté par le client, ou 'identity'"""
+    accepted = accepted_encodings(accept_encoding)
+    return next((e for e in (available or supported_encodings()) if e in accepted), 'identity')
+
+
+def compress(body, encoding, levels=DYNAMIC_LEVELS):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=levels['gzip'], mtime=0)
+    if encoding == 'br':
+        return brotli.compress(body, quality=levels['br'])
+    return body
+
+
+def decompress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'br':
+        return brotli.decompress(body)
+    return body
+
+
+def compress_response(body, mimetype, accept_encoding):
+    """Corps compressé et encodage choisi (None si la réponse reste telle quelle)"""
+    if mimetype not in COMPRESSIBLE_MIMETYPES or len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    encoding = negotiate(accept_encoding)
+    if encoding == 'identity':
+        return body, None
+    return compress(body, encoding), encoding
+
+
+class Payload(namedtuple('Payload', 'body encoding')):
+    """Corps JSON déjà compressé, stocké en cache sous la forme `<encodage>:<corps>`"""
+
+    @classmethod
+    def encode(cls, obj, encoding='gzip'):
+        if encoding not in supported_encodings():
+            encoding = 'gzip'
+        return cls(compress(dumps(obj), encoding, CACHED_LEVELS), encoding)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if isinstance(data, str):
+            # Entrée écrite avant la compression des payloads (JSON brut)
+            return cls(data.encode('utf-8'), 'identity')
+        encoding, sep, body = data.partition(b':')
+        if not sep or encoding.decode('ascii', 'replace') not in ('identity', 'gzip', 'br'):
+            return cls(data, 'identity')
+        return cls(body, encoding.decode('ascii'))
+
+    def to_bytes(self):
+        return self.encoding.encode('ascii') + b':' + self.body
+
+    def respond(self, accept_encoding):
+        """Renvoie `(corps, en-têtes)` : le corps stocké si le client accepte
+        son encodage, sinon le JSON décompressé"""
+        headers = {'Vary': 'Accept-Encoding'}
+        if self.encoding == 'identity' or self.encoding in accepted_encodings(accept_encoding):
+            if self.encoding != 'identity':
+                headers['Content-Encoding'] = self.encoding
+            return self.body, headers
+        return decompress(self.body, self.encoding), headers
+
+
+class CompressionMiddleware:
+    """Middleware ASGI : compresse les réponses en un seul morceau (équivalent
+    de l'`after_request` de app.py). Les flux (exports) et les réponses déjà
+    encodées passent tels quels."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next((value.decode('latin-1') for name, value in scope["headers"]
+                                if name == b"accept-encoding"), '')
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                message = self._compress(start, message, accept_encoding)
+            await send(start)
+            start = None
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _compress(start, message, accept_encoding):
+        headers = [(name, value) for name, value in start.get("headers", [])]
+        names = {name.lower() for name, _ in headers}
+        if b"content-encoding" in names:
+            return message
+        mimetype = next((value.decode('latin-1').split(';')[0].strip() for name, value in headers
+                         if name.lower() == b"content-type"), '')
+        body, encoding = compress_response(message.get("body", b""), mimetype, accept_encoding)
+        if encoding is None:
+            if mimetype in COMPRESSIBLE_MIMETYPES:
+                start["headers"] = headers + [(b"vary", b"Accept-Encoding")]
+            return message
+        headers = [(name, value) for name, value in headers if name.lower() != b"content-length"]
+        start["headers"] = headers + [
+            (b"content-encoding", encoding.encode()),
+            (b"content-length", str(len(body)).encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        return {**message, "body": body}
@@ -0,0 +1,343 @@
+"""Diagnostic du sharding : ciblage des requêtes, répartition des chunks, balancer.
+
+`/sharding-info` ne donnait que le nombre de shards. `ShardDiagnostics`
+ajoute, connecté au mongos :
+- la liste des shards (`config.shards`) et l'état du balancer
+  (`balancerStatus`, migrations de chunks de la dernière heure) ;
+- par collection shardée de `demoDB` : clé de sharding, chunks et documents
+  par shard (`config.chunks`, `$collStats`), et les shards « chauds » dont
+  la part dépasse `hot_factor` fois la part équitable ;
+- avec `?explain=1`, pour chaque requête du catalogue des routes
+  (`indexes.QUERIES`) : `explain` en `executionStats` par mongos, requête
+  ciblée (un shard), multi-shard ou diffusée à tous, nombre de shards
+  interrogés et temps de chaque shard. Un shard dont le temps moyen dépasse
+  `hot_factor` fois la médiane est signalé `slow`.
+
+`explain` en `executionStats` exécute les requêtes, et la répartition lit
+`config.chunks` et `$collStats` par collection : les deux mesures sont
+gardées `max_age` secondes (SHARD_DIAGNOSTICS_MAX_AGE) et `?refresh=1` force
+une nouvelle lecture. Chaque partie est indépendante : une erreur (droits sur
+`config`, replica set sans mongos) est rapportée dans sa section sans
+masquer les autres.
+
+    python app/sharding.py           # répartition + balancer
+    python app/sharding.py explain   # + ciblage des requêtes
+"""
+from datetime import datetime, timedelta
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+from indexes import QUERIES, winning_plan
+
+TARGETED = 'targeted'
+MULTI_SHARD = 'multi_shard'
+BROADCAST = 'broadcast'
+UNSHARDED = 'unsharded'
+# Part d'un shard au-delà de laquelle il est signalé (x part équitable / médiane)
+HOT_FACTOR = 1.5
+MIGRATION_EVENTS = ('moveChunk.commit', 'moveRange.commit')
+CLUSTER_SECTIONS = ('shard_list', 'balancer', 'collections')
+
+
+def explain_command(query):
+    command = {"find": query.collection, "filter": query.filter}
+    if query.sort:
+        command["sort"] = dict(query.sort)
+    if query.limit:
+        command["limit"] = query.limit
+    return {"explain": command, "verbosity": "executionStats"}
+
+
+def classify(shards_targeted, total_shards):
+    if shards_targeted == 0:
+        return UNSHARDED
+    if shards_targeted == 1:
+        return TARGETED
+    if total_shards and shards_targeted < total_shards:
+        return MULTI_SHARD
+    return BROADCAST
+
+
+def analyze_targeting(explain, total_shards=None):
+    """Ciblage et temps par shard d'une sortie d'`explain` (executionStats, mongos)"""
+    plan = winning_plan(explain.get("queryPlanner", {}).get("winningPlan", {}))
+    stats = explain.get("executionStats", {})
+    stages = stats.get("executionStages", {})
+    per_shard = [{
+        "shard": shard.get("shardName"),
+        "ms": shard.get("executionTimeMillis", shard.get("executionTimeMillisEstimate", 0)),
+        "returned": shard.get("nReturned", 0),
+        "keys_examined": shard.get("totalKeysExamined", 0),
+        "docs_examined": shard.get("totalDocsExamined", 0),
+    } for shard in stages.get("shards", [])]
+    shards_targeted = len(per_shard) or len(plan.get("shards", []))
+    return {
+        "targeting": classify(shards_targeted, total_shards),
+        "stage": plan.get("stage"),
+        "shards_targeted": shards_targeted,
+        "total_ms": stats.get("executionTimeMillis", 0),
+        "returned": stats.get("nReturned", 0),
+        "per_shard": per_shard,
+    }
+
+
+def targeting_report(query, explain, total_shards=None):
+    return {"query": query.name, "route": query.route, "collection": query.collection,
+            **analyze_targeting(explain, total_shards)}
+
+
+def shard_latency(reports, hot_factor=HOT_FACTOR):
+    """Temps par shard sur l'ensemble des requêtes; `slow` si > hot_factor x médiane"""
+    shards = {}
+    for report in reports:
+        for entry in report.get("per_shard", []):
+            shard = shards.setdefault(entry["shard"], {"queries": 0, "targeted": 0, "total_ms": 0, "max_ms": 0})
+            shard["queries"] += 1
+            shard["targeted"] += report["targeting"] == TARGETED
+            shard["total_ms"] += entry["ms"]
+            shard["max_ms"] = max(shard["max_ms"], entry["ms"])
+    for shard in shards.values():
+        shard["avg_ms"] = round(shard["total_ms"] / shard["queries"], 2)
+    if len(shards) > 1:
+        median = statistics.median(shard["avg_ms"] for shard in shards.values())
+        for shard in shards.values():
+            shard["slow"] = median > 0 and shard["avg_ms"] > hot_factor * median
+    return shards
+
+
+def hot_shards(counts, hot_factor=HOT_FACTOR):
+    """Shards dont la part de `counts` dépasse hot_factor x part équitable"""
+    total = sum(counts.values())
+    if len(counts) < 2 or not total:
+        return []
+    fair = total / len(counts)
+    return sorted(shard for shard, count in counts.items() if count > hot_factor * fair)
+
+
+def collection_distribution(meta, chunks, documents, hot_factor=HOT_FACTOR):
+    """Répartition d'une collection : `chunks` = [{_id: shard, chunks, jumbo}],
+    `documents` = {shard: nombre} (vide si `$collStats` indisponible)"""
+    shards = {row["_id"]: {"chunks": row["chunks"], "jumbo": row.get("jumbo", 0)} for row in chunks}
+    for shard, count in documents.items():
+        shards.setdefault(shard, {"chunks": 0, "jumbo": 0})["documents"] = count
+    chunk_counts = {shard: info["chunks"] for shard, info in shards.items()}
+    document_counts = {shard: info["documents"] for shard, info in shards.items() if "documents" in info}
+    return {
+        "collection": meta["_id"].split(".", 1)[1],
+        "key": meta.get("key"),
+        "balancing": not meta.get("noBalance", False),
+        "chunks": sum(chunk_counts.values()),
+        "shards": shards,
+        "hot_shards": sorted(set(hot_shards(chunk_counts, hot_factor)) | set(hot_shards(document_counts, hot_factor))),
+    }
+
+
+def chunks_pipeline(meta):
+    # `uuid` depuis MongoDB 5.0, `ns` avant
+    return [
+        {"$match": {"$or": [{"uuid": meta.get("uuid")}, {"ns": meta["_id"]}]}},
+        {"$group": {"_id": "$shard", "chunks": {"$sum": 1},
+                    "jumbo": {"$sum": {"$cond": [{"$eq": ["$jumbo", True]}, 1, 0]}}}},
+    ]
+
+
+def collstats_pipeline():
+    return [{"$collStats": {"count": {}}}]
+
+
+def sharded_collections_filter(db_name):
+    return {"_id": {"$regex": f"^{db_name}\\."}, "dropped": {"$ne": True}}
+
+
+def migrations_filter(since):
+    return {"what": {"$in": list(MIGRATION_EVENTS)}, "time": {"$gte": since}}
+
+
+def section(fn):
+    """Une partie du rapport, ou son erreur"""
+    try:
+        return fn()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def section_async(fn):
+    try:
+        return await fn()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def total_shards(cluster):
+    shards = cluster["shard_list"]
+    return len(shards) if isinstance(shards, list) else None
+
+
+class ShardDiagnostics:
+    """Rapport de sharding pour `/sharding-info` (client connecté au mongos)."""
+
+    def __init__(self, client, db_name='demoDB', queries=QUERIES, max_age=60.0, hot_factor=HOT_FACTOR):
+        self.client = client
+        self.db_name = db_name
+        self.queries = queries
+        self.max_age = max_age
+        self.hot_factor = hot_factor
+        self.runs = 0
+        self._cluster = None
+        self._targeting = None
+        self._lock = threading.Lock()
+
+    def shards(self):
+        return [{"id": shard["_id"], "host": shard.get("host"), "state": shard.get("state")}
+                for shard in self.client["config"].shards.find()]
+
+    def balancer(self):
+        status = self.client.admin.command("balancerStatus")
+        since = datetime.utcnow() - timedelta(hours=1)
+        return {
+            "mode": status.get("mode"),
+            "in_round": status.get("inBalancerRound"),
+            "rounds": status.get("numBalancerRounds"),
+            "migrations_last_hour": self.client["config"].changelog.count_documents(migrations_filter(since)),
+        }
+
+    def documents_per_shard(self, collection):
+        try:
+            return {row.get("shard", "-"): row.get("count", 0)
+                    for row in self.client[self.db_name][collection].aggregate(collstats_pipeline())}
+        except Exception:
+            return {}
+
+    def distribution(self):
+        config = self.client["config"]
+        collections = []
+        for meta in config.collections.find(sharded_collections_filter(self.db_name)):
+            chunks = list(config.chunks.aggregate(chunks_pipeline(meta)))
+            documents = self.documents_per_shard(meta["_id"].split(".", 1)[1])
+            collections.append(collection_distribution(meta, chunks, documents, self.hot_factor))
+        return collections
+
+    def explain(self, total_shards):
+        db = self.client[self.db_name]
+        reports = []
+        for query in self.queries:
+            try:
+                reports.append(targeting_report(query, db.command(explain_command(query)), total_shards))
+            except Exception as e:
+                reports.append({"query": query.name, "route": query.route, "collection": query.collection,
+                                "error": str(e)})
+        return reports
+
+    def _fresh(self, measure, refresh):
+        return not refresh and measure is not None and time.time() - measure["at"] < self.max_age
+
+    def _store(self, reports):
+        self.runs += 1
+        self._targeting = {"at": time.time(), "queries": reports,
+                           "shard_latency": shard_latency(reports, self.hot_factor)}
+        return self._targeting
+
+    def targeting(self, total_shards=None, refresh=False):
+        """Ciblage des requêtes du catalogue (mesure gardée `max_age` secondes)"""
+        with self._lock:
+            if not self._fresh(self._targeting, refresh):
+                self._store(self.explain(total_shards))
+            return self._targeting
+
+    def cluster(self, refresh=False):
+        """Shards, balancer et répartition des chunks (gardés `max_age` secondes)"""
+        with self._lock:
+            if not self._fresh(self._cluster, refresh):
+                self._cluster = {"at": time.time(), "shard_list": section(self.shards),
+                                 "balancer": section(self.balancer), "collections": section(self.distribution)}
+            return self._cluster
+
+    def report(self, explain=False, refresh=False):
+        cluster = self.cluster(refresh)
+        report = {key: cluster[key] for key in CLUSTER_SECTIONS}
+        if explain or refresh:
+            report["targeting"] = section(lambda: self.targeting(total_shards(cluster), refresh))
+        return report
+
+
+class AsyncShardDiagnostics(ShardDiagnostics):
+    """Variante de `ShardDiagnostics` pour le mode ASGI (AsyncMongoClient)."""
+
+    async def shards(self):
+        return [{"id": shard["_id"], "host": shard.get("host"), "state": shard.get("state")}
+                async for shard in self.client["config"].shards.find()]
+
+    async def balancer(self):
+        status = await self.client.admin.command("balancerStatus")
+        since = datetime.utcnow() - timedelta(hours=1)
+        return {
+            "mode": status.get("mode"),
+            "in_round": status.get("inBalancerRound"),
+            "rounds": status.get("numBalancerRounds"),
+            "migrations_last_hour": await self.client["config"].changelog.count_documents(migrations_filter(since)),
+        }
+
+    async def documents_per_shard(self, collection):
+        try:
+            cursor = await self.client[self.db_name][collection].aggregate(collstats_pipeline())
+            return {row.get("shard", "-"): row.get("count", 0) async for row in cursor}
+        except Exception:
+            return {}
+
+    async def distribution(self):
+        config = self.client["config"]
+        collections = []
+        async for meta in config.collections.find(sharded_collections_filter(self.db_name)):
+            chunks = await (await config.chunks.aggregate(chunks_pipeline(meta))).to_list(None)
+            documents = await self.documents_per_shard(meta["_id"].split(".", 1)[1])
+            collections.append(collection_distribution(meta, chunks, documents, self.hot_factor))
+        return collections
+
+    async def explain(self, total_shards):
+        db = self.client[self.db_name]
+        reports = []
+        for query in self.queries:
+            try:
+                reports.append(targeting_report(query, await db.command(explain_command(query)), total_shards))
+            except Exception as e:
+                reports.append({"query": query.name, "route": query.route, "collection": query.collection,
+                                "error": str(e)})
+        return reports
+
+    async def targeting(self, total_shards=None, refresh=False):
+        # Pas de verrou : deux mesures simultanées coûtent deux explain, sans incohérence
+        if not self._fresh(self._targeting, refresh):
+            self._store(await self.explain(total_shards))
+        return self._targeting
+
+    async def cluster(self, refresh=False):
+        if not self._fresh(self._cluster, refresh):
+            self._cluster = {"at": time.time(), "shard_list": await section_async(self.shards),
+                             "balancer": await section_async(self.balancer),
+                             "collections": await section_async(self.distribution)}
+        return self._cluster
+
+    async def report(self, explain=False, refresh=False):
+        cluster = await self.cluster(refresh)
+        report = {key: cluster[key] for key in CLUSTER_SECTIONS}
+        if explain or refresh:
+            report["targeting"] = await section_async(lambda: self.targeting(total_shards(cluster), refresh))
+        return report
+
+
+def main():
+    """`python app/sharding.py [explain]` (MONGODB_URI comme l'app)"""
+    from pymongo import MongoClient
+
+    uri = os.getenv('MONGODB_URI', 'mongodb://mongo-mongos.dev.svc.cluster.local:27017/?directConnection=true')
+    explain = len(sys.argv) > 1 and sys.argv[1] == 'explain'
+    report = ShardDiagnostics(MongoClient(uri)).report(explain=explain)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
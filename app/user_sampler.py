@@ -0,0 +1,268 @@
+"""Tirage d'un utilisateur aléatoire en O(1), quelle que soit la taille de `users`.
+
+Un set Redis contient les `user_id` (SADD à la création, vidé avec les
+données). `SRANDMEMBER` donne un id, puis un `find_one` ciblé sur la clé de
+shard `user_id` ne lit que `user_id`/`name` sur un seul shard.
+
+Si le set est absent (Redis vidé, premier démarrage) ou Redis indisponible,
+on retombe sur `$sample` (projection minimale, pas de chargement de la
+collection) et le set est reconstruit en arrière-plan par lots. La
+reconstruction fusionne les ids ajoutés pendant sa lecture de MongoDB, et
+abandonne si le set a été remplacé entre-temps (`reset`, qui incrémente
+`users:ids:generation`).
+"""
+import asyncio
+import contextvars
+import threading
+
+import redis
+
+USER_IDS_KEY = 'users:ids'
+REBUILD_LOCK_KEY = 'users:ids:rebuild'
+GENERATION_KEY = 'users:ids:generation'
+TMP_KEY = f"{USER_IDS_KEY}:tmp"
+PROJECTION = {"_id": 0, "user_id": 1, "name": 1}
+
+
+def sample_pipeline():
+    return [{"$sample": {"size": 1}}, {"$project": dict(PROJECTION)}]
+
+
+class UserSampler:
+    """Choix aléatoire d'un utilisateur sans lire toute la collection."""
+
+    def __init__(self, redis_client, db, rebuild_batch_size=1000, max_attempts=3):
+        self.redis = redis_client
+        self.db = db
+        self.rebuild_batch_size = rebuild_batch_size
+        self.max_attempts = max_attempts
+
+    def add(self, *user_ids):
+        if self.redis is None or not user_ids:
+            return
+        try:
+            self.redis.sadd(USER_IDS_KEY, *user_ids)
+        except redis.RedisError:
+            pass
+
+    def remove(self, *user_ids):
+        """Retire des ids supprimés (watcher des change streams)"""
+        if self.redis is None or not user_ids:
+            return
+        try:
+            self.redis.srem(USER_IDS_KEY, *user_ids)
+        except redis.RedisError:
+            pass
+
+    def reset(self, user_ids=()):
+        """Remplace le contenu du set (chargement ou vidage complet)"""
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline()
+            pipe.delete(USER_IDS_KEY)
+            if user_ids:
+                pipe.sadd(USER_IDS_KEY, *user_ids)
+            # Une reconstruction en cours ne doit pas écraser ce contenu
+            pipe.incr(GENERATION_KEY)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def pick(self):
+        """Renvoie `{"user_id", "name"}` d'un utilisateur aléatoire, ou None si aucun"""
+        if self.redis is not None:
+            try:
+                for _ in range(self.max_attempts):
+                    user_id = self.redis.srandmember(USER_IDS_KEY)
+                    if user_id is None:
+                        self.start_rebuild()
+                        break
+                    user = self.db.users.find_one({"user_id": user_id}, PROJECTION)
+                    if user is not None:
+                        return user
+                    # id orphelin (utilisateur supprimé hors de l'app)
+                    self.redis.srem(USER_IDS_KEY, user_id)
+            except redis.RedisError:
+                pass
+        users = list(self.db.users.aggregate(sample_pipeline()))
+        return users[0] if users else None
+
+    def pick_id(self):
+        """Un `user_id` aléatoire lu dans Redis seul, sans MongoDB (écriture
+        différée); None si le set est vide ou Redis indisponible"""
+        if self.redis is None:
+            return None
+        try:
+            user_id = self.redis.srandmember(USER_IDS_KEY)
+            if user_id is None:
+                self.start_rebuild()
+            return user_id
+        except redis.RedisError:
+            return None
+
+    def rebuild(self):
+        """Reconstruit le set par lots, puis le remplace atomiquement (RENAME);
+        renvoie False si un `reset` concurrent l'a rendu caduc"""
+        generation = self.redis.get(GENERATION_KEY)
+        self.redis.delete(TMP_KEY)
+        batch = []
+        built = False
+        cursor = self.db.users.find({}, {"_id": 0, "user_id": 1}, batch_size=self.rebuild_batch_size)
+        for user in cursor:
+            if "user_id" in user:
+                batch.append(user["user_id"])
+            if len(batch) >= self.rebuild_batch_size:
+                self.redis.sadd(TMP_KEY, *batch)
+                built, batch = True, []
+        if batch:
+            self.redis.sadd(TMP_KEY, *batch)
+            built = True
+        if not built:
+            return True
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(GENERATION_KEY)
+                if pipe.get(GENERATION_KEY) == generation:
+                    # Les `add` arrivés pendant la lecture sont fusionnés avant l'échange
+                    pipe.multi()
+                    pipe.sunionstore(TMP_KEY, TMP_KEY, USER_IDS_KEY)
+                    pipe.rename(TMP_KEY, USER_IDS_KEY)
+                    pipe.execute()
+                    return True
+            except redis.WatchError:
+                pass
+        self.redis.delete(TMP_KEY)
+        return False
+
+    def start_rebuild(self):
+        """Lance une reconstruction en arrière-plan (une seule à la fois, tous replicas confondus)"""
+        if self.redis is None:
+            return
+        if not self.redis.set(REBUILD_LOCK_KEY, '1', nx=True, ex=300):
+            return
+
+        def run():
+            try:
+                self.rebuild()
+            except Exception:
+                pass
+            finally:
+                self.redis.delete(REBUILD_LOCK_KEY)
+
+        threading.Thread(target=run, name="user-ids-rebuild", daemon=True).start()
+
+
+class AsyncUserSampler(UserSampler):
+    """Variante de `UserSampler` pour le mode ASGI (redis.asyncio + AsyncMongoClient)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tasks = set()
+
+    async def add(self, *user_ids):
+        if self.redis is None or not user_ids:
+            return
+        try:
+            await self.redis.sadd(USER_IDS_KEY, *user_ids)
+        except redis.RedisError:
+            pass
+
+    async def remove(self, *user_ids):
+        if self.redis is None or not user_ids:
+            return
+        try:
+            await self.redis.srem(USER_IDS_KEY, *user_ids)
+        except redis.RedisError:
+            pass
+
+    async def reset(self, user_ids=()):
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline()
+            pipe.delete(USER_IDS_KEY)
+            if user_ids:
+                pipe.sadd(USER_IDS_KEY, *user_ids)
+            pipe.incr(GENERATION_KEY)
+            await pipe.execute()
+        except redis.RedisError:
+            pass
+
+    async def pick(self):
+        if self.redis is not None:
+            try:
+                for _ in range(self.max_attempts):
+                    user_id = await self.redis.srandmember(USER_IDS_KEY)
+                    if user_id is None:
+                        await self.start_rebuild()
+                        break
+                    user = await self.db.users.find_one({"user_id": user_id}, PROJECTION)
+                    if user is not None:
+                        return user
+                    await self.redis.srem(USER_IDS_KEY, user_id)
+            except redis.RedisError:
+                pass
+        users = await (await self.db.users.aggregate(sample_pipeline())).to_list(None)
+        return users[0] if users else None
+
+    async def pick_id(self):
+        if self.redis is None:
+            return None
+        try:
+            user_id = await self.redis.srandmember(USER_IDS_KEY)
+            if user_id is None:
+                await self.start_rebuild()
+            return user_id
+        except redis.RedisError:
+            return None
+
+    async def rebuild(self):
+        generation = await self.redis.get(GENERATION_KEY)
+        await self.redis.delete(TMP_KEY)
+        batch = []
+        built = False
+        cursor = self.db.users.find({}, {"_id": 0, "user_id": 1}, batch_size=self.rebuild_batch_size)
+        async for user in cursor:
+            if "user_id" in user:
+                batch.append(user["user_id"])
+            if len(batch) >= self.rebuild_batch_size:
+                await self.redis.sadd(TMP_KEY, *batch)
+                built, batch = True, []
+        if batch:
+            await self.redis.sadd(TMP_KEY, *batch)
+            built = True
+        if not built:
+            return True
+        async with self.redis.pipeline() as pipe:
+            try:
+                await pipe.watch(GENERATION_KEY)
+                if await pipe.get(GENERATION_KEY) == generation:
+                    pipe.multi()
+                    pipe.sunionstore(TMP_KEY, TMP_KEY, USER_IDS_KEY)
+                    pipe.rename(TMP_KEY, USER_IDS_KEY)
+                    await pipe.execute()
+                    return True
+            except redis.WatchError:
+                pass
+        await self.redis.delete(TMP_KEY)
+        return False
+
+    async def start_rebuild(self):
+        if self.redis is None:
+            return
+        if not await self.redis.set(REBUILD_LOCK_KEY, '1', nx=True, ex=300):
+            return
+
+        async def run():
+            try:
+                await self.rebuild()
+            except Exception:
+                pass
+            finally:
+                await self.redis.delete(REBUILD_LOCK_KEY)
+
+        # Sans le budget pymongo.timeout de la requête qui l'a déclenchée
+        task = asyncio.get_running_loop().create_task(run(), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -0,0 +1,164 @@
+"""Test de charge du contrôle d'admission et de la limite de débit (rate_limit.py).
+
+Un client agressif enchaîne les écritures (`/api/random-user`) et les
+opérations d'administration (`/api/load-sample-data`) pendant que des
+lecteurs chargent `/hosts`. Le « cluster » est simulé : `--capacity`
+opérations simultanées, les écritures et l'admin coûtant plus cher que les
+lectures, donc une file d'attente qui affame les lectures quand il est
+saturé. Le serveur est simulé comme un worker gthread (`--threads`) :
+
+    python benchmarks/admission_load.py --duration 5 --readers 8 --attackers 8
+
+Modes comparés :
+- none      : aucune protection (comportement historique)
+- protected : AdmissionController + RateLimiter, tels que branchés dans app.py
+
+Le rapport JSON donne, par mode, la latence des lectures (p50/p95/p99) et les
+écritures acceptées, limitées (429) et délestées (503). Sans `--redis-url`,
+la limite de débit utilise un Redis en mémoire (fakeredis).
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from rate_limit import (ADMIN, READ, WRITE, AdmissionController, LimitClass, RateLimiter,  # noqa: E402
+                        route_class)
+
+PATHS = {READ: '/hosts', WRITE: '/api/random-user', ADMIN: '/api/load-sample-data'}
+
+
+def make_redis(url):
+    if url:
+        import redis
+        return redis.Redis.from_url(url, decode_responses=True)
+    import fakeredis
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+
+class SimulatedCluster:
+    """Capacité fixe d'opérations simultanées, coût par type d'opération (s)"""
+
+    def __init__(self, capacity, costs):
+        self.slots = threading.Semaphore(capacity)
+        self.costs = costs
+
+    def execute(self, kind):
+        with self.slots:
+            time.sleep(self.costs[kind])
+
+
+class SimulatedServer:
+    """Worker gthread : `threads` requêtes servies à la fois, le reste attend"""
+
+    def __init__(self, cluster, threads, admission=None, limiter=None):
+        self.cluster = cluster
+        self.pool = ThreadPoolExecutor(threads)
+        self.admission = admission
+        self.limiter = limiter
+
+    def handle(self, path, client):
+        priority = route_class(path)
+        if self.admission is not None:
+            if self.admission.try_enter(priority) is not None:
+                return 503
+        try:
+            if self.limiter is not None and self.limiter.applies(priority):
+                if not self.limiter.check(priority, client).allowed:
+                    return 429
+            started = time.perf_counter()
+            self.cluster.execute(priority)
+            if self.admission is not None:
+                self.admission.observe(time.perf_counter() - started)
+            return 200
+        finally:
+            if self.admission is not None:
+                self.admission.leave()
+
+    def request(self, path, client):
+        return self.pool.submit(self.handle, path, client).result()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+
+def run_mode(mode, args):
+    cluster = SimulatedCluster(args.capacity, {READ: args.read_ms / 1000, WRITE: args.write_ms / 1000,
+                                               ADMIN: args.admin_ms / 1000})
+    admission = limiter = None
+    if mode == 'protected':
+        admission = AdmissionController(args.threads, args.latency_ms)
+        limiter = RateLimiter(make_redis(args.redis_url), {
+            WRITE: LimitClass(WRITE, args.write_limit, 1),
+            ADMIN: LimitClass(ADMIN, args.admin_limit, 1),
+        })
+    server = SimulatedServer(cluster, args.threads, admission, limiter)
+    deadline = time.monotonic() + args.duration
+    read_latencies = []
+    statuses = {WRITE: {}, ADMIN: {}}
+    lock = threading.Lock()
+
+    def reader(index):
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            server.request(PATHS[READ], f"reader-{index}")
+            with lock:
+                read_latencies.append(time.perf_counter() - started)
+
+    def attacker(index):
+        kind = ADMIN if index % 4 == 0 else WRITE
+        while time.monotonic() < deadline:
+            status = server.request(PATHS[kind], "10.0.0.66")
+            with lock:
+                statuses[kind][status] = statuses[kind].get(status, 0) + 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    threads += [threading.Thread(target=attacker, args=(i,)) for i in range(args.attackers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.pool.shutdown()
+    return {
+        "mode": mode,
+        "reads": len(read_latencies),
+        "read_ms": {"p50": percentile(read_latencies, 0.5), "p95": percentile(read_latencies, 0.95),
+                    "p99": percentile(read_latencies, 0.99)},
+        "writes": {kind: {str(status): count for status, count in sorted(counts.items())}
+                   for kind, counts in statuses.items()},
+        "admission": admission.stats() if admission else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=8, help="threads du worker simulé")
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--attackers', type=int, default=8, help="threads du client agressif")
+    parser.add_argument('--capacity', type=int, default=4, help="opérations simultanées du cluster")
+    parser.add_argument('--read-ms', type=float, default=2)
+    parser.add_argument('--write-ms', type=float, default=10)
+    parser.add_argument('--admin-ms', type=float, default=100)
+    parser.add_argument('--write-limit', type=int, default=50, help="écritures par seconde et par client")
+    parser.add_argument('--admin-limit', type=int, default=1, help="opérations admin par seconde et par client")
+    parser.add_argument('--latency-ms', type=float, default=50, help="seuil de latence du délestage")
+    parser.add_argument('--redis-url', default=None)
+    parser.add_argument('--modes', default='none,protected')
+    args = parser.parse_args()
+
+    results = [run_mode(mode, args) for mode in args.modes.split(',')]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Temps de démarrage à froid d'un pod selon l'état des backends.
+
+Lance l'app (mode sync ou async) en sous-process et mesure le temps jusqu'à la
+première réponse de `/healthz` (le pod sert des requêtes) puis de `/readyz`
+en 200 (MongoDB joignable), pour plusieurs scénarios de backends :
+- refused   : rien n'écoute (connexion refusée immédiatement) ;
+- blackhole : un serveur accepte les connexions mais ne répond jamais
+  (backend saturé ou réseau qui perd les paquets) ;
+- real      : `--mongodb-uri` / `--redis-host` fournis.
+
+Le temps jusqu'à `/healthz` doit rester le même quel que soit le scénario :
+seul `/readyz` dépend des backends.
+
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --scenarios real --mongodb-uri mongodb://127.0.0.1:27017
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+
+COMMANDS = {
+    "sync": [sys.executable, os.path.join(APP_DIR, "app.py")],
+    "async": [sys.executable, "-m", "uvicorn", "asgi:app", "--app-dir", APP_DIR,
+              "--host", "127.0.0.1", "--log-level", "warning"],
+}
+BLACKHOLE_HOST = "127.0.0.2"
+
+
+def blackhole(host, port):
+    """Accepte les connexions et ne répond jamais"""
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(128)
+    held = []
+
+    def run():
+        while True:
+            connection, _ = server.accept()
+            held.append(connection)
+
+    threading.Thread(target=run, daemon=True).start()
+    return server
+
+
+def backend_env(scenario, args):
+    if scenario == "refused":
+        return {"MONGODB_URI": "mongodb://127.0.0.1:1/?directConnection=true", "REDIS_HOST": "127.0.0.1"}
+    if scenario == "blackhole":
+        return {"MONGODB_URI": f"mongodb://{BLACKHOLE_HOST}:27017/?directConnection=true",
+                "REDIS_HOST": BLACKHOLE_HOST}
+    return {"MONGODB_URI": args.mongodb_uri, "REDIS_HOST": args.redis_host}
+
+
+def wait_for(client, path, status, started, timeout):
+    while time.monotonic() - started < timeout:
+        try:
+            if client.get(path).status_code == status:
+                return round((time.monotonic() - started) * 1000, 1)
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def cold_start(mode, scenario, port, args):
+    env = dict(os.environ, PORT=str(port), ENVIRONMENT="dev", **backend_env(scenario, args))
+    command = COMMANDS[mode] + (["--port", str(port)] if mode == "async" else [])
+    started = time.monotonic()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            live_ms = wait_for(client, "/healthz", 200, started, args.timeout)
+            ready_ms = wait_for(client, "/readyz", 200, started, args.ready_timeout)
+    finally:
+        process.terminate()
+        process.wait()
+    return live_ms, ready_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--scenarios", default="refused,blackhole")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--ready-timeout", type=float, default=3,
+                        help="attente max de /readyz en 200 (jamais atteint sans vrai MongoDB)")
+    parser.add_argument("--mongodb-uri", default="mongodb://127.0.0.1:27017/?directConnection=true")
+    parser.add_argument("--redis-host", default="127.0.0.1")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    if "blackhole" in scenarios:
+        blackhole(BLACKHOLE_HOST, 27017)
+        blackhole(BLACKHOLE_HOST, 6379)
+
+    report = []
+    for mode in args.modes.split(","):
+        for scenario in scenarios:
+            runs = [cold_start(mode, scenario, args.port, args) for _ in range(args.runs)]
+            live = [live_ms for live_ms, _ in runs if live_ms is not None]
+            ready = [ready_ms for _, ready_ms in runs if ready_ms is not None]
+            report.append({
+                "mode": mode,
+                "scenario": scenario,
+                "runs": args.runs,
+                "live_p50_ms": statistics.median(live) if live else None,
+                "live_max_ms": max(live) if live else None,
+                "ready_p50_ms": statistics.median(ready) if ready else None,
+            })
+            print(json.dumps(report[-1]), file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Mémoire et latence du tirage d'un utilisateur aléatoire (/api/random-order).
+
+Pour chaque taille de collection, compare :
+- full-scan : ancien code, `list(db.users.find({}))` + `random.choice`
+- sample    : agrégation `$sample` avec projection user_id/name
+- redis-set : `SRANDMEMBER` sur le set Redis + `find_one` ciblé (UserSampler)
+
+La mémoire est le pic d'allocation Python (tracemalloc) pendant les tirages :
+elle doit rester constante pour sample/redis-set quand la collection grossit.
+
+    python benchmarks/random_user_pick.py --sizes 10000,1000000,10000000
+    python benchmarks/random_user_pick.py --fake --sizes 10000,100000
+
+Sans `--fake`, MongoDB et Redis locaux sont utilisés (base `benchRandomUser`,
+recréée à chaque taille). full-scan est ignoré au-delà de `--max-full-scan`.
+`--fake` ne sert qu'à vérifier le script : mongomock exécute `$sample` et
+`find_one` en parcourant la collection dans le process, les chiffres de
+mémoire ne sont significatifs qu'avec un vrai mongod.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from user_sampler import USER_IDS_KEY, UserSampler, sample_pipeline  # noqa: E402
+
+SEED_BATCH = 10000
+
+
+def connect(args):
+    if args.fake:
+        import fakeredis
+        import mongomock
+        return mongomock.MongoClient()["benchRandomUser"], fakeredis.FakeRedis(decode_responses=True)
+    import redis
+    from pymongo import MongoClient
+    db = MongoClient(args.mongodb_uri)["benchRandomUser"]
+    return db, redis.Redis(host=args.redis_host, decode_responses=True)
+
+
+def seed(db, redis_client, size):
+    db.users.drop()
+    redis_client.delete(USER_IDS_KEY)
+    for start in range(0, size, SEED_BATCH):
+        batch = [
+            {"user_id": f"user_{i}", "name": f"User {i}", "email": f"user{i}@ecam.be",
+             "country": "Belgium", "order_count": 0, "total_spent": 0}
+            for i in range(start, min(size, start + SEED_BATCH))
+        ]
+        db.users.insert_many(batch, ordered=False)
+        redis_client.sadd(USER_IDS_KEY, *(user["user_id"] for user in batch))
+    db.users.create_index("user_id")
+
+
+def full_scan(db, sampler):
+    users = list(db.users.find({}))
+    return random.choice(users) if users else None
+
+
+def sample(db, sampler):
+    users = list(db.users.aggregate(sample_pipeline()))
+    return users[0] if users else None
+
+
+def redis_set(db, sampler):
+    return sampler.pick()
+
+
+STRATEGIES = {"full-scan": full_scan, "sample": sample, "redis-set": redis_set}
+
+
+def measure(strategy, db, sampler, picks):
+    latencies = []
+    tracemalloc.start()
+    for _ in range(picks):
+        started = time.perf_counter()
+        strategy(db, sampler)
+        latencies.append(time.perf_counter() - started)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "picks": picks,
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+        "peak_alloc_kb": round(peak / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,1000000,10000000")
+    parser.add_argument("--picks", type=int, default=50)
+    parser.add_argument("--max-full-scan", type=int, default=1000000)
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument("--fake", action="store_true", help="mongomock + fakeredis en mémoire")
+    parser.add_argument("--mongodb-uri", default="mongodb://127.0.0.1:27017/?directConnection=true")
+    parser.add_argument("--redis-host", default="127.0.0.1")
+    args = parser.parse_args()
+
+    db, redis_client = connect(args)
+    sampler = UserSampler(redis_client, db)
+    report = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        seed(db, redis_client, size)
+        for name in args.strategies.split(","):
+            if name == "full-scan" and size > args.max_full_scan:
+                continue
+            picks = min(args.picks, 3) if name == "full-scan" else args.picks
+            report.append({"users": size, "strategy": name,
+                           **measure(STRATEGIES[name], db, sampler, picks)})
+            print(json.dumps(report[-1]), file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
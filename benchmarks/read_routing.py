@@ -0,0 +1,168 @@
+"""Débit des lectures de tableau de bord : tout sur le primaire vs routées vers les secondaires.
+
+Lance `--concurrency` lecteurs qui enchaînent les requêtes de `/api/users`
+(100 derniers utilisateurs) et de `/api/stats?exact=1`, pendant qu'un
+écrivain insère des commandes en continu sur le primaire, puis compare les
+classes de route :
+- primary   : toutes les lectures au primaire (comportement d'avant) ;
+- secondary : `secondaryPreferred` + `maxStalenessSeconds`, pool dédié
+  (`read_routing.load_route_classes`, classe `dashboard`).
+
+    python benchmarks/read_routing.py --mongodb-uri "mongodb://mongo-0,mongo-1,mongo-2/?replicaSet=rs0"
+    python benchmarks/read_routing.py --fake --duration 3
+
+Sans `--fake`, l'URI doit désigner un replica set (ou un mongos) avec au moins
+un secondaire ; la base `benchReadRouting` est remplie au départ. `--fake`
+simule un primaire et `--secondaries` secondaires capables de servir
+`--node-slots` requêtes de `--service-ms` chacun à la fois (l'écrivain occupe
+un slot du primaire) : il ne sert qu'à vérifier le script, les chiffres ne
+décrivent que le modèle (avec 2 secondaires, ~3x le débit du primaire seul).
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from read_routing import ReadRouter, load_route_classes  # noqa: E402
+
+USERS = 5000
+
+
+class FakeNode:
+    """Nœud simulé : `slots` requêtes en parallèle, `service` secondes chacune"""
+
+    def __init__(self, slots, service):
+        self.slots = threading.Semaphore(slots)
+        self.service = service
+
+    def query(self):
+        with self.slots:
+            time.sleep(self.service)
+
+
+class FakeCluster:
+    def __init__(self, secondaries, slots, service):
+        self.primary = FakeNode(slots, service)
+        self.secondaries = [FakeNode(slots, service) for _ in range(secondaries)]
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def node(self, route):
+        if route == 'primary' or not self.secondaries:
+            return self.primary
+        with self._lock:
+            self._next = (self._next + 1) % (len(self.secondaries) + 1)
+            # secondaryPreferred via mongos : répartition sur les membres éligibles
+            return self.secondaries[self._next - 1] if self._next else self.primary
+
+
+def seed(db):
+    db.users.drop()
+    db.orders.drop()
+    db.users.insert_many([{"user_id": f"user_{i}", "name": f"User {i}", "country": "France",
+                           "order_count": 0, "total_spent": 0} for i in range(USERS)])
+
+
+def real_read(db):
+    list(db.users.find({}, {"_id": 0}).sort("_id", -1).limit(100))
+    db.users.count_documents({})
+
+
+def writer(db, stop):
+    while not stop.is_set():
+        db.orders.insert_many([{"user_id": f"user_{i}", "amount": 10.0} for i in range(100)])
+
+
+def fake_writer(cluster, stop):
+    while not stop.is_set():
+        cluster.primary.query()
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_readers(read, args):
+    deadline = time.perf_counter() + args.duration
+    latencies = []
+
+    def loop():
+        mine = []
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            read()
+            mine.append(time.perf_counter() - started)
+        return mine
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for mine in pool.map(lambda _: loop(), range(args.concurrency)):
+            latencies.extend(mine)
+    return sorted(latencies)
+
+
+def measure(route, read, start_writer, args):
+    stop = threading.Event()
+    background = threading.Thread(target=start_writer, args=(stop,), daemon=True)
+    background.start()
+    try:
+        latencies = run_readers(read, args)
+    finally:
+        stop.set()
+        background.join()
+    return {
+        "route": route,
+        "concurrency": args.concurrency,
+        "reads": len(latencies),
+        "reads_per_sec": round(len(latencies) / args.duration, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--routes", default="primary,secondary")
+    parser.add_argument("--fake", action="store_true", help="cluster simulé en mémoire")
+    parser.add_argument("--secondaries", type=int, default=2)
+    parser.add_argument("--node-slots", type=int, default=4)
+    parser.add_argument("--service-ms", type=float, default=5)
+    parser.add_argument("--mongodb-uri", default="mongodb://127.0.0.1:27017/?replicaSet=rs0")
+    args = parser.parse_args()
+
+    report = []
+    if args.fake:
+        cluster = FakeCluster(args.secondaries, args.node_slots, args.service_ms / 1000)
+        for route in args.routes.split(","):
+            report.append(measure(route, lambda: cluster.node(route).query(),
+                                  lambda stop: fake_writer(cluster, stop), args))
+            print(json.dumps(report[-1]), file=sys.stderr)
+    else:
+        from pymongo import MongoClient
+        classes = load_route_classes(primary_pool_size=args.concurrency + 2, env={})
+        classes['dashboard'].pool_size = args.concurrency
+        router = ReadRouter(classes, args.mongodb_uri,
+                            lambda uri, route_class: MongoClient(uri, maxPoolSize=route_class.pool_size),
+                            db_name="benchReadRouting")
+        primary_db = router.db('primary')
+        seed(primary_db)
+        databases = {"primary": primary_db, "secondary": router.db('dashboard')}
+        for route in args.routes.split(","):
+            report.append(measure(route, lambda: real_read(databases[route]),
+                                  lambda stop: writer(primary_db, stop), args))
+            print(json.dumps(report[-1]), file=sys.stderr)
+        for client in router.clients():
+            client.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
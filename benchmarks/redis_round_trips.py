@@ -0,0 +1,142 @@
+"""Allers-retours Redis des opérations pipelinées (redis_pool.py, cache.py, analytics.py).
+
+Chaque opération est jouée deux fois sur le même Redis :
+- sequential : une commande par aller-retour (comportement historique) ;
+- pipelined  : le code actuel de l'app (TwoTierCache.invalidate,
+  sondes de /cache/status, écriture des pays de Analytics.rebuild).
+
+`--rtt-ms` ajoute une latence réseau simulée à chaque aller-retour, pour voir
+ce que le pipelining fait gagner face à un Redis distant :
+
+    python benchmarks/redis_round_trips.py --iterations 200 --rtt-ms 0.5 --countries 40
+
+Le rapport JSON donne, par opération et par mode, le nombre d'allers-retours
+par appel et la latence moyenne. Sans `--redis-url`, Redis est simulé en
+mémoire (fakeredis).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from cache import TwoTierCache, meta_key  # noqa: E402
+
+
+class CountingPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        self.counter.hit()
+        return super().execute(raise_on_error)
+
+
+class CountingRedis(redis.Redis):
+    """Client qui compte (et ralentit de `rtt` secondes) chaque aller-retour"""
+
+    def __init__(self, counter, **kwargs):
+        super().__init__(**kwargs)
+        self.counter = counter
+
+    def execute_command(self, *args, **options):
+        self.counter.hit()
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = CountingPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.counter = self.counter
+        return pipe
+
+
+class Counter:
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.round_trips = 0
+
+    def hit(self):
+        self.round_trips += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+
+def make_pool(url):
+    if url:
+        return redis.ConnectionPool.from_url(url, decode_responses=True)
+    import fakeredis
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True).connection_pool
+
+
+def invalidate_sequential(client, cache, keys):
+    client.delete(*keys, *(meta_key(key) for key in keys))
+    for key in keys:
+        client.publish(cache.channel, key)
+
+
+def status_sequential(client):
+    return client.dbsize(), client.ttl('hosts_data')
+
+
+def status_pipelined(client):
+    pipe = client.pipeline(transaction=False)
+    pipe.dbsize()
+    pipe.ttl('hosts_data')
+    return pipe.execute()
+
+
+def countries_sequential(client, rows):
+    for country, users in rows:
+        for key in ('bench:users', 'bench:orders', 'bench:revenue'):
+            client.hset(key, country, users)
+
+
+def countries_pipelined(client, rows):
+    # Même forme que Analytics.rebuild
+    pipe = client.pipeline(transaction=False)
+    for country, users in rows:
+        for key in ('bench:users', 'bench:orders', 'bench:revenue'):
+            pipe.hset(key, country, users)
+    pipe.execute()
+
+
+def measure(counter, operation, iterations):
+    counter.round_trips = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        operation()
+    elapsed = time.perf_counter() - started
+    return {"round_trips": round(counter.round_trips / iterations, 2),
+            "mean_ms": round(elapsed / iterations * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--rtt-ms', type=float, default=0.5, help="latence simulée par aller-retour")
+    parser.add_argument('--keys', type=int, default=2, help="clés invalidées par appel")
+    parser.add_argument('--countries', type=int, default=40, help="pays écrits par reconstruction")
+    parser.add_argument('--redis-url', default=None)
+    args = parser.parse_args()
+
+    counter = Counter(args.rtt_ms / 1000)
+    client = CountingRedis(counter, connection_pool=make_pool(args.redis_url))
+    cache = TwoTierCache(client)
+    keys = [f"bench:key:{i}" for i in range(args.keys)]
+    rows = [(f"C{i:02d}", i) for i in range(args.countries)]
+    operations = {
+        "invalidate": (lambda: invalidate_sequential(client, cache, keys), lambda: cache.invalidate(*keys)),
+        "cache_status": (lambda: status_sequential(client), lambda: status_pipelined(client)),
+        "analytics_countries": (lambda: countries_sequential(client, rows), lambda: countries_pipelined(client, rows)),
+    }
+    report = {"rtt_ms": args.rtt_ms, "iterations": args.iterations, "operations": {}}
+    for name, (sequential, pipelined) in operations.items():
+        report["operations"][name] = {
+            "sequential": measure(counter, sequential, args.iterations),
+            "pipelined": measure(counter, pipelined, args.iterations),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
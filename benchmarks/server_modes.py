@@ -0,0 +1,125 @@
+"""Compare le débit (requêtes/s) du mode sync (Flask) et du mode async (ASGI).
+
+Les deux serveurs sont lancés en sous-process contre le même MongoDB et le
+même Redis locaux, puis chargés avec N requêtes concurrentes :
+
+    docker run -d -p 27017:27017 mongo:7.0
+    docker run -d -p 6379:6379 redis:7.2-alpine
+    python benchmarks/server_modes.py --concurrency 200 --duration 10
+
+Le résultat (JSON) donne req/s et latences p50/p99 par mode et par route.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+
+COMMANDS = {
+    "sync": [sys.executable, os.path.join(APP_DIR, "app.py")],
+    "async": [sys.executable, "-m", "uvicorn", "asgi:app", "--app-dir", APP_DIR,
+              "--host", "127.0.0.1", "--log-level", "warning"],
+}
+DEFAULT_ROUTES = "/hosts,/api/stats,/api/users"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def start_server(mode, port, args):
+    env = dict(os.environ, MONGODB_URI=args.mongodb_uri, REDIS_HOST=args.redis_host,
+               ENVIRONMENT=args.environment, PORT=str(port))
+    command = COMMANDS[mode] + (["--port", str(port)] if mode == "async" else [])
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get("/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{base_url} ne répond pas après {timeout}s")
+
+
+async def drive(base_url, route, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(route)
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "route": route,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    }
+
+
+async def bench_mode(mode, port, args):
+    process = start_server(mode, port, args)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_ready(base_url)
+        results = []
+        for route in args.routes.split(","):
+            results.append(await drive(base_url, route, args.concurrency, args.duration))
+        return {"mode": mode, "results": results}
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongodb-uri", default="mongodb://127.0.0.1:27017/?directConnection=true")
+    parser.add_argument("--redis-host", default="127.0.0.1")
+    parser.add_argument("--environment", default="test")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10, help="durée par route (s)")
+    parser.add_argument("--routes", default=DEFAULT_ROUTES)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    report = []
+    for offset, mode in enumerate(args.modes.split(",")):
+        report.append(await bench_mode(mode, 5100 + offset, args))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
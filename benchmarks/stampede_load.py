@@ -0,0 +1,126 @@
+"""Test de charge du cache hosts_data à l'expiration (cache stampede).
+
+Simule plusieurs replicas demo-app (chacun avec son cache L1) partageant un
+même Redis, et une rafale de requêtes concurrentes juste après chaque
+expiration. Compte le nombre de requêtes MongoDB (simulées) par expiration :
+
+    python benchmarks/stampede_load.py --replicas 3 --threads 20 --expiries 5
+
+Modes comparés :
+- naive         : comportement historique (get, puis find + setex sur miss)
+- single-flight : verrou Redis par clé, sans stale-while-revalidate
+- swr           : single-flight + stale-while-revalidate
+
+Sans `--redis-url`, un Redis en mémoire (fakeredis) est utilisé.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from cache import LocalCache, TwoTierCache  # noqa: E402
+
+KEY = 'hosts_data'
+
+
+def make_redis(url):
+    if url:
+        import redis
+        return redis.Redis.from_url(url, decode_responses=True)
+    import fakeredis
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+
+class FakeMongo:
+    """Remplace `db.hosts.find({})` : latence fixe + compteur de requêtes."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def load_hosts_payload(self):
+        with self._lock:
+            self.queries += 1
+        time.sleep(self.latency)
+        return json.dumps([{"pod": "demo-app", "info": "bench"}])
+
+
+def naive_request(cache, mongo, ttl):
+    value, _ = cache.get(KEY)
+    if value is None:
+        value = mongo.load_hosts_payload()
+        cache.set(KEY, value, ttl)
+    return value
+
+
+def run_mode(mode, args):
+    redis_client = make_redis(args.redis_url)
+    redis_client.delete(KEY, f"{KEY}:meta", f"{KEY}:lock")
+    stale_ttl = args.ttl * 10 if mode == 'swr' else 0
+    replicas = [
+        TwoTierCache(redis_client, LocalCache(ttl=args.ttl), stale_ttl=stale_ttl)
+        for _ in range(args.replicas)
+    ]
+    mongo = FakeMongo(args.mongo_latency)
+
+    def request(cache):
+        if mode == 'naive':
+            naive_request(cache, mongo, args.ttl)
+        else:
+            cache.get_or_compute(KEY, mongo.load_hosts_payload, args.ttl)
+
+    # Remplissage initial
+    request(replicas[0])
+
+    per_expiry = []
+    for _ in range(args.expiries):
+        time.sleep(args.ttl + 0.05)
+        before = mongo.queries
+        barrier = threading.Barrier(args.replicas * args.threads)
+
+        def worker(cache):
+            barrier.wait()
+            request(cache)
+
+        threads = [
+            threading.Thread(target=worker, args=(cache,))
+            for cache in replicas for _ in range(args.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Laisser finir un éventuel rafraîchissement en arrière-plan
+        time.sleep(args.mongo_latency * 2)
+        per_expiry.append(mongo.queries - before)
+
+    return {
+        "mode": mode,
+        "requests_per_expiry": args.replicas * args.threads,
+        "mongo_queries_per_expiry": per_expiry,
+        "mongo_queries_per_expiry_avg": sum(per_expiry) / len(per_expiry),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replicas', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=20, help="requêtes concurrentes par replica")
+    parser.add_argument('--expiries', type=int, default=5)
+    parser.add_argument('--ttl', type=float, default=0.3, help="TTL du cache (s)")
+    parser.add_argument('--mongo-latency', type=float, default=0.1, help="latence simulée de find (s)")
+    parser.add_argument('--redis-url', default=None)
+    parser.add_argument('--modes', default='naive,single-flight,swr')
+    args = parser.parse_args()
+
+    results = [run_mode(mode, args) for mode in args.modes.split(',')]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
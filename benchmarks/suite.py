@@ -0,0 +1,420 @@
+"""Suite de charge : toutes les routes, à plusieurs tailles de données, contre des backends locaux.
+
+Pour chaque taille (`--sizes`, utilisateurs ; commandes = taille x
+`--orders-per-user`), la base est remplie puis chaque scénario (une route
+et une méthode) est chargé pendant `--duration` secondes par
+`--concurrency` threads. Le rapport JSON donne, par taille et par route :
+requêtes, erreurs (5xx ou exception), req/s, p50/p95/p99/max et RSS max du
+process qui sert l'app.
+
+Backends :
+- `fake` : l'app Flask dans ce process (client de test), branchée sur
+  mongomock + fakeredis. Aucun serveur nécessaire, reproductible, mais limité
+  par le GIL et par la vitesse de mongomock : à comparer avec lui-même
+  (régressions), pas avec la production. Le `bulk_write` de mongomock étant
+  incompatible avec pymongo 4.x, il est rejoué opération par opération.
+- `local` : `mongod` et `redis-server` lancés dans un dossier temporaire
+  (s'ils sont dans le PATH, sinon `--mongodb-uri`/`--redis-host` existants,
+  dont la base `demoDB` est écrasée), l'app en sous-process (`--mode
+  sync|async`, voir server_modes.py) et des requêtes HTTP réelles.
+
+    python benchmarks/suite.py --sizes 1000,100000 --duration 5 --output bench.json
+    python benchmarks/suite.py --save-baseline benchmarks/baselines/fake-sync.json
+    python benchmarks/suite.py --baseline benchmarks/baselines/fake-sync.json --tolerance 0.3
+
+Avec `--baseline`, chaque route est comparée au rapport de référence (même
+taille) : p95 plus lent, débit plus faible ou RSS plus haut que la
+tolérance, ou nouvelles erreurs, sont listés dans `regressions` et le script sort avec le code 1.
+
+Avec `--explain`, chaque taille ajoute le plan des requêtes de l'app
+(`indexes.QUERIES`) ; les COLLSCAN, tris en mémoire et scatter-gather non
+attendus sont listés dans `plan_warnings` (code de sortie 1). mongomock ne
+gérant pas `explain`, ce contrôle n'a de sens qu'avec `--backend local`.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # server_modes
+
+from indexes import IndexManager, explain_catalog  # noqa: E402
+import sample_data  # noqa: E402
+
+SEED_BATCH = 10000
+BULK_ORDERS = 100
+
+# (nom, méthode, chemin) ; le corps des POST est construit par `request_body`
+SCENARIOS = [
+    ("home", "GET", "/"),
+    ("user_dashboard", "GET", "/user-dashboard"),
+    ("page_info", "GET", "/api/page-info"),
+    ("hosts", "GET", "/hosts"),
+    ("stats_counter", "GET", "/api/stats"),
+    ("stats_estimated", "GET", "/api/stats?mode=estimated"),
+    ("stats_exact", "GET", "/api/stats?exact=1"),
+    ("users_default", "GET", "/api/users"),
+    ("users_page", "GET", "/api/users?limit=50"),
+    ("users_export", "GET", "/api/users?format=ndjson&limit=1000"),
+    ("analytics_countries", "GET", "/api/analytics/countries"),
+    ("analytics_top_spenders", "GET", "/api/analytics/top-spenders?limit=10"),
+    ("orders_stream", "GET", "/api/orders/stream"),
+    ("migrations", "GET", "/api/migrations"),
+    ("cache_status", "GET", "/cache/status"),
+    ("sharding_info", "GET", "/sharding-info"),
+    ("healthz", "GET", "/healthz"),
+    ("readyz", "GET", "/readyz"),
+    ("metrics", "GET", "/metrics"),
+    ("random_user", "POST", "/api/random-user"),
+    ("random_order", "POST", "/api/random-order"),
+    ("orders_bulk", "POST", "/api/orders/bulk"),
+]
+
+
+def request_body(name, users):
+    if name == "orders_bulk":
+        return [{"order_id": f"bench_{random.getrandbits(64):x}", "user_id": f"user_{random.randrange(users)}",
+                 "amount": 10.0} for _ in range(BULK_ORDERS)]
+    return None
+
+
+def generate_users(start, stop):
+    for i in range(start, stop):
+        yield {"user_id": f"user_{i}", "name": f"{sample_data.FIRST_NAMES[i % 8]} {sample_data.LAST_NAMES[i % 7]}",
+               "email": f"user_{i}@ecam.be", "country": sample_data.COUNTRIES[i % 6],
+               "order_count": 0, "total_spent": 0}
+
+
+def seed(db, redis_client, users, orders):
+    """Remplit users/orders par lots, avec les totaux par utilisateur cohérents"""
+    db.users.drop()
+    db.orders.drop()
+    redis_client.flushdb()
+    spent = {}
+    for start in range(0, orders, SEED_BATCH):
+        batch = []
+        for i in range(start, min(orders, start + SEED_BATCH)):
+            user = i % users
+            amount = float(10 + i % 190)
+            spent[user] = spent.get(user, 0) + amount
+            batch.append({"order_id": f"order_{i}", "user_id": f"user_{user}", "amount": amount})
+        db.orders.insert_many(batch)
+    for start in range(0, users, SEED_BATCH):
+        batch = list(generate_users(start, min(users, start + SEED_BATCH)))
+        for user in batch:
+            index = int(user["user_id"][5:])
+            if index in spent:
+                user["order_count"] = orders // users + (1 if index < orders % users else 0)
+                user["total_spent"] = spent[index]
+        db.users.insert_many(batch)
+    # Mêmes index que l'app (indexes.py), clés de sharding comprises
+    IndexManager(db).ensure()
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def drive(send, scenario, users, concurrency, duration):
+    """Charge un scénario ; `send(method, path, body)` renvoie le code HTTP"""
+    name, method, path = scenario
+    deadline = time.perf_counter() + duration
+
+    def loop():
+        latencies, errors = [], 0
+        while time.perf_counter() < deadline:
+            body = request_body(name, users)
+            started = time.perf_counter()
+            try:
+                status = send(method, path, body)
+                errors += status >= 500
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda _: loop(), range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for mine, _ in results for latency in mine)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "route": name,
+        "method": method,
+        "path": path,
+        "requests": len(latencies),
+        "errors": sum(errors for _, errors in results),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+class FakeBackend:
+    """App Flask dans ce process, sur mongomock + fakeredis"""
+
+    name = "fake"
+
+    def __init__(self, args):
+        # Échec immédiat des vrais clients créés à l'import de app.py
+        os.environ.setdefault("MONGODB_URI", "mongodb://127.0.0.1:9/?directConnection=true")
+        os.environ.setdefault("REDIS_HOST", "127.0.0.1")
+        os.environ.setdefault("MONGO_PRIMARY_SERVER_SELECTION_TIMEOUT_MS", "200")
+        import fakeredis
+        import mongomock
+        from mongomock.collection import Collection
+
+        def bulk_write(collection, requests, ordered=True, **kwargs):
+            for request in requests:
+                collection.update_one(request._filter, request._doc, upsert=request._upsert)
+        Collection.bulk_write = bulk_write
+
+        # app.py affiche sa configuration : le JSON doit rester seul sur stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            import app as app_module
+        from read_routing import ReadRouter
+
+        client = mongomock.MongoClient()
+        db = client["demoDB"]
+        redis_client = fakeredis.FakeRedis(decode_responses=True)
+        app_module.client, app_module.db, app_module.redis_client = client, db, redis_client
+        app_module.read_router = ReadRouter(app_module.MONGO_ROUTE_CLASSES, "mongomock",
+                                           lambda uri, route_class: client, clients={'primary': client})
+        for component in (app_module.stats_counters, app_module.user_sampler, app_module.analytics,
+                          app_module.migration_runner, app_module.order_ingestor, app_module.index_manager):
+            component.db = db
+        app_module.migration_runner.checkpoints = db.migrations
+        app_module.shard_diagnostics.client = client
+        app_module.order_stream.redis = redis_client
+        self.module = app_module
+        self.db, self.redis = db, redis_client
+        self._local = threading.local()
+
+    def start(self):
+        # Les moniteurs sondent maintenant les clients en mémoire
+        self.module.mongodb_monitor.check()
+        self.module.redis_monitor.check()
+
+    def prepare(self):
+        """Caches et agrégats construits avant la mesure (comme en régime établi)"""
+        self.module.hosts_cache.l1.clear()
+        self.module.stats_counters.reconcile()
+        self.module.user_sampler.rebuild()
+        self.module.analytics.rebuild()
+
+    def send(self, method, path, body):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.module.app.test_client()
+        return client.open(path, method=method, json=body).status_code
+
+    def peak_rss_kb(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def stop(self):
+        self.module.mongodb_monitor.stop()
+        self.module.redis_monitor.stop()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalBackend:
+    """mongod/redis-server locaux et l'app en sous-process, requêtes HTTP"""
+
+    name = "local"
+
+    def __init__(self, args):
+        import httpx
+        import redis
+        from pymongo import MongoClient
+        self.args = args
+        self.processes = []
+        self.tmpdir = tempfile.mkdtemp(prefix="bench-suite-")
+        if args.mongodb_uri is None:
+            if shutil.which("mongod") is None:
+                raise SystemExit("mongod introuvable : installer MongoDB ou passer --mongodb-uri")
+            port = free_port()
+            self.processes.append(subprocess.Popen(
+                ["mongod", "--dbpath", self.tmpdir, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+                stdout=subprocess.DEVNULL))
+            args.mongodb_uri = f"mongodb://127.0.0.1:{port}/?directConnection=true"
+        if args.redis_host is None:
+            # L'app se connecte toujours au port 6379
+            if shutil.which("redis-server") is None:
+                raise SystemExit("redis-server introuvable : installer Redis ou passer --redis-host")
+            self.processes.append(subprocess.Popen(
+                ["redis-server", "--port", "6379", "--bind", "127.0.0.1", "--save", "", "--appendonly", "no"],
+                stdout=subprocess.DEVNULL))
+            args.redis_host = "127.0.0.1"
+        args.environment = "test"
+        self.db = MongoClient(args.mongodb_uri)["demoDB"]
+        self.redis = redis.Redis(host=args.redis_host, decode_responses=True)
+        self.base_url = f"http://127.0.0.1:{args.port}"
+        self.httpx = httpx
+        self.server = None
+        self._local = threading.local()
+
+    def start(self):
+        import asyncio
+        from server_modes import start_server, wait_ready
+        self.server = start_server(self.args.mode, self.args.port, self.args)
+        asyncio.run(wait_ready(self.base_url, timeout=60))
+
+    def prepare(self):
+        client = self.httpx.Client(base_url=self.base_url, timeout=600)
+        client.post("/api/analytics/rebuild")
+        deadline = time.monotonic() + 600
+        while client.get("/api/analytics/countries").status_code == 503 and time.monotonic() < deadline:
+            time.sleep(0.5)
+        client.get("/api/stats")
+        client.close()
+
+    def send(self, method, path, body):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.httpx.Client(base_url=self.base_url, timeout=30)
+        return client.request(method, path, json=body).status_code
+
+    def peak_rss_kb(self):
+        """VmHWM du serveur (Linux), ou None"""
+        try:
+            with open(f"/proc/{self.server.pid}/status") as f:
+                return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        except (OSError, StopIteration, AttributeError):
+            return None
+
+    def stop(self):
+        for process in ([self.server] if self.server else []) + self.processes:
+            process.terminate()
+            process.wait(timeout=30)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+BACKENDS = {"fake": FakeBackend, "local": LocalBackend}
+
+
+def compare(report, baseline, tolerance, min_delta_ms=1.0):
+    """Routes plus lentes (p95), moins rapides (req/s) ou en erreur par rapport à la référence
+
+    Un écart de p95 sous `min_delta_ms` est du bruit, même relativement grand
+    (routes sous la milliseconde comme /healthz).
+    """
+    reference = {(run["users"], row["route"]): row for run in baseline["runs"] for row in run["results"]}
+    regressions = []
+    for run in report["runs"]:
+        for row in run["results"]:
+            before = reference.get((run["users"], row["route"]))
+            if before is None:
+                continue
+            problems = []
+            if before["p95_ms"] and row["p95_ms"] and row["p95_ms"] > before["p95_ms"] * (1 + tolerance) and \
+                    row["p95_ms"] - before["p95_ms"] >= min_delta_ms:
+                problems.append(f"p95 {before['p95_ms']} -> {row['p95_ms']} ms")
+            if before["rps"] and row["rps"] < before["rps"] * (1 - tolerance):
+                problems.append(f"req/s {before['rps']} -> {row['rps']}")
+            if before.get("peak_rss_kb") and row["peak_rss_kb"] and \
+                    row["peak_rss_kb"] > before["peak_rss_kb"] * (1 + tolerance):
+                problems.append(f"RSS {before['peak_rss_kb']} -> {row['peak_rss_kb']} Ko")
+            if row["errors"] > before["errors"]:
+                problems.append(f"erreurs {before['errors']} -> {row['errors']}")
+            if problems:
+                regressions.append({"users": run["users"], "route": row["route"], "problems": problems})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="fake")
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync", help="backend local seulement")
+    parser.add_argument("--sizes", default="1000", help="nombres d'utilisateurs, ex. 1000,100000,1000000")
+    parser.add_argument("--orders-per-user", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=3, help="durée par route (s)")
+    parser.add_argument("--routes", default=None, help="noms de scénarios séparés par des virgules (défaut : tous)")
+    parser.add_argument("--mongodb-uri", default=None)
+    parser.add_argument("--redis-host", default=None)
+    parser.add_argument("--port", type=int, default=5200)
+    parser.add_argument("--output", help="écrit aussi le rapport dans ce fichier")
+    parser.add_argument("--baseline", help="rapport de référence à comparer")
+    parser.add_argument("--save-baseline", help="enregistre le rapport comme référence")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="écart de p95 ignoré en dessous (ms)")
+    parser.add_argument("--explain", action="store_true",
+                        help="ajoute le plan des requêtes de l'app ; COLLSCAN/scatter-gather inattendus = échec")
+    args = parser.parse_args()
+
+    wanted = set(args.routes.split(",")) if args.routes else None
+    scenarios = [scenario for scenario in SCENARIOS if wanted is None or scenario[0] in wanted]
+    backend = BACKENDS[args.backend](args)
+    report = {
+        "backend": backend.name,
+        "mode": "sync" if backend.name == "fake" else args.mode,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "python": platform.python_version(),
+        "runs": [],
+    }
+    try:
+        backend.start()
+        for size in (int(size) for size in args.sizes.split(",")):
+            orders = int(size * args.orders_per_user)
+            started = time.perf_counter()
+            seed(backend.db, backend.redis, size, orders)
+            seed_s = round(time.perf_counter() - started, 2)
+            backend.prepare()
+            results = []
+            for scenario in scenarios:
+                row = drive(backend.send, scenario, size, args.concurrency, args.duration)
+                row["peak_rss_kb"] = backend.peak_rss_kb()
+                results.append(row)
+                print(json.dumps({"users": size, **row}), file=sys.stderr)
+            run = {"users": size, "orders": orders, "seed_s": seed_s, "results": results}
+            if args.explain:
+                run["plans"] = explain_catalog(backend.db)
+            report["runs"].append(run)
+    finally:
+        backend.stop()
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+        status = 1 if report["regressions"] else 0
+    if args.explain:
+        report["plan_warnings"] = [{"users": run["users"], "query": plan["query"], "unexpected": plan["unexpected"]}
+                                   for run in report["runs"] for plan in run["plans"] if plan.get("unexpected")]
+        status = 1 if report["plan_warnings"] else status
+    output = json.dumps(report, indent=2)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                f.write(output + "\n")
+    print(output)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -130,6 +130,8 @@ try {
 try {
     db.orders.createIndex({ order_id: 'hashed' });
     sh.shardCollection('demoDB.orders', { order_id: 'hashed' });
+    // Unicité d'order_id : idempotence du worker write-behind (order_stream.py)
+    db.orders.createIndex({ order_id: 1 }, { unique: true });
     print('✅ Orders shardé sur order_id');
 } catch(e) { 
     print('❌ Orders: ' + e.message); 
@@ -1,9 +1,28 @@
-#!/bin/sh
-# Démarrer Flask en arrière-plan
-python /app/app.py &
+#!/bin/bash
+# Démarrer l'application en arrière-plan
+# SERVER_MODE=sync (défaut) : gunicorn préfork, workers gthread (Flask)
+# SERVER_MODE=async         : gunicorn préfork, workers uvicorn (ASGI)
+# SERVER_MODE=dev           : serveur de développement Flask (un seul process)
+if [ "$SERVER_MODE" = "dev" ]; then
+    python /app/app.py &
+else
+    gunicorn --config /app/gunicorn_conf.py --chdir /app &
+fi
+APP_PID=$!
 
 # Remplace {{HOSTNAME}} par le hostname du pod
 sed -i "s/{{HOSTNAME}}/$HOSTNAME/g" /usr/share/nginx/html/index.html
 
 # Démarrer Nginx
-nginx -g "daemon off;"
+nginx -g "daemon off;" &
+NGINX_PID=$!
+
+# Arrêt propre : Kubernetes envoie SIGTERM, gunicorn termine les requêtes en cours
+trap 'kill -TERM $APP_PID $NGINX_PID 2>/dev/null; wait $APP_PID' TERM INT
+
+# Si l'app ou nginx s'arrête, le conteneur s'arrête (Kubernetes le redémarre)
+wait -n $APP_PID $NGINX_PID
+EXIT_CODE=$?
+kill -TERM $APP_PID $NGINX_PID 2>/dev/null
+wait $APP_PID
+exit $EXIT_CODE
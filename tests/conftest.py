@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Les modules de app/ s'importent entre eux à plat (comme dans le conteneur,
+# où ils sont copiés dans /app) : on ajoute donc app/ au path de test.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
@@ -0,0 +1,50 @@
+import fakeredis
+import mongomock
+
+from analytics import REBUILD_LOCK_KEY, Analytics
+import sample_data
+
+
+def setup():
+    db = mongomock.MongoClient()["demoDB"]
+    db.users.insert_many(sample_data.sample_users())
+    return Analytics(fakeredis.FakeRedis(decode_responses=True), db), db
+
+
+def test_rebuild_groups_users_by_country_and_ranks_spenders():
+    analytics, _ = setup()
+    analytics.rebuild()
+
+    france = next(row for row in analytics.countries() if row["country"] == "France")
+    assert france == {"country": "France", "users": 1, "orders": 3, "revenue": 150.5}
+    top = analytics.top_spenders(2)
+    assert [(row["rank"], row["name"], row["total_spent"]) for row in top] == [
+        (1, "Charlie Wilson", 320.75), (2, "Alice Dupont", 150.5)
+    ]
+
+
+def test_incremental_updates_match_a_full_rebuild():
+    analytics, db = setup()
+    analytics.rebuild()
+    new_user = {"user_id": "user_6", "name": "Nabil Petit", "country": "Belgium", "order_count": 0, "total_spent": 0}
+    db.users.insert_one(dict(new_user))
+    analytics.record_users([new_user])
+    orders = [{"user_id": "user_6", "amount": 500.0}, {"user_id": "user_2", "amount": 4.5}]
+    for order in orders:
+        db.users.update_one({"user_id": order["user_id"]}, {"$inc": {"order_count": 1, "total_spent": order["amount"]}})
+    analytics.record_orders(orders)
+
+    incremental = (analytics.countries(), analytics.top_spenders(3))
+    analytics.rebuild()
+    assert (analytics.countries(), analytics.top_spenders(3)) == incremental
+    assert incremental[1][0]["name"] == "Nabil Petit"
+
+
+def test_reads_before_first_build_trigger_a_rebuild():
+    analytics, _ = setup()
+    analytics.start_rebuild = lambda: analytics.redis.set(REBUILD_LOCK_KEY, '1')
+
+    assert analytics.countries() is None
+    assert analytics.redis.exists(REBUILD_LOCK_KEY)
+    analytics.reset()
+    assert analytics.countries() == []
@@ -11,3 +11,51 @@ def test_homepage(client):
     """Vérifie que la page d'accueil répond correctement"""
     response = client.get('/')
     assert response.status_code == 200
+
+def test_homepage_conditional_request(client):
+    """Une requête conditionnelle avec le bon ETag reçoit un 304 sans corps"""
+    etag = client.get('/').headers['ETag']
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_slow_calls_without_deadline_never_open_breaker(monkeypatch):
+    """Les traitements longs (imports, migrations) ne comptent pas comme appels lents"""
+    import itertools
+    import sys
+    from breaker import CLOSED, CircuitBreaker
+    app_module = sys.modules['app.app']
+    breaker = CircuitBreaker('mongodb', slow_call_seconds=1)
+    monkeypatch.setattr(app_module, 'mongo_breaker', breaker)
+    ticks = itertools.count(step=5.0)
+    monkeypatch.setattr(app_module.time, 'perf_counter', lambda: next(ticks))
+
+    @app_module.mongo_route(deadline_ms=None)
+    def bulk_import():
+        return "ok"
+
+    with app.test_request_context():
+        for _ in range(20):
+            assert bulk_import().status_code == 200
+    assert breaker.state == CLOSED
+
+def test_stats_fall_back_to_estimates_when_redis_fails(client, monkeypatch):
+    """Panne Redis (ou circuit ouvert) : comptes estimés plutôt qu'une 500"""
+    import sys
+    import redis
+    app_module = sys.modules['app.app']
+
+    def broken_read():
+        raise redis.ConnectionError("circuit ouvert")
+    monkeypatch.setattr(app_module.stats_counters, 'read', broken_read)
+    monkeypatch.setattr(app_module.stats_counters, 'estimated', lambda db=None: {"users": 3, "orders": 5})
+
+    response = client.get('/api/stats')
+
+    assert response.status_code == 200
+    assert response.get_json() == {"total_users": 3, "total_orders": 5, "source": "estimated"}
+
+def test_bulk_orders_rejects_invalid_batch_size(client):
+    response = client.post('/api/orders/bulk?batch_size=abc', json=[])
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "batch_size must be an integer"}
@@ -0,0 +1,11 @@
+from starlette.testclient import TestClient
+
+from asgi import app
+
+
+def test_homepage():
+    """Le mode async sert la même page d'accueil que le mode Flask"""
+    with TestClient(app) as client:
+        response = client.get('/')
+        assert response.status_code == 200
+        assert 'Pod Hostname' in response.text
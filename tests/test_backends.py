@@ -0,0 +1,47 @@
+import time
+
+from backends import BackendMonitor, backoff_delay, health_report
+
+
+def test_backoff_grows_and_is_capped():
+    assert backoff_delay(1, initial=1, maximum=30) < backoff_delay(4, initial=1, maximum=30)
+    assert backoff_delay(50, initial=1, maximum=30) <= 36
+
+
+def test_monitor_reconnects_and_notifies_changes():
+    up = {"value": False}
+    changes = []
+
+    def probe():
+        if not up["value"]:
+            raise ConnectionError("down")
+        return "ok"
+
+    monitor = BackendMonitor('redis', probe, changes.append, check_interval=5, initial_backoff=0.5)
+    first, second = monitor.check(), monitor.check()
+    assert second > first and monitor.last_error == "down"
+    up["value"] = True
+    assert monitor.check() == 5
+    up["value"] = False
+    monitor.check()
+    up["value"] = True
+    monitor.check()
+    assert changes == [False, True, False, True]
+    assert monitor.reconnects == 1 and monitor.stats()["ready_after_ms"] is not None
+
+
+def test_monitor_thread_does_not_block_start():
+    started = time.perf_counter()
+    monitor = BackendMonitor('mongodb', lambda: time.sleep(1), check_interval=0.01)
+    monitor.start()
+    assert time.perf_counter() - started < 0.5 and monitor.alive()
+    monitor.stop()
+
+
+def test_readiness_requires_mongodb_only():
+    mongodb = BackendMonitor('mongodb', lambda: "Sharding")
+    redis_ = BackendMonitor('redis', lambda: None)
+    mongodb.check()
+    redis_._update(False, error="refused")
+    ready, report = health_report([mongodb, redis_])
+    assert ready and report["redis"]["available"] is False
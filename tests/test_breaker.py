@@ -0,0 +1,40 @@
+import pytest
+
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+def failing():
+    raise ConnectionError("down")
+
+
+def test_opens_on_failure_rate_then_fails_fast():
+    breaker = CircuitBreaker('mongodb', window=10, min_calls=4, failure_rate=0.5, open_seconds=60)
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            breaker.call(failing)
+    assert breaker.state == OPEN
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(calls.append, 1)
+    assert calls == [] and breaker.stats()["rejected"] == 1
+
+
+def test_slow_calls_open_the_circuit():
+    breaker = CircuitBreaker('redis', min_calls=3, slow_call_seconds=0.1, slow_call_rate=0.6)
+    for _ in range(3):
+        breaker.record(True, 0.5)
+    assert breaker.state == OPEN
+
+
+def test_half_open_trials_close_or_reopen():
+    breaker = CircuitBreaker('mongodb', min_calls=1, open_seconds=0, half_open_calls=2)
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+
+    assert breaker.allow() and breaker.allow() and not breaker.allow()
+    breaker.record(True, 0.01)
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import fakeredis
+import pytest
+
+from cache import LocalCache, TwoTierCache
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(maxsize=2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_local_cache_expires_entries():
+    cache = LocalCache(ttl=0.01)
+    cache.set("a", "1")
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_two_tier_reports_l1_l2_and_miss(redis_client):
+    cache = TwoTierCache(redis_client, LocalCache(ttl=60))
+    assert cache.get("hosts_data") == (None, None)
+
+    cache.set("hosts_data", "[]", 300)
+    assert cache.get("hosts_data") == ("[]", "L1")
+
+    cache.l1.clear()
+    assert cache.get("hosts_data") == ("[]", "L2")
+    assert cache.get("hosts_data") == ("[]", "L1")
+
+
+def test_invalidation_reaches_other_replicas(redis_client):
+    replica_a = TwoTierCache(redis_client, LocalCache(ttl=60))
+    replica_b = TwoTierCache(redis_client, LocalCache(ttl=60))
+    replica_b.start_listener()
+    try:
+        replica_a.set("hosts_data", "[]", 300)
+        assert replica_b.get("hosts_data") == ("[]", "L2")
+
+        replica_a.invalidate("hosts_data")
+        deadline = time.time() + 3
+        while replica_b.l1.get("hosts_data") is not None and time.time() < deadline:
+            time.sleep(0.05)
+        assert replica_b.get("hosts_data") == (None, None)
+    finally:
+        replica_b.stop_listener()
+
+
+def _slow_loader(calls, value="[]", delay=0.2):
+    def loader():
+        calls.append(1)
+        time.sleep(delay)
+        return value
+    return loader
+
+
+def test_get_or_compute_is_single_flight_across_replicas(redis_client):
+    replicas = [TwoTierCache(redis_client, LocalCache(ttl=60)) for _ in range(3)]
+    calls = []
+    loader = _slow_loader(calls)
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda c=cache: results.append(c.get_or_compute("hosts_data", loader, 300)))
+        for cache in replicas for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 30
+    assert all(value == "[]" for value, _ in results)
+
+
+def test_stale_value_is_served_while_refreshing(redis_client):
+    cache = TwoTierCache(redis_client, LocalCache(ttl=60), stale_ttl=30)
+    cache.set("hosts_data", "old", ttl=0.01)
+    time.sleep(0.02)
+
+    calls = []
+    value, tier = cache.get_or_compute("hosts_data", _slow_loader(calls, "new", delay=0.05), 300)
+    assert (value, tier) == ("old", "STALE")
+
+    deadline = time.time() + 3
+    while cache.get("hosts_data")[0] != "new" and time.time() < deadline:
+        time.sleep(0.02)
+    assert cache.get("hosts_data")[0] == "new"
+    assert len(calls) == 1
+
+
+def test_stale_entry_is_refreshed_once_across_replicas(redis_client):
+    replicas = [TwoTierCache(redis_client, LocalCache(ttl=60), stale_ttl=30) for _ in range(2)]
+    replicas[0].set("hosts_data", "old", ttl=0.01)
+    assert replicas[1].get("hosts_data") == ("old", "L2")
+    time.sleep(0.02)
+
+    calls = []
+    loader = _slow_loader(calls, "new", delay=0.01)
+    for replica in replicas:
+        # Chaque replica sert l'entrée périmée de son L1, après la fin du rafraîchissement précédent
+        assert replica.get_or_compute("hosts_data", loader, 300) == ("old", "STALE")
+        deadline = time.time() + 3
+        while replica.l1.get("hosts_data").value != "new" and time.time() < deadline:
+            time.sleep(0.02)
+
+    assert replicas[1].get("hosts_data") == ("new", "L1")
+    assert len(calls) == 1
+
+
+def test_last_good_value_outlives_invalidation(redis_client):
+    writer = TwoTierCache(redis_client, LocalCache(), last_good_ttl=3600)
+    writer.get_or_compute('hosts_data', lambda: '["v1"]', ttl=1)
+    writer.invalidate('hosts_data')
+
+    other_replica = TwoTierCache(redis_client, LocalCache(), last_good_ttl=3600)
+    assert other_replica.get('hosts_data') == (None, None)
+    assert other_replica.last_good('hosts_data') == '["v1"]'
+
+
+def test_binary_cache_returns_compressed_bytes_on_decoding_client(redis_client):
+    cache = TwoTierCache(redis_client, LocalCache(ttl=60), binary=True, last_good_ttl=60)
+    payload = b"gzip:\x1f\x8b\x08\x00\xff"
+    cache.set("hosts_data", payload, 300)
+
+    cache.l1.clear()
+    cache._last_good.clear()
+    assert cache.get("hosts_data") == (payload, "L2")
+    assert cache.last_good("hosts_data") == payload
@@ -0,0 +1,73 @@
+import json
+
+from bson import Timestamp
+import fakeredis
+import mongomock
+
+from change_stream import EVENTS_CHANNEL, ChangeWatcher, summarize
+from events import RESYNC_MESSAGE, EventHub
+from user_sampler import USER_IDS_KEY
+
+
+def change(coll, op, token, **fields):
+    return {"_id": {"_data": token}, "ns": {"db": "demoDB", "coll": coll}, "operationType": op,
+            "clusterTime": Timestamp(1700000000, 1), **fields}
+
+
+def test_summary_counts_operations_and_keeps_public_fields():
+    summary = summarize([
+        change("users", "insert", "01", documentKey={"user_id": "user_1", "_id": 1},
+               fullDocument={"user_id": "user_1", "name": "Alice", "password": "x"}),
+        change("users", "update", "02", documentKey={"user_id": "user_1", "_id": 1},
+               updateDescription={"updatedFields": {"order_count": 2, "stats_pending": True}}),
+        change("orders", "delete", "03", documentKey={"order_id": "order_9", "_id": 2}),
+    ])
+
+    users = summary["collections"]["users"]
+    assert users["insert"] == 1 and users["update"] == 1
+    assert users["recent"][0] == {"op": "insert", "id": "user_1", "fields": {"user_id": "user_1", "name": "Alice"}}
+    assert users["recent"][1]["fields"] == {"order_count": 2}
+    assert summary["collections"]["orders"]["recent"] == [{"op": "delete", "id": "order_9"}]
+
+
+def test_watcher_invalidates_hosts_updates_sampler_and_saves_token():
+    db = mongomock.MongoClient()["demoDB"]
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    redis_client.set("hosts_data", "cached")
+    redis_client.sadd(USER_IDS_KEY, "user_old")
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(EVENTS_CHANNEL)
+    watcher = ChangeWatcher(db, redis_client)
+
+    handled = watcher.handle([
+        change("hosts", "update", "01", documentKey={"_id": "pod-1"}),
+        change("users", "insert", "02", documentKey={"user_id": "user_new", "_id": 1},
+               fullDocument={"user_id": "user_new", "name": "Bob"}),
+        change("users", "delete", "03", documentKey={"user_id": "user_old", "_id": 2}),
+    ])
+
+    assert handled == 3
+    assert redis_client.get("hosts_data") is None
+    assert redis_client.smembers(USER_IDS_KEY) == {"user_new"}
+    assert watcher.load_token() == {"_data": "03"}
+    messages = [pubsub.get_message(timeout=0.1) for _ in range(3)]
+    message = json.loads(next(m for m in messages if m)["data"])
+    assert message["type"] == "changes" and set(message["collections"]) == {"hosts", "users"}
+
+
+def test_event_hub_fans_out_and_resyncs_slow_clients():
+    hub = EventHub(None, max_clients=2, queue_size=2)
+    fast, slow = hub.subscribe(), hub.subscribe()
+
+    assert hub.subscribe() is None and hub.stats()["rejected"] == 1
+    hub.broadcast('{"type":"changes"}')
+    fast.get_nowait()
+    hub.broadcast('{"type":"changes"}')
+    hub.broadcast('{"type":"changes"}')
+
+    assert slow.get_nowait() == RESYNC_MESSAGE and slow.empty()
+    stream = hub.stream(fast)
+    assert next(stream).startswith("retry:")
+    assert next(stream) == 'data: {"type":"changes"}\n\n'
+    stream.close()
+    assert hub.stats()["clients"] == 1
@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+from coalescing import AsyncCoalescer, Coalescer, query_key
+
+
+def test_identical_concurrent_reads_share_one_call():
+    coalescer = Coalescer()
+    release = threading.Event()
+    calls = []
+
+    def read():
+        calls.append(1)
+        release.wait(2)
+        return ["alice"]
+
+    key = query_key('list', 'users', {}, None, [("_id", -1)], 100)
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(coalescer.run, key, read)]
+        while not coalescer.stats()["in_flight"]:
+            time.sleep(0.001)
+        futures += [pool.submit(coalescer.run, key, read) for _ in range(7)]
+        while coalescer.stats()["requests"] < 8:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == [["alice"]] * 8 and len(calls) == 1
+    assert coalescer.stats()["coalesced"] == 7 and coalescer.stats()["in_flight"] == 0
+    assert coalescer.run(key, lambda: ["bob"]) == ["bob"]
+
+
+def test_keys_differ_by_route_and_query():
+    assert query_key('list', 'users', {}, None, None, 100) != query_key('primary', 'users', {}, None, None, 100)
+    assert query_key('list', 'users', {}, None, None, 100) != query_key('list', 'users', {}, None, None, 50)
+
+
+def test_async_waiters_share_result_and_errors():
+    coalescer = AsyncCoalescer(window_ms=5)
+    calls = []
+    observed = []
+    coalescer.observer = lambda name, coalesced: observed.append(coalesced)
+
+    async def read():
+        calls.append(1)
+        return {"users": 3}
+
+    async def fail():
+        calls.append(1)
+        raise RuntimeError("shard down")
+
+    async def scenario():
+        results = await asyncio.gather(*(coalescer.run(b"stats", read) for _ in range(5)))
+        errors = await asyncio.gather(*(coalescer.run(b"other", fail) for _ in range(3)), return_exceptions=True)
+        return results, errors
+
+    results, errors = asyncio.run(scenario())
+
+    assert results == [{"users": 3}] * 5
+    assert [str(error) for error in errors] == ["shard down"] * 3
+    assert len(calls) == 2 and observed.count(True) == 6
+    assert coalescer.stats()["errors"] == 1
+
+
+def test_disabled_coalescer_calls_every_time():
+    coalescer = Coalescer(enabled=False)
+
+    assert [coalescer.run(b"k", lambda: 1) for _ in range(3)] == [1, 1, 1]
+    assert coalescer.stats()["backend_calls"] == 3
+
+    with pytest.raises(ValueError):
+        coalescer.run(b"k", lambda: int("x"))
@@ -0,0 +1,28 @@
+import fakeredis
+import mongomock
+import pytest
+
+from counters import Counters
+
+
+@pytest.fixture
+def counters():
+    db = mongomock.MongoClient()["demoDB"]
+    return Counters(fakeredis.FakeRedis(decode_responses=True), db)
+
+
+def test_counters_are_none_until_initialized(counters):
+    assert counters.read() is None
+    counters.set(users=0, orders=0)
+    assert counters.read() == {"users": 0, "orders": 0}
+
+
+def test_incr_and_reconcile_fix_drift(counters):
+    counters.set(users=0, orders=0)
+    counters.db.users.insert_many([{"user_id": "user_1"}, {"user_id": "user_2"}])
+    counters.incr('users')
+    assert counters.read() == {"users": 1, "orders": 0}
+
+    assert counters.reconcile() == {"users": 2, "orders": 0}
+    assert counters.read() == {"users": 2, "orders": 0}
+    assert counters.last_drift == {"users": 1, "orders": 0}
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+import mongomock
+import pytest
+
+from db_sync import SYNC_STATE_COLLECTION, DatabaseSync, id_partitions, incremental_filter, sampled
+import sample_data
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    # mongomock ne sait pas exécuter les ReplaceOne de pymongo récent en bulk_write
+    class Result:
+        def __init__(self, matched, upserted):
+            self.matched_count, self.upserted_count = matched, upserted
+
+    def bulk_write(self, requests, ordered=True):
+        matched = sum(self.replace_one(request._filter, request._doc, upsert=True).matched_count
+                      for request in requests)
+        return Result(matched, len(requests) - matched)
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_write)
+    source = mongomock.MongoClient()
+    users = [{"user_id": f"user_{i}", "name": f"Name {i}", "email": f"u{i}@ecam.be"} for i in range(40)]
+    source["demoDB"].users.insert_many(users)
+    source["demoDB"].orders.insert_many([sample_data.random_order(dict(users[i % 40])) for i in range(60)])
+    return source, mongomock.MongoClient()
+
+
+def sync(clients, **kwargs):
+    source, target = clients
+    return DatabaseSync(source, target, parallel=2, batch_size=7, log=lambda message: None, **kwargs)
+
+
+def test_full_copy_anonymizes_and_reports(clients):
+    report = sync(clients, anonymize=True).run(("users", "orders"))
+
+    target = clients[1]["demoDB"]
+    source = clients[0]["demoDB"]
+    assert target.users.count_documents({}) == 40
+    assert target.orders.count_documents({}) == 60
+    user = target.users.find_one({"user_id": "user_3"})
+    assert user["name"] == "User_user_3" and user["source"] == "dev_sync"
+    assert user["email"] == source.users.find_one({"user_id": "user_3"})["email"]
+    assert all(order["user_name"] == f"User_{order['user_id']}" for order in target.orders.find())
+    assert report["mode"] == "full" and report["written"] == target.users.count_documents({}) + 60
+    assert target[SYNC_STATE_COLLECTION].find_one({"_id": "users"})["mode"] == "full"
+
+
+def test_sample_keeps_orders_of_sampled_users(clients):
+    sync(clients, sample=0.3).run(("users", "orders"))
+
+    target = clients[1]["demoDB"]
+    user_ids = {user["user_id"] for user in target.users.find()}
+    assert 0 < len(user_ids) < clients[0]["demoDB"].users.count_documents({})
+    assert {order["user_id"] for order in target.orders.find()} <= user_ids
+    assert sampled({"user_id": "user_1"}, "users", 0.3) == sampled({"user_id": "user_1"}, "orders", 0.3)
+
+
+def test_incremental_copies_only_created_or_updated_documents(clients):
+    source, target = clients[0]["demoDB"], clients[1]["demoDB"]
+    old = datetime(2024, 1, 1)
+    source.hosts.insert_many([{"_id": ObjectId.from_datetime(old + timedelta(hours=i)), "info": i, "updated_at": old}
+                              for i in range(10)])
+    tool = sync(clients)
+    tool.run(("hosts",))
+    target[SYNC_STATE_COLLECTION].update_one({"_id": "hosts"},
+                                             {"$set": {"started_at": datetime.utcnow() - timedelta(minutes=5)}})
+    source.hosts.update_one({"info": 3}, {"$set": {"info": 33, "updated_at": datetime.utcnow()}})
+    source.hosts.insert_one({"info": 10})
+
+    report = tool.run(("hosts",), incremental=True)
+
+    assert report["mode"] == "incremental" and report["written"] == 2
+    assert target.hosts.count_documents({}) == 11
+    assert target.hosts.count_documents({"info": 33}) == 1
+
+
+def test_incremental_filter_and_id_partitions():
+    since = datetime(2024, 1, 1)
+    query = incremental_filter(since)
+    assert query["$or"][0]["_id"]["$gte"] == ObjectId.from_datetime(since)
+    assert query["$or"][1] == {"updated_at": {"$gte": since}}
+
+    collection = mongomock.MongoClient()["db"]["items"]
+    start = datetime(2024, 1, 1)
+    collection.insert_many([{"_id": ObjectId.from_datetime(start + timedelta(hours=i))} for i in range(100)])
+    collection.insert_one({"_id": "legacy-1"})
+    partitions = id_partitions(collection, 4)
+    assert len(partitions) == 5
+    assert sum(collection.count_documents(partition.filter) for partition in partitions) == 101
@@ -0,0 +1,48 @@
+import mongomock
+
+from indexes import COLLSCAN, IN_MEMORY_SORT, SCATTER_GATHER, QUERIES, IndexManager, analyze_plan, explain_report
+
+
+def test_ensure_creates_missing_indexes_once():
+    db = mongomock.MongoClient()["demoDB"]
+    db.orders.create_index("order_id", unique=True)
+    manager = IndexManager(db)
+
+    first = {(row["collection"], row["name"]): row["status"] for row in manager.ensure()["indexes"]}
+    second = {row["status"] for row in manager.ensure()["indexes"]}
+
+    assert first[("orders", "order_id_1")] == "exists"
+    assert first[("users", "country_1_total_spent_-1")] == "created"
+    assert second == {"exists"}
+    assert "email_1" in db.users.index_information()
+
+
+def test_ensure_reports_conflicting_index_without_dropping_it():
+    db = mongomock.MongoClient()["demoDB"]
+    db.orders.create_index("order_id", name="order_id_1")
+
+    statuses = {row["name"]: row["status"] for row in IndexManager(db).ensure()["indexes"]}
+
+    assert statuses["order_id_1"] == "conflict"
+    assert not db.orders.index_information()["order_id_1"].get("unique")
+
+
+def test_analyze_plan_flags_collscan_and_in_memory_sort():
+    explain = {"queryPlanner": {"winningPlan": {"queryPlan": {
+        "stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}}}
+
+    assert analyze_plan(explain) == {"flags": [COLLSCAN, IN_MEMORY_SORT], "indexes": [], "shards": 1}
+
+
+def test_scatter_gather_is_only_reported_when_not_accepted():
+    shard = {"winningPlan": {"stage": "LIMIT", "inputStage": {
+        "stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_id_1__id_-1"}}}}
+    explain = {"queryPlanner": {"winningPlan": {"stage": "SHARD_MERGE_SORT", "shards": [shard, shard]}}}
+    queries = {query.name: query for query in QUERIES}
+
+    accepted = explain_report(queries["orders_of_user"], explain)
+    targeted = explain_report(queries["user_by_id"], explain)
+
+    assert accepted["flags"] == [SCATTER_GATHER] and accepted["unexpected"] == []
+    assert accepted["indexes"] == ["user_id_1__id_-1"] and accepted["shards"] == 2
+    assert targeted["unexpected"] == [SCATTER_GATHER]
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+from pymongo.errors import BulkWriteError, ConnectionFailure
+import pytest
+
+from ingest import OrderIngestor, iter_ndjson, user_increments, validate_order
+
+
+def test_ndjson_skips_blank_lines_and_flags_invalid_json():
+    items = list(iter_ndjson([b'{"user_id": "user_1", "amount": 1}\n', b'\n', b'oops\n']))
+    assert items[0] == {"user_id": "user_1", "amount": 1}
+    assert isinstance(items[1], ValueError)
+
+
+def test_validate_order_generates_order_id_and_rejects_bad_amount():
+    order = validate_order({"user_id": "user_1", "amount": 12.345})
+    assert order["order_id"].startswith("order_")
+    assert order["amount"] == 12.35
+    with pytest.raises(ValueError):
+        validate_order({"user_id": "user_1", "amount": "12"})
+
+
+def test_user_increments_are_grouped_per_user():
+    orders = [
+        {"user_id": "user_1", "amount": 10.0},
+        {"user_id": "user_2", "amount": 5.0},
+        {"user_id": "user_1", "amount": 2.5},
+    ]
+    updates = {op._filter["user_id"]: op._doc["$inc"] for op in user_increments(orders)}
+    assert updates == {
+        "user_1": {"order_count": 2, "total_spent": 12.5},
+        "user_2": {"order_count": 1, "total_spent": 5.0},
+    }
+
+
+class FailingOrders:
+    """Collection `orders` : doublon sur `order_id` déjà vu, panne au lot `fail_at`"""
+
+    def __init__(self, fail_at=None):
+        self.seen = set()
+        self.calls = 0
+        self.fail_at = fail_at
+
+    def insert_many(self, orders, ordered=True):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise ConnectionFailure("mongos injoignable")
+        errors = []
+        for index, order in enumerate(orders):
+            if order["order_id"] in self.seen:
+                errors.append({"index": index, "code": 11000, "errmsg": "duplicate key", "op": order})
+            self.seen.add(order["order_id"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+def ingestor(orders, batch_size):
+    users = SimpleNamespace(find=lambda *args: [{"user_id": "user_1", "name": "Alice"}],
+                            bulk_write=lambda updates, ordered=True: None)
+    return OrderIngestor(SimpleNamespace(users=users, orders=orders), batch_size=batch_size)
+
+
+def test_errors_report_the_position_in_the_input():
+    raw = [{"user_id": "user_1", "amount": 1, "order_id": "o1"}, {"user_id": "user_1"},
+           {"user_id": "user_1", "amount": 2, "order_id": "o2"}, {"user_id": "user_1", "amount": 3, "order_id": "o1"}]
+
+    report = ingestor(FailingOrders(), batch_size=10).ingest(raw).to_dict()
+
+    assert report["inserted"] == 2 and report["rejected"] == 2
+    assert [(error["index"], error.get("order_id")) for error in report["errors"]] == [(1, None), (3, "o1")]
+
+
+def test_failed_batch_returns_partial_report():
+    raw = [{"user_id": "user_1", "amount": i, "order_id": f"o{i}"} for i in range(6)]
+
+    report = ingestor(FailingOrders(fail_at=2), batch_size=2).ingest(raw).to_dict()
+
+    assert report["inserted"] == 2 and report["received"] == 4
+    assert report["error"] == "mongos injoignable" and report["batches"][1]["error"] == "mongos injoignable"
@@ -0,0 +1,31 @@
+import fakeredis
+from prometheus_client import REGISTRY
+
+import metrics
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_redis_commands_are_timed_per_operation():
+    client = metrics.InstrumentedRedis(connection_pool=fakeredis.FakeRedis().connection_pool)
+    before = sample('redis_command_duration_seconds_count', command='get', outcome='ok')
+    client.get('missing')
+    assert sample('redis_command_duration_seconds_count', command='get', outcome='ok') == before + 1
+
+
+def test_cache_results_are_counted():
+    before = sample('cache_requests_total', cache='hosts_data', result='l2')
+    metrics.observe_cache('hosts_data', 'L2')
+    metrics.observe_cache('hosts_data', None)
+    assert sample('cache_requests_total', cache='hosts_data', result='l2') == before + 1
+    assert sample('cache_requests_total', cache='hosts_data', result='miss') >= 1
+
+
+def test_metrics_endpoint_exposes_route_histogram():
+    from app.app import app
+    client = app.test_client()
+    client.get('/api/page-info')
+    body = client.get('/metrics').data.decode()
+    assert 'http_request_duration_seconds_bucket{le="0.001",method="GET",route="/api/page-info",status="200"}' in body
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+import mongomock
+import pymongo
+from pymongo import _csot
+
+from migrations import (DONE, MIGRATIONS, PAUSED, RUNNING, AsyncMigrationRunner, MigrationRunner,
+                        throttle_delay)
+
+
+def users_db(count):
+    db = mongomock.MongoClient()["demoDB"]
+    db.users.insert_many([{"user_id": f"user_{i}", "total_spent": 10} for i in range(count)])
+    return db
+
+
+class StopAfterFirstBatch(MigrationRunner):
+    """Simule un pod arrêté après le premier lot"""
+
+    def checkpoint(self, *args):
+        state = super().checkpoint(*args)
+        self.stop()
+        return state
+
+
+def test_migrations_run_in_version_order_by_batches():
+    db = users_db(5)
+    runner = MigrationRunner(db, "pod-a", batch_size=2, max_docs_per_sec=0)
+
+    assert runner.run_all() is True
+
+    user = db.users.find_one({"user_id": "user_0"})
+    assert user["schema_version"] == 2
+    assert (user["order_count"], user["total_spent"]) == (0, 10)
+    assert isinstance(user["created_at"], datetime)
+    progress = {report["version"]: report for report in runner.progress()["migrations"]}
+    assert progress[1]["status"] == DONE
+    assert (progress[1]["processed"], progress[1]["batches"], progress[1]["percent"]) == (5, 3, 100.0)
+
+
+def test_interrupted_migration_resumes_from_checkpoint():
+    db = users_db(5)
+    interrupted = StopAfterFirstBatch(db, "pod-a", batch_size=2, max_docs_per_sec=0)
+    assert interrupted.run_all() is False
+    assert db.migrations.find_one({"_id": 1})["status"] == PAUSED
+    assert db.users.count_documents({"schema_version": 1}) == 2
+
+    MigrationRunner(db, "pod-b", batch_size=2, max_docs_per_sec=0).run_all()
+    state = db.migrations.find_one({"_id": 1})
+    assert (state["processed"], state["status"]) == (5, DONE)
+    assert db.users.count_documents({"schema_version": 2}) == 5
+
+
+def test_migration_leased_by_another_pod_is_not_run_twice():
+    db = users_db(3)
+    db.migrations.insert_one({"_id": 1, "status": RUNNING, "owner": "pod-a",
+                              "lease_expires": datetime.utcnow() + timedelta(seconds=60)})
+    assert MigrationRunner(db, "pod-b", max_docs_per_sec=0).run_all() is False
+    assert db.users.count_documents({"schema_version": {"$exists": True}}) == 0
+
+
+def test_rerun_only_processes_documents_inserted_since_last_checkpoint():
+    db = users_db(3)
+    runner = MigrationRunner(db, "pod-a", max_docs_per_sec=0)
+    runner.run_all()
+    db.users.insert_one({"user_id": "user_new"})
+    runner.run_all()
+    assert db.migrations.find_one({"_id": 1})["processed"] == 4
+    assert db.users.find_one({"user_id": "user_new"})["schema_version"] == 2
+
+
+def test_rerun_of_finished_migration_ignores_checkpoint():
+    db = users_db(3)
+    runner = MigrationRunner(db, "pod-a", max_docs_per_sec=0)
+    runner.run_all()
+    # _id inférieur au point de reprise (autre process, horloge en retard)
+    db.users.insert_one({"_id": ObjectId.from_datetime(datetime(2000, 1, 1)), "user_id": "user_late"})
+    assert db.migrations.find_one({"_id": 1})["last_id"] > db.users.find_one({"user_id": "user_late"})["_id"]
+
+    assert runner.run_all() is True
+    assert db.users.find_one({"user_id": "user_late"})["schema_version"] == 2
+
+
+def test_throttle_delay_caps_documents_per_second():
+    assert throttle_delay(1000, 0.1, 2000) == 0.4
+    assert throttle_delay(1000, 1.0, 2000) == 0.0
+    assert throttle_delay(1000, 0.0, 0) == 0.0
+
+
+def test_async_migration_does_not_inherit_request_deadline():
+    deadlines = []
+
+    class Runner(AsyncMigrationRunner):
+        async def run_all(self):
+            deadlines.append(_csot.get_timeout())
+
+    async def scenario():
+        runner = Runner(mongomock.MongoClient()["demoDB"], "pod-a")
+        # Comme run_migration sous @mongo_route (budget de 2 s)
+        with pymongo.timeout(2):
+            assert runner.start()
+        await runner._thread
+
+    asyncio.run(scenario())
+
+    assert deadlines == [None]
+
+
+def test_migrated_documents_are_marked_updated_for_incremental_sync():
+    # $$NOW : heure du serveur, comme $currentDate dans les routes d'écriture
+    for migration in MIGRATIONS:
+        assert migration.update(datetime.utcnow())[0]["$set"]["updated_at"] == "$$NOW"
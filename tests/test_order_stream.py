@@ -0,0 +1,82 @@
+import fakeredis
+import mongomock
+import pytest
+
+from order_stream import DEAD_LETTER_STREAM, ORDERS_STREAM, OrderStream, OrderStreamConsumer
+import sample_data
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    # mongomock ne sait pas exécuter les UpdateOne de pymongo récent en bulk_write
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self.update_one(request._filter, request._doc)
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_write)
+    db = mongomock.MongoClient()["demoDB"]
+    db.users.insert_many(sample_data.sample_users())
+    return fakeredis.FakeRedis(decode_responses=True), db
+
+
+def consumer(redis_client, db, name="worker-1", **kwargs):
+    worker = OrderStreamConsumer(redis_client, db, name, batch_size=10, block_ms=1, **kwargs)
+    worker.ensure_indexes()
+    worker.source.ensure_group()
+    return worker
+
+
+def test_consumer_writes_batch_and_groups_user_increments(backends):
+    redis_client, db = backends
+    worker = consumer(redis_client, db)
+    stream = OrderStream(redis_client)
+    for amount in (10, 20):
+        stream.publish(sample_data.random_order({"user_id": "user_5"}) | {"amount": amount})
+
+    assert stream.lag()["lag"] == 2
+    assert worker.run_once() == 2
+
+    user = db.users.find_one({"user_id": "user_5"})
+    assert (user["order_count"], user["total_spent"]) == (2, 30)
+    orders = list(db.orders.find({}, {"_id": 0}))
+    assert [order["user_name"] for order in orders] == ["Eve Chen", "Eve Chen"]
+    assert not any("stats_pending" in order for order in orders)
+    lag = stream.lag()
+    assert (lag["length"], lag["lag"], lag["pending"], lag["oldest_age_s"]) == (2, 0, 0, 0.0)
+
+
+def test_redelivered_messages_are_applied_once(backends):
+    redis_client, db = backends
+    stream = OrderStream(redis_client)
+    crashed = consumer(redis_client, db, "worker-crashed")
+    stream.publish({"order_id": "order_a", "user_id": "user_5", "amount": 10})
+    stream.publish({"order_id": "order_b", "user_id": "user_5", "amount": 5})
+    messages = crashed.read_batch()
+    # Arrêt brutal après l'insert, avant les $inc et l'ACK
+    db.orders.insert_one({"order_id": "order_a", "user_id": "user_5", "amount": 10.0, "stats_pending": True})
+    assert stream.lag()["pending"] == 2
+
+    survivor = consumer(redis_client, db, "worker-2", claim_idle_ms=0)
+    assert survivor.run_once() == len(messages)
+    assert (survivor.duplicates, survivor.claimed) == (1, 2)
+    user = db.users.find_one({"user_id": "user_5"})
+    assert (user["order_count"], user["total_spent"]) == (2, 15)
+
+    # Même message republié (retry du client) : ignoré
+    stream.publish({"order_id": "order_a", "user_id": "user_5", "amount": 10})
+    survivor.run_once()
+    assert db.users.find_one({"user_id": "user_5"})["order_count"] == 2
+    assert db.orders.count_documents({}) == 2
+    assert stream.lag()["pending"] == 0
+
+
+def test_unreadable_messages_go_to_dead_letter_stream(backends):
+    redis_client, db = backends
+    worker = consumer(redis_client, db)
+    redis_client.xadd(ORDERS_STREAM, {"order": "not json"})
+    redis_client.xadd(ORDERS_STREAM, {"order": '{"user_id": "user_1", "amount": -1}'})
+
+    assert worker.run_once() == 2
+    assert worker.dead_lettered == 2
+    assert redis_client.xlen(DEAD_LETTER_STREAM) == 2
+    assert db.orders.count_documents({}) == 0
+    assert OrderStream(redis_client).lag()["pending"] == 0
@@ -0,0 +1,24 @@
+import gzip
+
+from pages import StaticPage, accepted_encodings, build_pages
+
+
+def test_pages_do_not_embed_pod_specific_values():
+    pages = build_pages('dev')
+    assert pages['home'].etag() == build_pages('dev')['home'].etag()
+    assert pages['home'].etag() != build_pages('test')['home'].etag()
+
+
+def test_respond_negotiates_encoding_and_revalidates():
+    page = StaticPage('<html>' + 'x' * 1000 + '</html>')
+    status, body, headers = page.respond(accept_encoding='gzip, deflate')
+    assert status == 200 and headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(body) == page.body
+
+    status, body, _ = page.respond(if_none_match=headers['ETag'])
+    assert status == 304 and body == b''
+    assert page.respond(if_none_match='"other"')[0] == 200
+
+
+def test_accept_encoding_ignores_zero_quality():
+    assert accepted_encodings('br;q=0, gzip;q=0.5') == {'gzip'}
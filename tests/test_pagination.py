@@ -0,0 +1,48 @@
+import json
+
+import mongomock
+import pytest
+
+from pagination import (BadRequest, decode_cursor, encode_cursor, json_array_chunks, keyset_filter,
+                        ndjson_chunks, next_cursor, parse_list_args, parse_projection)
+
+
+@pytest.fixture
+def users():
+    collection = mongomock.MongoClient()["demoDB"].users
+    collection.insert_many([{"user_id": f"user_{i}", "name": f"User {i}", "email": "x"} for i in range(7)])
+    return collection
+
+
+def test_cursor_round_trip_and_rejects_garbage(users):
+    document_id = users.find_one()["_id"]
+    assert decode_cursor(encode_cursor(document_id)) == document_id
+    with pytest.raises(BadRequest):
+        decode_cursor("not-a-cursor")
+
+
+def test_keyset_pages_cover_collection_once(users):
+    seen, after = [], None
+    while True:
+        query, projection, limit, _ = parse_list_args({"limit": "3", "after": after, "fields": "user_id"})
+        page = list(users.find(query, projection).sort("_id", -1).limit(limit))
+        seen += [user["user_id"] for user in page]
+        after = next_cursor(page, limit)
+        if after is None:
+            break
+    assert seen == [f"user_{i}" for i in range(6, -1, -1)]
+    assert keyset_filter(None) == {}
+
+
+def test_projection_validates_field_names():
+    assert parse_projection("name, email") == {"name": 1, "email": 1, "_id": 1}
+    with pytest.raises(BadRequest):
+        parse_projection("$where")
+
+
+def test_stream_chunks_are_batched(users):
+    lines = "".join(ndjson_chunks(users.find().sort("_id", -1), json.dumps, batch_size=2)).splitlines()
+    assert len(lines) == 7 and "_id" not in json.loads(lines[0])
+    chunks = list(json_array_chunks(users.find(), json.dumps, batch_size=3))
+    assert len(chunks) == 5
+    assert [user["user_id"] for user in json.loads("".join(chunks))] == [f"user_{i}" for i in range(7)]
@@ -0,0 +1,107 @@
+import asyncio
+
+import fakeredis
+import redis
+
+from rate_limit import (ADMIN, READ, WRITE, AdmissionController, AdmissionMiddleware, AsyncRateLimiter, LimitClass,
+                        RateLimiter, client_id)
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_limit_is_shared_between_pods_and_refusals_do_not_consume_it():
+    server = fakeredis.FakeServer()
+    clock = Clock()
+    classes = {WRITE: LimitClass(WRITE, 3, 10)}
+    pods = [RateLimiter(fakeredis.FakeRedis(server=server, decode_responses=True), classes, clock=clock)
+            for _ in range(2)]
+
+    results = [pods[i % 2].check(WRITE, "1.2.3.4").allowed for i in range(5)]
+    other_client = pods[0].check(WRITE, "5.6.7.8")
+    refused = pods[1].check(WRITE, "1.2.3.4")
+
+    assert results == [True, True, True, False, False]
+    assert other_client.allowed and other_client.remaining == 2
+    assert refused.headers()["Retry-After"] == "10" and refused.headers()["X-RateLimit-Remaining"] == "0"
+    # Fenêtre suivante, à mi-parcours : la précédente (3 requêtes) pèse encore pour moitié
+    clock.now = 1015.0
+    assert [pods[0].check(WRITE, "1.2.3.4").allowed for _ in range(2)] == [True, False]
+
+
+def test_limiter_falls_back_to_process_window_when_redis_fails():
+    class BrokenRedis:
+        def pipeline(self):
+            raise redis.ConnectionError("down")
+
+    limiter = RateLimiter(BrokenRedis(), {ADMIN: LimitClass(ADMIN, 1, 60)}, clock=Clock())
+
+    assert limiter.check(ADMIN, "a").allowed and not limiter.check(ADMIN, "a").allowed
+    assert limiter.stats()["local_fallbacks"] == 2
+
+
+def test_admission_sheds_admin_and_writes_before_reads():
+    clock = Clock()
+    admission = AdmissionController(max_in_flight=4, latency_threshold_ms=100, clock=clock)
+
+    assert admission.try_enter(ADMIN) is None
+    assert admission.try_enter(ADMIN) == 'overloaded'
+    assert [admission.try_enter(WRITE) for _ in range(3)] == [None, None, 'overloaded']
+    assert admission.try_enter(READ) is None and admission.try_enter(READ) == 'overloaded'
+    for _ in range(4):
+        admission.leave()
+
+    admission.observe(0.08)
+    assert admission.try_enter(ADMIN) == 'slow_backend'
+    assert admission.try_enter(WRITE) is None and admission.try_enter(READ) is None
+    admission.leave()
+    admission.leave()
+    clock.now += 60
+    assert admission.try_enter(ADMIN) is None
+    assert admission.stats()["shed"] == {"admin:overloaded": 1, "write:overloaded": 1, "read:overloaded": 1,
+                                         "admin:slow_backend": 1}
+
+
+def test_asgi_middleware_returns_429_with_headers_and_exempts_probes():
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    limiter = AsyncRateLimiter(fakeredis.FakeAsyncRedis(decode_responses=True), {WRITE: LimitClass(WRITE, 1, 60)},
+                               clock=Clock(960.0))
+    admission = AdmissionController(max_in_flight=10)
+    middleware = AdmissionMiddleware(app, admission, limiter, trusted_hops=1)
+
+    # Adresse forgée différente à chaque requête : seule celle de l'ingress compte
+    spoofed = iter(f"7.7.7.{i}" for i in range(10))
+
+    async def call(path):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "path": path, "method": "POST", "client": ("9.9.9.9", 1234),
+                 "headers": [(b"x-forwarded-for", f"{next(spoofed)}, 10.0.0.1".encode())]}
+        await middleware(scope, None, send)
+        return sent[0]
+
+    async def scenario():
+        return [await call("/api/random-user"), await call("/api/random-user"), await call("/healthz")]
+
+    first, second, probe = asyncio.run(scenario())
+
+    assert first["status"] == 200 and probe["status"] == 200
+    assert second["status"] == 429 and (b"retry-after", b"60") in second["headers"]
+    assert calls == ["/api/random-user", "/healthz"] and admission.in_flight == 0
+    assert client_id("7.7.7.7, 10.0.0.1", "9.9.9.9") == "9.9.9.9"
+    assert client_id("7.7.7.7, 10.0.0.1", "9.9.9.9", trusted_hops=1) == "10.0.0.1"
+    assert client_id("10.0.0.1", "9.9.9.9", trusted_hops=2) == "9.9.9.9" and client_id(None, "9.9.9.9", 1) == "9.9.9.9"
@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import mongomock
+import pytest
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from read_routing import RouteClass, ReadRouter, load_route_classes
+
+
+def test_defaults_send_dashboard_and_list_reads_to_secondaries():
+    classes = load_route_classes(primary_pool_size=8, deadline_ms=1500, env={})
+
+    assert classes['primary'].make_read_preference() == Primary()
+    assert classes['primary'].pool_size == 8
+    dashboard = classes['dashboard'].make_read_preference()
+    assert dashboard == SecondaryPreferred(max_staleness=90)
+    assert classes['dashboard'].deadline_ms == 1500
+    assert classes['analytics'].deadline_ms is None
+
+
+def test_env_overrides_one_route_class():
+    env = {"MONGO_LIST_READ_PREFERENCE": "nearest", "MONGO_LIST_MAX_STALENESS": "120",
+           "MONGO_LIST_POOL_SIZE": "5", "MONGO_LIST_DEADLINE_MS": "0", "MONGO_LIST_HEDGED": "true"}
+    route_class = load_route_classes(env=env)['list']
+
+    assert (route_class.read_preference, route_class.max_staleness, route_class.pool_size) == ('nearest', 120, 5)
+    assert route_class.deadline_ms is None
+    with pytest.warns(DeprecationWarning):
+        assert route_class.make_read_preference().document["hedge"] == {"enabled": True}
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"read_preference": "secondaryPreferred", "max_staleness": 30},
+    {"read_preference": "primary", "max_staleness": 90},
+    {"read_preference": "secondary-preferred"},
+])
+def test_invalid_route_class_is_rejected(kwargs):
+    with pytest.raises(ValueError):
+        RouteClass("dashboard", **kwargs)
+
+
+def test_router_shares_clients_by_pool_and_pins_primary_after_writes():
+    created = []
+
+    def factory(uri, route_class):
+        created.append(route_class.name)
+        return mongomock.MongoClient()
+
+    primary = mongomock.MongoClient()
+    classes = load_route_classes(env={"MONGO_LIST_POOL_SIZE": "50"})
+    router = ReadRouter(classes, "mongodb://mongos", factory, clients={'primary': primary})
+
+    router.db('dashboard'), router.db('list'), router.db('analytics')
+    assert created == ['dashboard', 'analytics']
+    assert router.db('list', read_your_writes=True) is router.db('primary')
+    assert router.read_your_writes_seconds() == 120
+
+
+def test_concurrent_first_requests_create_one_client_per_pool():
+    created = []
+    start = threading.Barrier(8)
+
+    def factory(uri, route_class):
+        created.append(route_class.name)
+        time.sleep(0.01)
+        return mongomock.MongoClient()
+
+    router = ReadRouter(load_route_classes(env={}), "mongodb://mongos", factory)
+
+    def first_request(_):
+        start.wait()
+        return router.client('dashboard')
+
+    with ThreadPoolExecutor(8) as pool:
+        clients = list(pool.map(first_request, range(8)))
+
+    assert created == ['dashboard'] and all(client is clients[0] for client in clients)
@@ -0,0 +1,71 @@
+import fakeredis
+import redis
+
+import redis_pool
+from cache import LocalCache, TwoTierCache
+from metrics import InstrumentedRedis
+
+
+def test_shared_client_uses_blocking_pool_with_health_checks():
+    client = redis_pool.make_redis(InstrumentedRedis, "redis.invalid", max_connections=7, pool_timeout=0.5,
+                                   health_check_interval=15, socket_timeout=2)
+
+    report = redis_pool.describe(client)
+
+    assert isinstance(client, InstrumentedRedis)
+    assert isinstance(client.connection_pool, redis.BlockingConnectionPool)
+    assert report == {"max_connections": 7, "in_use": 0, "idle": 0, "pool_timeout": 0.5, "socket_timeout": 2,
+                      "health_check_interval": 15, "protocol": 2}
+    assert redis_pool.describe(None) is None
+
+
+def test_hot_keys_are_read_through_hot_client_with_fallback():
+    shared = fakeredis.FakeRedis(decode_responses=True)
+    cache = TwoTierCache(shared, LocalCache(ttl=60), binary=True, hot_keys=("hosts_data",))
+    cache.set("hosts_data", b"[1]", 300)
+    cache.set("other", b"[2]", 300)
+    cache.l1.clear()
+
+    class HotClient:
+        calls = []
+        broken = False
+
+        def execute_command(self, *args):
+            if self.broken:
+                raise redis.ConnectionError("down")
+            self.calls.append(args)
+            return shared.execute_command(*args, NEVER_DECODE=True)
+
+    hot = cache.hot_redis = HotClient()
+
+    assert cache.get("hosts_data") == (b"[1]", "L2")
+    assert cache.get("other") == (b"[2]", "L2")
+    assert [args[1] for args in hot.calls] == ["hosts_data"]
+    cache.l1.clear()
+    hot.broken = True
+    assert cache.get("hosts_data") == (b"[1]", "L2")
+
+
+def test_invalidate_deletes_and_publishes_in_one_round_trip():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    executed = []
+
+    class Pipeline(redis.client.Pipeline):
+        def execute(self, raise_on_error=True):
+            executed.append([args[0] for args, _ in self.command_stack])
+            return super().execute(raise_on_error)
+
+    client.pipeline = lambda transaction=True: Pipeline(client.connection_pool, client.response_callbacks,
+                                                        transaction, None)
+    pubsub = client.pubsub()
+    pubsub.subscribe("cache-invalidation")
+    pubsub.get_message(timeout=1)
+    cache = TwoTierCache(client, LocalCache(ttl=60), channel="cache-invalidation")
+    cache.set("a", "1", 300)
+    executed.clear()
+
+    cache.invalidate("a", "b")
+
+    assert executed == [["DEL", "PUBLISH", "PUBLISH"]]
+    assert client.get("a") is None
+    assert [pubsub.get_message(timeout=1)["data"] for _ in range(2)] == ["a", "b"]
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+import gzip
+import json
+
+from bson import Decimal128, ObjectId
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import serialization
+from serialization import CompressionMiddleware, Payload
+
+
+def test_dumps_handles_bson_types_like_the_stdlib_fallback():
+    document = {
+        "_id": ObjectId("0123456789ab0123456789ab"),
+        "amount": Decimal128("12.50"),
+        "created_at": datetime(2026, 1, 2, 3, 4, 5, 123456),
+        "aware": datetime(2026, 1, 2, tzinfo=timezone(timedelta(hours=2))),
+        "name": "Zoé",
+    }
+    fallback = json.dumps(document, ensure_ascii=False, separators=(',', ':'),
+                          default=serialization.json_default).encode('utf-8')
+
+    assert serialization.dumps(document) == fallback
+    assert serialization.loads(fallback)["created_at"] == "2026-01-02T03:04:05.123456Z"
+
+
+def test_cached_payload_is_served_as_stored_or_decompressed():
+    stored = Payload.encode([{"pod": "web-1"}]).to_bytes()
+    payload = Payload.from_bytes(stored)
+
+    body, headers = payload.respond("gzip, deflate")
+    assert headers["Content-Encoding"] == "gzip" and body == payload.body
+    body, headers = payload.respond("identity")
+    assert "Content-Encoding" not in headers and body == b'[{"pod":"web-1"}]'
+    # Ancienne entrée du cache (JSON brut, décodé par le client Redis)
+    assert Payload.from_bytes('[]').respond("gzip") == (b'[]', {'Vary': 'Accept-Encoding'})
+
+
+def test_small_or_binary_responses_are_not_compressed():
+    assert serialization.compress_response(b"{}", "application/json", "gzip") == (b"{}", None)
+    body = b"x" * 4096
+    assert serialization.compress_response(body, "image/png", "gzip") == (body, None)
+    compressed, encoding = serialization.compress_response(body, "application/json", "gzip;q=1, br;q=0")
+    assert encoding == "gzip" and gzip.decompress(compressed) == body
+
+
+def test_asgi_middleware_compresses_large_json_only():
+    async def large(request):
+        return JSONResponse({"users": ["user"] * 1000})
+
+    async def small(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/large", large), Route("/small", small)])
+    app.add_middleware(CompressionMiddleware)
+    client = TestClient(app)
+
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < 1000
+    assert response.json() == {"users": ["user"] * 1000}
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
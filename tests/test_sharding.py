@@ -0,0 +1,63 @@
+import mongomock
+
+from indexes import QUERIES
+from sharding import (BROADCAST, MULTI_SHARD, TARGETED, UNSHARDED, ShardDiagnostics, analyze_targeting,
+                      collection_distribution, shard_latency)
+
+
+def shard_explain(stage, *shards):
+    return {
+        "queryPlanner": {"winningPlan": {"stage": stage, "shards": [{"shardName": name} for name, _ in shards]}},
+        "executionStats": {"nReturned": 1, "executionTimeMillis": max(ms for _, ms in shards),
+                           "executionStages": {"stage": stage, "shards": [
+                               {"shardName": name, "executionTimeMillis": ms, "nReturned": 1,
+                                "totalKeysExamined": 1, "totalDocsExamined": 1} for name, ms in shards]}},
+    }
+
+
+def test_targeting_is_classified_from_shards_in_explain():
+    single = analyze_targeting(shard_explain("SINGLE_SHARD", ("rs-a", 2)), total_shards=3)
+    multi = analyze_targeting(shard_explain("SHARD_MERGE", ("rs-a", 2), ("rs-b", 3)), total_shards=3)
+    broadcast = analyze_targeting(shard_explain("SHARD_MERGE", ("rs-a", 2), ("rs-b", 3), ("rs-c", 9)), 3)
+    unsharded = analyze_targeting({"queryPlanner": {"winningPlan": {"stage": "IXSCAN"}}})
+
+    assert (single["targeting"], single["shards_targeted"]) == (TARGETED, 1)
+    assert multi["targeting"] == MULTI_SHARD
+    assert broadcast["targeting"] == BROADCAST and broadcast["total_ms"] == 9
+    assert broadcast["per_shard"][2] == {"shard": "rs-c", "ms": 9, "returned": 1, "keys_examined": 1,
+                                         "docs_examined": 1}
+    assert unsharded["targeting"] == UNSHARDED
+
+
+def test_slow_and_hot_shards_are_flagged():
+    reports = [{"targeting": BROADCAST, **analyze_targeting(
+        shard_explain("SHARD_MERGE", ("rs-a", 2), ("rs-b", 2), ("rs-c", 12)))}]
+    latency = shard_latency(reports)
+    distribution = collection_distribution(
+        {"_id": "demoDB.users", "key": {"user_id": "hashed"}},
+        [{"_id": "rs-a", "chunks": 2}, {"_id": "rs-b", "chunks": 2, "jumbo": 1}, {"_id": "rs-c", "chunks": 2}],
+        {"rs-a": 100, "rs-b": 100, "rs-c": 700},
+    )
+
+    assert latency["rs-c"]["slow"] and not latency["rs-a"]["slow"]
+    assert distribution["chunks"] == 6 and distribution["shards"]["rs-b"] == {"chunks": 2, "jumbo": 1,
+                                                                              "documents": 100}
+    assert distribution["hot_shards"] == ["rs-c"]
+
+
+def test_report_keeps_sections_independent_and_caches_targeting():
+    client = mongomock.MongoClient()
+    client["config"].shards.insert_many([{"_id": "rs-a", "host": "rs-a/h:27018", "state": 1}])
+    diagnostics = ShardDiagnostics(client, queries=QUERIES[:2])
+
+    report = diagnostics.report(explain=True)
+    client["config"].shards.insert_one({"_id": "rs-b", "host": "rs-b/h:27018", "state": 1})
+    again = diagnostics.report(explain=True)
+
+    assert report["shard_list"] == [{"id": "rs-a", "host": "rs-a/h:27018", "state": 1}]
+    assert "error" in report["balancer"]
+    assert report["collections"] == []
+    assert [query["query"] for query in report["targeting"]["queries"]] == ["users_recent", "users_after_cursor"]
+    assert again["targeting"]["at"] == report["targeting"]["at"] and diagnostics.runs == 1
+    assert again["shard_list"] == report["shard_list"]
+    assert len(diagnostics.report(refresh=True)["shard_list"]) == 2 and diagnostics.runs == 2
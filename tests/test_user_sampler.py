@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import fakeredis
+import mongomock
+import pymongo
+from pymongo import _csot
+import pytest
+
+from user_sampler import USER_IDS_KEY, AsyncUserSampler, UserSampler
+
+
+@pytest.fixture
+def sampler():
+    db = mongomock.MongoClient()["demoDB"]
+    db.users.insert_many([{"user_id": f"user_{i}", "name": f"User {i}", "email": "x"} for i in range(5)])
+    return UserSampler(fakeredis.FakeRedis(decode_responses=True), db)
+
+
+def test_pick_returns_only_id_and_name(sampler):
+    sampler.reset([f"user_{i}" for i in range(5)])
+    user = sampler.pick()
+    assert set(user) == {"user_id", "name"}
+
+
+def test_pick_drops_orphan_ids(sampler):
+    sampler.reset(["ghost"])
+    user = sampler.pick()
+    assert user is not None and user["user_id"].startswith("user_")
+    assert not sampler.redis.sismember(USER_IDS_KEY, "ghost")
+
+
+def test_missing_set_falls_back_to_sample_and_rebuilds(sampler):
+    assert sampler.pick() is not None
+    deadline = time.time() + 3
+    while sampler.redis.scard(USER_IDS_KEY) < 5 and time.time() < deadline:
+        time.sleep(0.02)
+    assert sampler.redis.scard(USER_IDS_KEY) == 5
+
+
+def during_rebuild_read(sampler, action):
+    """`action()` exécutée pendant que la reconstruction lit MongoDB"""
+    find = sampler.db.users.find
+
+    def reading(*args, **kwargs):
+        for index, user in enumerate(find(*args, **kwargs)):
+            if index == 2:
+                action()
+            yield user
+    sampler.db.users.find = reading
+
+
+def test_rebuild_keeps_ids_added_while_reading(sampler):
+    during_rebuild_read(sampler, lambda: sampler.add("user_new"))
+
+    assert sampler.rebuild() is True
+    assert sampler.redis.smembers(USER_IDS_KEY) == {f"user_{i}" for i in range(5)} | {"user_new"}
+
+
+def test_rebuild_does_not_undo_concurrent_reset(sampler):
+    during_rebuild_read(sampler, lambda: sampler.reset())
+
+    assert sampler.rebuild() is False
+    assert sampler.redis.scard(USER_IDS_KEY) == 0 and not sampler.redis.exists(f"{USER_IDS_KEY}:tmp")
+
+
+def test_async_rebuild_does_not_inherit_request_deadline():
+    deadlines = []
+
+    class Sampler(AsyncUserSampler):
+        async def rebuild(self):
+            deadlines.append(_csot.get_timeout())
+
+    async def scenario():
+        sampler = Sampler(fakeredis.FakeAsyncRedis(decode_responses=True), None)
+        with pymongo.timeout(2):
+            await sampler.start_rebuild()
+        await asyncio.gather(*sampler._tasks)
+
+    asyncio.run(scenario())
+
+    assert deadlines == [None]